@@ -1,14 +1,17 @@
 from typing import List, Dict, Any, Optional
 from config_manager import ConfigManager
+from conversation_summarizer import get_conversation_summarizer
 import json
 import re
+import uuid
 
 
 class ConversationManager:
     """对话管理类，处理消息的存储"""
     
-    def __init__(self, config: ConfigManager):
+    def __init__(self, config: ConfigManager, session_id: Optional[str] = None):
         self.config = config
+        self.session_id = session_id or uuid.uuid4().hex
         self.messages: List[Dict[str, Any]] = []
         self.interaction_count = 0
         
@@ -44,7 +47,20 @@ class ConversationManager:
         refresh_interval = self.config.get('prompt_refresh_interval', 3)
         return self.interaction_count % refresh_interval == 0
 
+    def manage_context(self) -> None:
+        """对话超过token阈值时在后台将最早的消息压缩为摘要，不等待结果"""
+        summarizer = get_conversation_summarizer(self.config)
+        if summarizer is not None:
+            summarizer.schedule(self.session_id, self.messages)
+
+    def get_context_messages(self) -> List[Dict[str, Any]]:
+        """发送给模型的消息：已被摘要覆盖的部分替换为摘要消息，完整历史保持不变"""
+        summarizer = get_conversation_summarizer(self.config)
+        if summarizer is None:
+            return list(self.messages)
+        return summarizer.apply(self.session_id, self.messages)
+
     def refresh_context_with_prompt(self, user_question: str, system_prompt: str) -> None:
         """刷新上下文并添加新的系统提示"""
-        # self.manage_context() 调用上下文截断总结
-        self.add_system_message(user_question, system_prompt)
\ No newline at end of file
+        self.manage_context()
+        self.add_system_message(user_question, system_prompt)
@@ -2,8 +2,27 @@ import agent_tools
 import re
 import ast
 import subprocess
-import inspect
-from typing import List, Dict, Any,Tuple
+import functools
+from typing import List, Dict, Any, Callable, Optional, Tuple
+from tool_executor import get_tool_executor
+from tool_cache import get_tool_cache
+from tool_registry import ToolRegistry, ToolDescriptor, build_descriptor
+
+
+@functools.lru_cache(maxsize=1)
+def _agent_tool_descriptors() -> Tuple[ToolDescriptor, ...]:
+    """agent_tools 模块中工具的描述符，进程内只生成一次，所有 ToolManager 共享"""
+    resources = getattr(agent_tools, "TOOL_RESOURCES", {})
+    descriptors = []
+    for attr_name in dir(agent_tools):
+        attr = getattr(agent_tools, attr_name)
+        # 检查是否是函数且不是私有函数，并且是在tools模块中定义的
+        if (callable(attr) and 
+            not attr_name.startswith('_') and 
+            hasattr(attr, '__module__') and 
+            attr.__module__ == "agent_tools"):
+            descriptors.append(build_descriptor(attr_name, attr, warm_up=resources.get(attr_name)))
+    return tuple(descriptors)
 
 
 class ToolManager:
@@ -12,25 +31,28 @@ class ToolManager:
     def __init__(self, config=None):
         self.tools = {}
         self.config = config
+        self.registry = ToolRegistry()
+        self.db_tools = None
         self._register_tools_from_module()
         
     def _register_tools_from_module(self):
-        """从tools模块注册工具函数"""
-        # 获取tools模块中的所有函数
-        for attr_name in dir(agent_tools):
-            attr = getattr(agent_tools, attr_name)
-            # 检查是否是函数且不是私有函数，并且是在tools模块中定义的
-            if (callable(attr) and 
-                not attr_name.startswith('_') and 
-                hasattr(attr, '__module__') and 
-                attr.__module__ == "agent_tools"):
-                self.tools[attr_name] = attr
-        
-        # 尝试注册数据库工具（可选）
+        """
+        从tools模块注册工具函数
+        
+        只注册描述符：agent_tools 的描述符在进程内共享，网页工具的依赖在首次调用时导入；
+        数据库工具在首次调用时才连接。需要低延迟的部署可调用 warm_up 提前加载
+        """
+        for descriptor in _agent_tool_descriptors():
+            self.registry.add(descriptor)
+            self.tools[descriptor.name] = descriptor.function
+        
+        # 尝试注册数据库工具（可选，仅在配置启用时）
+        if self.config is None or not self.config.get('database.enabled', False):
+            return
         try:
             from database_agent_tools import register_database_tools
-            register_database_tools(self, self.config)
-            print("[系统] 数据库工具注册成功")
+            if register_database_tools(self, self.config, lazy=True):
+                print("[系统] 数据库工具注册成功")
         except ImportError:
             print("[系统] 数据库工具模块未找到，跳过数据库工具注册")
         except Exception as e:
@@ -81,89 +103,181 @@ class ToolManager:
             params (Dict[str, Any]): 参数字典
             
         Returns:
-            Any: 函数执行结果
+            Any: 函数执行结果；配置了缓存策略的工具在有效期内直接返回缓存结果
+            
+        Raises:
+            ValueError: 未知的工具，或参数不符合工具注册时编译的校验规则
         """
-        if func_name not in self.tools:
+        descriptor = self.registry.get(func_name)
+        if descriptor is None:
             raise ValueError(f"未知的工具函数: {func_name}，请检查当前函数工具是否可用，名称是否正确")
+        params = descriptor.validate(params)
         
-        try:
-            return self.tools[func_name](**params)
-        except TypeError as e:
-            # 提供更友好的参数错误信息
-            sig = inspect.signature(self.tools[func_name])
-            raise ValueError(f"工具'{func_name}'参数错误: {e}。期望参数: {sig}")
+        cache = get_tool_cache(self.config)
+        if cache is not None and cache.cacheable(func_name):
+            hit, result = cache.get(func_name, params)
+            if hit:
+                return result
+        
+        result = descriptor.function(**params)
+        
+        if cache is not None:
+            cache.set(func_name, params, result)
+        return result
+    
+    def invalidate_tool_cache(self, *keys: str, tool: Optional[str] = None) -> None:
+        """
+        清除缓存的工具结果（数据变化时调用）
+        
+        Args:
+            keys: 失效键，如 "product_name=安吉白茶"（见 tool_cache.make_tag）
+            tool: 给出时清除该工具的全部结果
+        """
+        cache = get_tool_cache(self.config)
+        if cache is None:
+            return
+        if keys:
+            cache.invalidate(*keys)
+        if tool:
+            cache.invalidate_tool(tool)
     
-    def execute_action_list(self, action_list: List[Dict[str, Any]]) -> List[Any]:
+    def execute_action_list(self, action_list: List[Any], deadline: Optional[float] = None) -> List[Any]:
         """
-        执行多个工具调用
+        并发执行多个工具调用（同一步中的工具互不依赖）
         
         Args:
-            action_list (List[Dict]): 动作列表
+            action_list (List): 动作列表，元素为 (工具名, 参数字典) 或 {"tool": 工具名, 参数...}
+            deadline (float): 整批截止时间（秒），到期时只返回已完成的结果；
+                              未给出时使用 tools.executor.deadline，0 表示等待全部完成
             
         Returns:
-            List[Any]: 所有工具执行结果的列表
+            List[Any]: 与输入顺序一致的执行结果列表，失败的工具为 {"error": ...}
         """
-        # parsed_actions = self.parse_action_list(action_list) 这个有点问题
-        results = []
-        
-        for tool_name, params in action_list:
-            try:
-                result = self.execute_tool(tool_name, params)
-                results.append(result)
-            except Exception as e:
-                # 记录错误但继续执行其他工具
-                error_msg = f"工具'{tool_name}'执行失败: {e}"
-                results.append({"error": error_msg})
-        
-        return results
+        parsed_actions = []
+        for action in action_list:
+            if isinstance(action, dict):
+                parsed_actions.extend(self.parse_action_list([action]))
+            else:
+                parsed_actions.append(tuple(action))
+        return self._run_actions(self.execute_tool, parsed_actions, deadline)
     
-    def execute_parsed_actions(self, parsed_actions: List[Tuple[str, Dict[str, Any]]]) -> List[Any]:
+    def execute_parsed_actions(self, parsed_actions: List[Tuple[str, Dict[str, Any]]],
+                               deadline: Optional[float] = None) -> List[Any]:
         """
-        执行已解析的工具调用
+        并发执行已解析的工具调用
         
         Args:
             parsed_actions (List[Tuple[str, Dict[str, Any]]]): 已解析的动作列表
+            deadline (float): 整批截止时间（秒），同 execute_action_list
             
         Returns:
-            List[Any]: 所有工具执行结果的列表
+            List[Any]: 与输入顺序一致的执行结果列表
         """
-        results = []
-        
-        for tool_name, params in parsed_actions:
-            try:
-                result = self.tools[tool_name](**params)
-                results.append(result)
-            except Exception as e:
-                # 记录错误但继续执行其他工具
-                error_msg = f"工具'{tool_name}'执行失败: {e}"
-                results.append({"error": error_msg})
+        return self._run_actions(self.execute_tool, parsed_actions, deadline)
+    
+    def _run_actions(self, call, parsed_actions: List[Tuple[str, Dict[str, Any]]],
+                     deadline: Optional[float]) -> List[Any]:
+        """通过共享的工具执行器运行一批调用"""
+        if not parsed_actions:
+            return []
+        return get_tool_executor(self.config).run(call, parsed_actions, self._batch_deadline(deadline))
+    
+    def _batch_deadline(self, deadline: Optional[float]) -> Optional[float]:
+        if deadline is None and self.config is not None:
+            deadline = self.config.get('tools.executor.deadline', 0) or None
+        return deadline
+    
+    def submit_action(self, action: Dict[str, Any]):
+        """
+        立即提交单个动作，不等待结果（流式输出中 action 对象一闭合就开始执行）
         
-        return results
+        Args:
+            action (Dict): {"tool": 工具名, 参数...}
+            
+        Returns:
+            提交凭据，交给 collect_actions 按顺序收集结果
+        """
+        (tool_name, params), = self.parse_action_list([action])
+        return get_tool_executor(self.config).submit(self.execute_tool, tool_name, params)
+    
+    def collect_actions(self, submitted: List[Any], deadline: Optional[float] = None) -> List[Any]:
+        """按提交顺序收集 submit_action 的结果，超时与截止时间同 execute_action_list"""
+        return get_tool_executor(self.config).collect(submitted, self._batch_deadline(deadline))
     
     def get_tool_list(self) -> str:
-        """获取工具列表的描述信息，用于生成系统提示词"""
-        tool_descriptions = []
+        """获取工具列表的描述信息，用于生成系统提示词（缓存到工具注册变化为止）"""
+        return self.registry.render_tool_list()
+    
+    def get_tool_schemas(self) -> List[Dict[str, Any]]:
+        """
+        获取工具的 JSON Schema 描述，用于提供商的原生工具调用
         
-        for tool_name, tool_func in self.tools.items():
-            # 获取函数签名和文档字符串
-            sig = inspect.signature(tool_func)
-            doc = inspect.getdoc(tool_func)
-            signature = f"{tool_name}{sig}"
-            tool_descriptions.append(f"- {signature}: {doc}")
+        带 args_schema 的工具使用其 pydantic 模型生成，其余根据函数签名与文档字符串生成，
+        结果缓存到工具注册变化为止
         
-        return "\n".join(tool_descriptions)
+        Returns:
+            List[Dict]: [{"name", "description", "parameters"}, ...]，按名称排序
+        """
+        return self.registry.schemas()
     
-    def register_tool(self, name: str, func: callable) -> None:
-        """注册新的工具函数"""
+    def register_tool(self, name: str, func: callable = None, description: Optional[str] = None,
+                      args_schema: Optional[type] = None, function: callable = None,
+                      warm_up: Optional[Callable[[], Any]] = None) -> None:
+        """
+        注册新的工具函数，注册时生成描述、参数 Schema 与参数校验器
+        
+        Args:
+            name (str): 工具名
+            func (callable): 工具函数（也可用 function 关键字给出），可以是首次调用时才加载的 LazyFunction
+            description (str): 工具说明，默认使用函数文档字符串
+            args_schema (type): pydantic 参数模型，给出时按模型生成 Schema 并校验参数
+            warm_up (callable): 提前加载工具资源的函数，由 warm_up 调用
+        """
+        func = func or function
+        if func is None:
+            raise ValueError(f"注册工具'{name}'时缺少工具函数")
+        self.registry.register(name, func, description, args_schema, warm_up)
         self.tools[name] = func
     
+    def warm_up(self, names: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        提前加载工具背后的资源（数据库连接、HTTP会话与解析器），避免首次调用的延迟
+        
+        Args:
+            names (List[str]): 只预热这些工具，默认全部
+            
+        Returns:
+            Dict[str, Any]: {工具名: True 或错误信息}，没有可预热资源的工具不列出
+        """
+        results, done = {}, {}
+        for name in names if names is not None else self.registry.names():
+            descriptor = self.registry.get(name)
+            if descriptor is None or descriptor.warm_up is None:
+                continue
+            # 多个工具共用同一资源时只加载一次
+            warm_up = descriptor.warm_up
+            key = (id(getattr(warm_up, "__self__", None)), getattr(warm_up, "__func__", warm_up))
+            if key not in done:
+                try:
+                    warm_up()
+                    done[key] = True
+                except Exception as e:
+                    done[key] = f"{type(e).__name__}: {e}"
+            results[name] = done[key]
+        return results
+    
     def unregister_tool(self, name: str) -> bool:
         """注销工具函数"""
-        if name in self.tools:
-            del self.tools[name]
-            return True
-        return False
+        self.tools.pop(name, None)
+        return self.registry.unregister(name)
+    
+    def close(self) -> None:
+        """释放共享的数据库工具（最后一个使用者释放时关闭连接）"""
+        if self.db_tools is not None:
+            from database_tools import release_database_tools
+            release_database_tools(self.db_tools)
+            self.db_tools = None
     
     def list_tools(self) -> List[str]:
         """返回所有已注册工具的名称列表"""
-        return list(self.tools.keys())
\ No newline at end of file
+        return list(self.tools.keys())
@@ -3,28 +3,78 @@ LLM Agent with React pattern and tool usage
 Enhanced version with better database tool integration
 """
 
+import re
 import logging
+import importlib.util
 import time
 import json
-from typing import Dict, List, Any, Optional, Generator
+import threading
+import uuid
+from typing import Dict, List, Any, Optional, Generator, Tuple
 from config_manager import ConfigManager
 from Toolmanager import ToolManager
 from system_prompts import get_system_prompt
+from react_parser import parse_react_response, ReactStep, StreamingActionParser
+from function_calling import tool_result_message
+from run_memo import RunMemo, create_run_memo
+from tool_cache import NEVER_CACHE
+from deadline import Deadline, DeadlineExceeded, deadline_scope, iter_within
 
 logger = logging.getLogger("LLM_Agent")
 
-# Check if database tools are available
-try:
-    from database_tools import create_database_tools
-    DATABASE_AVAILABLE = True
-except ImportError:
-    DATABASE_AVAILABLE = False
+# The top-level object closing right after the useful part of a reply, with its fence if any
+_OBJECT_CLOSE = re.compile(r'\s*\}(?:\s*```)?')
+
+# Check if database tools are available (without importing the driver; tools connect on first use)
+DATABASE_AVAILABLE = importlib.util.find_spec("mysql") is not None
+if not DATABASE_AVAILABLE:
     logger.warning("Database tools not available")
 
+class _ReplyTailEstimator:
+    """
+    Process-wide estimate of how much a reply keeps generating after its useful part
+    
+    Streams are normally aborted once the action array or final_answer is complete, so the
+    tail is never seen; the first such reply, and every Nth after it, is streamed to the end
+    to seed the estimate and keep it current
+    """
+    
+    def __init__(self, alpha: float = 0.2):
+        self.alpha = alpha
+        self.tokens = 0.0
+        self.seconds = 0.0
+        self.samples = 0
+        self._replies = 0
+        self._lock = threading.Lock()
+    
+    def should_measure(self, every: int) -> bool:
+        with self._lock:
+            self._replies += 1
+            return every > 0 and (self.samples == 0 or self._replies % every == 0)
+    
+    def observe(self, tokens: int, seconds: float):
+        with self._lock:
+            if self.samples == 0:
+                self.tokens, self.seconds = float(tokens), seconds
+            else:
+                self.tokens += self.alpha * (tokens - self.tokens)
+                self.seconds += self.alpha * (seconds - self.seconds)
+            self.samples += 1
+    
+    def estimate(self) -> Optional[Tuple[float, float]]:
+        """(tokens, seconds) of the average tail, or None before the first sample"""
+        with self._lock:
+            return (self.tokens, self.seconds) if self.samples else None
+
+
+_reply_tails = _ReplyTailEstimator()
+
+
 class ReactAgent:
     """ReAct Agent with enhanced database tool integration"""
     
-    def __init__(self, config: Optional[ConfigManager] = None):
+    def __init__(self, config: Optional[ConfigManager] = None, session_id: Optional[str] = None):
+        self.session_id = session_id or uuid.uuid4().hex
         # 支持旧的 AgentConfig 和新的 ConfigManager
         if config is None:
             self.config = ConfigManager()
@@ -59,14 +109,17 @@ class ReactAgent:
         
         # Initialize components
         self.tool_manager = ToolManager(self.config)
-        self.db_tools = None
+        self.api_manager = None
         self.system_prompt = ""
+        self.native_system_prompt = ""
         self.last_prompt_refresh = 0
         
         # Initialize tools and database
         self._init_tools()
         self._init_database_tools()
         self._refresh_system_prompt()
+        if self.config.get('tools.warm_up', False):
+            self.warm_up()
         
         logger.info("ReActAgent 初始化完成")
     
@@ -77,12 +130,6 @@ class ReactAgent:
             from agent_tools import register_agent_tools
             register_agent_tools(self.tool_manager)
             
-            # Register database tools if available
-            if DATABASE_AVAILABLE:
-                from database_agent_tools import register_database_tools
-                db_config = self._get_database_config()
-                register_database_tools(self.tool_manager, db_config)
-            
             logger.info("工具初始化完成")
         except Exception as e:
             logger.error(f"工具初始化失败: {e}")
@@ -100,7 +147,12 @@ class ReactAgent:
         return db_config_dict
     
     def _init_database_tools(self):
-        """Initialize database tools (if enabled)"""
+        """
+        Initialize database tools (if enabled)
+        
+        The ToolManager registers the database tools without connecting; the first
+        database tool call (or warm_up) joins the process-wide shared connection
+        """
         if not self.config.get('database.enabled', False):
             logger.info("数据库功能已禁用")
             return
@@ -109,19 +161,47 @@ class ReactAgent:
             logger.warning("数据库依赖未安装，跳过数据库功能")
             return
         
-        try:
-            db_config = self._get_database_config()
-            if db_config['enable_database']:
-                self.db_tools = create_database_tools(db_config)
-                logger.info("数据库工具初始化成功")
-        except Exception as e:
-            logger.error(f"数据库工具初始化失败: {e}")
-            self.db_tools = None
+        if "search_database" not in self.tool_manager.tools:
+            from database_agent_tools import register_database_tools
+            register_database_tools(self.tool_manager, self._get_database_config(), lazy=True)
+        logger.info("数据库工具初始化成功（首次调用时连接）")
+    
+    @property
+    def db_tools(self):
+        """The shared database tools, once connected"""
+        return self.tool_manager.db_tools
+    
+    def warm_up(self) -> Dict[str, Any]:
+        """
+        Load tool resources (database connection, HTTP session, parsers) and the API
+        client ahead of the first request, for latency-sensitive deployments
+        """
+        results = self.tool_manager.warm_up()
+        self._get_api_manager()
+        failed = {name: error for name, error in results.items() if error is not True}
+        if failed:
+            logger.warning(f"工具预热失败: {failed}")
+        else:
+            logger.info(f"工具预热完成: {len(results)} 个工具")
+        return results
+    
+    def close(self):
+        """Release shared resources held by this agent (the shared database connection)"""
+        self.tool_manager.close()
+    
+    def _get_api_manager(self):
+        """Get the agent's API manager, creating it on first use"""
+        if self.api_manager is None:
+            from api_manager import APIManager
+            self.api_manager = APIManager(self.config)
+        return self.api_manager
     
     def _refresh_system_prompt(self):
         """Refresh system prompt based on configuration"""
         prompt_type = self.config.get('system_prompt.type', 'database_enhanced')
-        self.system_prompt = get_system_prompt(prompt_type)
+        self.system_prompt = get_system_prompt(prompt_type, self.tool_manager.get_tool_list())
+        # 原生工具调用模式下工具描述通过 tools 字段发送，提示词中不再列出
+        self.native_system_prompt = get_system_prompt(prompt_type)
         self.last_prompt_refresh = time.time()
         logger.info(f"系统提示已加载，类型: {prompt_type}")
     
@@ -131,88 +211,95 @@ class ReactAgent:
         return time.time() - self.last_prompt_refresh > interval
     
     def run(self, user_input: str, timeout: int = 60) -> Dict[str, Any]:
-        """Run agent with user input and return result"""
+        """
+        Run agent with user input and return result
+        
+        Model calls, retries, tools and subprocesses only get what is left of ``timeout``;
+        when it runs out the run returns status "timeout" with the partial results so far
+        """
+        deadline = Deadline(timeout)
+        with deadline_scope(deadline):
+            return self._run(user_input, deadline)
+    
+    def _run(self, user_input: str, deadline: Deadline) -> Dict[str, Any]:
         start_time = time.time()
+        messages = []
+        actions = 0
         
         try:
             # Refresh prompt if needed
             if self._should_refresh_prompt():
                 self._refresh_system_prompt()
             
-            # Initialize API manager
-            from api_manager import APIManager
-            api_manager = APIManager(self.config)
+            # Reuse the agent's API manager (shared HTTP pool underneath)
+            api_manager = self._get_api_manager()
+            model = self.config.get('api.deepseek.default_model', 'deepseek-chat')
+            native = api_manager.native_tools_enabled(model)
             
             # Prepare initial messages
             messages = [
-                {"role": "system", "content": self.system_prompt},
+                {"role": "system", "content": self.native_system_prompt if native else self.system_prompt},
                 {"role": "user", "content": user_input}
             ]
             
             max_steps = self.config.get('max_steps', 10)
             current_step = 0
+            memo = create_run_memo(self.config)
             
             while current_step < max_steps:
-                # Check timeout
-                if time.time() - start_time > timeout:
-                    return {
-                        "status": "timeout",
-                        "message": f"任务超时（{timeout}秒）",
-                        "elapsed_time": time.time() - start_time
-                    }
+                # Get LLM response as a parsed step (assistant message appended to history)
+                deadline.check("LLM请求")
+                step = self._request_step(api_manager, messages, model, native)
                 
-                # Get LLM response
-                response = api_manager.chat_completion(
-                    messages=messages,
-                    model=self.config.get('api.deepseek.default_model', 'deepseek-chat'),
-                    temperature=0.1
-                )
-                
-                if not response:
+                if step is None:
                     return {
                         "status": "error",
                         "message": "API调用失败",
                         "elapsed_time": time.time() - start_time
                     }
                 
-                # Add assistant response to messages
-                messages.append({"role": "assistant", "content": response})
-                
-                # Check if response contains action
-                if self._contains_action(response):
-                    # Parse and execute action
-                    action_result = self._execute_action(response)
-                    
-                    # Add action result to messages
-                    messages.append({"role": "user", "content": f"Action Result: {action_result}"})
-                    
-                    # Check if we should continue
-                    if self._is_final_result(action_result):
+                if step.has_action:
+                    deadline.check("工具执行")
+                    loop = memo.observe_step(step.actions) if memo else None
+                    if loop:
+                        logger.warning(f"检测到动作循环，提前结束: {loop}")
                         return {
-                            "status": "success",
-                            "answer": response,
-                            "actions": current_step + 1,
+                            "status": "loop_detected",
+                            "message": loop,
+                            "actions": actions,
                             "elapsed_time": time.time() - start_time
                         }
-                else:
-                    # No action, return final answer
+                    messages.extend(self._execute_actions(step, native, memo=memo))
+                    actions += 1
+                elif step.is_final:
                     return {
                         "status": "success", 
-                        "answer": response,
-                        "actions": current_step,
+                        "answer": step.final_answer,
+                        "actions": actions,
                         "elapsed_time": time.time() - start_time
                     }
+                else:
+                    messages.append({"role": "user", "content": self._format_error_message(step)})
                 
                 current_step += 1
             
             return {
                 "status": "max_steps_reached",
                 "answer": "达到最大步骤限制",
-                "actions": current_step,
+                "actions": actions,
                 "elapsed_time": time.time() - start_time
             }
             
         except Exception as e:
+            if isinstance(e, DeadlineExceeded) or deadline.expired:
+                logger.warning(f"Agent执行超时，返回部分结果: {e}")
+                return {
+                    "status": "timeout",
+                    "message": f"任务超时（{deadline.timeout}秒）",
+                    "partial": self._partial_result(messages),
+                    "actions": actions,
+                    "elapsed_time": time.time() - start_time
+                }
             logger.error(f"Agent执行失败: {e}")
             return {
                 "status": "error",
@@ -221,11 +308,56 @@ class ReactAgent:
             }
     
     def run_stream(self, user_input: str, timeout: int = 60) -> Generator[str, None, Dict[str, Any]]:
-        """Run agent with streaming output"""
+        """
+        Run agent with streaming output: the execution transcript (model output, tool results)
+        
+        The deadline works as in run(); it is only made current around each blocking step,
+        since a generator cannot hold a context across its yields
+        """
+        return (yield from self._select_stream(user_input, timeout, "text"))
+    
+    def run_events(self, user_input: str, timeout: int = 60) -> Generator[Dict[str, Any], None, Dict[str, Any]]:
+        """
+        Run agent with streaming output as typed events for end users, without the model's raw
+        output, thoughts or tool observations:
+        
+        - {"type": "answer", "content": ...}: the next piece of the final_answer text
+        - {"type": "answer_reset"}: the answer streamed so far was withdrawn (an action followed)
+        - {"type": "tool_start", "step": ..., "tools": [...]}
+        - {"type": "tool_end", "step": ..., "tools": [...], "elapsed": ...}
+        
+        Returns the same result as run_stream
+        """
+        return (yield from self._select_stream(user_input, timeout, "event"))
+    
+    def _select_stream(self, user_input: str, timeout: int, kind: str) -> Generator[Any, None, Dict[str, Any]]:
+        """Pass on one kind of item ("text" or "event") from _run_stream"""
+        stream = self._run_stream(user_input, timeout)
+        try:
+            while True:
+                try:
+                    item_kind, value = next(stream)
+                except StopIteration as stop:
+                    return stop.value
+                if item_kind == kind:
+                    yield value
+        finally:
+            stream.close()
+    
+    def _run_stream(self, user_input: str, timeout: int) -> Generator[Tuple[str, Any], None, Dict[str, Any]]:
+        """Run agent, yielding ("text", transcript piece) and ("event", typed event) items"""
         start_time = time.time()
+        deadline = Deadline(timeout)
+        messages = []
         stats = {
             'steps': 0,
             'api_calls': 0,
+            'first_token_latency': None,
+            'speculative_actions': 0,
+            'aborted_streams': 0,
+            'tokens_saved': 0,
+            'latency_saved': 0.0,
+            'memo_hits': 0,
             'elapsed_time': 0
         }
         
@@ -234,178 +366,354 @@ class ReactAgent:
             if self._should_refresh_prompt():
                 self._refresh_system_prompt()
             
-            yield f"系统提示已加载，提供商: {self.config.get('api.default_provider', 'deepseek')}, " \
-                  f"模型: {self.config.get('api.deepseek.default_model', 'deepseek-chat')}\n"
+            yield "text", f"系统提示已加载，提供商: {self.config.get('api.default_provider', 'deepseek')}, " \
+                          f"模型: {self.config.get('api.deepseek.default_model', 'deepseek-chat')}\n"
             
-            # Initialize API manager
-            from api_manager import APIManager
-            api_manager = APIManager(self.config)
+            # Reuse the agent's API manager (shared HTTP pool underneath)
+            api_manager = self._get_api_manager()
+            model = self.config.get('api.deepseek.default_model', 'deepseek-chat')
+            native = api_manager.native_tools_enabled(model)
             
             # Prepare initial messages
             messages = [
-                {"role": "system", "content": self.system_prompt},
+                {"role": "system", "content": self.native_system_prompt if native else self.system_prompt},
                 {"role": "user", "content": user_input}
             ]
             
             max_steps = self.config.get('max_steps', 10)
             current_step = 0
+            memo = create_run_memo(self.config)
             
             while current_step < max_steps:
-                # Check timeout
-                if time.time() - start_time > timeout:
-                    yield f"\n[超时] 任务执行超过{timeout}秒\n"
-                    stats['elapsed_time'] = time.time() - start_time
-                    return {"status": "timeout", "stats": stats}
-                
-                # Get LLM response
-                response = api_manager.chat_completion(
-                    messages=messages,
-                    model=self.config.get('api.deepseek.default_model', 'deepseek-chat'),
-                    temperature=0.1
-                )
+                deadline.check("LLM请求")
+                yield "text", "\n[思考] "
+                dispatched = []
+                if native:
+                    # Structured tool calls arrive in one non-streamed reply
+                    with deadline_scope(deadline):
+                        step = self._request_step(api_manager, messages, model, native)
+                    if stats['first_token_latency'] is None:
+                        stats['first_token_latency'] = time.time() - start_time
+                    if step is not None:
+                        yield "text", step.thought or ""
+                else:
+                    # Stream LLM response token by token
+                    response = yield from self._stream_reply(api_manager, messages, model, stats,
+                                                             dispatched, start_time, memo, deadline)
+                    step = None
+                    if response:
+                        # Add assistant response to messages
+                        messages.append({"role": "assistant", "content": response})
+                        step = self._parse_response(response)
                 stats['api_calls'] += 1
                 
-                if not response:
-                    yield "\n[错误] API调用失败\n"
+                if step is None:
+                    yield "text", "\n[错误] API调用失败\n"
                     stats['elapsed_time'] = time.time() - start_time
                     return {"status": "error", "stats": stats}
                 
-                yield f"\n[思考] {response}\n"
+                yield "text", "\n"
                 
-                # Add assistant response to messages
-                messages.append({"role": "assistant", "content": response})
-                
-                # Check if response contains action
-                if self._contains_action(response):
-                    yield "\n[执行动作]...\n"
-                    
-                    # Parse and execute action
-                    action_result = self._execute_action(response)
-                    stats['steps'] += 1
-                    
-                    yield f"[动作结果] {action_result}\n"
-                    
-                    # Add action result to messages
-                    messages.append({"role": "user", "content": f"Action Result: {action_result}"})
-                    
-                    # Check if we should continue
-                    if self._is_final_result(action_result):
+                if step.has_action:
+                    deadline.check("工具执行")
+                    loop = memo.observe_step(step.actions) if memo else None
+                    if loop:
+                        stats['memo_hits'] = memo.hits
                         stats['elapsed_time'] = time.time() - start_time
-                        yield f"\n[完成] 任务完成，步骤: {stats['steps']}\n"
-                        return {"status": "success", "stats": stats}
-                else:
-                    # No action, return final answer
+                        yield "text", f"\n[循环] {loop}，提前结束\n"
+                        return {"status": "loop_detected", "message": loop, "stats": stats}
+                    tools = [action["tool"] for action in step.actions]
+                    yield "text", "\n[执行动作]...\n"
+                    yield "event", {"type": "tool_start", "step": stats['steps'] + 1, "tools": tools}
+                    tools_started = time.time()
+                    with deadline_scope(deadline):
+                        observations = self._execute_actions(step, native, dispatched, memo)
+                    stats['steps'] += 1
+                    stats['memo_hits'] = memo.hits if memo else 0
+                    yield "text", f"[动作结果] {' '.join(msg['content'] for msg in observations)}\n"
+                    yield "event", {"type": "tool_end", "step": stats['steps'], "tools": tools,
+                                    "elapsed": round(time.time() - tools_started, 3)}
+                    messages.extend(observations)
+                elif step.is_final:
                     stats['elapsed_time'] = time.time() - start_time
-                    yield f"\n[完成] 直接回答，步骤: {stats['steps']}\n"
-                    return {"status": "success", "stats": stats}
+                    yield "text", f"\n[完成] 任务完成，步骤: {stats['steps']}\n"
+                    return {"status": "success", "answer": step.final_answer, "stats": stats}
+                else:
+                    yield "text", f"\n[格式错误] {step.error_summary() or '缺少 action 或 final_answer'}\n"
+                    messages.append({"role": "user", "content": self._format_error_message(step)})
                 
                 current_step += 1
             
             stats['elapsed_time'] = time.time() - start_time
-            yield f"\n[警告] 达到最大步骤限制 ({max_steps})\n"
+            yield "text", f"\n[警告] 达到最大步骤限制 ({max_steps})\n"
             return {"status": "max_steps_reached", "stats": stats}
             
         except Exception as e:
+            if isinstance(e, DeadlineExceeded) or deadline.expired:
+                stats['elapsed_time'] = time.time() - start_time
+                yield "text", f"\n[超时] 任务执行超过{timeout}秒，返回部分结果\n"
+                return {"status": "timeout", "partial": self._partial_result(messages), "stats": stats}
             logger.error(f"Agent流式执行失败: {e}")
             stats['elapsed_time'] = time.time() - start_time
-            yield f"\n[错误] 执行失败: {str(e)}\n"
+            yield "text", f"\n[错误] 执行失败: {str(e)}\n"
             return {"status": "error", "stats": stats}
     
-    def _contains_action(self, response: str) -> bool:
-        """Check if response contains action markers"""
-        action_indicators = ["动作", "action", "工具", "tool", "搜索", "search", "查询", "check"]
-        return any(indicator in response.lower() for indicator in action_indicators)
+    def _build_request_messages(self, messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """
+        Fit the conversation into the configured context window for the next request
+        
+        The oldest turns are replaced by the session's latest finished summary, and a newer one
+        is started in the background so it runs alongside the model call and the tool execution
+        """
+        from token_counter import get_token_counter
+        from conversation_summarizer import get_conversation_summarizer
+        
+        summarizer = get_conversation_summarizer(self.config)
+        if summarizer is not None:
+            summarizer.schedule(self.session_id, messages)
+            messages = summarizer.apply(self.session_id, messages)
+        
+        context_window = self.config.get('conversation.context_window', 8000)
+        reserve = self.config.get('conversation.response_reserve', 1024)
+        return get_token_counter().fit_messages(
+            messages,
+            max_prompt_tokens=max(context_window - reserve, 0),
+            max_history=self.config.get('conversation.max_history', None),
+            pinned=1  # always keep the user's original question
+        )
     
-    def _execute_action(self, response: str) -> str:
-        """Parse and execute action from response"""
+    def _stream_reply(self, api_manager, messages: List[Dict[str, Any]], model: str, stats: Dict[str, Any],
+                      dispatched: List, start_time: float, memo: Optional[RunMemo] = None,
+                      deadline: Optional[Deadline] = None) -> Generator[Tuple[str, Any], None, str]:
+        """
+        Stream one reply to the caller and return its text
+        
+        The raw chunks go to the transcript; the final_answer text, as far as it has arrived,
+        goes out as "answer" events (withdrawn with "answer_reset" if an action follows it).
+        Each action object is dispatched as soon as it closes, except tools with side effects
+        (tool_cache.NEVER_CACHE), which wait for the parsed reply. Once the action array or the
+        final_answer is complete the upstream request is aborted; the output tokens and time
+        this saves are estimated from replies that are occasionally streamed to the end
+        """
+        speculative = self.config.get('tools.speculative_dispatch', True)
+        early_stop = self.config.get('conversation.early_stop', True)
+        parser = StreamingActionParser()
+        measure = (speculative or early_stop) and _reply_tails.should_measure(
+            self.config.get('conversation.early_stop_measure_every', 20))
+        
+        parts = []
+        shown = ""
+        stop_at, stop_time, aborted = None, None, False
+        stream = api_manager.call_api_stream(
+            messages=self._build_request_messages(messages),
+            model=model,
+            temperature=self._request_temperature()
+        )
         try:
-            # Enhanced action parsing with database tool priority
-            response_lower = response.lower()
-            
-            # Check for product stock queries
-            if "库存" in response_lower or "stock" in response_lower or "有货" in response_lower:
-                product_name = self._extract_product_name(response)
-                if product_name:
-                    return self.tool_manager.execute_tool("check_product_stock", {"product_name": product_name})
-            
-            # Check for order status queries
-            if "订单" in response_lower or "order" in response_lower:
-                order_id = self._extract_order_id(response)
-                if order_id:
-                    return self.tool_manager.execute_tool("check_order_status", {"order_id": order_id})
-            
-            # Check for general database searches
-            if "数据库" in response_lower or "database" in response_lower:
-                query = self._extract_query(response, ["搜索", "查询", "search", "find"])
-                if query:
-                    return self.tool_manager.execute_tool("search_database", {"query": query})
-            
-            # Fallback to tool manager's action parsing
-            return self.tool_manager.parse_and_execute(response)
-            
-        except Exception as e:
-            return f"动作执行失败: {str(e)}"
+            # Stops taking chunks once the deadline passes; the partial reply is kept
+            for chunk in iter_within(deadline, stream):
+                if stats['first_token_latency'] is None:
+                    stats['first_token_latency'] = time.time() - start_time
+                parts.append(chunk)
+                if stop_at is not None:
+                    # The tail of a measured reply is not shown
+                    continue
+                yield "text", chunk
+                
+                for action in parser.feed(chunk):
+                    if speculative and action["tool"] not in NEVER_CACHE:
+                        with deadline_scope(deadline):
+                            dispatched.append(self._dispatch_action(action, memo))
+                        stats['speculative_actions'] += 1
+                answer = parser.partial_final_answer() or ""
+                if not answer.startswith(shown):
+                    yield "event", {"type": "answer_reset"}
+                    shown = ""
+                if len(answer) > len(shown):
+                    yield "event", {"type": "answer", "content": answer[len(shown):]}
+                    shown = answer
+                if parser.action_closed and speculative:
+                    stop_at = parser.action_end
+                elif parser.final_answer_end is not None and early_stop:
+                    stop_at = parser.final_answer_end
+                if stop_at is not None:
+                    stop_time = time.time()
+                    if not measure and not parser.complete:
+                        aborted = True
+                        break
+        finally:
+            stream.close()
+        
+        response = "".join(parts)
+        if stop_at is None:
+            return response
+        if aborted:
+            stats['aborted_streams'] += 1
+            estimate = _reply_tails.estimate()
+            if estimate is None:
+                # No reply has been streamed to the end yet: the saving is unknown, not zero
+                logger.info("回复已完整，提前结束生成 - 暂无完整回复样本，不估算节省量")
+            else:
+                tokens, seconds = estimate
+                stats['tokens_saved'] += round(tokens)
+                stats['latency_saved'] += seconds
+                logger.info(f"回复已完整，提前结束生成 - 预计节省 Tokens: {round(tokens)}, 耗时: {seconds:.2f}s")
+        elif measure:
+            from token_counter import get_token_counter
+            _reply_tails.observe(get_token_counter().count_text(response[stop_at:]), time.time() - stop_time)
+        return self._trim_reply(response, stop_at, parser)
     
-    def _extract_product_name(self, response: str) -> str:
-        """Extract product name from response"""
-        product_names = [
-            "青城山腊肉", "安吉白茶", "元阳红米", "苗银手镯", 
-            "宏村竹笋", "阳朔金桔", "湘西腊鱼", "婺源皇菊"
-        ]
+    @staticmethod
+    def _trim_reply(response: str, stop_at: int, parser: StreamingActionParser) -> str:
+        """
+        Drop whatever followed the useful part of a reply, keeping the history valid JSON
         
-        for product in product_names:
-            if product in response:
-                return product
+        The object's own closing brace (and fence) is kept when the reply has it right there;
+        only a reply cut before the object closed gets a synthesized one
+        """
+        closing = _OBJECT_CLOSE.match(response, stop_at)
+        trimmed = response[:closing.end()] if closing else response[:stop_at] + "\n}"
+        if "```" in response[:parser.start] and not trimmed.endswith("```"):
+            trimmed += "\n```"
+        return trimmed
+    
+    def _request_temperature(self) -> float:
+        """
+        Sampling temperature for agent requests (conversation.agent_temperature)
+        
+        Unset, it is 0 while the response cache is on and does not cache sampled replies,
+        so repeated questions can be answered from the cache; otherwise 0.1
+        """
+        configured = self.config.get('conversation.agent_temperature')
+        if configured is not None:
+            return configured
+        if (self.config.get('api.cache.enabled', False)
+                and not self.config.get('api.cache.allow_nonzero_temperature', False)):
+            return 0.0
+        return 0.1
+    
+    def _request_step(self, api_manager, messages: List[Dict[str, Any]], model: str, native: bool) -> Optional[ReactStep]:
+        """Request the next reply, append it to the history and parse it; None when the reply is empty"""
+        request_messages = self._build_request_messages(messages)
+        if native:
+            reply = api_manager.call_api_with_tools(
+                messages=request_messages,
+                tools=self.tool_manager.get_tool_schemas(),
+                model=model,
+                temperature=self._request_temperature()
+            )
+            if not reply["content"] and not reply["tool_calls"]:
+                return None
+            messages.append(reply["message"])
+            # Structured calls need no parsing or repair
+            return ReactStep(
+                thought=reply["content"] if reply["tool_calls"] else None,
+                actions=[{"tool": call["name"], **call["arguments"]} for call in reply["tool_calls"]],
+                final_answer=None if reply["tool_calls"] else reply["content"],
+                data=reply,
+                format="native"
+            )
         
-        # If no specific product found, try to extract from context
-        if "腊肉" in response:
-            return "青城山腊肉"
-        elif "白茶" in response:
-            return "安吉白茶"
-        elif "红米" in response:
-            return "元阳红米"
+        response = api_manager.call_api(messages=request_messages, model=model, temperature=self._request_temperature())
+        if not response:
+            return None
+        messages.append({"role": "assistant", "content": response})
+        return self._parse_response(response)
+    
+    def _parse_response(self, response: str) -> ReactStep:
+        """Parse a model reply in a single pass (JSON, text ReAct or plain answer)"""
+        step = parse_react_response(response)
+        if step.errors:
+            logger.warning(f"回复格式有误（{step.format}）: {step.error_summary()}")
+        return step
+    
+    def _dispatch_action(self, action: Dict[str, Any], memo: Optional[RunMemo] = None):
+        """
+        Submit one tool call without waiting; returns (action, ticket or known result)
         
-        return ""
+        A call identical to an earlier one in the same run reuses its result, or its ticket
+        while it is still running
+        """
+        if memo is not None:
+            found, value = memo.get(action)
+            if found:
+                return action, value
+        try:
+            ticket = self.tool_manager.submit_action(action)
+        except Exception as e:
+            return action, {"error": f"动作执行失败: {e}"}
+        if memo is not None:
+            memo.put(action, ticket)
+        return action, ticket
     
-    def _extract_order_id(self, response: str) -> str:
-        """Extract order ID from response"""
-        import re
+    def _execute_actions(self, step: ReactStep, native: bool = False, dispatched: Optional[List] = None,
+                         memo: Optional[RunMemo] = None) -> List[Dict[str, Any]]:
+        """
+        Execute the parsed tool calls and format the results as the messages to append
+        
+        Calls already dispatched while the reply was streaming are reused instead of run again;
+        dispatched calls the parsed reply does not contain are cancelled, or collected and
+        discarded when they already started
+        """
+        pending = list(dispatched or [])
+        tickets = []
+        for action in step.actions:
+            index = next((index for index, (sent, _) in enumerate(pending) if sent == action), None)
+            if index is not None:
+                tickets.append(pending.pop(index)[1])
+            else:
+                tickets.append(self._dispatch_action(action, memo)[1])
         
-        # Look for patterns like "订单3", "order 3", "订单 3"
-        patterns = [
-            r"订单\s*(\d+)",
-            r"order\s*(\d+)",
-            r"订单号\s*(\d+)",
-            r"order\s*#\s*(\d+)"
-        ]
+        orphans, cancelled = [], 0
+        in_use = {id(ticket) for ticket in tickets}
+        for action, ticket in pending:
+            # Identical calls share one ticket (see RunMemo); keep it when the reply still needs it
+            if not isinstance(ticket, tuple) or id(ticket) in in_use:
+                continue
+            if ticket[1].cancel():
+                cancelled += 1
+                if memo is not None:
+                    # Forget the cancelled ticket so a later identical call runs again
+                    memo.put(action, {"error": "已取消"})
+            else:
+                orphans.append((action, ticket))
+        if cancelled or orphans:
+            logger.info(f"回复中不存在的预执行动作: 已取消 {cancelled} 个，等待结束 {len(orphans)} 个")
         
-        for pattern in patterns:
-            match = re.search(pattern, response, re.IGNORECASE)
-            if match:
-                return match.group(1)
+        # Submitted calls are (tool, future, submitted_at) tickets; a ticket shared by identical
+        # calls is collected once
+        owned = tickets + [ticket for _, ticket in orphans]
+        submitted = list({id(ticket): ticket for ticket in owned if isinstance(ticket, tuple)}.values())
+        collected = dict(zip((id(ticket) for ticket in submitted), self.tool_manager.collect_actions(submitted)))
+        results = [collected[id(ticket)] if isinstance(ticket, tuple) else ticket for ticket in owned]
+        if memo is not None:
+            for action, result in zip(step.actions + [action for action, _ in orphans], results):
+                memo.put(action, result)
+        results = results[:len(step.actions)]
         
-        # If no pattern found, look for standalone numbers in order context
-        if "订单" in response or "order" in response.lower():
-            numbers = re.findall(r'\b\d+\b', response)
-            if numbers:
-                return numbers[0]  # Return first number found
+        if native:
+            # One tool message per call, matched by call id
+            return [tool_result_message(call["id"], result)
+                    for call, result in zip(step.data["tool_calls"], results)]
         
-        return ""
+        observation = results[0] if len(results) == 1 else results
+        return [{"role": "user", "content": json.dumps({"observation": observation}, ensure_ascii=False, default=str)}]
     
-    def _extract_query(self, response: str, keywords: List[str]) -> str:
-        """Extract query from response based on keywords"""
-        for keyword in keywords:
-            if keyword in response:
-                # Simple extraction - in practice, use more sophisticated NLP
-                parts = response.split(keyword, 1)
-                if len(parts) > 1:
-                    query = parts[1].strip()
-                    # Clean up the query
-                    query = query.split('。')[0].split('！')[0].split('？')[0].strip()
-                    return query
-        return ""
+    def _partial_result(self, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """What the run produced before it was cut off: the last thought and all tool observations"""
+        last_thought = None
+        observations = []
+        for msg in messages[2:]:
+            content = msg.get("content") or ""
+            if msg["role"] == "assistant":
+                last_thought = content if msg.get("tool_calls") else (parse_react_response(content).thought or last_thought)
+            elif msg["role"] == "tool" or content.startswith('{"observation"'):
+                observations.append(content)
+        return {"last_thought": last_thought, "observations": observations}
     
-    def _is_final_result(self, action_result: str) -> bool:
-        """Check if action result indicates final answer"""
-        final_indicators = ["完成", "成功", "找到", "final", "success", "found", "库存", "状态"]
-        return any(indicator in action_result.lower() for indicator in final_indicators)
\ No newline at end of file
+    def _format_error_message(self, step: ReactStep) -> str:
+        """Tell the model why its reply could not be used, with the error positions"""
+        detail = step.error_summary() or "回复中既没有 action 也没有 final_answer"
+        return json.dumps({
+            "Incorrect_answer_format": f"回答解析失败（{detail}），请检查回复是否为合理json格式后重新回答"
+        }, ensure_ascii=False)
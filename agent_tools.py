@@ -1,7 +1,31 @@
 import subprocess
 import os
+import threading
 from typing import List, Dict, Any, Optional
 
+from deadline import remaining_time
+
+_web_lock = threading.Lock()
+_web = None
+
+
+def _web_resources():
+    """
+    网页工具共用的资源，首次使用时创建：(requests.Session, BeautifulSoup)
+    requests 与 bs4 只在第一次调用网页工具（或预热）时导入，会话在进程内复用连接
+    """
+    global _web
+    if _web is None:
+        with _web_lock:
+            if _web is None:
+                import requests
+                from bs4 import BeautifulSoup
+                session = requests.Session()
+                session.headers['User-Agent'] = ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+                                                 '(KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36')
+                _web = (session, BeautifulSoup)
+    return _web
+
 
 def is_web_environment() -> bool:
     """检测是否在Web环境中运行"""
@@ -65,10 +89,14 @@ def run_terminal_command(command: str, level: str = "dangerous") -> Dict[str, An
         confirm = "y"
 
     try:
-        result = subprocess.run(command, shell=True, capture_output=True, text=True, check=True,encoding='utf-8',errors='replace',)
+        # 运行有截止时间时，命令只能使用剩余的时间
+        timeout = remaining_time(None, "执行终端命令")
+        result = subprocess.run(command, shell=True, capture_output=True, text=True, check=True,encoding='utf-8',errors='replace',timeout=timeout)
         return {"status": "success", "output": result.stdout}
     except subprocess.CalledProcessError as e:
         return {"status": "error", "returncode": e.returncode, "error": e.stderr}
+    except (subprocess.TimeoutExpired, TimeoutError) as e:
+        return {"status": "timeout", "error": f"命令未在截止时间前完成: {e}"}
     except Exception as e:
         return {"status": "exception", "error": str(e)}
 
@@ -85,19 +113,14 @@ def search_web(query: str, num_results: int = 5) -> Dict[str, Any]:
         dict: 包含搜索结果的字典，包含标题、链接和摘要
     """
     try:
-        import requests
-        from bs4 import BeautifulSoup
         import urllib.parse
+        session, BeautifulSoup = _web_resources()
         
         # 使用DuckDuckGo搜索（无需API key）
         encoded_query = urllib.parse.quote_plus(query)
         url = f"https://duckduckgo.com/html/?q={encoded_query}"
         
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        
-        response = requests.get(url, headers=headers, timeout=10)
+        response = session.get(url, timeout=remaining_time(10, "网页搜索"))
         soup = BeautifulSoup(response.content, 'html.parser')
         
         results = []
@@ -144,14 +167,9 @@ def fetch_webpage_content(url: str, max_length: int = 2000) -> Dict[str, Any]:
         dict: 包含网页标题和内容的字典
     """
     try:
-        import requests
-        from bs4 import BeautifulSoup
-        
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
+        session, BeautifulSoup = _web_resources()
         
-        response = requests.get(url, headers=headers, timeout=15)
+        response = session.get(url, timeout=remaining_time(15, "获取网页内容"))
         response.raise_for_status()
         
         soup = BeautifulSoup(response.content, 'html.parser')
@@ -275,6 +293,7 @@ def create_and_run_python_file(file_path: str, file_name: str, code: str, conda_
     import tempfile
     import sys
     
+    timeout = 60
     try:
         # 确保文件名以.py结尾
         if not file_name.endswith('.py'):
@@ -301,7 +320,8 @@ def create_and_run_python_file(file_path: str, file_name: str, code: str, conda_
             # 使用当前Python环境执行
             command = f'python "{full_file_path}"'
         
-        # 执行文件
+        # 执行文件（运行有截止时间时不超过剩余时间）
+        timeout = remaining_time(60, "执行Python文件")
         result = subprocess.run(
             command, 
             shell=True, 
@@ -310,7 +330,7 @@ def create_and_run_python_file(file_path: str, file_name: str, code: str, conda_
             cwd=file_path,  # 设置工作目录
             encoding='utf-8',
             errors='replace',
-            timeout=60  # 60秒超时
+            timeout=timeout
         )
         
         # 准备返回结果
@@ -345,7 +365,7 @@ def create_and_run_python_file(file_path: str, file_name: str, code: str, conda_
         
         return execution_result
         
-    except subprocess.TimeoutExpired:
+    except (subprocess.TimeoutExpired, TimeoutError):
         # 超时情况下也尝试删除文件
         cleanup_result = {}
         if auto_delete and 'full_file_path' in locals():
@@ -357,7 +377,7 @@ def create_and_run_python_file(file_path: str, file_name: str, code: str, conda_
         
         return {
             "status": "timeout",
-            "error": "代码执行超时（60秒），可能存在无限循环或长时间运行的操作",
+            "error": f"代码执行超时（{timeout:.3g}秒），可能存在无限循环或长时间运行的操作",
             "file_path": full_file_path if 'full_file_path' in locals() else None,
             **cleanup_result
         }
@@ -382,4 +402,11 @@ def create_and_run_python_file(file_path: str, file_name: str, code: str, conda_
             "error": f"创建或执行Python文件时发生异常: {str(e)}",
             "file_path": full_file_path if 'full_file_path' in locals() else None,
             **cleanup_result
-        }
\ No newline at end of file
+        }
+
+# 工具背后需要提前加载的资源，供 ToolManager.warm_up 使用
+TOOL_RESOURCES = {
+    "search_web": _web_resources,
+    "fetch_webpage_content": _web_resources,
+    "search_and_summarize": _web_resources,
+}
@@ -0,0 +1,161 @@
+"""
+批量调用 - 在共享限流下并发执行大量相互独立的 call_api 请求
+结果按完成顺序流式返回，也可按输入顺序汇总；单条失败不影响其他请求。
+指定结果文件（JSONL）后每条结果完成即追加写入，任务中断后重跑会跳过已成功的条目
+"""
+import os
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, asdict
+from typing import Dict, List, Any, Optional, Iterator, Callable
+
+from logger import logger
+from response_cache import ResponseCache
+
+
+@dataclass
+class BatchResult:
+    """单条批量请求的结果"""
+    index: int
+    content: Optional[str] = None
+    success: bool = True
+    error: Optional[str] = None
+    duration: float = 0.0
+    resumed: bool = False  # 来自结果文件，本次未重新请求
+
+
+class BatchResultsFile:
+    """批量任务的结果文件，每行一条 JSON，用于断点续跑"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+    def load(self, keys: List[str]) -> Dict[int, BatchResult]:
+        """读取已成功的结果；输入内容已变化的条目（key 不一致）会被忽略"""
+        completed: Dict[int, BatchResult] = {}
+        if not os.path.exists(self.path):
+            return completed
+
+        partial = False
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line_no, line in enumerate(f, 1):
+                partial = not line.endswith("\n")
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # 进程中断时最后一行可能不完整
+                    logger.warning(f"跳过结果文件中无法解析的第 {line_no} 行: {self.path}")
+                    continue
+                index = record.get("index")
+                if (not record.get("success") or not isinstance(index, int)
+                        or index >= len(keys) or record.get("key") != keys[index]):
+                    continue
+                completed[index] = BatchResult(
+                    index=index,
+                    content=record.get("content"),
+                    duration=record.get("duration", 0.0),
+                    resumed=True
+                )
+
+        if partial:
+            # 补上换行，避免续跑追加的第一条结果与不完整的行连在一起
+            with self._lock, open(self.path, "a", encoding="utf-8") as f:
+                f.write("\n")
+        return completed
+
+    def append(self, result: BatchResult, key: str):
+        """追加一条结果并立即落盘"""
+        record = asdict(result)
+        record.pop("resumed")
+        record["key"] = key
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+
+def iter_batch(api_manager, batch: List[List[Dict[str, str]]], model: str = None,
+               temperature: float = None, max_concurrency: int = None,
+               results_path: str = None) -> Iterator[BatchResult]:
+    """
+    并发执行批量请求，按完成顺序逐条产出结果
+
+    Args:
+        api_manager: APIManager 实例
+        batch: 消息列表的列表，每个元素是一次独立的 call_api 请求
+        model: 模型名称，如果为None则使用默认模型
+        temperature: 采样温度，如果为None则使用配置中的值
+        max_concurrency: 最大并发数，如果为None则使用 api.batch.max_concurrency
+        results_path: 结果文件路径（JSONL），指定后支持断点续跑
+
+    Yields:
+        BatchResult，从结果文件恢复的条目最先产出
+    """
+    model = model or api_manager.model
+    max_concurrency = max_concurrency or api_manager.config.get('api.batch.max_concurrency', 8)
+    provider = api_manager.get_provider_for_model(model)
+    params = api_manager._sampling_params(provider, temperature)
+    keys = [ResponseCache.make_key(messages, model, params) for messages in batch]
+
+    results_file = BatchResultsFile(results_path) if results_path else None
+    completed = results_file.load(keys) if results_file else {}
+    pending = [index for index in range(len(batch)) if index not in completed]
+
+    logger.info(f"批量调用开始 - 总数: {len(batch)}, 已完成: {len(completed)}, "
+                f"待执行: {len(pending)}, 并发: {max_concurrency}")
+    for index in sorted(completed):
+        yield completed[index]
+
+    def run_one(index: int) -> BatchResult:
+        start_time = time.time()
+        try:
+            content = api_manager.call_api(batch[index], model=model, temperature=temperature)
+            return BatchResult(index=index, content=content, duration=time.time() - start_time)
+        except Exception as e:
+            logger.warning(f"批量调用第 {index} 条失败: {e}")
+            return BatchResult(index=index, success=False, error=str(e), duration=time.time() - start_time)
+
+    executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="api-batch")
+    failed = 0
+    try:
+        futures = [executor.submit(run_one, index) for index in pending]
+        for future in as_completed(futures):
+            result = future.result()
+            if result.success and results_file:
+                results_file.append(result, keys[result.index])
+            failed += 0 if result.success else 1
+            yield result
+    finally:
+        # 调用方提前停止迭代时丢弃尚未开始的请求
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    logger.info(f"批量调用结束 - 成功: {len(batch) - failed}, 失败: {failed}")
+
+
+def run_batch(api_manager, batch: List[List[Dict[str, str]]], model: str = None,
+              temperature: float = None, max_concurrency: int = None, results_path: str = None,
+              on_result: Callable[[BatchResult], Any] = None) -> List[BatchResult]:
+    """
+    并发执行批量请求，返回与输入顺序一致的结果列表
+
+    Args:
+        on_result: 每条结果完成时的回调（按完成顺序），其余参数同 iter_batch
+
+    Returns:
+        与 batch 等长的 BatchResult 列表
+    """
+    results: List[Optional[BatchResult]] = [None] * len(batch)
+    for result in iter_batch(api_manager, batch, model, temperature, max_concurrency, results_path):
+        results[result.index] = result
+        if on_result:
+            on_result(result)
+    return results
@@ -2,29 +2,231 @@
 增强版API管理器 - 支持多LLM提供商和智能重试
 支持的提供商: DeepSeek, OpenAI, Anthropic
 """
-import os
+import sys
 import time
 import json
+import functools
+import threading
+import importlib
+import importlib.util
 import requests
 import logging
-from typing import Dict, List, Any, Optional, Tuple
-from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type, before_sleep_log
-from dataclasses import dataclass, asdict
-import backoff
-
-try:
-    import openai
-    OPENAI_AVAILABLE = True
-except ImportError:
-    OPENAI_AVAILABLE = False
-
-try:
-    import anthropic
-    ANTHROPIC_AVAILABLE = False
-except ImportError:
-    ANTHROPIC_AVAILABLE = False
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from contextlib import nullcontext
+from typing import Dict, List, Any, Optional, Tuple, AsyncGenerator, Generator, TYPE_CHECKING
+from dataclasses import dataclass
+
+if TYPE_CHECKING:
+    import aiohttp
+
+# 提供商SDK与 aiohttp 导入开销较大，只检查是否安装，首次使用对应提供商时才导入
+OPENAI_AVAILABLE = importlib.util.find_spec("openai") is not None
+ANTHROPIC_AVAILABLE = importlib.util.find_spec("anthropic") is not None
 
 from logger import logger
+from http_transport import get_transport, get_async_session
+from response_cache import get_response_cache, ResponseCache
+from token_counter import get_token_counter
+from provider_health import get_provider_health
+from rate_limiter import get_rate_limiter, error_status, retry_after_seconds
+from api_batch import BatchResult, iter_batch, run_batch
+from api_metrics import get_api_metrics
+from cassette import get_cassette
+from prompt_cache import canonical_prefix, cached_prompt_tokens, anthropic_prompt_usage, with_cache_control
+from deadline import DeadlineExceeded, current_deadline, remaining_time, run_with_context
+from function_calling import (openai_tools, anthropic_tools, tool_reply, openai_tool_calls, anthropic_reply,
+                              has_tool_messages, to_anthropic_messages)
+
+
+def _deadline_reached(retry_state) -> bool:
+    """当前截止时间已到时不再重试"""
+    deadline = current_deadline()
+    return deadline is not None and deadline.expired
+
+
+# 服务端 Retry-After 提示的默认上限（秒），实际上限取自 api.rate_limit.max_retry_after
+MAX_RETRY_AFTER = 60
+RETRYABLE_ERRORS = (requests.exceptions.RequestException, TimeoutError)
+# 惰性导入的模块中可重试的异常：模块未被导入时也不可能抛出这些异常
+LAZY_RETRYABLE_ERRORS = {
+    "asyncio": ("TimeoutError",),
+    "aiohttp": ("ClientError",),
+    "openai": ("APIConnectionError", "RateLimitError", "InternalServerError"),
+    "anthropic": ("APIConnectionError", "RateLimitError", "InternalServerError")
+}
+# 4xx 中只有这些状态码值得重试，其余（如 400/401/403）重试也不会成功
+RETRYABLE_CLIENT_STATUS = {408, 409, 429}
+
+
+def _retryable_error_types() -> tuple:
+    """当前进程中可重试的异常类型"""
+    types = RETRYABLE_ERRORS
+    for module_name, names in LAZY_RETRYABLE_ERRORS.items():
+        module = sys.modules.get(module_name)
+        if module is not None:
+            types = types + tuple(getattr(module, name) for name in names if hasattr(module, name))
+    return types
+
+
+def _import_sdk(name: str):
+    """首次使用时导入提供商SDK"""
+    return importlib.import_module(name)
+
+
+def _is_retryable(error: BaseException) -> bool:
+    """网络错误、超时、429 与 5xx 可重试；截止时间已到不重试"""
+    if isinstance(error, DeadlineExceeded) or not isinstance(error, _retryable_error_types()):
+        return False
+    status = error_status(error)
+    return status is None or status >= 500 or status in RETRYABLE_CLIENT_STATUS
+
+
+def _retry_wait(retry_state, max_retry_after: float = None) -> float:
+    """
+    优先遵循服务端的 Retry-After 提示，没有时使用指数退避；等待不超过剩余时间
+
+    Args:
+        max_retry_after: Retry-After 的上限；未指定时取被装饰方法所属 APIManager 的配置
+    """
+    if max_retry_after is None:
+        manager = retry_state.args[0] if retry_state.args else None
+        max_retry_after = getattr(manager, "max_retry_after", MAX_RETRY_AFTER)
+    error = retry_state.outcome.exception() if retry_state.outcome else None
+    hint = retry_after_seconds(error) if error is not None else None
+    wait = min(hint, max_retry_after) if hint is not None else _retry_policy()["backoff"](retry_state)
+    deadline = current_deadline()
+    remaining = deadline.remaining() if deadline is not None else None
+    return wait if remaining is None else min(wait, remaining)
+
+
+@functools.lru_cache(maxsize=1)
+def _retry_policy() -> Dict[str, Any]:
+    """
+    同步与异步调用共用的重试策略；重试不会超出当前截止时间（见 deadline.py）
+
+    tenacity 在第一次需要重试控制器时才导入，不计入 api_manager 的导入耗时
+    """
+    import tenacity
+    return {
+        "stop": tenacity.stop_any(tenacity.stop_after_attempt(3), _deadline_reached),
+        "backoff": tenacity.wait_exponential(multiplier=1, min=4, max=10),
+        "retry": tenacity.retry_if_exception(_is_retryable),
+        "before_sleep": tenacity.before_sleep_log(logger.logger, logging.WARNING),
+        "sync": tenacity.Retrying,
+        "async": tenacity.AsyncRetrying
+    }
+
+
+def _retrying(asynchronous: bool = False, max_retry_after: float = None):
+    """
+    按统一重试策略构造 tenacity 控制器
+
+    Args:
+        asynchronous: 返回 AsyncRetrying（用于协程）
+        max_retry_after: Retry-After 的上限，见 _retry_wait
+    """
+    policy = _retry_policy()
+    return policy["async" if asynchronous else "sync"](
+        stop=policy["stop"],
+        wait=functools.partial(_retry_wait, max_retry_after=max_retry_after),
+        retry=policy["retry"],
+        before_sleep=policy["before_sleep"]
+    )
+
+
+def _with_retry(fn):
+    """方法装饰器：失败时按统一策略重试（等价于 tenacity.retry，但延迟导入 tenacity）"""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        return _retrying()(fn, *args, **kwargs)
+    return wrapper
+
+
+def _with_retry_async(fn):
+    """_with_retry 的协程版本"""
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        return await _retrying(asynchronous=True)(fn, *args, **kwargs)
+    return wrapper
+
+# 对冲请求使用的共享线程池
+_hedge_executor: Optional[ThreadPoolExecutor] = None
+_hedge_executor_lock = threading.Lock()
+
+
+def _get_hedge_executor(max_workers: int = 16) -> ThreadPoolExecutor:
+    """获取对冲请求线程池"""
+    global _hedge_executor
+    if _hedge_executor is None:
+        with _hedge_executor_lock:
+            if _hedge_executor is None:
+                _hedge_executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="api-hedge")
+    return _hedge_executor
+
+
+class HedgeCancelled(Exception):
+    """对冲请求的另一路已胜出，本路请求被中止"""
+
+
+class _HedgeScope:
+    """
+    对冲请求中一路的取消范围
+    
+    该路请求拿到响应（或流）后登记关闭回调；另一路胜出时 cancel() 立即关闭连接，
+    使仍在等待首token或读取响应体的同步请求尽快结束并归还限流许可
+    """
+    
+    def __init__(self):
+        self.cancelled = False
+        self._closers = []
+        self._lock = threading.Lock()
+    
+    def register(self, close):
+        """登记关闭回调；已取消时立即调用"""
+        with self._lock:
+            if not self.cancelled:
+                self._closers.append(close)
+                return
+        close()
+    
+    def cancel(self):
+        """标记取消并关闭已登记的连接"""
+        with self._lock:
+            if self.cancelled:
+                return
+            self.cancelled = True
+            closers, self._closers = self._closers, []
+        for close in closers:
+            try:
+                close()
+            except Exception as e:
+                logger.debug(f"关闭落败的对冲请求失败: {e}")
+    
+    def check(self):
+        """已取消时抛出 HedgeCancelled，避免落败方再发起新的请求"""
+        if self.cancelled:
+            raise HedgeCancelled("对冲请求的另一路已胜出")
+
+
+# 当前线程所在的对冲请求（一路），由 _in_hedge_scope 设置
+_hedge_scope: contextvars.ContextVar = contextvars.ContextVar("hedge_scope", default=None)
+
+
+def _in_hedge_scope(scope: _HedgeScope, fn, *args):
+    """在指定的对冲取消范围内执行 fn"""
+    token = _hedge_scope.set(scope)
+    try:
+        return fn(*args)
+    finally:
+        _hedge_scope.reset(token)
+
+
+def _register_closer(close):
+    """处于对冲请求中时登记连接的关闭回调，落败时由另一路关闭"""
+    scope = _hedge_scope.get()
+    if scope is not None:
+        scope.register(close)
 
 
 @dataclass
@@ -37,6 +239,12 @@ class APICallStats:
     total_tokens: int = 0
     cost: float = 0.0
     duration: float = 0.0
+    estimated_prompt_tokens: int = 0  # 发送前基于 tiktoken 的预估
+    time_to_first_token: Optional[float] = None  # 仅流式调用
+    cached_prompt_tokens: int = 0   # 命中提供商前缀缓存的prompt tokens（已包含在 prompt_tokens 中）
+    cache_write_tokens: int = 0     # 写入前缀缓存的prompt tokens（Anthropic）
+    streamed: bool = False          # 流式调用，duration 包含整个输出过程
+    replayed: bool = False          # 磁带回放，未访问上游
     success: bool = True
     error: Optional[str] = None
 
@@ -45,21 +253,22 @@ class APIManager:
     """API管理器，支持多提供商"""
     
     # API定价（每1K tokens，单位：美元）
+    # cached_input: 命中前缀缓存的输入价格；cache_write: 写入缓存的输入价格（Anthropic）
     PRICING = {
         "deepseek": {
-            "deepseek-chat": {"input": 0.00014, "output": 0.00028},  # DeepSeek-V2.5
-            "deepseek-coder": {"input": 0.00014, "output": 0.00028},
-            "deepseek-reasoner": {"input": 0.0014, "output": 0.028},  # DeepSeek-R1
+            "deepseek-chat": {"input": 0.00014, "cached_input": 0.000014, "output": 0.00028},  # DeepSeek-V2.5
+            "deepseek-coder": {"input": 0.00014, "cached_input": 0.000014, "output": 0.00028},
+            "deepseek-reasoner": {"input": 0.0014, "cached_input": 0.00014, "output": 0.028},  # DeepSeek-R1
         },
         "openai": {
-            "gpt-4o": {"input": 0.005, "output": 0.015},
-            "gpt-4o-mini": {"input": 0.00015, "output": 0.0006},
+            "gpt-4o": {"input": 0.005, "cached_input": 0.0025, "output": 0.015},
+            "gpt-4o-mini": {"input": 0.00015, "cached_input": 0.000075, "output": 0.0006},
             "gpt-3.5-turbo": {"input": 0.0005, "output": 0.0015},
         },
         "anthropic": {
-            "claude-3-5-sonnet-20241022": {"input": 0.003, "output": 0.015},
-            "claude-3-5-haiku-20241022": {"input": 0.0008, "output": 0.004},
-            "claude-3-opus-20240229": {"input": 0.015, "output": 0.075},
+            "claude-3-5-sonnet-20241022": {"input": 0.003, "cached_input": 0.0003, "cache_write": 0.00375, "output": 0.015},
+            "claude-3-5-haiku-20241022": {"input": 0.0008, "cached_input": 0.00008, "cache_write": 0.001, "output": 0.004},
+            "claude-3-opus-20240229": {"input": 0.015, "cached_input": 0.0015, "cache_write": 0.01875, "output": 0.075},
         }
     }
     
@@ -71,8 +280,44 @@ class APIManager:
             "total_tokens": 0,
             "total_cost": 0.0,
             "errors": 0,
-            "by_provider": {}
+            "cached_prompt_tokens": 0,
+            "prompt_cache_savings": 0.0,
+            "by_provider": {},
+            "aborted_streams": 0,  # 调用方提前中止的流式请求（例如 action 已完整）
+            "hedging": {
+                "hedged": 0,        # 主请求超过延迟阈值，发起了对冲请求
+                "failovers": 0,     # 主请求失败，切换到备用
+                "backup_wins": 0,   # 对冲请求先返回
+                "demoted_skips": 0, # 主提供商处于降级期，直接使用备用
+                "cancelled": 0,     # 另一路胜出后被中止的落败请求
+                "wasted_tokens": 0  # 落败请求已消耗（或预估已发送）的tokens
+            }
         }
+        self._stats_lock = threading.Lock()
+        
+        # 进程级共享的提供商健康度（对冲延迟与自动降级）
+        self.health = get_provider_health(config)
+        
+        # 进程级共享的耗时/TTFT/tokens每秒 直方图
+        self.metrics = get_api_metrics()
+        
+        # 进程级共享限流器（api.rate_limit），所有会话共用配额
+        self.rate_limiter = get_rate_limiter(config)
+        # 重试等待与限流暂停使用同一个 Retry-After 上限
+        self.max_retry_after = (self.rate_limiter.max_retry_after if self.rate_limiter
+                                else config.get('api.rate_limit.max_retry_after', MAX_RETRY_AFTER))
+        
+        # 进程级共享连接池，所有实例复用
+        self.transport = get_transport(config)
+        
+        # 可选的响应缓存（api.cache.enabled）
+        self.cache = get_response_cache(config)
+        
+        # 可选的录制/回放磁带（api.cassette.mode），用于离线可复现的测试
+        self.cassette = get_cassette(config)
+        
+        # 共享的token计数器，用于发送前预估prompt大小
+        self.token_counter = get_token_counter()
         
         # 初始化各提供商客户端
         self._init_clients()
@@ -85,28 +330,62 @@ class APIManager:
         self.deepseek_api_key = self.config.get('api.deepseek.api_key', '')
         self.deepseek_base_url = self.config.get('api.deepseek.base_url', 'https://api.deepseek.com')
         
-        # OpenAI 客户端
-        if OPENAI_AVAILABLE:
-            openai_api_key = self.config.get('api.openai.api_key', '')
-            if openai_api_key:
-                self.openai_client = openai.OpenAI(
-                    api_key=openai_api_key,
-                    base_url=self.config.get('api.openai.base_url', None)
-                )
-            else:
-                self.openai_client = None
-        else:
-            self.openai_client = None
+        # OpenAI / Anthropic 的SDK与客户端在首次调用对应提供商时才导入和创建
+        self._client_lock = threading.Lock()
+        self._openai_client = None
+        self._anthropic_client = None
+        self._async_openai_client = None
+        self._async_anthropic_client = None
+    
+    @property
+    def openai_client(self):
+        """OpenAI 客户端，未安装SDK或未配置密钥时为None"""
+        api_key = self.config.get('api.openai.api_key', '')
+        if self._openai_client is None and OPENAI_AVAILABLE and api_key:
+            with self._client_lock:
+                if self._openai_client is None:
+                    openai = _import_sdk("openai")
+                    self._openai_client = openai.OpenAI(
+                        api_key=api_key,
+                        base_url=self.config.get('api.openai.base_url', None)
+                    )
+        return self._openai_client
+    
+    @property
+    def anthropic_client(self):
+        """Anthropic 客户端，未安装SDK或未配置密钥时为None"""
+        api_key = self.config.get('api.anthropic.api_key', '')
+        if self._anthropic_client is None and ANTHROPIC_AVAILABLE and api_key:
+            with self._client_lock:
+                if self._anthropic_client is None:
+                    anthropic = _import_sdk("anthropic")
+                    self._anthropic_client = anthropic.Anthropic(api_key=api_key)
+        return self._anthropic_client
+    
+    def _request_timeout(self) -> Tuple[float, float]:
+        """
+        获取 (连接超时, 读取超时)，不超过当前截止时间的剩余时间
         
-        # Anthropic 客户端
-        if ANTHROPIC_AVAILABLE:
-            anthropic_api_key = self.config.get('api.anthropic.api_key', '')
-            if anthropic_api_key:
-                self.anthropic_client = anthropic.Anthropic(api_key=anthropic_api_key)
-            else:
-                self.anthropic_client = None
-        else:
-            self.anthropic_client = None
+        Raises:
+            DeadlineExceeded: 截止时间已到，不再发起请求
+        """
+        read_timeout = self.config.get('api.http.read_timeout', self.config.get('api.timeout', 60))
+        read_timeout = remaining_time(read_timeout, "LLM请求")
+        connect_timeout = self.config.get('api.http.connect_timeout', 10)
+        return (min(connect_timeout, read_timeout), read_timeout)
+    
+    def _sdk_timeout(self, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """有截止时间时为 SDK 请求设置剩余时间作为超时"""
+        timeout = remaining_time(None, "LLM请求")
+        if timeout is not None:
+            kwargs["timeout"] = timeout
+        return kwargs
+    
+    def _async_request_timeout(self) -> "aiohttp.ClientTimeout":
+        """获取异步请求的超时设置（与同步调用一致）"""
+        import aiohttp
+        connect_timeout, read_timeout = self._request_timeout()
+        return aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
     
     @property
     def model(self) -> str:
@@ -132,69 +411,143 @@ class APIManager:
         # 默认返回配置中的提供商
         return self.provider
     
-    def estimate_cost(self, provider: str, model: str, prompt_tokens: int, completion_tokens: int) -> float:
-        """估算API调用成本"""
+    def estimate_cost(self, provider: str, model: str, prompt_tokens: int, completion_tokens: int,
+                      cached_tokens: int = 0, cache_write_tokens: int = 0) -> float:
+        """
+        估算API调用成本
+        
+        cached_tokens 与 cache_write_tokens 是 prompt_tokens 中按缓存价格计费的部分，
+        未配置缓存价格的模型按普通输入价格计算
+        """
         pricing = self.PRICING.get(provider, {})
         model_pricing = pricing.get(model, {"input": 0, "output": 0})
+        input_price = model_pricing.get("input", 0)
         
-        input_cost = (prompt_tokens / 1000) * model_pricing.get("input", 0)
+        uncached_tokens = max(prompt_tokens - cached_tokens - cache_write_tokens, 0)
+        input_cost = (uncached_tokens / 1000) * input_price
+        input_cost += (cached_tokens / 1000) * model_pricing.get("cached_input", input_price)
+        input_cost += (cache_write_tokens / 1000) * model_pricing.get("cache_write", input_price)
         output_cost = (completion_tokens / 1000) * model_pricing.get("output", 0)
         
         return input_cost + output_cost
     
+    def prompt_cache_savings(self, stats: APICallStats) -> float:
+        """与不使用前缀缓存相比节省的成本（写入缓存的额外费用会抵扣节省）"""
+        full_cost = self.estimate_cost(stats.provider, stats.model, stats.prompt_tokens, stats.completion_tokens)
+        return full_cost - stats.cost
+    
     def update_stats(self, stats: APICallStats):
         """更新统计信息"""
-        self.stats["request_count"] += 1
-        self.stats["total_tokens"] += stats.total_tokens
-        self.stats["total_cost"] += stats.cost
-        
-        if not stats.success:
-            self.stats["errors"] += 1
-        
-        # 按提供商统计
-        provider = stats.provider
-        if provider not in self.stats["by_provider"]:
-            self.stats["by_provider"][provider] = {
-                "request_count": 0,
-                "total_tokens": 0,
-                "total_cost": 0.0,
-                "errors": 0
-            }
+        # 对冲延迟与耗时直方图只学习真实的上游调用：非流式调用记录完整耗时，流式调用只记录首token耗时
+        if not stats.replayed:
+            self.health.record(stats.provider, stats.model, stats.success,
+                               duration=None if stats.streamed else stats.duration,
+                               first_token=stats.time_to_first_token if stats.streamed else None)
+            self.metrics.record(stats.provider, stats.model, stats.success, stats.duration,
+                                stats.completion_tokens, stats.time_to_first_token)
         
-        self.stats["by_provider"][provider]["request_count"] += 1
-        self.stats["by_provider"][provider]["total_tokens"] += stats.total_tokens
-        self.stats["by_provider"][provider]["total_cost"] += stats.cost
-        if not stats.success:
-            self.stats["by_provider"][provider]["errors"] += 1
+        # 对冲请求会在多个线程中并发更新统计
+        with self._stats_lock:
+            self.stats["request_count"] += 1
+            self.stats["total_tokens"] += stats.total_tokens
+            self.stats["total_cost"] += stats.cost
+            self.stats["cached_prompt_tokens"] += stats.cached_prompt_tokens
+            if stats.cached_prompt_tokens or stats.cache_write_tokens:
+                self.stats["prompt_cache_savings"] += self.prompt_cache_savings(stats)
+            
+            if not stats.success:
+                self.stats["errors"] += 1
+            
+            # 按提供商统计
+            provider = stats.provider
+            if provider not in self.stats["by_provider"]:
+                self.stats["by_provider"][provider] = {
+                    "request_count": 0,
+                    "total_tokens": 0,
+                    "total_cost": 0.0,
+                    "cached_prompt_tokens": 0,
+                    "errors": 0
+                }
+            
+            self.stats["by_provider"][provider]["request_count"] += 1
+            self.stats["by_provider"][provider]["total_tokens"] += stats.total_tokens
+            self.stats["by_provider"][provider]["total_cost"] += stats.cost
+            self.stats["by_provider"][provider]["cached_prompt_tokens"] += stats.cached_prompt_tokens
+            if not stats.success:
+                self.stats["by_provider"][provider]["errors"] += 1
     
     def get_stats(self) -> dict:
         """获取统计信息"""
-        success_rate = ((self.stats["request_count"] - self.stats["errors"]) / self.stats["request_count"] * 100) if self.stats["request_count"] > 0 else 0
+        with self._stats_lock:
+            snapshot = {
+                "request_count": self.stats["request_count"],
+                "total_tokens": self.stats["total_tokens"],
+                "total_cost": self.stats["total_cost"],
+                "errors": self.stats["errors"],
+                "cached_prompt_tokens": self.stats["cached_prompt_tokens"],
+                "prompt_cache_savings": self.stats["prompt_cache_savings"],
+                "by_provider": {name: dict(values) for name, values in self.stats["by_provider"].items()},
+                "aborted_streams": self.stats["aborted_streams"],
+                "hedging": dict(self.stats["hedging"])
+            }
+        success_rate = ((snapshot["request_count"] - snapshot["errors"]) / snapshot["request_count"] * 100) if snapshot["request_count"] > 0 else 0
         
         return {
-            "request_count": self.stats["request_count"],
-            "total_tokens": self.stats["total_tokens"],
-            "total_cost": self.stats["total_cost"],
-            "errors": self.stats["errors"],
+            "request_count": snapshot["request_count"],
+            "total_tokens": snapshot["total_tokens"],
+            "total_cost": snapshot["total_cost"],
+            "errors": snapshot["errors"],
             "success_rate": round(success_rate, 2),
-            "by_provider": self.stats["by_provider"]
+            "prompt_cache": {
+                "cached_prompt_tokens": snapshot["cached_prompt_tokens"],
+                "savings": round(snapshot["prompt_cache_savings"], 6)
+            },
+            "by_provider": snapshot["by_provider"],
+            "aborted_streams": snapshot["aborted_streams"],
+            "hedging": snapshot["hedging"],
+            "latency": self.metrics.get_stats(),
+            "provider_health": self.health.get_stats(),
+            "rate_limit": self.rate_limiter.get_stats() if self.rate_limiter else {"enabled": False},
+            "transport": self.transport.get_stats(),
+            "cache": self.cache.get_stats() if self.cache else {"enabled": False},
+            "cassette": self.cassette.get_stats() if self.cassette else {"enabled": False}
+        }
+    
+    def _sampling_params(self, provider: str, temperature: float = None) -> Dict[str, Any]:
+        """获取采样参数，temperature 可按调用覆盖"""
+        return {
+            "max_tokens": self.config.get(f'api.{provider}.max_tokens', 4096),
+            "temperature": temperature if temperature is not None else self.config.get(f'api.{provider}.temperature', 0.7),
+            "top_p": self.config.get(f'api.{provider}.top_p', 1.0)
         }
     
+    def estimate_prompt_tokens(self, messages: List[Dict[str, str]]) -> int:
+        """在发送请求前预估prompt的token数"""
+        return self.token_counter.count_messages(self._prepare_messages(messages))
+    
     def _prepare_messages(self, messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
-        """准备消息格式"""
+        """准备消息格式，开头的系统消息规范化为字节稳定的前缀"""
         prepared = []
         for msg in messages:
             if isinstance(msg, dict) and "role" in msg and "content" in msg:
-                prepared.append({
+                content = msg["content"]
+                if msg["role"] == "system" and all(m["role"] == "system" for m in prepared):
+                    content = canonical_prefix(content)
+                message = {
                     "role": msg["role"],
-                    "content": msg["content"]
-                })
+                    "content": content
+                }
+                # 原生工具调用的助手消息与工具结果需要保留调用ID
+                for key in ("tool_calls", "tool_call_id"):
+                    if key in msg:
+                        message[key] = msg[key]
+                prepared.append(message)
         return prepared
     
-    def call_deepseek(self, messages: List[Dict[str, str]], model: str = None) -> Tuple[str, APICallStats]:
-        """调用 DeepSeek API"""
-        model = model or self.model
-        
+    def _build_deepseek_request(self, messages: List[Dict[str, str]], model: str, stream: bool = False,
+                                temperature: float = None,
+                                tools: List[Dict[str, Any]] = None) -> Tuple[str, Dict[str, str], Dict[str, Any]]:
+        """构造 DeepSeek 请求的 (url, headers, data)"""
         headers = {
             "Authorization": f"Bearer {self.deepseek_api_key}",
             "Content-Type": "application/json"
@@ -203,78 +556,128 @@ class APIManager:
         data = {
             "model": model,
             "messages": self._prepare_messages(messages),
-            "max_tokens": self.config.get('api.deepseek.max_tokens', 4096),
-            "temperature": self.config.get('api.deepseek.temperature', 0.7),
-            "top_p": self.config.get('api.deepseek.top_p', 1.0),
-            "stream": False
+            **self._sampling_params("deepseek", temperature),
+            "stream": stream
         }
+        if stream:
+            # 要求在最后一个chunk中返回usage，保证流式调用的统计一致
+            data["stream_options"] = {"include_usage": True}
+        if tools:
+            data["tools"] = openai_tools(tools)
         
         # DeepSeek 的 URL 已经是完整的端点
         url = f"{self.deepseek_base_url.rstrip('/')}/chat/completions"
-        
-        logger.debug(f"调用 DeepSeek API: {model}")
-        response = requests.post(url, headers=headers, json=data, timeout=self.config.get('api.timeout', 60))
-        response.raise_for_status()
-        
-        result = response.json()
-        content = result["choices"][0]["message"]["content"]
-        
-        # 统计信息
-        usage = result.get("usage", {})
-        prompt_tokens = usage.get("prompt_tokens", 0)
-        completion_tokens = usage.get("completion_tokens", 0)
-        
-        stats = APICallStats(
-            provider="deepseek",
+        return url, headers, data
+    
+    def _make_stats(self, provider: str, model: str, prompt_tokens: int, completion_tokens: int,
+                    total_tokens: int = None, cached_tokens: int = 0, cache_write_tokens: int = 0) -> APICallStats:
+        """根据token用量构造统计对象"""
+        return APICallStats(
+            provider=provider,
             model=model,
             prompt_tokens=prompt_tokens,
             completion_tokens=completion_tokens,
-            total_tokens=prompt_tokens + completion_tokens,
-            cost=self.estimate_cost("deepseek", model, prompt_tokens, completion_tokens)
+            total_tokens=total_tokens if total_tokens is not None else prompt_tokens + completion_tokens,
+            cost=self.estimate_cost(provider, model, prompt_tokens, completion_tokens, cached_tokens, cache_write_tokens),
+            cached_prompt_tokens=cached_tokens,
+            cache_write_tokens=cache_write_tokens
+        )
+    
+    def _make_stream_stats(self, provider: str, model: str, usage: Dict[str, int]) -> APICallStats:
+        """根据流式调用累计的 usage 构造统计对象"""
+        stats = self._make_stats(provider, model, usage["prompt_tokens"], usage["completion_tokens"],
+                                 cached_tokens=usage.get("cached_tokens", 0),
+                                 cache_write_tokens=usage.get("cache_write_tokens", 0))
+        stats.streamed = True
+        return stats
+    
+    def _parse_deepseek_response(self, result: Dict[str, Any], model: str,
+                                 tools: bool = False) -> Tuple[Any, APICallStats]:
+        """解析 DeepSeek 非流式响应；tools 为真时返回统一的工具调用回复"""
+        message = result["choices"][0]["message"]
+        content = message["content"]
+        if tools:
+            content = tool_reply(content, openai_tool_calls(message.get("tool_calls")))
+        
+        # 统计信息
+        usage = result.get("usage") or {}
+        stats = self._make_stats(
+            "deepseek", model,
+            usage.get("prompt_tokens", 0),
+            usage.get("completion_tokens", 0),
+            cached_tokens=cached_prompt_tokens(usage)
         )
         
         return content, stats
     
-    def call_openai(self, messages: List[Dict[str, str]], model: str = None) -> Tuple[str, APICallStats]:
-        """调用 OpenAI API"""
-        if not OPENAI_AVAILABLE or not self.openai_client:
-            raise ValueError("OpenAI 客户端不可用，请安装 openai 包并配置 API 密钥")
-        
+    def call_deepseek(self, messages: List[Dict[str, str]], model: str = None,
+                      temperature: float = None, tools: List[Dict[str, Any]] = None) -> Tuple[Any, APICallStats]:
+        """调用 DeepSeek API"""
         model = model or self.model
+        url, headers, data = self._build_deepseek_request(messages, model, temperature=temperature, tools=tools)
         
-        logger.debug(f"调用 OpenAI API: {model}")
-        response = self.openai_client.chat.completions.create(
-            model=model,
-            messages=self._prepare_messages(messages),
-            max_tokens=self.config.get('api.openai.max_tokens', 4096),
-            temperature=self.config.get('api.openai.temperature', 0.7),
-            top_p=self.config.get('api.openai.top_p', 1.0)
-        )
+        logger.debug(f"调用 DeepSeek API: {model}")
+        # 对冲请求以流式读取响应体，落败时另一路可以随时关闭连接
+        hedged = _hedge_scope.get() is not None
+        response = self.transport.post(url, headers=headers, json=data, timeout=self._request_timeout(),
+                                       stream=hedged)
+        _register_closer(response.close)
+        try:
+            response.raise_for_status()
+            result = response.json()
+        finally:
+            if hedged:
+                response.close()
         
-        content = response.choices[0].message.content
+        return self._parse_deepseek_response(result, model, tools=bool(tools))
+    
+    def _build_openai_kwargs(self, messages: List[Dict[str, str]], model: str, temperature: float = None,
+                             tools: List[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """构造 OpenAI 请求参数"""
+        kwargs = {
+            "model": model,
+            "messages": self._prepare_messages(messages),
+            **self._sampling_params("openai", temperature)
+        }
+        if tools:
+            kwargs["tools"] = openai_tools(tools)
+        return self._sdk_timeout(kwargs)
+    
+    def _parse_openai_response(self, response, model: str, tools: bool = False) -> Tuple[Any, APICallStats]:
+        """解析 OpenAI 响应；tools 为真时返回统一的工具调用回复"""
+        message = response.choices[0].message
+        content = message.content
+        if tools:
+            content = tool_reply(content, openai_tool_calls(message.tool_calls))
         usage = response.usage
         
-        prompt_tokens = usage.prompt_tokens
-        completion_tokens = usage.completion_tokens
-        
-        stats = APICallStats(
-            provider="openai",
-            model=model,
-            prompt_tokens=prompt_tokens,
-            completion_tokens=completion_tokens,
-            total_tokens=usage.total_tokens,
-            cost=self.estimate_cost("openai", model, prompt_tokens, completion_tokens)
+        stats = self._make_stats(
+            "openai", model,
+            usage.prompt_tokens,
+            usage.completion_tokens,
+            usage.total_tokens,
+            cached_tokens=cached_prompt_tokens(usage)
         )
         
         return content, stats
     
-    def call_anthropic(self, messages: List[Dict[str, str]], model: str = None) -> Tuple[str, APICallStats]:
-        """调用 Anthropic API"""
-        if not ANTHROPIC_AVAILABLE or not self.anthropic_client:
-            raise ValueError("Anthropic 客户端不可用，请安装 anthropic 包并配置 API 密钥")
+    def call_openai(self, messages: List[Dict[str, str]], model: str = None,
+                    temperature: float = None, tools: List[Dict[str, Any]] = None) -> Tuple[Any, APICallStats]:
+        """调用 OpenAI API"""
+        if not OPENAI_AVAILABLE or not self.openai_client:
+            raise ValueError("OpenAI 客户端不可用，请安装 openai 包并配置 API 密钥")
         
         model = model or self.model
         
+        logger.debug(f"调用 OpenAI API: {model}")
+        response = self.openai_client.chat.completions.create(
+            **self._build_openai_kwargs(messages, model, temperature, tools))
+        
+        return self._parse_openai_response(response, model, tools=bool(tools))
+    
+    def _build_anthropic_kwargs(self, messages: List[Dict[str, str]], model: str, temperature: float = None,
+                                tools: List[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """构造 Anthropic 请求参数"""
         # Anthropic 的消息格式稍有不同
         # 需要分离系统消息和用户消息
         system_msg = None
@@ -285,51 +688,159 @@ class APIManager:
                 system_msg = msg["content"]
             else:
                 user_messages.append(msg)
+        if has_tool_messages(user_messages):
+            user_messages = to_anthropic_messages(user_messages)
         
-        logger.debug(f"调用 Anthropic API: {model}")
+        if self.config.get('api.prompt_cache.enabled', True):
+            # 前缀缓存断点：系统提示词 + 最新一条消息（下一步请求可复用此前全部历史）
+            user_messages = self._prepare_messages(user_messages)
+            if user_messages and self.config.get('api.prompt_cache.cache_history', True):
+                user_messages[-1] = with_cache_control(user_messages[-1])
+            if system_msg:
+                system_msg = [{"type": "text", "text": canonical_prefix(system_msg),
+                               "cache_control": {"type": "ephemeral"}}]
         
         kwargs = {
             "model": model,
             "messages": user_messages,
-            "max_tokens": self.config.get('api.anthropic.max_tokens', 4096),
-            "temperature": self.config.get('api.anthropic.temperature', 0.7),
-            "top_p": self.config.get('api.anthropic.top_p', 1.0)
+            **self._sampling_params("anthropic", temperature)
         }
         
         if system_msg:
             kwargs["system"] = system_msg
+        if tools:
+            kwargs["tools"] = anthropic_tools(tools)
         
-        response = self.anthropic_client.messages.create(**kwargs)
-        content = response.content[0].text
+        return self._sdk_timeout(kwargs)
+    
+    def _parse_anthropic_response(self, response, model: str, tools: bool = False) -> Tuple[Any, APICallStats]:
+        """解析 Anthropic 响应；tools 为真时返回统一的工具调用回复"""
+        content = anthropic_reply(response.content) if tools else response.content[0].text
         
-        usage = response.usage
-        prompt_tokens = usage.input_tokens
-        completion_tokens = usage.output_tokens
+        prompt_tokens, cached_tokens, cache_write_tokens = anthropic_prompt_usage(response.usage)
+        stats = self._make_stats("anthropic", model, prompt_tokens, response.usage.output_tokens,
+                                 cached_tokens=cached_tokens, cache_write_tokens=cache_write_tokens)
         
-        stats = APICallStats(
-            provider="anthropic",
-            model=model,
-            prompt_tokens=prompt_tokens,
-            completion_tokens=completion_tokens,
-            total_tokens=prompt_tokens + completion_tokens,
-            cost=self.estimate_cost("anthropic", model, prompt_tokens, completion_tokens)
+        return content, stats
+    
+    def call_anthropic(self, messages: List[Dict[str, str]], model: str = None,
+                       temperature: float = None, tools: List[Dict[str, Any]] = None) -> Tuple[Any, APICallStats]:
+        """调用 Anthropic API"""
+        if not ANTHROPIC_AVAILABLE or not self.anthropic_client:
+            raise ValueError("Anthropic 客户端不可用，请安装 anthropic 包并配置 API 密钥")
+        
+        model = model or self.model
+        
+        logger.debug(f"调用 Anthropic API: {model}")
+        response = self.anthropic_client.messages.create(
+            **self._build_anthropic_kwargs(messages, model, temperature, tools))
+        
+        return self._parse_anthropic_response(response, model, tools=bool(tools))
+    
+    def _record_success(self, stats: APICallStats, start_time: float):
+        """记录成功调用的统计与日志"""
+        stats.duration = time.time() - start_time
+        self.update_stats(stats)
+        
+        # 记录API调用日志
+        logger.log_api_call(
+            provider=stats.provider,
+            model=stats.model,
+            prompt_tokens=stats.prompt_tokens,
+            completion_tokens=stats.completion_tokens,
+            cost=stats.cost
         )
         
-        return content, stats
+        logger.info(f"API请求成功 - 耗时: {stats.duration:.2f}s, "
+                   f"Tokens: {stats.total_tokens}, 成本: ${stats.cost:.6f}")
     
-    @retry(
-        stop=stop_after_attempt(3),
-        wait=wait_exponential(multiplier=1, min=4, max=10),
-        retry=retry_if_exception_type((requests.exceptions.RequestException, TimeoutError)),
-        before_sleep=before_sleep_log(logger.logger, logging.WARNING)
-    )
-    def call_api(self, messages: List[Dict[str, str]], model: str = None) -> str:
+    def _record_failure(self, provider: str, model: str, error: Exception, start_time: float):
+        """记录失败调用的统计与日志"""
+        duration = time.time() - start_time
+        logger.error(f"API请求失败 - 提供商: {provider}, 模型: {model}, "
+                    f"耗时: {duration:.2f}s, 错误: {str(error)}", exc_info=True)
+        
+        # 记录失败的统计
+        self.update_stats(APICallStats(
+            provider=provider,
+            model=model,
+            success=False,
+            error=str(error),
+            duration=duration
+        ))
+    
+    def _cache_lookup(self, messages: List[Dict[str, str]], model: str, provider: str,
+                      temperature: float = None) -> Tuple[Optional[str], Optional[str]]:
+        """
+        查询响应缓存
+        
+        Returns:
+            (缓存键, 命中的内容)，不可缓存时缓存键为None，未命中时内容为None
+        """
+        if self.cache is None:
+            return None, None
+        
+        params = self._sampling_params(provider, temperature)
+        if self.cache.should_bypass(params):
+            return None, None
+        
+        key = self.cache.make_key(messages, model, params)
+        entry = self.cache.get(key)
+        if entry is not None:
+            logger.info(f"响应缓存命中 - 模型: {model}, 节省Tokens: "
+                        f"{entry.get('prompt_tokens', 0) + entry.get('completion_tokens', 0)}")
+            return key, entry["content"]
+        return key, None
+    
+    def _cache_store(self, key: Optional[str], content: str, stats: APICallStats):
+        """写入响应缓存"""
+        if key is not None and self.cache is not None:
+            self.cache.set(key, content, stats.prompt_tokens, stats.completion_tokens, stats.cost)
+    
+    def _cassette_key(self, messages: List[Dict[str, str]], model: str, provider: str,
+                      temperature: float = None) -> str:
+        return ResponseCache.make_key(messages, model, self._sampling_params(provider, temperature))
+    
+    def _cassette_replay(self, messages: List[Dict[str, str]], model: str, provider: str,
+                         temperature: float = None) -> Optional[Dict[str, Any]]:
+        """
+        从磁带回放，回放的调用计入请求统计，但不计入耗时直方图与对冲延迟样本
+        
+        Returns:
+            命中时返回录制条目，否则返回None；replay 模式未命中时抛出 CassetteMissError
+        """
+        if self.cassette is None:
+            return None
+        entry = self.cassette.get(self._cassette_key(messages, model, provider, temperature))
+        if entry is not None:
+            logger.info(f"磁带回放 - 提供商: {provider}, 模型: {model}")
+            stats = self._make_stats(provider, model, entry.get("prompt_tokens", 0), entry.get("completion_tokens", 0))
+            stats.replayed = True
+            self._record_success(stats, time.time())
+        return entry
+    
+    def _cassette_record(self, messages: List[Dict[str, str]], model: str, provider: str, temperature: float,
+                         content: str, stats: APICallStats, chunks: List[str] = None):
+        """将一次真实交互写入磁带"""
+        if self.cassette is None or not self.cassette.can_record or stats.model != model:
+            return
+        self.cassette.put(
+            self._cassette_key(messages, model, provider, temperature),
+            provider, model, content,
+            prompt_tokens=stats.prompt_tokens,
+            completion_tokens=stats.completion_tokens,
+            duration=stats.duration,
+            chunks=chunks
+        )
+    
+    def call_api(self, messages: List[Dict[str, str]], model: str = None, temperature: float = None) -> str:
         """
-        调用API的主要方法，支持自动重试
+        调用API的主要方法，支持响应缓存与自动重试
         
         Args:
             messages: 消息列表
             model: 模型名称，如果为None则使用默认模型
+            temperature: 采样温度，如果为None则使用配置中的值
             
         Returns:
             AI响应内容
@@ -343,108 +854,964 @@ class APIManager:
         model = model or self.model
         provider = self.get_provider_for_model(model)
         
+        cache_key, cached = self._cache_lookup(messages, model, provider, temperature)
+        if cached is not None:
+            return cached
+        
+        replayed = self._cassette_replay(messages, model, provider, temperature)
+        if replayed is not None:
+            return replayed["content"]
+        
+        if self._hedging_enabled():
+            content, stats = self._call_hedged(messages, model, provider, temperature)
+        else:
+            content, stats = self._call_with_retry(messages, model, provider, temperature)
+        
+        # 备用模型的回答不写入主模型的缓存键
+        if stats.model == model:
+            self._cache_store(cache_key, content, stats)
+        self._cassette_record(messages, model, provider, temperature, content, stats)
+        return content
+    
+    @_with_retry
+    def _call_with_retry(self, messages: List[Dict[str, str]], model: str, provider: str,
+                         temperature: float = None, tools: List[Dict[str, Any]] = None) -> Tuple[Any, APICallStats]:
+        """调用提供商API并记录统计，失败时自动重试"""
         start_time = time.time()
-        stats = None
+        estimated_tokens = self.estimate_prompt_tokens(messages)
+        scope = _hedge_scope.get()
+        sent = False
         
         try:
-            logger.info(f"API请求开始 - 提供商: {provider}, 模型: {model}")
+            logger.info(f"API请求开始 - 提供商: {provider}, 模型: {model}, 预估Prompt Tokens: {estimated_tokens}")
             
-            if provider == "deepseek":
-                content, stats = self.call_deepseek(messages, model)
-            elif provider == "openai":
-                content, stats = self.call_openai(messages, model)
-            elif provider == "anthropic":
-                content, stats = self.call_anthropic(messages, model)
-            else:
-                raise ValueError(f"不支持的提供商: {provider}")
+            with self._rate_limit(provider, estimated_tokens) as permit:
+                if scope is not None:
+                    scope.check()
+                sent = True
+                if provider == "deepseek":
+                    content, stats = self.call_deepseek(messages, model, temperature, tools)
+                elif provider == "openai":
+                    content, stats = self.call_openai(messages, model, temperature, tools)
+                elif provider == "anthropic":
+                    content, stats = self.call_anthropic(messages, model, temperature, tools)
+                else:
+                    raise ValueError(f"不支持的提供商: {provider}")
+                if permit:
+                    permit.settle(stats.total_tokens)
             
-            # 更新统计
-            stats.duration = time.time() - start_time
-            self.update_stats(stats)
+        except Exception as e:
+            if scope is not None and scope.cancelled:
+                # 另一路已胜出，连接是被主动关闭的：不计为提供商失败，也不再重试
+                if sent:
+                    self._count_hedge("wasted_tokens", estimated_tokens)
+                if isinstance(e, HedgeCancelled):
+                    raise
+                raise HedgeCancelled(f"对冲请求 {provider}:{model} 已中止") from e
+            self._record_failure(provider, model, e, start_time)
+            raise
+        
+        stats.estimated_prompt_tokens = estimated_tokens
+        self._record_success(stats, start_time)
+        if scope is not None and scope.cancelled:
+            # SDK 的非流式请求无法中途关闭，落败后仍会完整返回
+            self._count_hedge("wasted_tokens", stats.total_tokens)
+        return content, stats
+    
+    # ==================== 原生工具调用 ====================
+    
+    def native_tools_enabled(self, model: str = None) -> bool:
+        """模型所属提供商是否启用了原生工具调用（api.<provider>.native_tools）"""
+        provider = self.get_provider_for_model(model)
+        return bool(self.config.get(f'api.{provider}.native_tools', False))
+    
+    def call_api_with_tools(self, messages: List[Dict[str, Any]], tools: List[Dict[str, Any]],
+                            model: str = None, temperature: float = None) -> Dict[str, Any]:
+        """
+        通过提供商的原生 tools 字段调用API
+        
+        工具描述不再写进提示词，模型直接返回结构化的 tool_calls。
+        这类调用不经过响应缓存与磁带，重试、限流与对冲策略同 call_api
+        
+        Args:
+            messages: 消息列表，可包含带 tool_calls 的助手消息与 tool 消息
+            tools: 工具描述 [{"name", "description", "parameters": JSON Schema}]
+            model: 模型名称，如果为None则使用默认模型
+            temperature: 采样温度，如果为None则使用配置中的值
             
-            # 记录API调用日志
-            logger.log_api_call(
-                provider=stats.provider,
-                model=stats.model,
-                prompt_tokens=stats.prompt_tokens,
-                completion_tokens=stats.completion_tokens,
-                cost=stats.cost
-            )
+        Returns:
+            {"content": 文本, "tool_calls": [{"id", "name", "arguments"}], "message": 可追加到历史的助手消息}
+        """
+        if not messages:
+            raise ValueError("消息列表不能为空")
+        
+        model = model or self.model
+        provider = self.get_provider_for_model(model)
+        if self._hedging_enabled():
+            reply, _ = self._call_hedged(messages, model, provider, temperature, tools)
+        else:
+            reply, _ = self._call_with_retry(messages, model, provider, temperature, tools)
+        return reply
+    
+    # ==================== 限流 ====================
+    
+    def _api_key_for(self, provider: str) -> str:
+        """获取提供商当前使用的API密钥（用于区分限流配额）"""
+        if provider == "deepseek":
+            return self.deepseek_api_key
+        return self.config.get(f'api.{provider}.api_key', '')
+    
+    def _rate_limit(self, provider: str, tokens: int):
+        """获取同步调用许可；未启用限流时返回空上下文（permit 为 None）"""
+        if self.rate_limiter is None:
+            return nullcontext(None)
+        return self.rate_limiter.limit(provider, self._api_key_for(provider), tokens)
+    
+    def _rate_limit_async(self, provider: str, tokens: int):
+        """获取异步调用许可"""
+        if self.rate_limiter is None:
+            return nullcontext(None)
+        return self.rate_limiter.limit_async(provider, self._api_key_for(provider), tokens)
+    
+    # ==================== 对冲请求与故障切换 ====================
+    
+    def _hedging_enabled(self) -> bool:
+        """是否启用对冲（需要配置备用模型）"""
+        return bool(self.config.get('api.hedging.enabled', False) and self.config.get('api.hedging.backup_model', ''))
+    
+    def _count_hedge(self, key: str, amount: int = 1):
+        """累加对冲统计"""
+        with self._stats_lock:
+            self.stats["hedging"][key] += amount
+    
+    def _cancel_hedge_loser(self, future, scope: _HedgeScope):
+        """另一路胜出后中止落败的对冲请求：尚未开始的直接取消，进行中的关闭其连接"""
+        if future.done():
+            return
+        scope.cancel()
+        future.cancel()
+        self._count_hedge("cancelled")
+    
+    def _hedge_legs(self, model: str, provider: str) -> List[Tuple[str, str]]:
+        """
+        确定对冲的 [(模型, 提供商), ...] 顺序
+        
+        主提供商处于降级期而备用正常时，交换两者顺序
+        """
+        backup_model = self.config.get('api.hedging.backup_model', '')
+        backup_provider = self.get_provider_for_model(backup_model)
+        legs = [(model, provider), (backup_model, backup_provider)]
+        
+        if self.health.is_demoted(provider, model) and not self.health.is_demoted(backup_provider, backup_model):
+            logger.warning(f"{provider}:{model} 处于降级期，优先使用备用 {backup_provider}:{backup_model}")
+            self._count_hedge("demoted_skips")
+            legs.reverse()
+        return legs
+    
+    def _hedge_delay(self, provider: str, model: str, first_token: bool = False) -> float:
+        """根据最近的调用耗时（流式调用为首token耗时）百分位数计算对冲触发延迟"""
+        percentile = self.config.get('api.hedging.percentile', 95)
+        observed = self.health.latency_percentile(provider, model, percentile, first_token)
+        if observed is None:
+            return self.config.get('api.hedging.default_delay', 5.0)
+        return max(observed, self.config.get('api.hedging.min_delay', 0.5))
+    
+    def _call_hedged(self, messages: List[Dict[str, str]], model: str, provider: str,
+                     temperature: float = None, tools: List[Dict[str, Any]] = None) -> Tuple[Any, APICallStats]:
+        """
+        对冲调用：主请求超过延迟阈值仍未返回时，向备用提供商发起同样的请求，取先返回者
+        
+        先返回者胜出后立即关闭落败请求的连接（DeepSeek 协议以流式读取响应体，可在任意时刻中止）；
+        SDK 的非流式请求无法中途关闭，会在后台结束后丢弃结果。落败方的用量计入 hedging.wasted_tokens
+        """
+        (first_model, first_provider), (second_model, second_provider) = self._hedge_legs(model, provider)
+        executor = _get_hedge_executor(self.config.get('api.hedging.max_workers', 16))
+        delay = self._hedge_delay(first_provider, first_model)
+        
+        first_scope = _HedgeScope()
+        first = executor.submit(run_with_context(_in_hedge_scope, first_scope, self._call_with_retry,
+                                                 messages, first_model, first_provider, temperature, tools))
+        done, _ = wait([first], timeout=delay)
+        if first in done:
+            if first.exception() is None:
+                return first.result()
+            logger.warning(f"主请求 {first_provider}:{first_model} 失败，切换到 {second_provider}:{second_model}: "
+                           f"{first.exception()}")
+            self._count_hedge("failovers")
+            return self._call_with_retry(messages, second_model, second_provider, temperature, tools)
+        
+        logger.info(f"主请求 {first_provider}:{first_model} 超过 {delay:.2f}s 未返回，"
+                    f"发起对冲请求 -> {second_provider}:{second_model}")
+        self._count_hedge("hedged")
+        second_scope = _HedgeScope()
+        second = executor.submit(run_with_context(_in_hedge_scope, second_scope, self._call_with_retry,
+                                                  messages, second_model, second_provider, temperature, tools))
+        scopes = {first: first_scope, second: second_scope}
+        errors = {}
+        for future in as_completed([first, second]):
+            try:
+                result = future.result()
+            except Exception as e:
+                errors[future] = e
+                continue
+            loser = second if future is first else first
+            self._cancel_hedge_loser(loser, scopes[loser])
+            if future is second:
+                self._count_hedge("backup_wins")
+            return result
+        raise errors.get(first) or errors[second]
+    
+    def _parse_deepseek_sse(self, line: str, usage: Dict[str, int]) -> Tuple[bool, Optional[str]]:
+        """
+        解析一行 DeepSeek SSE 数据
+        
+        Returns:
+            (是否结束, 文本片段)，usage 在包含用量的chunk中被更新
+        """
+        line = line.strip()
+        if not line.startswith("data: "):
+            return False, None
+        data_str = line[6:]
+        if data_str == "[DONE]":
+            return True, None
+        try:
+            chunk = json.loads(data_str)
+        except json.JSONDecodeError:
+            return False, None
+        if chunk.get("usage"):
+            usage["prompt_tokens"] = chunk["usage"].get("prompt_tokens", 0)
+            usage["completion_tokens"] = chunk["usage"].get("completion_tokens", 0)
+            usage["cached_tokens"] = cached_prompt_tokens(chunk["usage"])
+        if chunk.get("choices"):
+            delta = chunk["choices"][0].get("delta", {})
+            if delta.get("content"):
+                return False, delta["content"]
+        return False, None
+    
+    def _open_with_retry_sync(self, opener):
+        """按统一重试策略建立流式连接（开始输出后不再重试）"""
+        scope = _hedge_scope.get()
+        for attempt in _retrying(max_retry_after=self.max_retry_after):
+            with attempt:
+                if scope is not None:
+                    scope.check()
+                return opener()
+    
+    def _stream_deepseek(self, messages: List[Dict[str, str]], model: str, usage: Dict[str, int],
+                         temperature: float = None):
+        """DeepSeek 流式输出，usage 在流结束时被填充"""
+        url, headers, data = self._build_deepseek_request(messages, model, stream=True, temperature=temperature)
+        
+        def opener():
+            response = self.transport.post(url, headers=headers, json=data,
+                                           timeout=self._request_timeout(), stream=True)
+            try:
+                response.raise_for_status()
+            except Exception:
+                response.close()
+                raise
+            return response
+        
+        response = self._open_with_retry_sync(opener)
+        _register_closer(response.close)
+        try:
+            for line in response.iter_lines(decode_unicode=False):
+                if not line:
+                    continue
+                done, text = self._parse_deepseek_sse(line.decode('utf-8'), usage)
+                if done:
+                    break
+                if text:
+                    yield text
+        finally:
+            # 调用方提前停止迭代时也会走到这里，及时中止上游请求
+            response.close()
+    
+    def _stream_openai(self, messages: List[Dict[str, str]], model: str, usage: Dict[str, int],
+                       temperature: float = None):
+        """OpenAI 流式输出"""
+        if not OPENAI_AVAILABLE or not self.openai_client:
+            raise ValueError("OpenAI 客户端不可用，请安装 openai 包并配置 API 密钥")
+        kwargs = self._build_openai_kwargs(messages, model, temperature)
+        kwargs["stream"] = True
+        kwargs["stream_options"] = {"include_usage": True}
+        
+        stream = self._open_with_retry_sync(lambda: self.openai_client.chat.completions.create(**kwargs))
+        _register_closer(stream.close)
+        try:
+            for chunk in stream:
+                if getattr(chunk, "usage", None):
+                    usage["prompt_tokens"] = chunk.usage.prompt_tokens
+                    usage["cached_tokens"] = cached_prompt_tokens(chunk.usage)
+                    usage["completion_tokens"] = chunk.usage.completion_tokens
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            stream.close()
+    
+    def _stream_anthropic(self, messages: List[Dict[str, str]], model: str, usage: Dict[str, int],
+                          temperature: float = None):
+        """Anthropic 流式输出"""
+        if not ANTHROPIC_AVAILABLE or not self.anthropic_client:
+            raise ValueError("Anthropic 客户端不可用，请安装 anthropic 包并配置 API 密钥")
+        kwargs = self._build_anthropic_kwargs(messages, model, temperature)
+        kwargs["stream"] = True
+        
+        stream = self._open_with_retry_sync(lambda: self.anthropic_client.messages.create(**kwargs))
+        _register_closer(stream.close)
+        try:
+            for event in stream:
+                if event.type == "message_start":
+                    (usage["prompt_tokens"], usage["cached_tokens"],
+                     usage["cache_write_tokens"]) = anthropic_prompt_usage(event.message.usage)
+                elif event.type == "message_delta" and getattr(event, "usage", None):
+                    usage["completion_tokens"] = event.usage.output_tokens
+                elif event.type == "content_block_delta" and getattr(event.delta, "text", None):
+                    yield event.delta.text
+        finally:
+            stream.close()
+    
+    # ==================== 批量调用 ====================
+    
+    def call_api_batch(self, batch: List[List[Dict[str, str]]], model: str = None, temperature: float = None,
+                       max_concurrency: int = None, results_path: str = None,
+                       on_result=None) -> List[BatchResult]:
+        """
+        并发执行一批相互独立的请求（共享限流与缓存）
+        
+        Args:
+            batch: 消息列表的列表，每个元素是一次 call_api 请求
+            model: 模型名称，如果为None则使用默认模型
+            temperature: 采样温度，如果为None则使用配置中的值
+            max_concurrency: 最大并发数，如果为None则使用 api.batch.max_concurrency
+            results_path: 结果文件路径（JSONL），任务中断后用同一路径重跑会跳过已成功的条目
+            on_result: 每条结果完成时的回调，按完成顺序调用
             
-            logger.info(f"API请求成功 - 耗时: {stats.duration:.2f}s, "
-                       f"Tokens: {stats.total_tokens}, 成本: ${stats.cost:.6f}")
+        Returns:
+            与输入顺序一致的 BatchResult 列表，失败条目 success=False 并带有 error
+        """
+        return run_batch(self, batch, model, temperature, max_concurrency, results_path, on_result)
+    
+    def iter_api_batch(self, batch: List[List[Dict[str, str]]], model: str = None, temperature: float = None,
+                       max_concurrency: int = None, results_path: str = None) -> Generator[BatchResult, None, None]:
+        """call_api_batch 的流式版本，按完成顺序逐条产出 BatchResult"""
+        return iter_batch(self, batch, model, temperature, max_concurrency, results_path)
+    
+    def call_api_stream(self, messages: List[Dict[str, str]], model: str = None,
+                        temperature: float = None) -> Generator[str, None, None]:
+        """
+        流式调用API，逐段产出文本
+        
+        支持 DeepSeek、OpenAI 与 Anthropic。连接建立阶段按 call_api 的策略重试，
+        流结束后按提供商返回的用量记录 APICallStats；调用方提前关闭生成器时会中止上游请求。
+        启用对冲时以首token耗时作为触发条件，见 _stream_hedged
+        
+        Args:
+            messages: 消息列表
+            model: 模型名称，如果为None则使用默认模型
+            temperature: 采样温度，如果为None则使用配置中的值
             
-            return content
+        Yields:
+            响应文本片段
+        """
+        if not messages:
+            raise ValueError("消息列表不能为空")
+        
+        model = model or self.model
+        provider = self.get_provider_for_model(model)
+        self._stream_source(provider)
+        
+        replayed = self._cassette_replay(messages, model, provider, temperature)
+        if replayed is not None:
+            for chunk in replayed.get("chunks") or [replayed["content"]]:
+                yield chunk
+            return
+        
+        if self._hedging_enabled():
+            yield from self._stream_hedged(messages, model, provider, temperature)
+        else:
+            yield from self._stream_with_stats(messages, model, provider, temperature)
+    
+    def _stream_source(self, provider: str):
+        """提供商对应的同步流式实现"""
+        if provider == "deepseek":
+            return self._stream_deepseek
+        if provider == "openai":
+            return self._stream_openai
+        if provider == "anthropic":
+            return self._stream_anthropic
+        raise ValueError(f"不支持的提供商: {provider}")
+    
+    def _stream_with_stats(self, messages: List[Dict[str, str]], model: str, provider: str,
+                           temperature: float = None) -> Generator[str, None, None]:
+        """向单个提供商发起流式请求，占用限流许可并在结束或中止时记录统计"""
+        stream = self._stream_source(provider)
+        estimated_tokens = self.estimate_prompt_tokens(messages)
+        logger.info(f"开始流式API请求 - 提供商: {provider}, 模型: {model}, 预估Prompt Tokens: {estimated_tokens}")
+        start_time = time.time()
+        usage = {"prompt_tokens": 0, "completion_tokens": 0}
+        # 录制时保留原始分片，回放时按同样的节奏输出
+        chunks = [] if self.cassette is not None and self.cassette.can_record else None
+        
+        # 流式调用在整个输出期间占用一个并发槽
+        first_token_time = None
+        emitted = []
+        # 作为对冲请求的一路时，落败后连接会被另一路关闭
+        scope = _hedge_scope.get()
+        
+        with self._rate_limit(provider, estimated_tokens) as permit:
+            if scope is not None:
+                scope.check()
+            upstream = stream(messages, model, usage, temperature)
+            try:
+                for text in upstream:
+                    if first_token_time is None:
+                        first_token_time = time.time()
+                    if chunks is not None:
+                        chunks.append(text)
+                    emitted.append(text)
+                    yield text
+            except GeneratorExit:
+                # 调用方提前关闭：立即中止上游请求，提供商不会返回用量，按已输出内容估算
+                upstream.close()
+                stats = self._record_aborted_stream(provider, model, usage, estimated_tokens, "".join(emitted),
+                                                    start_time, first_token_time)
+                if scope is not None and scope.cancelled:
+                    self._count_hedge("wasted_tokens", stats.total_tokens)
+                raise
+            except HedgeCancelled:
+                # 重试前发现已被取消，新的请求没有发出
+                raise
+            except Exception as e:
+                if scope is not None and scope.cancelled:
+                    # 另一路已胜出，连接是被主动关闭的，按中止的流记录
+                    raise self._hedge_loser_aborted(provider, model, usage, estimated_tokens, "".join(emitted),
+                                                    start_time, first_token_time) from e
+                self._record_failure(provider, model, e, start_time)
+                raise
+            if scope is not None and scope.cancelled:
+                # 连接被关闭后上游可能静默结束，同样不是完整的回答
+                raise self._hedge_loser_aborted(provider, model, usage, estimated_tokens, "".join(emitted),
+                                                start_time, first_token_time)
+            if permit:
+                permit.settle(usage["prompt_tokens"] + usage["completion_tokens"])
+        
+        stats = self._make_stream_stats(provider, model, usage)
+        stats.estimated_prompt_tokens = estimated_tokens
+        if first_token_time is not None:
+            stats.time_to_first_token = first_token_time - start_time
+        self._record_success(stats, start_time)
+        if chunks is not None:
+            self._cassette_record(messages, model, provider, temperature, "".join(chunks), stats, chunks)
+    
+    def _stream_hedged(self, messages: List[Dict[str, str]], model: str, provider: str,
+                       temperature: float = None) -> Generator[str, None, None]:
+        """
+        对冲流式调用：主请求超过首token延迟阈值仍未输出时，向备用提供商发起同样的请求，
+        继续输出先产出首个片段的一方
+        
+        已开始输出后不再切换。胜出时立即关闭落败方的连接；落败方若仍在等待响应头，
+        则在拿到响应后立即关闭。落败方计入 aborted_streams，其用量计入 hedging.wasted_tokens
+        """
+        (first_model, first_provider), (second_model, second_provider) = self._hedge_legs(model, provider)
+        executor = _get_hedge_executor(self.config.get('api.hedging.max_workers', 16))
+        delay = self._hedge_delay(first_provider, first_model, first_token=True)
+        
+        first_scope = _HedgeScope()
+        first_stream = self._stream_with_stats(messages, first_model, first_provider, temperature)
+        first = executor.submit(run_with_context(_in_hedge_scope, first_scope, next, first_stream, None))
+        done, _ = wait([first], timeout=delay)
+        if first in done:
+            if first.exception() is None:
+                yield from self._resume_stream(first_stream, first.result())
+                return
+            logger.warning(f"主流式请求 {first_provider}:{first_model} 失败，切换到 {second_provider}:{second_model}: "
+                           f"{first.exception()}")
+            self._count_hedge("failovers")
+            yield from self._stream_with_stats(messages, second_model, second_provider, temperature)
+            return
+        
+        logger.info(f"主流式请求 {first_provider}:{first_model} 超过 {delay:.2f}s 未输出首token，"
+                    f"发起对冲请求 -> {second_provider}:{second_model}")
+        self._count_hedge("hedged")
+        second_scope = _HedgeScope()
+        second_stream = self._stream_with_stats(messages, second_model, second_provider, temperature)
+        second = executor.submit(run_with_context(_in_hedge_scope, second_scope, next, second_stream, None))
+        streams = {first: first_stream, second: second_stream}
+        scopes = {first: first_scope, second: second_scope}
+        
+        errors = {}
+        for future in as_completed([first, second]):
+            try:
+                head = future.result()
+            except Exception as e:
+                errors[future] = e
+                continue
+            loser = second if future is first else first
+            # 落败方的生成器仍在另一线程中执行，先关闭其连接，等 next 返回后再关闭生成器
+            self._cancel_hedge_loser(loser, scopes[loser])
+            loser.add_done_callback(lambda _, stream=streams[loser]: stream.close())
+            if future is second:
+                self._count_hedge("backup_wins")
+            yield from self._resume_stream(streams[future], head)
+            return
+        raise errors.get(first) or errors[second]
+    
+    def _hedge_loser_aborted(self, provider: str, model: str, usage: Dict[str, int], estimated_tokens: int,
+                             emitted: str, start_time: float, first_token_time: Optional[float]) -> HedgeCancelled:
+        """记录被另一路中止的对冲流式请求及其浪费的tokens，返回要抛出的异常"""
+        stats = self._record_aborted_stream(provider, model, usage, estimated_tokens, emitted,
+                                            start_time, first_token_time)
+        self._count_hedge("wasted_tokens", stats.total_tokens)
+        return HedgeCancelled(f"对冲流式请求 {provider}:{model} 已中止")
+    
+    @staticmethod
+    def _resume_stream(stream: Generator[str, None, None], head: Optional[str]) -> Generator[str, None, None]:
+        """先产出已取出的首个片段（None 表示流为空），再继续输出剩余部分；提前关闭时一并关闭原流"""
+        try:
+            if head is None:
+                return
+            yield head
+            yield from stream
+        finally:
+            stream.close()
+    
+    def _record_aborted_stream(self, provider: str, model: str, usage: Dict[str, int], estimated_tokens: int,
+                               emitted: str, start_time: float, first_token_time: Optional[float]) -> APICallStats:
+        """记录被调用方提前中止的流式请求"""
+        stats = self._make_stats(provider, model,
+                                 usage["prompt_tokens"] or estimated_tokens,
+                                 usage["completion_tokens"] or self.token_counter.count_text(emitted))
+        stats.streamed = True
+        stats.estimated_prompt_tokens = estimated_tokens
+        if first_token_time is not None:
+            stats.time_to_first_token = first_token_time - start_time
+        with self._stats_lock:
+            self.stats["aborted_streams"] += 1
+        self._record_success(stats, start_time)
+        return stats
+    
+    # ==================== 异步调用 ====================
+    
+    def _get_async_openai_client(self):
+        """获取异步 OpenAI 客户端"""
+        if not OPENAI_AVAILABLE or not self.config.get('api.openai.api_key', ''):
+            raise ValueError("OpenAI 客户端不可用，请安装 openai 包并配置 API 密钥")
+        if self._async_openai_client is None:
+            openai = _import_sdk("openai")
+            self._async_openai_client = openai.AsyncOpenAI(
+                api_key=self.config.get('api.openai.api_key', ''),
+                base_url=self.config.get('api.openai.base_url', None)
+            )
+        return self._async_openai_client
+    
+    def _get_async_anthropic_client(self):
+        """获取异步 Anthropic 客户端"""
+        if not ANTHROPIC_AVAILABLE or not self.config.get('api.anthropic.api_key', ''):
+            raise ValueError("Anthropic 客户端不可用，请安装 anthropic 包并配置 API 密钥")
+        if self._async_anthropic_client is None:
+            anthropic = _import_sdk("anthropic")
+            self._async_anthropic_client = anthropic.AsyncAnthropic(
+                api_key=self.config.get('api.anthropic.api_key', '')
+            )
+        return self._async_anthropic_client
+    
+    async def call_deepseek_async(self, messages: List[Dict[str, str]], model: str = None,
+                                  temperature: float = None) -> Tuple[str, APICallStats]:
+        """异步调用 DeepSeek API"""
+        model = model or self.model
+        url, headers, data = self._build_deepseek_request(messages, model, temperature=temperature)
+        
+        logger.debug(f"异步调用 DeepSeek API: {model}")
+        session = get_async_session(self.config)
+        async with session.post(url, headers=headers, json=data, timeout=self._async_request_timeout()) as response:
+            response.raise_for_status()
+            result = await response.json(content_type=None)
+        
+        return self._parse_deepseek_response(result, model)
+    
+    async def call_openai_async(self, messages: List[Dict[str, str]], model: str = None,
+                                temperature: float = None) -> Tuple[str, APICallStats]:
+        """异步调用 OpenAI API"""
+        client = self._get_async_openai_client()
+        model = model or self.model
+        
+        logger.debug(f"异步调用 OpenAI API: {model}")
+        response = await client.chat.completions.create(**self._build_openai_kwargs(messages, model, temperature))
+        
+        return self._parse_openai_response(response, model)
+    
+    async def call_anthropic_async(self, messages: List[Dict[str, str]], model: str = None,
+                                   temperature: float = None) -> Tuple[str, APICallStats]:
+        """异步调用 Anthropic API"""
+        client = self._get_async_anthropic_client()
+        model = model or self.model
+        
+        logger.debug(f"异步调用 Anthropic API: {model}")
+        response = await client.messages.create(**self._build_anthropic_kwargs(messages, model, temperature))
+        
+        return self._parse_anthropic_response(response, model)
+    
+    async def call_api_async(self, messages: List[Dict[str, str]], model: str = None,
+                             temperature: float = None) -> str:
+        """
+        call_api 的异步版本，缓存、统计与重试策略与同步调用完全一致
+        
+        Args:
+            messages: 消息列表
+            model: 模型名称，如果为None则使用默认模型
+            temperature: 采样温度，如果为None则使用配置中的值
             
-        except Exception as e:
-            duration = time.time() - start_time
-            logger.error(f"API请求失败 - 提供商: {provider}, 模型: {model}, "
-                        f"耗时: {duration:.2f}s, 错误: {str(e)}", exc_info=True)
+        Returns:
+            AI响应内容
+        """
+        if not messages:
+            raise ValueError("消息列表不能为空")
+        
+        model = model or self.model
+        provider = self.get_provider_for_model(model)
+        
+        cache_key, cached = self._cache_lookup(messages, model, provider, temperature)
+        if cached is not None:
+            return cached
+        
+        replayed = self._cassette_replay(messages, model, provider, temperature)
+        if replayed is not None:
+            return replayed["content"]
+        
+        if self._hedging_enabled():
+            content, stats = await self._call_hedged_async(messages, model, provider, temperature)
+        else:
+            content, stats = await self._call_with_retry_async(messages, model, provider, temperature)
+        
+        if stats.model == model:
+            self._cache_store(cache_key, content, stats)
+        self._cassette_record(messages, model, provider, temperature, content, stats)
+        return content
+    
+    @_with_retry_async
+    async def _call_with_retry_async(self, messages: List[Dict[str, str]], model: str, provider: str,
+                                     temperature: float = None) -> Tuple[str, APICallStats]:
+        """异步调用提供商API并记录统计，失败时自动重试"""
+        start_time = time.time()
+        estimated_tokens = self.estimate_prompt_tokens(messages)
+        
+        try:
+            logger.info(f"异步API请求开始 - 提供商: {provider}, 模型: {model}, 预估Prompt Tokens: {estimated_tokens}")
             
-            # 记录失败的统计
-            if stats is None:
-                stats = APICallStats(
-                    provider=provider,
-                    model=model,
-                    success=False,
-                    error=str(e),
-                    duration=duration
-                )
-                self.update_stats(stats)
+            async with self._rate_limit_async(provider, estimated_tokens) as permit:
+                if provider == "deepseek":
+                    content, stats = await self.call_deepseek_async(messages, model, temperature)
+                elif provider == "openai":
+                    content, stats = await self.call_openai_async(messages, model, temperature)
+                elif provider == "anthropic":
+                    content, stats = await self.call_anthropic_async(messages, model, temperature)
+                else:
+                    raise ValueError(f"不支持的提供商: {provider}")
+                if permit:
+                    permit.settle(stats.total_tokens)
             
+        except Exception as e:
+            self._record_failure(provider, model, e, start_time)
             raise
+        
+        stats.estimated_prompt_tokens = estimated_tokens
+        self._record_success(stats, start_time)
+        return content, stats
+    
+    async def _call_hedged_async(self, messages: List[Dict[str, str]], model: str, provider: str,
+                                 temperature: float = None) -> Tuple[str, APICallStats]:
+        """_call_hedged 的异步版本，落败的请求会被直接取消"""
+        import asyncio
+        (first_model, first_provider), (second_model, second_provider) = self._hedge_legs(model, provider)
+        delay = self._hedge_delay(first_provider, first_model)
+        
+        first = asyncio.ensure_future(self._call_with_retry_async(messages, first_model, first_provider, temperature))
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if first in done:
+            if first.exception() is None:
+                return first.result()
+            logger.warning(f"主请求 {first_provider}:{first_model} 失败，切换到 {second_provider}:{second_model}: "
+                           f"{first.exception()}")
+            self._count_hedge("failovers")
+            return await self._call_with_retry_async(messages, second_model, second_provider, temperature)
+        
+        logger.info(f"主请求 {first_provider}:{first_model} 超过 {delay:.2f}s 未返回，"
+                    f"发起对冲请求 -> {second_provider}:{second_model}")
+        self._count_hedge("hedged")
+        second = asyncio.ensure_future(self._call_with_retry_async(messages, second_model, second_provider, temperature))
+        
+        pending = {first, second}
+        errors = {}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        errors[task] = task.exception()
+                        continue
+                    if task is second:
+                        self._count_hedge("backup_wins")
+                    return task.result()
+            raise errors.get(first) or errors[second]
+        finally:
+            # 取消仍在进行的落败请求
+            for task in (first, second):
+                if not task.done():
+                    task.cancel()
+    
+    async def _open_with_retry(self, opener):
+        """按统一重试策略建立流式连接（开始输出后不再重试）"""
+        async for attempt in _retrying(asynchronous=True, max_retry_after=self.max_retry_after):
+            with attempt:
+                return await opener()
+    
+    async def _stream_deepseek_async(self, messages: List[Dict[str, str]], model: str, usage: Dict[str, int],
+                                     temperature: float = None):
+        """DeepSeek 异步流式输出，usage 在流结束时被填充"""
+        url, headers, data = self._build_deepseek_request(messages, model, stream=True, temperature=temperature)
+        session = get_async_session(self.config)
+        
+        async def opener():
+            response = await session.post(url, headers=headers, json=data, timeout=self._async_request_timeout())
+            try:
+                response.raise_for_status()
+            except Exception:
+                response.release()
+                raise
+            return response
+        
+        response = await self._open_with_retry(opener)
+        try:
+            async for raw_line in response.content:
+                done, text = self._parse_deepseek_sse(raw_line.decode('utf-8'), usage)
+                if done:
+                    break
+                if text:
+                    yield text
+        finally:
+            response.close()
+    
+    async def _stream_openai_async(self, messages: List[Dict[str, str]], model: str, usage: Dict[str, int],
+                                   temperature: float = None):
+        """OpenAI 异步流式输出"""
+        client = self._get_async_openai_client()
+        kwargs = self._build_openai_kwargs(messages, model, temperature)
+        kwargs["stream"] = True
+        kwargs["stream_options"] = {"include_usage": True}
+        
+        stream = await self._open_with_retry(lambda: client.chat.completions.create(**kwargs))
+        try:
+            async for chunk in stream:
+                if getattr(chunk, "usage", None):
+                    usage["prompt_tokens"] = chunk.usage.prompt_tokens
+                    usage["cached_tokens"] = cached_prompt_tokens(chunk.usage)
+                    usage["completion_tokens"] = chunk.usage.completion_tokens
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            # 调用方提前停止或任务被取消时关闭HTTP响应，连接归还连接池
+            await stream.close()
     
-    def call_api_stream(self, messages: List[Dict[str, str]], model: str = None):
+    async def _stream_anthropic_async(self, messages: List[Dict[str, str]], model: str, usage: Dict[str, int],
+                                      temperature: float = None):
+        """Anthropic 异步流式输出"""
+        client = self._get_async_anthropic_client()
+        kwargs = self._build_anthropic_kwargs(messages, model, temperature)
+        kwargs["stream"] = True
+        
+        stream = await self._open_with_retry(lambda: client.messages.create(**kwargs))
+        try:
+            async for event in stream:
+                if event.type == "message_start":
+                    (usage["prompt_tokens"], usage["cached_tokens"],
+                     usage["cache_write_tokens"]) = anthropic_prompt_usage(event.message.usage)
+                elif event.type == "message_delta" and getattr(event, "usage", None):
+                    usage["completion_tokens"] = event.usage.output_tokens
+                elif event.type == "content_block_delta" and getattr(event.delta, "text", None):
+                    yield event.delta.text
+        finally:
+            # 调用方提前停止或任务被取消时关闭HTTP响应，连接归还连接池
+            await stream.close()
+    
+    async def call_api_stream_async(self, messages: List[Dict[str, str]], model: str = None,
+                                    temperature: float = None) -> AsyncGenerator[str, None]:
         """
-        流式调用API（实验性功能）
+        异步流式调用API，逐段产出文本
         
-        目前仅支持 DeepSeek
+        支持 DeepSeek、OpenAI 与 Anthropic。连接建立阶段按 call_api 的策略重试，
+        流结束后按提供商返回的用量记录 APICallStats；调用方提前关闭生成器或任务被取消时
+        会中止上游请求，并与 call_api_stream 一样计入 aborted_streams。
+        启用对冲时以首token耗时作为触发条件，见 _stream_hedged_async
+        
+        Args:
+            messages: 消息列表
+            model: 模型名称，如果为None则使用默认模型
+            temperature: 采样温度，如果为None则使用配置中的值
+            
+        Yields:
+            响应文本片段
         """
         if not messages:
             raise ValueError("消息列表不能为空")
         
         model = model or self.model
-        provider = self.get_provider_for(model)
+        provider = self.get_provider_for_model(model)
+        self._stream_source_async(provider)
+        
+        replayed = self._cassette_replay(messages, model, provider, temperature)
+        if replayed is not None:
+            for chunk in replayed.get("chunks") or [replayed["content"]]:
+                yield chunk
+            return
+        
+        if self._hedging_enabled():
+            source = self._stream_hedged_async(messages, model, provider, temperature)
+        else:
+            source = self._stream_with_stats_async(messages, model, provider, temperature)
+        try:
+            async for text in source:
+                yield text
+        finally:
+            # 异步生成器不会随外层关闭而自动关闭
+            await source.aclose()
+    
+    def _stream_source_async(self, provider: str):
+        """提供商对应的异步流式实现"""
+        if provider == "deepseek":
+            return self._stream_deepseek_async
+        if provider == "openai":
+            return self._stream_openai_async
+        if provider == "anthropic":
+            return self._stream_anthropic_async
+        raise ValueError(f"不支持的提供商: {provider}")
+    
+    async def _stream_with_stats_async(self, messages: List[Dict[str, str]], model: str, provider: str,
+                                       temperature: float = None) -> AsyncGenerator[str, None]:
+        """_stream_with_stats 的异步版本"""
+        import asyncio
         
-        if provider != "deepseek":
-            raise NotImplementedError(f"流式响应暂不支持提供商: {provider}")
+        stream = self._stream_source_async(provider)
+        estimated_tokens = self.estimate_prompt_tokens(messages)
+        logger.info(f"开始异步流式API请求 - 提供商: {provider}, 模型: {model}, 预估Prompt Tokens: {estimated_tokens}")
+        start_time = time.time()
+        usage = {"prompt_tokens": 0, "completion_tokens": 0}
+        # 录制时保留原始分片，回放时按同样的节奏输出
+        chunks = [] if self.cassette is not None and self.cassette.can_record else None
         
-        logger.info(f"开始流式API请求 - 提供商: {provider}, 模型: {model}")
+        first_token_time = None
+        emitted = []
         
-        headers = {
-            "Authorization": f"Bearer {self.deepseek_api_key}",
-            "Content-Type": "application/json"
-        }
+        async with self._rate_limit_async(provider, estimated_tokens) as permit:
+            upstream = stream(messages, model, usage, temperature)
+            try:
+                async for text in upstream:
+                    if first_token_time is None:
+                        first_token_time = time.time()
+                    if chunks is not None:
+                        chunks.append(text)
+                    emitted.append(text)
+                    yield text
+            except (GeneratorExit, asyncio.CancelledError):
+                # 调用方提前关闭或任务被取消：立即中止上游请求，按已输出内容估算用量
+                await upstream.aclose()
+                self._record_aborted_stream(provider, model, usage, estimated_tokens, "".join(emitted),
+                                            start_time, first_token_time)
+                raise
+            except Exception as e:
+                self._record_failure(provider, model, e, start_time)
+                raise
+            if permit:
+                permit.settle(usage["prompt_tokens"] + usage["completion_tokens"])
         
-        data = {
-            "model": model,
-            "messages": self._prepare_messages(messages),
-            "max_tokens": self.config.get('api.deepseek.max_tokens', 4096),
-            "temperature": self.config.get('api.deepseek.temperature', 0.7),
-            "top_p": self.config.get('api.deepseek.top_p', 1.0),
-            "stream": True
-        }
+        stats = self._make_stream_stats(provider, model, usage)
+        stats.estimated_prompt_tokens = estimated_tokens
+        if first_token_time is not None:
+            stats.time_to_first_token = first_token_time - start_time
+        self._record_success(stats, start_time)
+        if chunks is not None:
+            self._cassette_record(messages, model, provider, temperature, "".join(chunks), stats, chunks)
+    
+    async def _stream_hedged_async(self, messages: List[Dict[str, str]], model: str, provider: str,
+                                   temperature: float = None) -> AsyncGenerator[str, None]:
+        """_stream_hedged 的异步版本，仍在等待首token的落败请求会被直接取消"""
+        import asyncio
+        (first_model, first_provider), (second_model, second_provider) = self._hedge_legs(model, provider)
+        delay = self._hedge_delay(first_provider, first_model, first_token=True)
         
-        url = f"{self.deepseek_base_url.rstrip('/')}/chat/completions"
+        first_stream = self._stream_with_stats_async(messages, first_model, first_provider, temperature)
+        first = asyncio.ensure_future(self._first_chunk(first_stream))
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if first in done:
+            if first.exception() is None:
+                async for text in self._resume_stream_async(first_stream, first.result()):
+                    yield text
+                return
+            logger.warning(f"主流式请求 {first_provider}:{first_model} 失败，切换到 {second_provider}:{second_model}: "
+                           f"{first.exception()}")
+            self._count_hedge("failovers")
+            second_stream = self._stream_with_stats_async(messages, second_model, second_provider, temperature)
+            try:
+                async for text in second_stream:
+                    yield text
+            finally:
+                await second_stream.aclose()
+            return
         
-        response = requests.post(url, headers=headers, json=data, timeout=self.config.get('api.timeout', 60), stream=True)
-        response.raise_for_status()
-        
-        for line in response.iter_lines():
-            if line:
-                line = line.decode('utf-8')
-                if line.startswith("data: "):
-                    data_str = line[6:]
-                    if data_str == "[DONE]":
-                        break
-                    try:
-                        chunk = json.loads(data_str)
-                        if "choices" in chunk and len(chunk["choices"]) > 0:
-                            delta = chunk["choices"][0].get("delta", {})
-                            if "content" in delta:
-                                yield delta["content"]
-                    except json.JSONDecodeError:
-                        continue
+        logger.info(f"主流式请求 {first_provider}:{first_model} 超过 {delay:.2f}s 未输出首token，"
+                    f"发起对冲请求 -> {second_provider}:{second_model}")
+        self._count_hedge("hedged")
+        second_stream = self._stream_with_stats_async(messages, second_model, second_provider, temperature)
+        second = asyncio.ensure_future(self._first_chunk(second_stream))
+        streams = {first: first_stream, second: second_stream}
+        
+        pending = {first, second}
+        errors = {}
+        winner = None
+        try:
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        errors[task] = task.exception()
+                    elif winner is None:
+                        winner = task
+        finally:
+            # 取消仍在等待首token的落败请求，已产出首个片段的落败流直接关闭
+            for task in (first, second):
+                if task is winner:
+                    continue
+                if not task.done():
+                    task.cancel()
+                    await asyncio.gather(task, return_exceptions=True)
+                await streams[task].aclose()
+        
+        if winner is None:
+            raise errors.get(first) or errors[second]
+        if winner is second:
+            self._count_hedge("backup_wins")
+        async for text in self._resume_stream_async(streams[winner], winner.result()):
+            yield text
+    
+    @staticmethod
+    async def _first_chunk(stream: AsyncGenerator[str, None]) -> Optional[str]:
+        """取出流的首个片段，流为空时返回None"""
+        try:
+            return await stream.__anext__()
+        except StopAsyncIteration:
+            return None
+    
+    @staticmethod
+    async def _resume_stream_async(stream: AsyncGenerator[str, None], head: Optional[str]) -> AsyncGenerator[str, None]:
+        """_resume_stream 的异步版本"""
+        try:
+            if head is None:
+                return
+            yield head
+            async for text in stream:
+                yield text
+        finally:
+            await stream.aclose()
 
 
 # 向后兼容的函数
@@ -462,7 +1829,7 @@ def call_deepseek_api(messages, api_key=None, base_url=None, model="deepseek-cha
         config.set('api.deepseek.default_model', model)
     
     api_manager = APIManager(config)
-    return api_manager.call_api(messages, model)
+    return api_manager.call_api(messages, model, temperature)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,160 @@
+"""
+API调用指标 - 固定内存的对数分桶直方图
+按 提供商/模型 聚合请求耗时、首token延迟(TTFT)与输出速度(tokens/s)，
+提供 p50/p95/p99 等百分位数，用于容量规划
+"""
+import math
+import threading
+from typing import Dict, Any, Optional, List
+
+
+class LogHistogram:
+    """
+    对数分桶直方图
+
+    桶边界按几何级数分布（每个数量级 buckets_per_decade 个桶），
+    内存固定，百分位数的相对误差约为 10^(1/buckets_per_decade) - 1（默认约 5.9%）
+    """
+
+    def __init__(self, min_value: float = 0.001, max_value: float = 100000.0, buckets_per_decade: int = 40):
+        self.min_value = min_value
+        self.max_value = max_value
+        self.buckets_per_decade = buckets_per_decade
+        self._log_min = math.log10(min_value)
+        bucket_count = int(math.ceil((math.log10(max_value) - self._log_min) * buckets_per_decade)) + 1
+        # 第 0 个桶收集所有小于 min_value 的值，最后一个桶收集超出上限的值
+        self.counts: List[int] = [0] * (bucket_count + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def _bucket(self, value: float) -> int:
+        if value < self.min_value:
+            return 0
+        index = int((math.log10(value) - self._log_min) * self.buckets_per_decade) + 1
+        return min(index, len(self.counts) - 1)
+
+    def _bucket_value(self, index: int) -> float:
+        """桶的代表值（上下边界的几何平均）"""
+        if index == 0:
+            return self.min_value
+        lower = 10 ** (self._log_min + (index - 1) / self.buckets_per_decade)
+        upper = 10 ** (self._log_min + index / self.buckets_per_decade)
+        return math.sqrt(lower * upper)
+
+    def record(self, value: float):
+        """记录一个样本（调用方负责加锁）"""
+        if value is None or value < 0 or math.isnan(value):
+            return
+        self.counts[self._bucket(value)] += 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, percentile: float) -> Optional[float]:
+        """估算百分位数，结果限制在实际观测到的最小/最大值之间"""
+        if self.count == 0:
+            return None
+        target = max(1, math.ceil(percentile / 100 * self.count))
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= target:
+                if index == len(self.counts) - 1:
+                    # 超出上限的桶没有上边界，用观测到的最大值
+                    return self.max
+                return min(max(self._bucket_value(index), self.min), self.max)
+        return self.max
+
+    def summary(self, digits: int = 4) -> Dict[str, Any]:
+        """汇总统计"""
+        if self.count == 0:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "mean": round(self.total / self.count, digits),
+            "min": round(self.min, digits),
+            "max": round(self.max, digits),
+            "p50": round(self.percentile(50), digits),
+            "p95": round(self.percentile(95), digits),
+            "p99": round(self.percentile(99), digits)
+        }
+
+
+class _ModelMetrics:
+    """单个 提供商/模型 的直方图集合"""
+
+    def __init__(self):
+        self.latency = LogHistogram()            # 请求总耗时（秒）
+        self.ttft = LogHistogram()               # 首token延迟（秒），仅流式调用
+        self.tokens_per_second = LogHistogram()  # 输出速度
+        self.errors = 0
+
+
+class APIMetrics:
+    """线程安全的 提供商/模型 指标聚合"""
+
+    def __init__(self):
+        self._models: Dict[str, _ModelMetrics] = {}
+        self._lock = threading.Lock()
+
+    def record(self, provider: str, model: str, success: bool, duration: float,
+               completion_tokens: int = 0, time_to_first_token: Optional[float] = None):
+        """
+        记录一次调用
+
+        Args:
+            duration: 请求总耗时（秒）
+            completion_tokens: 输出token数，用于计算 tokens/s
+            time_to_first_token: 首token延迟，流式调用时提供；tokens/s 按首token之后的生成时间计算
+        """
+        key = f"{provider}:{model}"
+        with self._lock:
+            metrics = self._models.get(key)
+            if metrics is None:
+                metrics = self._models[key] = _ModelMetrics()
+            if not success:
+                metrics.errors += 1
+                return
+
+            metrics.latency.record(duration)
+            if time_to_first_token is not None:
+                metrics.ttft.record(time_to_first_token)
+            generation_time = duration - (time_to_first_token or 0.0)
+            if completion_tokens > 0 and generation_time > 0:
+                metrics.tokens_per_second.record(completion_tokens / generation_time)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """各 提供商/模型 的百分位统计"""
+        with self._lock:
+            return {
+                key: {
+                    "latency": metrics.latency.summary(),
+                    "ttft": metrics.ttft.summary(),
+                    "tokens_per_second": metrics.tokens_per_second.summary(digits=2),
+                    "errors": metrics.errors
+                }
+                for key, metrics in self._models.items()
+            }
+
+    def reset(self):
+        """清空所有指标"""
+        with self._lock:
+            self._models.clear()
+
+
+# 进程级共享实例，Web 各会话的调用汇总到一起
+_metrics: Optional[APIMetrics] = None
+_metrics_lock = threading.Lock()
+
+
+def get_api_metrics() -> APIMetrics:
+    """获取进程级共享的API指标"""
+    global _metrics
+    if _metrics is None:
+        with _metrics_lock:
+            if _metrics is None:
+                _metrics = APIMetrics()
+    return _metrics
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+冷启动基准 - 基于 python -X importtime 测量模块导入与初始化耗时
+每个场景在全新的子进程中运行多次取中位数，超出预算时以非零状态码退出，可直接用于CI
+
+用法:
+    python benchmark_startup.py              # 运行全部场景并检查预算
+    python benchmark_startup.py --top 15     # 同时列出最耗时的导入
+    python benchmark_startup.py --json       # 输出机器可读的结果
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+from typing import Dict, List, Any, Tuple
+
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# 导入耗时预算（毫秒），取多次运行的中位数与之比较。
+# api_manager 实测中位数约 165-180ms，其中约 80ms 来自 requests（重试判定与共享连接池需要，
+# 保持在模块级导入）；提供商SDK、aiohttp 与 tenacity 均在首次使用时才导入。
+# 预算在实测值上预留约 10-20% 的余量，新增模块级导入超出余量时应改为延迟导入
+IMPORT_BUDGETS_MS = {
+    "api_manager": 200,
+}
+
+# 初始化场景：在子进程中执行代码并测量耗时（毫秒，包含导入）
+INIT_SCENARIOS = {
+    "APIManager()": (
+        "from config_manager import ConfigManager\n"
+        "from api_manager import APIManager\n"
+        "APIManager(ConfigManager())\n"
+        "import sys\n"
+        "assert 'tenacity' not in sys.modules"
+    ),
+    # 未启用数据库的 Agent：工具只注册描述符，网页工具依赖在首次调用时导入
+    "ReactAgent()": (
+        "from config_manager import ConfigManager\n"
+        "from agent import ReactAgent\n"
+        "ReactAgent(ConfigManager())\n"
+        "import sys\n"
+        "assert 'requests' not in sys.modules and 'mysql.connector' not in sys.modules"
+    ),
+    # 启用数据库时连续创建3个 Agent（与 web_app 每个会话一个 Agent 相同）；
+    # 连接由模拟的 mysql.connector.connect 建立（每次50ms），不依赖真实的MySQL服务。
+    # 数据库工具在首次调用时才连接，预热后所有 Agent 共享同一连接
+    "3x ReactAgent(数据库)": (
+        "import time, mysql.connector\n"
+        "from unittest import mock\n"
+        "from config_manager import ConfigManager\n"
+        "from agent import ReactAgent\n"
+        "def _connect(**kwargs):\n"
+        "    time.sleep(0.05)\n"
+        "    return mock.MagicMock()\n"
+        "config = ConfigManager()\n"
+        "config.set('database.enabled', True)\n"
+        "with mock.patch.object(mysql.connector, 'connect', side_effect=_connect) as connect:\n"
+        "    agents = [ReactAgent(config) for _ in range(3)]\n"
+        "assert connect.call_count == 0, connect.call_count"
+    ),
+    "3x ReactAgent(数据库, 预热)": (
+        "import time, mysql.connector\n"
+        "from unittest import mock\n"
+        "from config_manager import ConfigManager\n"
+        "from agent import ReactAgent\n"
+        "from database_tools import get_shared_database_stats\n"
+        "def _connect(**kwargs):\n"
+        "    time.sleep(0.05)\n"
+        "    return mock.MagicMock()\n"
+        "config = ConfigManager()\n"
+        "config.set('database.enabled', True)\n"
+        "config.set('tools.warm_up', True)\n"
+        "with mock.patch.object(mysql.connector, 'connect', side_effect=_connect) as connect:\n"
+        "    agents = [ReactAgent(config) for _ in range(3)]\n"
+        "assert connect.call_count == 1, connect.call_count\n"
+        "assert list(get_shared_database_stats().values()) == [3]"
+    ),
+}
+INIT_BUDGETS_MS = {
+    "APIManager()": 250,
+    "ReactAgent()": 250,
+    "3x ReactAgent(数据库)": 600,
+    "3x ReactAgent(数据库, 预热)": 1000,
+}
+
+
+def _run(args: List[str]) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable] + args, cwd=PROJECT_ROOT,
+                          capture_output=True, text=True, check=False)
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int]]:
+    """解析 -X importtime 输出为 [(模块名, 自身耗时us, 累计耗时us), ...]"""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3:
+            continue
+        entries.append((parts[2].strip(), int(parts[0]), int(parts[1])))
+    return entries
+
+
+def measure_import(module: str, runs: int) -> Dict[str, Any]:
+    """测量模块在全新进程中的导入耗时"""
+    samples = []
+    heaviest: Dict[str, int] = {}
+    for _ in range(runs):
+        result = _run(["-X", "importtime", "-c", f"import {module}"])
+        if result.returncode != 0:
+            raise RuntimeError(f"导入 {module} 失败:\n{result.stderr[-2000:]}")
+        entries = parse_importtime(result.stderr)
+        total = next((cumulative for name, _, cumulative in reversed(entries) if name == module), 0)
+        samples.append(total / 1000)
+        for name, self_us, _ in entries:
+            heaviest[name] = max(heaviest.get(name, 0), self_us)
+    return {
+        "median_ms": round(statistics.median(samples), 1),
+        "samples_ms": [round(sample, 1) for sample in samples],
+        "heaviest": sorted(heaviest.items(), key=lambda item: item[1], reverse=True)
+    }
+
+
+def measure_init(code: str, runs: int) -> Dict[str, Any]:
+    """测量一段初始化代码在全新进程中的耗时（含导入）"""
+    wrapped = (
+        "import time\n"
+        "_start = time.perf_counter()\n"
+        f"{code}\n"
+        "print('__elapsed__', (time.perf_counter() - _start) * 1000)\n"
+    )
+    samples = []
+    for _ in range(runs):
+        result = _run(["-c", wrapped])
+        lines = [line for line in result.stdout.splitlines() if line.startswith("__elapsed__")]
+        if result.returncode != 0 or not lines:
+            raise RuntimeError(f"初始化场景失败:\n{result.stderr[-2000:]}")
+        samples.append(float(lines[-1].split()[1]))
+    return {
+        "median_ms": round(statistics.median(samples), 1),
+        "samples_ms": [round(sample, 1) for sample in samples]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="冷启动耗时基准")
+    parser.add_argument("--runs", type=int, default=5, help="每个场景的运行次数")
+    parser.add_argument("--top", type=int, default=0, help="列出最耗时的N个导入")
+    parser.add_argument("--json", action="store_true", help="输出JSON")
+    args = parser.parse_args()
+
+    report = {"imports": {}, "init": {}, "over_budget": []}
+
+    for module, budget in IMPORT_BUDGETS_MS.items():
+        result = measure_import(module, args.runs)
+        result["budget_ms"] = budget
+        report["imports"][module] = result
+        if result["median_ms"] > budget:
+            report["over_budget"].append(f"import {module}")
+
+    for name, code in INIT_SCENARIOS.items():
+        result = measure_init(code, args.runs)
+        result["budget_ms"] = INIT_BUDGETS_MS.get(name)
+        report["init"][name] = result
+        if result["budget_ms"] is not None and result["median_ms"] > result["budget_ms"]:
+            report["over_budget"].append(name)
+
+    if args.json:
+        for result in report["imports"].values():
+            result["heaviest"] = result["heaviest"][:args.top or 10]
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print("📦 导入耗时（中位数）")
+        for module, result in report["imports"].items():
+            mark = "✅" if result["median_ms"] <= result["budget_ms"] else "❌"
+            print(f"  {mark} import {module}: {result['median_ms']}ms (预算 {result['budget_ms']}ms)")
+            for name, self_us in result["heaviest"][:args.top]:
+                print(f"       {self_us / 1000:8.1f}ms  {name}")
+        print("🚀 初始化耗时（中位数，含导入）")
+        for name, result in report["init"].items():
+            budget = result["budget_ms"]
+            mark = "✅" if budget is None or result["median_ms"] <= budget else "❌"
+            print(f"  {mark} {name}: {result['median_ms']}ms" + (f" (预算 {budget}ms)" if budget else ""))
+
+    if report["over_budget"]:
+        if not args.json:
+            print(f"\n超出预算: {', '.join(report['over_budget'])}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+录制/回放磁带 - 将真实的LLM交互保存到文件并离线回放
+模式:
+    record: 正常调用提供商，并把每次交互写入磁带
+    replay: 只从磁带回放，未录制的请求直接报错
+    auto:   有录制则回放，否则调用提供商并录制
+请求按消息内容、模型与采样参数的哈希匹配，与响应缓存使用同一套键
+"""
+import os
+import json
+import time
+import threading
+from typing import Dict, List, Any, Optional
+
+from logger import logger
+
+
+CASSETTE_MODES = ("record", "replay", "auto")
+
+
+class CassetteMissError(KeyError):
+    """回放模式下请求没有对应的录制"""
+
+
+class Cassette:
+    """单个磁带文件（JSON）"""
+
+    def __init__(self, path: str, mode: str = "auto"):
+        if mode not in CASSETTE_MODES:
+            raise ValueError(f"不支持的磁带模式: {mode}，可选: {', '.join(CASSETTE_MODES)}")
+        self.path = path
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self.stats = {"replayed": 0, "recorded": 0, "misses": 0}
+
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self._entries = json.load(f).get("interactions", {})
+        elif mode == "replay":
+            raise FileNotFoundError(f"磁带文件不存在: {path}")
+        logger.info(f"磁带已加载 - 模式: {mode}, 文件: {path}, 已录制: {len(self._entries)}")
+
+    @property
+    def can_record(self) -> bool:
+        return self.mode in ("record", "auto")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        查找录制
+
+        record 模式总是返回None（重新录制）；replay 模式未命中时抛出 CassetteMissError
+        """
+        if self.mode == "record":
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self.stats["replayed"] += 1
+                return entry
+            self.stats["misses"] += 1
+        if self.mode == "replay":
+            raise CassetteMissError(f"磁带中没有该请求的录制: {key[:12]}... ({self.path})")
+        return None
+
+    def put(self, key: str, provider: str, model: str, content: str, prompt_tokens: int = 0,
+            completion_tokens: int = 0, duration: float = 0.0, chunks: List[str] = None):
+        """写入一次交互并立即保存"""
+        if not self.can_record:
+            return
+        entry = {
+            "provider": provider,
+            "model": model,
+            "content": content,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "duration": round(duration, 4),
+            "recorded_at": time.time()
+        }
+        if chunks is not None:
+            entry["chunks"] = chunks
+        with self._lock:
+            self._entries[key] = entry
+            self.stats["recorded"] += 1
+            self._save()
+
+    def _save(self):
+        """原子地写回磁带文件（调用方持有锁）"""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "interactions": self._entries}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self.stats, "mode": self.mode, "path": self.path, "entries": len(self._entries)}
+
+
+# 同一路径的磁带在进程内共享
+_cassettes: Dict[str, Cassette] = {}
+_cassettes_lock = threading.Lock()
+
+
+def get_cassette(config) -> Optional[Cassette]:
+    """
+    获取配置的磁带
+
+    Args:
+        config: ConfigManager 实例，读取 api.cassette.mode / api.cassette.path
+
+    Returns:
+        未配置模式或路径时返回None
+    """
+    mode = config.get('api.cassette.mode', '')
+    path = config.get('api.cassette.path', '')
+    if not mode or not path:
+        return None
+    with _cassettes_lock:
+        cassette = _cassettes.get(path)
+        if cassette is None or cassette.mode != mode:
+            cassette = _cassettes[path] = Cassette(path, mode)
+    return cassette
@@ -37,18 +37,81 @@ class ConfigManager:
                 "deepseek": {
                     "api_key": os.getenv("DEEPSEEK_API_KEY", "your-deepseek-api-key-here"),
                     "base_url": os.getenv("DEEPSEEK_BASE_URL", "https://api.deepseek.com"),
-                    "default_model": os.getenv("DEEPSEEK_MODEL", "deepseek-chat")
+                    "default_model": os.getenv("DEEPSEEK_MODEL", "deepseek-chat"),
+                    "native_tools": os.getenv("DEEPSEEK_NATIVE_TOOLS", "false").lower() == "true"
                 },
                 "openai": {
                     "api_key": os.getenv("OPENAI_API_KEY", ""),
                     "base_url": os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1"),
-                    "default_model": os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+                    "default_model": os.getenv("OPENAI_MODEL", "gpt-4o-mini"),
+                    "native_tools": os.getenv("OPENAI_NATIVE_TOOLS", "false").lower() == "true"
                 },
                 "anthropic": {
                     "api_key": os.getenv("ANTHROPIC_API_KEY", ""),
-                    "default_model": os.getenv("ANTHROPIC_MODEL", "claude-3-5-sonnet-20241022")
+                    "default_model": os.getenv("ANTHROPIC_MODEL", "claude-3-5-sonnet-20241022"),
+                    "native_tools": os.getenv("ANTHROPIC_NATIVE_TOOLS", "false").lower() == "true"
                 },
-                "default_provider": os.getenv("LLM_PROVIDER", "deepseek")  # deepseek, openai, anthropic
+                "default_provider": os.getenv("LLM_PROVIDER", "deepseek"),  # deepseek, openai, anthropic
+                "http": {
+                    "pool_connections": int(os.getenv("HTTP_POOL_CONNECTIONS", "10")),
+                    "pool_maxsize": int(os.getenv("HTTP_POOL_MAXSIZE", "20")),
+                    "keep_alive": os.getenv("HTTP_KEEP_ALIVE", "true").lower() == "true",
+                    "connect_timeout": float(os.getenv("HTTP_CONNECT_TIMEOUT", "10")),
+                    "read_timeout": float(os.getenv("HTTP_READ_TIMEOUT", "60")),
+                    "async_limit": int(os.getenv("HTTP_ASYNC_LIMIT", "100"))
+                },
+                "cache": {
+                    "enabled": os.getenv("RESPONSE_CACHE_ENABLED", "false").lower() == "true",
+                    "max_entries": int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000")),
+                    "ttl": int(os.getenv("RESPONSE_CACHE_TTL", "3600")),
+                    "disk_path": os.getenv("RESPONSE_CACHE_DIR", ""),
+                    "max_disk_entries": int(os.getenv("RESPONSE_CACHE_MAX_DISK_ENTRIES", "10000")),
+                    "allow_nonzero_temperature": os.getenv("RESPONSE_CACHE_ALLOW_SAMPLING", "false").lower() == "true"
+                },
+                "hedging": {
+                    "enabled": os.getenv("HEDGING_ENABLED", "false").lower() == "true",
+                    "backup_model": os.getenv("HEDGING_BACKUP_MODEL", ""),
+                    "percentile": float(os.getenv("HEDGING_PERCENTILE", "95")),
+                    "default_delay": float(os.getenv("HEDGING_DEFAULT_DELAY", "5")),
+                    "min_delay": float(os.getenv("HEDGING_MIN_DELAY", "0.5")),
+                    "min_samples": int(os.getenv("HEDGING_MIN_SAMPLES", "5")),
+                    "latency_window": int(os.getenv("HEDGING_LATENCY_WINDOW", "100")),
+                    "demote_threshold": float(os.getenv("HEDGING_DEMOTE_THRESHOLD", "0.5")),
+                    "demote_cooldown": int(os.getenv("HEDGING_DEMOTE_COOLDOWN", "60")),
+                    "max_workers": int(os.getenv("HEDGING_MAX_WORKERS", "16"))
+                },
+                "rate_limit": {
+                    "enabled": os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true",
+                    "deepseek": {
+                        "rpm": int(os.getenv("DEEPSEEK_RPM", "0")),
+                        "tpm": int(os.getenv("DEEPSEEK_TPM", "0"))
+                    },
+                    "openai": {
+                        "rpm": int(os.getenv("OPENAI_RPM", "0")),
+                        "tpm": int(os.getenv("OPENAI_TPM", "0"))
+                    },
+                    "anthropic": {
+                        "rpm": int(os.getenv("ANTHROPIC_RPM", "0")),
+                        "tpm": int(os.getenv("ANTHROPIC_TPM", "0"))
+                    },
+                    "concurrency": {
+                        "initial": int(os.getenv("RATE_LIMIT_CONCURRENCY", "16")),
+                        "min": int(os.getenv("RATE_LIMIT_CONCURRENCY_MIN", "1")),
+                        "max": int(os.getenv("RATE_LIMIT_CONCURRENCY_MAX", "64"))
+                    },
+                    "max_retry_after": int(os.getenv("RATE_LIMIT_MAX_RETRY_AFTER", "60"))
+                },
+                "batch": {
+                    "max_concurrency": int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
+                },
+                "prompt_cache": {
+                    "enabled": os.getenv("PROMPT_CACHE_ENABLED", "true").lower() == "true",
+                    "cache_history": os.getenv("PROMPT_CACHE_HISTORY", "true").lower() == "true"
+                },
+                "cassette": {
+                    "mode": os.getenv("LLM_CASSETTE_MODE", ""),  # record, replay, auto
+                    "path": os.getenv("LLM_CASSETTE_PATH", "")
+                }
             },
             "max_tokens": int(os.getenv("MAX_TOKENS", "4000")),
             "temperature": float(os.getenv("TEMPERATURE", "0.7")),
@@ -84,17 +147,65 @@ class ConfigManager:
             },
             
             "conversation": {
-                "max_history": int(os.getenv("MAX_HISTORY", "10")),
+                # 可选的消息条数上限；默认只按 context_window 的 token 预算裁剪
+                "max_history": int(os.getenv("MAX_HISTORY")) if os.getenv("MAX_HISTORY") else None,
                 "context_window": int(os.getenv("CONTEXT_WINDOW", "8000")),
+                "response_reserve": int(os.getenv("RESPONSE_RESERVE", "1024")),
                 "auto_refresh_prompt": os.getenv("AUTO_REFRESH_PROMPT", "true").lower() == "true",
-                "refresh_threshold": int(os.getenv("REFRESH_THRESHOLD", "5"))
+                "refresh_threshold": int(os.getenv("REFRESH_THRESHOLD", "5")),
+                "early_stop": os.getenv("EARLY_STOP", "true").lower() == "true",
+                "early_stop_measure_every": int(os.getenv("EARLY_STOP_MEASURE_EVERY", "20")),
+                # 未设置时由 Agent 根据响应缓存决定（见 ReactAgent._request_temperature）
+                "agent_temperature": float(os.getenv("AGENT_TEMPERATURE")) if os.getenv("AGENT_TEMPERATURE") else None,
+                "summary": {
+                    "enabled": os.getenv("SUMMARY_ENABLED", "false").lower() == "true",
+                    "trigger_ratio": float(os.getenv("SUMMARY_TRIGGER_RATIO", "0.6")),
+                    "keep_recent": int(os.getenv("SUMMARY_KEEP_RECENT", "4")),
+                    "max_tokens": int(os.getenv("SUMMARY_MAX_TOKENS", "300")),
+                    "model": os.getenv("SUMMARY_MODEL", ""),
+                    "workers": int(os.getenv("SUMMARY_WORKERS", "2")),
+                    "max_sessions": int(os.getenv("SUMMARY_MAX_SESSIONS", "256")),
+                    "max_entries": int(os.getenv("SUMMARY_MAX_ENTRIES", "4"))
+                }
             },
             
             "tools": {
                 "search_timeout": int(os.getenv("SEARCH_TIMEOUT", "10")),
                 "file_size_limit": int(os.getenv("FILE_SIZE_LIMIT", "10485760")),  # 10MB
                 "enable_web_search": os.getenv("ENABLE_WEB_SEARCH", "true").lower() == "true",
-                "enable_file_operations": os.getenv("ENABLE_FILE_OPERATIONS", "true").lower() == "true"
+                "enable_file_operations": os.getenv("ENABLE_FILE_OPERATIONS", "true").lower() == "true",
+                "speculative_dispatch": os.getenv("SPECULATIVE_TOOL_DISPATCH", "true").lower() == "true",
+                "warm_up": os.getenv("TOOLS_WARM_UP", "false").lower() == "true",
+                "executor": {
+                    "max_workers": int(os.getenv("TOOL_MAX_WORKERS", "8")),
+                    "timeout": float(os.getenv("TOOL_TIMEOUT", "60")),
+                    "deadline": float(os.getenv("TOOL_BATCH_DEADLINE", "0")),
+                    "tool_timeouts": {},
+                    "concurrency": {
+                        "write_to_file": 1,
+                        "run_terminal_command": 1
+                    }
+                },
+                "cache": {
+                    "enabled": os.getenv("TOOL_CACHE_ENABLED", "true").lower() == "true",
+                    "max_entries": int(os.getenv("TOOL_CACHE_MAX_ENTRIES", "500")),
+                    "backend": os.getenv("TOOL_CACHE_BACKEND", ""),
+                    "disk_path": os.getenv("TOOL_CACHE_DIR", ".tool_cache"),
+                    "redis_url": os.getenv("TOOL_CACHE_REDIS_URL", "redis://localhost:6379/0"),
+                    "policies": {
+                        "search_web": {"ttl": 300, "max_entries": 500},
+                        "fetch_webpage_content": {"ttl": 600, "max_entries": 200},
+                        "check_product_stock": {"ttl": 30, "max_entries": 1000, "invalidate_on": ["product_name"]},
+                        "check_order_status": {"ttl": 30, "max_entries": 1000, "invalidate_on": ["order_id"]},
+                        "search_database": {"ttl": 60, "max_entries": 500}
+                    }
+                },
+                "run_memo": {
+                    "enabled": os.getenv("RUN_MEMO_ENABLED", "true").lower() == "true",
+                    "uncached": [],
+                    "cycle_repeats": int(os.getenv("RUN_MEMO_CYCLE_REPEATS", "3")),
+                    "max_cycle_period": int(os.getenv("RUN_MEMO_MAX_CYCLE_PERIOD", "3"))
+                }
             }
         }
     
@@ -298,15 +409,81 @@ api:
     api_key: "your-deepseek-api-key-here"
     base_url: "https://api.deepseek.com"
     default_model: "deepseek-chat"
+    native_tools: false     # 通过提供商原生 tools 字段调用工具（不在提示词中列出工具）
   
   openai:
     api_key: "your-openai-api-key-here"
     base_url: "https://api.openai.com/v1"
     default_model: "gpt-4o-mini"
+    native_tools: false     # 通过提供商原生 tools 字段调用工具（不在提示词中列出工具）
   
   anthropic:
     api_key: "your-anthropic-api-key-here"
     default_model: "claude-3-5-sonnet-20241022"
+    native_tools: false     # 通过提供商原生 tools 字段调用工具（不在提示词中列出工具）
+  
+  # 共享HTTP连接池（所有API调用复用）
+  http:
+    pool_connections: 10   # 缓存的host连接池数量
+    pool_maxsize: 20       # 每个host的最大连接数
+    keep_alive: true
+    connect_timeout: 10    # 建立连接超时（秒）
+    read_timeout: 60       # 等待响应超时（秒）
+    async_limit: 100       # 异步调用（call_api_async）的并发连接上限
+  
+  # LLM响应缓存（相同消息+模型+采样参数直接返回缓存结果）
+  cache:
+    enabled: false
+    max_entries: 1000      # 内存LRU条目上限
+    ttl: 3600              # 过期时间（秒），0表示不过期
+    disk_path: ""          # 磁盘缓存目录，留空则只使用内存
+    max_disk_entries: 10000  # 磁盘缓存条目上限，超出时先删过期条目，再删最旧的，0表示不限
+    allow_nonzero_temperature: false  # temperature > 0 时默认不缓存
+  
+  # 对冲请求：主提供商在延迟百分位内未返回时，同时请求备用模型，取先返回者
+  hedging:
+    enabled: false
+    backup_model: "gpt-4o-mini"  # 备用模型（按模型名自动选择提供商）
+    percentile: 95         # 以最近成功调用耗时（流式调用为首token耗时）的该百分位作为触发延迟
+    default_delay: 5       # 样本不足时的触发延迟（秒）
+    min_delay: 0.5
+    min_samples: 5
+    latency_window: 100    # 每个提供商保留的最近耗时样本数
+    demote_threshold: 0.5  # 成功率滑动平均低于该值时降级
+    demote_cooldown: 60    # 降级持续时间（秒）
+    max_workers: 16
+  
+  # 提供商限流：按 提供商+API密钥 共享配额，0 表示不限制
+  rate_limit:
+    enabled: true
+    deepseek:
+      rpm: 0               # 每分钟请求数
+      tpm: 0               # 每分钟tokens数
+    openai:
+      rpm: 500
+      tpm: 200000
+    anthropic:
+      rpm: 50
+      tpm: 40000
+    concurrency:           # 自适应并发上限：成功时缓慢增加，429/5xx 时减半
+      initial: 16
+      min: 1
+      max: 64
+    max_retry_after: 60    # 服务端 Retry-After 的最长等待（秒）
+  
+  # 批量调用（call_api_batch）
+  batch:
+    max_concurrency: 8
+  
+  # 提供商前缀缓存：系统提示词保持字节稳定；Anthropic 额外添加 cache_control 标记
+  prompt_cache:
+    enabled: true
+    cache_history: true    # Anthropic: 同时在最新一条消息处设置断点，复用多步对话历史
+  
+  # 录制/回放磁带：record 录制真实交互，replay 只回放（离线、可复现），auto 有则回放否则录制
+  cassette:
+    mode: ""
+    path: "cassettes/agent.json"
 
 # 模型参数
 max_tokens: 4000
@@ -346,10 +523,23 @@ security:
 
 # 对话配置
 conversation:
-  max_history: 10
-  context_window: 8000
+  max_history:             # 可选的历史消息条数上限，留空时只按 token 预算裁剪
+  context_window: 8000     # 每次请求的上下文token上限
+  response_reserve: 1024   # 为模型回复预留的token数
   auto_refresh_prompt: true
   refresh_threshold: 5
+  early_stop: true              # 流式输出中 final_answer 完整后立即返回并中止请求
+  early_stop_measure_every: 20  # 首次及此后每N次回复完整生成一次，用于估算提前结束节省的tokens与耗时
+  agent_temperature:            # Agent 请求的采样温度；留空时启用响应缓存则为 0（重复问题可命中缓存），否则为 0.1
+  summary:                 # 后台增量摘要：超过阈值后将最早的消息压缩为摘要
+    enabled: false         # 每个会话额外产生后台模型调用（计费），需要时再开启
+    trigger_ratio: 0.6     # 消息超过 (context_window - response_reserve) 的该比例时开始摘要
+    keep_recent: 4         # 始终原样保留的最近消息数
+    max_tokens: 300        # 摘要长度上限
+    model: ""              # 生成摘要的模型，留空使用默认模型
+    workers: 2             # 后台摘要线程数
+    max_sessions: 256      # 最多缓存摘要的会话数
+    max_entries: 4         # 每个会话最多保留的摘要数
 
 # 工具配置
 tools:
@@ -357,6 +547,36 @@ tools:
   file_size_limit: 10485760  # 10MB
   enable_web_search: true
   enable_file_operations: true
+  speculative_dispatch: true # 流式输出中 action 对象一闭合就开始执行，action 数组闭合后中止请求
+  warm_up: false             # 创建 Agent 时预先建立数据库连接、HTTP会话（默认在首次调用工具时加载）
+  # 同一步中的多个工具调用并发执行
+  executor:
+    max_workers: 8           # 工具线程池大小，1 表示顺序执行
+    timeout: 60              # 单个工具默认超时（秒），0 表示不限
+    deadline: 0              # 整批截止时间（秒），到期只返回已完成的结果；0 表示等待全部完成
+    tool_timeouts:           # 按工具名覆盖超时
+      search_web: 15
+    concurrency:             # 按工具名限制同时执行的调用数
+      write_to_file: 1
+      run_terminal_command: 1
+  cache:                     # 跨请求的工具结果缓存，只缓存下面列出的工具
+    enabled: true
+    max_entries: 500         # 策略未给出 max_entries 时每个工具的条目上限
+    backend: ""              # 共享后端：disk / redis，留空只使用进程内LRU
+    disk_path: ".tool_cache" # disk 后端目录，同一台机器上的工作进程共享
+    redis_url: "redis://localhost:6379/0"
+    policies:                # ttl 秒；invalidate_on 中的参数值作为失效键，如 product_name=安吉白茶
+      search_web: {ttl: 300, max_entries: 500}
+      fetch_webpage_content: {ttl: 600, max_entries: 200}
+      check_product_stock: {ttl: 30, max_entries: 1000, invalidate_on: [product_name]}
+      check_order_status: {ttl: 30, max_entries: 1000, invalidate_on: [order_id]}
+      search_database: {ttl: 60, max_entries: 500}
+    # write_to_file、run_terminal_command 等有副作用的工具始终不缓存
+  run_memo:                  # 单次运行内相同参数的工具调用直接复用结果
+    enabled: true
+    uncached: []             # 额外的每次都必须执行的工具；tool_cache.NEVER_CACHE 中有副作用的工具始终包含在内
+    cycle_repeats: 3         # 同一组动作连续出现该次数时以 loop_detected 状态提前结束
+    max_cycle_period: 3      # 检测的最长循环周期（步数）
 """
 
 
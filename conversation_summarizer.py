@@ -0,0 +1,254 @@
+"""
+后台增量对话摘要 - 对话超过token阈值后，将最早的若干轮压缩为一条持续更新的摘要消息
+摘要在后台线程中生成（与模型生成、工具执行并行），不阻塞请求：组装请求时只使用
+已经完成的摘要。每个会话的摘要按所覆盖消息的指纹缓存，新的摘要只在上一份摘要的
+基础上追加新覆盖的消息，已摘要的内容不会被重新计算
+"""
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Any, Callable, Optional, Tuple
+
+from logger import logger
+from token_counter import get_token_counter
+
+SUMMARY_PREFIX = "[此前对话摘要]"
+
+SUMMARY_INSTRUCTIONS = (
+    "你负责压缩对话历史。请将已有摘要与新增对话合并为一份新的摘要，保留用户目标、"
+    "已调用的工具及关键结果、已确认的事实和尚未完成的事项，省略寒暄与重复内容。"
+    "只输出摘要正文，不超过{max_tokens}个token。"
+)
+
+# summarize(已有摘要, 新增消息) -> 新摘要
+Summarize = Callable[[str, List[Dict[str, Any]]], str]
+
+
+def _message_digest(previous: str, message: Dict[str, Any]) -> str:
+    """链式指纹：前缀指纹 + 当前消息"""
+    payload = json.dumps(message, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha1((previous + payload).encode("utf-8")).hexdigest()
+
+
+def _prefix_digests(messages: List[Dict[str, Any]]) -> List[str]:
+    """digests[n] 为前 n 条消息的指纹"""
+    digests = [""]
+    for message in messages:
+        digests.append(_message_digest(digests[-1], message))
+    return digests
+
+
+def format_transcript(messages: List[Dict[str, Any]]) -> str:
+    """将消息转换为摘要模型可读的文本"""
+    lines = []
+    for message in messages:
+        content = message.get("content") or ""
+        for call in message.get("tool_calls") or []:
+            function = call.get("function", {})
+            content += f"\n调用工具 {function.get('name')}: {function.get('arguments')}"
+        lines.append(f"{message.get('role', 'user')}: {content}")
+    return "\n\n".join(lines)
+
+
+class ConversationSummarizer:
+    """进程级共享的对话摘要器"""
+
+    def __init__(self, summarize: Summarize, trigger_tokens: int = 4000, keep_recent: int = 4,
+                 pinned: int = 1, max_workers: int = 2, max_sessions: int = 256, max_entries: int = 4):
+        """
+        Args:
+            summarize: 生成摘要的函数 summarize(已有摘要, 新增消息)
+            trigger_tokens: 消息总token数超过该值时开始摘要
+            keep_recent: 始终原样保留的最近消息数
+            pinned: 始终原样保留的前几条非系统消息数（如用户的原始问题）
+            max_workers: 后台摘要线程数
+            max_sessions: 最多缓存的会话数，超出时淘汰最久未使用的会话
+            max_entries: 每个会话最多保留的摘要数，超出时丢弃覆盖范围最小（最旧）的摘要；
+                         较旧的摘要只在对话历史被改写、与新摘要的前缀不一致时才会用到
+        """
+        self.summarize = summarize
+        self.trigger_tokens = trigger_tokens
+        self.keep_recent = max(1, keep_recent)
+        self.pinned = pinned
+        self.max_sessions = max_sessions
+        self.max_entries = max(1, max_entries)
+        self._pool = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="summarizer")
+        # 会话 -> [(覆盖到的消息位置, 前缀指纹, 摘要)]，按覆盖位置递增
+        self._sessions: "OrderedDict[str, List[Tuple[int, str, str]]]" = OrderedDict()
+        self._pending: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self.stats = {"scheduled": 0, "summaries": 0, "failures": 0, "applied": 0}
+
+    def _head_size(self, messages: List[Dict[str, Any]]) -> int:
+        """开头的系统消息与固定消息的条数"""
+        head, kept = 0, 0
+        while head < len(messages):
+            if messages[head].get("role") != "system":
+                if kept >= self.pinned:
+                    break
+                kept += 1
+            head += 1
+        return head
+
+    def _cut(self, messages: List[Dict[str, Any]]) -> int:
+        """摘要覆盖到的位置；保留部分不能以工具结果开头（需紧跟发起调用的助手消息）"""
+        cut = len(messages) - self.keep_recent
+        while cut > 0 and messages[cut].get("role") == "tool":
+            cut -= 1
+        return cut
+
+    def _latest(self, session_id: str, digests: List[str]) -> Optional[Tuple[int, str, str]]:
+        """与当前消息前缀一致的最新摘要"""
+        with self._lock:
+            entries = self._sessions.get(session_id)
+            if not entries:
+                return None
+            self._sessions.move_to_end(session_id)
+            for entry in reversed(entries):
+                covered, digest, _ = entry
+                if covered < len(digests) and digests[covered] == digest:
+                    return entry
+        return None
+
+    def apply(self, session_id: str, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        用已完成的摘要替换被覆盖的消息，不等待进行中的摘要
+
+        Returns:
+            新的消息列表（不修改原列表）；没有可用摘要时原样返回
+        """
+        entry = self._latest(session_id, _prefix_digests(messages))
+        if entry is None:
+            return messages
+        covered, _, summary = entry
+        head = self._head_size(messages)
+        with self._lock:
+            self.stats["applied"] += 1
+        return messages[:head] + [{"role": "user", "content": f"{SUMMARY_PREFIX}\n{summary}"}] + messages[covered:]
+
+    def schedule(self, session_id: str, messages: List[Dict[str, Any]]) -> bool:
+        """
+        超过阈值时在后台更新摘要，立即返回
+
+        Returns:
+            是否提交了新的摘要任务
+        """
+        if get_token_counter().count_messages(messages) <= self.trigger_tokens:
+            return False
+        digests = _prefix_digests(messages)
+        head = self._head_size(messages)
+        cut = self._cut(messages)
+        entry = self._latest(session_id, digests)
+        start, previous = (entry[0], entry[2]) if entry else (head, "")
+        if cut <= start:
+            return False
+
+        with self._lock:
+            if session_id in self._pending:
+                return False
+            self._pending[session_id] = self._pool.submit(
+                self._run, session_id, previous, list(messages[start:cut]), cut, digests[cut])
+            self.stats["scheduled"] += 1
+        return True
+
+    def _run(self, session_id: str, previous: str, new_messages: List[Dict[str, Any]], cut: int, digest: str):
+        try:
+            summary = self.summarize(previous, new_messages).strip()
+            if not summary:
+                raise ValueError("摘要为空")
+            with self._lock:
+                entries = self._sessions.setdefault(session_id, [])
+                entries.append((cut, digest, summary))
+                entries.sort(key=lambda entry: entry[0])
+                del entries[:-self.max_entries]
+                self._sessions.move_to_end(session_id)
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+                self.stats["summaries"] += 1
+            logger.info(f"对话摘要已更新 - 会话: {session_id}, 覆盖消息: {cut}, 新增: {len(new_messages)}")
+        except Exception as e:
+            with self._lock:
+                self.stats["failures"] += 1
+            logger.warning(f"对话摘要失败 - 会话: {session_id}: {e}")
+        finally:
+            with self._lock:
+                self._pending.pop(session_id, None)
+
+    def wait(self, session_id: str, timeout: Optional[float] = None):
+        """等待会话进行中的摘要完成（用户两轮之间或测试中使用）"""
+        with self._lock:
+            future = self._pending.get(session_id)
+        if future is not None:
+            try:
+                future.result(timeout=timeout)
+            except Exception:
+                pass
+
+    def drop(self, session_id: str):
+        """丢弃会话的摘要缓存（会话结束时调用）"""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self.stats, "sessions": len(self._sessions), "pending": len(self._pending)}
+
+
+def llm_summarize(config, max_tokens: int = 300) -> Summarize:
+    """使用配置中的模型生成摘要"""
+    api_manager = None
+    lock = threading.Lock()
+
+    def summarize(previous: str, new_messages: List[Dict[str, Any]]) -> str:
+        nonlocal api_manager
+        with lock:
+            if api_manager is None:
+                from api_manager import APIManager
+                api_manager = APIManager(config)
+        content = f"已有摘要:\n{previous or '（无）'}\n\n新增对话:\n{format_transcript(new_messages)}"
+        messages = [
+            {"role": "system", "content": SUMMARY_INSTRUCTIONS.format(max_tokens=max_tokens)},
+            {"role": "user", "content": content}
+        ]
+        summary = api_manager.call_api(messages, model=config.get('conversation.summary.model') or None,
+                                       temperature=0)
+        return get_token_counter().truncate_text(summary, max_tokens)
+
+    return summarize
+
+
+_summarizer: Optional[ConversationSummarizer] = None
+_summarizer_lock = threading.Lock()
+
+
+def get_conversation_summarizer(config=None) -> Optional[ConversationSummarizer]:
+    """
+    获取进程级共享的对话摘要器
+
+    Args:
+        config: ConfigManager 实例，读取 conversation.* 配置；为None或未启用摘要（默认不启用，
+                摘要是额外的付费模型调用）时返回None
+    """
+    global _summarizer
+    if config is None or not config.get('conversation.summary.enabled', False):
+        return None
+    if _summarizer is not None:
+        return _summarizer
+
+    def setting(key, default):
+        return config.get(f'conversation.summary.{key}', default)
+
+    with _summarizer_lock:
+        if _summarizer is None:
+            budget = config.get('conversation.context_window', 8000) - config.get('conversation.response_reserve', 1024)
+            _summarizer = ConversationSummarizer(
+                summarize=llm_summarize(config, setting('max_tokens', 300)),
+                trigger_tokens=int(max(budget, 0) * setting('trigger_ratio', 0.6)),
+                keep_recent=setting('keep_recent', 4),
+                max_workers=setting('workers', 2),
+                max_sessions=setting('max_sessions', 256),
+                max_entries=setting('max_entries', 4)
+            )
+    return _summarizer
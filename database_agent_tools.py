@@ -4,6 +4,7 @@ Registers database tools for agent use with improved descriptions and functional
 """
 
 import logging
+import threading
 from typing import Dict, Any, Optional
 from pydantic import BaseModel, Field
 
@@ -27,75 +28,131 @@ class OrderStatusArgs(BaseModel):
     """Arguments for order status query"""
     order_id: str = Field(description="Order ID to check status for")
 
-def register_database_tools(tool_manager, config=None):
+def database_config_dict(config=None) -> Dict[str, Any]:
+    """
+    Normalize a database configuration to the dict used by database_tools
+    
+    Args:
+        config: A dict, a ConfigManager (database.* keys) or an object with
+                enable_database/db_* attributes
+    """
+    if isinstance(config, dict):
+        return config
+    if hasattr(config, 'get') and callable(config.get):
+        return {
+            'enable_database': config.get('database.enabled', False),
+            'host': config.get('database.host', 'localhost'),
+            'user': config.get('database.user', 'root'),
+            'password': config.get('database.password', ''),
+            'database': config.get('database.database', 'llm_agent_db'),
+            'port': config.get('database.port', 3306)
+        }
+    if getattr(config, 'enable_database', False):
+        return {
+            'enable_database': True,
+            'host': getattr(config, 'db_host', 'localhost'),
+            'user': getattr(config, 'db_user', 'root'),
+            'password': getattr(config, 'db_password', ''),
+            'database': getattr(config, 'db_name', 'llm_agent_db'),
+            'port': getattr(config, 'db_port', 3306)
+        }
+    return {}
+
+# (tool name, description, DatabaseTools method, args model)
+DATABASE_TOOL_SPECS = [
+    # Enhanced database search tool
+    ("search_database",
+     "搜索数据库中的产品信息、库存状态、订单详情、用户数据等。适用于查询具体数据如产品库存、订单状态、用户信息等。对于产品库存查询、订单状态检查等场景优先使用此工具。",
+     "search_knowledge_base", DatabaseSearchArgs),
+    # Direct SQL query tool
+    ("execute_sql_query",
+     "直接执行SQL查询语句来获取数据库中的精确数据。适用于需要特定数据查询的场景。",
+     "execute_sql_query", DatabaseQueryArgs),
+    # Product stock check tool
+    ("check_product_stock",
+     "直接查询特定产品的库存状态。输入产品名称，返回库存数量。",
+     "check_product_stock", ProductStockArgs),
+    # Order status check tool
+    ("check_order_status",
+     "直接查询特定订单的状态信息。输入订单ID，返回订单状态详情。",
+     "check_order_status", OrderStatusArgs),
+]
+
+class _LazyDatabaseTools:
+    """Acquires the shared database tools for a tool manager on the first database tool call"""
+    
+    def __init__(self, tool_manager, db_config: Dict[str, Any]):
+        self.tool_manager = tool_manager
+        self.db_config = db_config
+        self._lock = threading.Lock()
+    
+    def load(self):
+        """Connect (or join the shared connection); raises when the database is unavailable"""
+        from database_tools import acquire_database_tools, release_database_tools
+        
+        with self._lock:
+            if self.tool_manager.db_tools is None:
+                db_tools = acquire_database_tools(self.db_config)
+                if not (db_tools and db_tools.db_manager):
+                    release_database_tools(db_tools)
+                    raise RuntimeError("数据库不可用，请检查数据库配置与连接")
+                self.tool_manager.db_tools = db_tools
+                logger.info("数据库工具已连接")
+            return self.tool_manager.db_tools
+    
+    def method(self, name: str):
+        return lambda: getattr(self.load(), name)
+
+def register_database_tools(tool_manager, config=None, lazy: bool = False):
     """
     Register database tools with the tool manager
     
     Args:
         tool_manager: Tool manager instance
-        config: Database configuration (dict or object)
+        config: Database configuration (dict, ConfigManager or object)
+        lazy: Register the tools without connecting; the connection is made on the
+              first database tool call or by ``tool_manager.warm_up()``
+    
+    The tools come from the process-level shared provider in database_tools and
+    are stored as ``tool_manager.db_tools``; ``tool_manager.close()`` releases them.
     """
     try:
-        from database_tools import create_database_tools
+        from database_tools import acquire_database_tools, release_database_tools
+        from tool_registry import LazyFunction
         
-        # Handle both dict and object config
-        if isinstance(config, dict):
-            db_config = config
-        else:
-            # If config is an object, convert to dict
-            db_config = {}
-            if hasattr(config, 'enable_database') and config.enable_database:
-                db_config = {
-                    'enable_database': True,
-                    'host': getattr(config, 'db_host', 'localhost'),
-                    'user': getattr(config, 'db_user', 'root'),
-                    'password': getattr(config, 'db_password', ''),
-                    'database': getattr(config, 'db_name', 'llm_agent_db'),
-                    'port': getattr(config, 'db_port', 3306)
-                }
+        # Database tools are shared process-wide; register them at most once per tool manager
+        if getattr(tool_manager, 'db_tools', None) is not None or "search_database" in tool_manager.tools:
+            return True
         
-        # Create database tools instance
-        db_tools = create_database_tools(db_config)
+        db_config = database_config_dict(config)
+        if lazy:
+            if not db_config.get('enable_database', False):
+                logger.warning("数据库工具未启用")
+                return False
+            loader = _LazyDatabaseTools(tool_manager, db_config)
+            for name, description, method, args_schema in DATABASE_TOOL_SPECS:
+                tool_manager.register_tool(name=name, description=description,
+                                           function=LazyFunction(loader.method(method)),
+                                           args_schema=args_schema, warm_up=loader.load)
+            logger.info("数据库工具注册成功（首次调用时连接）")
+            return True
+        
+        db_tools = acquire_database_tools(db_config)
         
         if db_tools and db_tools.db_manager:
-            # Register enhanced database search tool
-            tool_manager.register_tool(
-                name="search_database",
-                description="搜索数据库中的产品信息、库存状态、订单详情、用户数据等。适用于查询具体数据如产品库存、订单状态、用户信息等。对于产品库存查询、订单状态检查等场景优先使用此工具。",
-                function=db_tools.search_knowledge_base,
-                args_schema=DatabaseSearchArgs
-            )
-            
-            # Register direct SQL query tool
-            tool_manager.register_tool(
-                name="execute_sql_query",
-                description="直接执行SQL查询语句来获取数据库中的精确数据。适用于需要特定数据查询的场景。",
-                function=db_tools.execute_sql_query,
-                args_schema=DatabaseQueryArgs
-            )
-            
-            # Register product stock check tool
-            tool_manager.register_tool(
-                name="check_product_stock",
-                description="直接查询特定产品的库存状态。输入产品名称，返回库存数量。",
-                function=db_tools.check_product_stock,
-                args_schema=ProductStockArgs
-            )
-            
-            # Register order status check tool
-            tool_manager.register_tool(
-                name="check_order_status", 
-                description="直接查询特定订单的状态信息。输入订单ID，返回订单状态详情。",
-                function=db_tools.check_order_status,
-                args_schema=OrderStatusArgs
-            )
+            for name, description, method, args_schema in DATABASE_TOOL_SPECS:
+                tool_manager.register_tool(name=name, description=description,
+                                           function=getattr(db_tools, method),
+                                           args_schema=args_schema)
             
+            tool_manager.db_tools = db_tools
             logger.info("数据库工具注册成功 - 包括搜索、SQL执行、产品库存和订单状态工具")
             return True
         else:
+            release_database_tools(db_tools)
             logger.warning("数据库工具未启用或初始化失败")
             return False
             
     except Exception as e:
         logger.error(f"数据库工具注册失败: {e}")
-        return False
\ No newline at end of file
+        return False
@@ -8,6 +8,8 @@ import mysql.connector
 from typing import Dict, Any, List, Optional
 import logging
 import re
+import hashlib
+import threading
 
 logger = logging.getLogger(__name__)
 
@@ -17,30 +19,56 @@ class DatabaseManager:
     def __init__(self, config):
         self.config = config
         self.connection = None
+        # The connection may be shared by several agents and tool threads; MySQL
+        # connections are not thread-safe, so queries on one manager are serialized
+        self._lock = threading.RLock()
         self.connect()
     
     def connect(self):
         """Establish database connection"""
         try:
+            # autocommit: a long-lived shared connection must not keep one
+            # REPEATABLE READ snapshot open, or every reader sees stale rows
             self.connection = mysql.connector.connect(
                 host=self.config['host'],
                 database=self.config['database'],
                 user=self.config['user'],
                 password=self.config['password'],
-                port=self.config.get('port', 3306)
+                port=self.config.get('port', 3306),
+                autocommit=True
             )
             logger.info("Database connection established")
         except Exception as e:
             logger.error(f"Database connection failed: {e}")
             raise
     
+    def close(self):
+        """Close the database connection"""
+        with self._lock:
+            if self.connection is not None:
+                try:
+                    self.connection.close()
+                except Exception as e:
+                    logger.warning(f"Failed to close database connection: {e}")
+                self.connection = None
+                logger.info("Database connection closed")
+    
+    def _ensure_connection(self):
+        """Reconnect if the server dropped the connection (e.g. after wait_timeout); call under _lock"""
+        if self.connection is None:
+            self.connect()
+        else:
+            self.connection.ping(reconnect=True, attempts=2, delay=0)
+    
     def execute_query(self, sql: str, params: tuple = None) -> List[Dict]:
         """Execute SQL query and return results as dictionaries"""
         try:
-            cursor = self.connection.cursor(dictionary=True)
-            cursor.execute(sql, params or ())
-            results = cursor.fetchall()
-            cursor.close()
+            with self._lock:
+                self._ensure_connection()
+                cursor = self.connection.cursor(dictionary=True)
+                cursor.execute(sql, params or ())
+                results = cursor.fetchall()
+                cursor.close()
             return results
         except Exception as e:
             logger.error(f"Query execution failed: {e}")
@@ -49,20 +77,22 @@ class DatabaseManager:
     def get_table_schema(self) -> Dict[str, List[str]]:
         """Get all table names and their columns from the database"""
         try:
-            cursor = self.connection.cursor()
-            
-            # Get all table names
-            cursor.execute("SHOW TABLES")
-            tables = [row[0] for row in cursor.fetchall()]
-            
-            # Get columns for each table
-            schema = {}
-            for table in tables:
-                cursor.execute(f"DESCRIBE {table}")
-                columns = [row[0] for row in cursor.fetchall()]
-                schema[table] = columns
-            
-            cursor.close()
+            with self._lock:
+                self._ensure_connection()
+                cursor = self.connection.cursor()
+                
+                # Get all table names
+                cursor.execute("SHOW TABLES")
+                tables = [row[0] for row in cursor.fetchall()]
+                
+                # Get columns for each table
+                schema = {}
+                for table in tables:
+                    cursor.execute(f"DESCRIBE {table}")
+                    columns = [row[0] for row in cursor.fetchall()]
+                    schema[table] = columns
+                
+                cursor.close()
             return schema
         except Exception as e:
             logger.error(f"Failed to get table schema: {e}")
@@ -424,4 +454,72 @@ class DatabaseTools:
 
 def create_database_tools(config):
     """Factory function to create database tools instance"""
-    return DatabaseTools(config)
\ No newline at end of file
+    return DatabaseTools(config)
+
+
+# Process-level database tools shared by every agent and ToolManager,
+# keyed by connection parameters: {key: [DatabaseTools, reference count]}
+_shared_tools: Dict[tuple, list] = {}
+_shared_lock = threading.Lock()
+
+
+def _connection_key(config: Dict[str, Any]) -> tuple:
+    # The password is part of the key (hashed, so it is not kept in the registry):
+    # a caller with different or wrong credentials must not join an existing connection
+    password = hashlib.sha256(str(config.get('password', '')).encode('utf-8')).hexdigest()
+    return (config.get('host', 'localhost'), int(config.get('port', 3306)),
+            config.get('user', 'root'), config.get('database', 'llm_agent_db'), password)
+
+
+def acquire_database_tools(config: Dict[str, Any]) -> Optional[DatabaseTools]:
+    """
+    Get the shared database tools for a connection, creating it on first use
+    
+    Every successful call must be paired with release_database_tools; the
+    connection is closed when the last holder releases it.
+    
+    Args:
+        config: Database configuration dict (enable_database, host, port, user, password, database)
+        
+    Returns:
+        The shared DatabaseTools, or None when the database is disabled or unreachable
+    """
+    if not isinstance(config, dict) or not config.get('enable_database', False):
+        return None
+    key = _connection_key(config)
+    with _shared_lock:
+        entry = _shared_tools.get(key)
+        if entry is None:
+            try:
+                tools = DatabaseTools(config)
+            except Exception as e:
+                logger.error(f"Failed to create shared database tools: {e}")
+                return None
+            entry = _shared_tools[key] = [tools, 0]
+        entry[1] += 1
+        return entry[0]
+
+
+def release_database_tools(tools: Optional[DatabaseTools]) -> None:
+    """Release a reference taken by acquire_database_tools"""
+    if tools is None:
+        return
+    with _shared_lock:
+        for key, entry in list(_shared_tools.items()):
+            if entry[0] is tools:
+                entry[1] -= 1
+                if entry[1] <= 0:
+                    del _shared_tools[key]
+                    if tools.db_manager:
+                        tools.db_manager.close()
+                return
+
+
+def get_shared_database_stats() -> Dict[str, int]:
+    """Open shared connections and their reference counts, keyed by host:port/database"""
+    stats: Dict[str, int] = {}
+    with _shared_lock:
+        for key, entry in _shared_tools.items():
+            name = f"{key[0]}:{key[1]}/{key[3]}"
+            stats[name] = stats.get(name, 0) + entry[1]
+    return stats
\ No newline at end of file
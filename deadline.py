@@ -0,0 +1,102 @@
+"""
+截止时间 - 在一次 Agent 运行的各个子操作之间传递剩余的时间预算
+运行开始时创建 Deadline 并通过 deadline_scope 设为当前截止时间，LLM请求、重试等待、
+工具执行和子进程都只使用剩余的时间，而不是各自固定的超时；时间用完时抛出
+DeadlineExceeded，由 Agent 返回已有的部分结果。
+
+当前截止时间保存在 contextvars 中：同一线程内的嵌套调用和 asyncio 任务自动可见，
+提交到线程池的任务需要通过 run_with_context 复制上下文
+"""
+import time
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, Optional
+
+
+class DeadlineExceeded(TimeoutError):
+    """截止时间已到"""
+
+
+class Deadline:
+    """基于单调时钟的截止时间，timeout 为None表示不限时"""
+
+    def __init__(self, timeout: Optional[float] = None):
+        self.timeout = timeout
+        self.expires_at = None if timeout is None else time.monotonic() + max(0.0, float(timeout))
+
+    def remaining(self) -> Optional[float]:
+        """剩余秒数（不小于0），不限时返回None"""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+    def check(self, operation: str = ""):
+        """已到截止时间时抛出 DeadlineExceeded"""
+        if self.expired:
+            suffix = f"，已取消: {operation}" if operation else ""
+            raise DeadlineExceeded(f"超过截止时间（{self.timeout}秒）{suffix}")
+
+    def limit(self, timeout: Optional[float], operation: str = "") -> Optional[float]:
+        """
+        将子操作自己的超时限制在剩余时间内
+
+        Raises:
+            DeadlineExceeded: 已没有剩余时间
+        """
+        self.check(operation)
+        remaining = self.remaining()
+        if remaining is None:
+            return timeout
+        return remaining if timeout is None or timeout <= 0 else min(timeout, remaining)
+
+
+_current: contextvars.ContextVar = contextvars.ContextVar("deadline", default=None)
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current.get()
+
+
+@contextmanager
+def deadline_scope(deadline: Optional[Deadline]):
+    """在代码块内设置当前截止时间；嵌套时保留更早到期的一个"""
+    outer = _current.get()
+    if deadline is None or (outer is not None and outer.expires_at is not None
+                            and (deadline.expires_at is None or outer.expires_at <= deadline.expires_at)):
+        deadline = outer
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
+
+
+def remaining_time(timeout: Optional[float], operation: str = "") -> Optional[float]:
+    """子操作可用的超时：timeout 与当前剩余时间中的较小者；没有当前截止时间时原样返回"""
+    deadline = _current.get()
+    return timeout if deadline is None else deadline.limit(timeout, operation)
+
+
+def run_with_context(fn: Callable, *args, **kwargs) -> Callable[[], Any]:
+    """绑定当前上下文（包括截止时间），用于提交到线程池"""
+    context = contextvars.copy_context()
+    return lambda: context.run(fn, *args, **kwargs)
+
+
+def iter_within(deadline: Optional[Deadline], iterator: Iterator) -> Iterator:
+    """
+    在截止时间内逐个取出元素，到期后停止
+
+    每次取元素时设置当前截止时间，适合由生成器驱动的流式请求（生成器内部不能长期持有上下文）
+    """
+    while deadline is None or not deadline.expired:
+        with deadline_scope(deadline):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
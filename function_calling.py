@@ -0,0 +1,136 @@
+"""
+原生工具调用 - 在提供商的 tools 字段与内部统一格式之间转换
+
+内部统一使用 OpenAI/DeepSeek 的消息格式：
+    助手消息: {"role": "assistant", "content": 文本, "tool_calls": [{"id", "type": "function",
+               "function": {"name", "arguments": JSON字符串}}]}
+    工具结果: {"role": "tool", "tool_call_id": 调用ID, "content": 结果文本}
+Anthropic 请求发送前再转换为 tool_use / tool_result 内容块
+"""
+import json
+from typing import Dict, List, Any, Optional
+
+from react_parser import loads_tolerant
+
+
+def openai_tools(schemas: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """工具描述 -> DeepSeek/OpenAI 的 tools 字段"""
+    return [{
+        "type": "function",
+        "function": {
+            "name": schema["name"],
+            "description": schema.get("description", ""),
+            "parameters": schema["parameters"]
+        }
+    } for schema in schemas]
+
+
+def anthropic_tools(schemas: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """工具描述 -> Anthropic 的 tools 字段"""
+    return [{
+        "name": schema["name"],
+        "description": schema.get("description", ""),
+        "input_schema": schema["parameters"]
+    } for schema in schemas]
+
+
+def _parse_arguments(arguments: Any) -> Dict[str, Any]:
+    """解析模型给出的参数；JSON字符串按容错方式解析"""
+    if isinstance(arguments, dict):
+        return arguments
+    if not arguments:
+        return {}
+    value, _, _ = loads_tolerant(str(arguments))
+    return value if isinstance(value, dict) else {}
+
+
+def tool_reply(content: Optional[str], tool_calls: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    构造统一的工具调用回复
+
+    Args:
+        content: 模型输出的文本（可能为空）
+        tool_calls: [{"id", "name", "arguments"}]，arguments 可以是字典或JSON字符串
+
+    Returns:
+        {"content": 文本, "tool_calls": [{"id", "name", "arguments": 字典}], "message": 可追加到历史的助手消息}
+    """
+    calls = [{
+        "id": call.get("id") or f"call_{index}",
+        "name": call["name"],
+        "arguments": _parse_arguments(call.get("arguments"))
+    } for index, call in enumerate(tool_calls or [])]
+
+    message = {"role": "assistant", "content": content or ""}
+    if calls:
+        message["tool_calls"] = [{
+            "id": call["id"],
+            "type": "function",
+            "function": {"name": call["name"], "arguments": json.dumps(call["arguments"], ensure_ascii=False)}
+        } for call in calls]
+    return {"content": content or "", "tool_calls": calls, "message": message}
+
+
+def openai_tool_calls(tool_calls: Any) -> List[Dict[str, Any]]:
+    """读取 DeepSeek（dict）或 OpenAI SDK（对象）响应中的 tool_calls"""
+    calls = []
+    for call in tool_calls or []:
+        if isinstance(call, dict):
+            function = call.get("function") or {}
+            calls.append({"id": call.get("id"), "name": function.get("name"), "arguments": function.get("arguments")})
+        else:
+            calls.append({"id": call.id, "name": call.function.name, "arguments": call.function.arguments})
+    return [call for call in calls if call["name"]]
+
+
+def anthropic_reply(blocks: Any) -> Dict[str, Any]:
+    """读取 Anthropic 响应的 text / tool_use 内容块"""
+    texts, calls = [], []
+    for block in blocks or []:
+        block_type = getattr(block, "type", None)
+        if block_type == "text":
+            texts.append(block.text)
+        elif block_type == "tool_use":
+            calls.append({"id": block.id, "name": block.name, "arguments": block.input})
+    return tool_reply("".join(texts), calls)
+
+
+def tool_result_message(call_id: str, result: Any) -> Dict[str, Any]:
+    """工具执行结果 -> 统一格式的 tool 消息"""
+    content = result if isinstance(result, str) else json.dumps(result, ensure_ascii=False, default=str)
+    return {"role": "tool", "tool_call_id": call_id, "content": content}
+
+
+def has_tool_messages(messages: List[Dict[str, Any]]) -> bool:
+    return any(msg.get("role") == "tool" or msg.get("tool_calls") for msg in messages)
+
+
+def to_anthropic_messages(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    将统一格式中的工具调用转换为 Anthropic 内容块
+
+    连续的 tool 消息合并为一条 user 消息中的多个 tool_result 块
+    """
+    converted: List[Dict[str, Any]] = []
+    for msg in messages:
+        if msg.get("role") == "tool":
+            block = {"type": "tool_result", "tool_use_id": msg["tool_call_id"], "content": msg.get("content", "")}
+            previous = converted[-1] if converted else None
+            if previous and previous["role"] == "user" and isinstance(previous["content"], list) \
+                    and previous["content"] and previous["content"][-1].get("type") == "tool_result":
+                previous["content"].append(block)
+            else:
+                converted.append({"role": "user", "content": [block]})
+        elif msg.get("tool_calls"):
+            blocks = [{"type": "text", "text": msg["content"]}] if msg.get("content") else []
+            for call in msg["tool_calls"]:
+                blocks.append({
+                    "type": "tool_use",
+                    "id": call["id"],
+                    "name": call["function"]["name"],
+                    "input": _parse_arguments(call["function"].get("arguments"))
+                })
+            converted.append({"role": "assistant", "content": blocks})
+        else:
+            converted.append(msg)
+    return converted
@@ -0,0 +1,210 @@
+"""
+共享HTTP传输层 - 进程级连接池与Keep-Alive
+所有 APIManager 实例与向后兼容的 call_deepseek_api 共用同一个连接池，
+避免每个 ReAct 步骤都重新进行 TCP+TLS 握手
+"""
+import threading
+import weakref
+import importlib.util
+from typing import Dict, Any, Optional, Tuple, TYPE_CHECKING
+
+import requests
+from requests.adapters import HTTPAdapter
+
+if TYPE_CHECKING:
+    import aiohttp
+
+# aiohttp 只在首次异步调用时导入，避免拖慢只使用同步接口的进程启动
+AIOHTTP_AVAILABLE = importlib.util.find_spec("aiohttp") is not None
+
+from logger import logger
+
+
+class PooledTransport:
+    """线程安全的连接池HTTP传输"""
+
+    def __init__(self, pool_connections: int = 10, pool_maxsize: int = 20,
+                 keep_alive: bool = True, connect_timeout: float = 10.0,
+                 read_timeout: float = 60.0):
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.keep_alive = keep_alive
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+
+        self._lock = threading.Lock()
+        self._request_count = 0
+        self._error_count = 0
+
+        self.session = requests.Session()
+        # 重试由上层 tenacity 负责，这里不做重复重试
+        self.adapter = HTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            max_retries=0,
+            pool_block=False
+        )
+        self.session.mount("https://", self.adapter)
+        self.session.mount("http://", self.adapter)
+        if not keep_alive:
+            self.session.headers["Connection"] = "close"
+
+    def _resolve_timeout(self, timeout) -> Tuple[float, float]:
+        """将单值超时拆分为 (连接超时, 读取超时)"""
+        if timeout is None:
+            return (self.connect_timeout, self.read_timeout)
+        if isinstance(timeout, (tuple, list)):
+            return (timeout[0], timeout[1])
+        # 单个数值视为读取超时，连接超时不超过它
+        return (min(self.connect_timeout, timeout), timeout)
+
+    def request(self, method: str, url: str, timeout=None, **kwargs) -> requests.Response:
+        """发送请求，复用连接池中的连接"""
+        with self._lock:
+            self._request_count += 1
+        try:
+            return self.session.request(method, url, timeout=self._resolve_timeout(timeout), **kwargs)
+        except requests.exceptions.RequestException:
+            with self._lock:
+                self._error_count += 1
+            raise
+
+    def post(self, url: str, timeout=None, **kwargs) -> requests.Response:
+        """发送POST请求"""
+        return self.request("POST", url, timeout=timeout, **kwargs)
+
+    def get(self, url: str, timeout=None, **kwargs) -> requests.Response:
+        """发送GET请求"""
+        return self.request("GET", url, timeout=timeout, **kwargs)
+
+    def get_stats(self) -> dict:
+        """获取连接池统计信息，包括连接复用率"""
+        new_connections = 0
+        pooled_requests = 0
+        # urllib3 在每个 host 的连接池上记录新建连接数与请求数
+        pools = self.adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            new_connections += getattr(pool, "num_connections", 0)
+            pooled_requests += getattr(pool, "num_requests", 0)
+
+        reused = max(pooled_requests - new_connections, 0)
+        reuse_ratio = (reused / pooled_requests * 100) if pooled_requests > 0 else 0
+
+        with self._lock:
+            request_count = self._request_count
+            error_count = self._error_count
+
+        return {
+            "request_count": request_count,
+            "errors": error_count,
+            "new_connections": new_connections,
+            "reused_connections": reused,
+            "reuse_ratio": round(reuse_ratio, 2),
+            "pool_connections": self.pool_connections,
+            "pool_maxsize": self.pool_maxsize,
+            "keep_alive": self.keep_alive,
+            "timeout": {"connect": self.connect_timeout, "read": self.read_timeout}
+        }
+
+    def close(self):
+        """关闭所有连接"""
+        self.session.close()
+
+
+# 进程级共享实例
+_transport: Optional[PooledTransport] = None
+_transport_lock = threading.Lock()
+
+
+def get_transport(config=None) -> PooledTransport:
+    """
+    获取进程级共享的传输实例
+
+    首次调用时根据配置创建，之后所有调用方共用同一个连接池
+
+    Args:
+        config: ConfigManager 实例，读取 api.http.* 配置
+
+    Returns:
+        共享的 PooledTransport 实例
+    """
+    global _transport
+    if _transport is not None:
+        return _transport
+
+    with _transport_lock:
+        if _transport is None:
+            settings: Dict[str, Any] = {}
+            if config is not None:
+                settings = {
+                    "pool_connections": config.get('api.http.pool_connections', 10),
+                    "pool_maxsize": config.get('api.http.pool_maxsize', 20),
+                    "keep_alive": config.get('api.http.keep_alive', True),
+                    "connect_timeout": config.get('api.http.connect_timeout', 10),
+                    "read_timeout": config.get('api.http.read_timeout', config.get('api.timeout', 60))
+                }
+            _transport = PooledTransport(**settings)
+            logger.info(f"HTTP连接池已创建 - 池数量: {_transport.pool_connections}, "
+                        f"每池连接上限: {_transport.pool_maxsize}")
+    return _transport
+
+
+def reset_transport():
+    """关闭并丢弃共享传输实例（主要用于测试或配置变更后）"""
+    global _transport
+    with _transport_lock:
+        if _transport is not None:
+            _transport.close()
+        _transport = None
+
+
+# aiohttp 会话绑定在事件循环上，每个循环一个共享会话
+_async_sessions = weakref.WeakKeyDictionary()
+_async_sessions_lock = threading.Lock()
+
+
+def get_async_session(config=None) -> "aiohttp.ClientSession":
+    """
+    获取当前事件循环共享的 aiohttp 会话
+
+    必须在协程中调用。同一事件循环上的所有异步API调用复用同一个连接池
+
+    Args:
+        config: ConfigManager 实例，读取 api.http.* 配置
+
+    Returns:
+        aiohttp.ClientSession 实例
+    """
+    if not AIOHTTP_AVAILABLE:
+        raise ImportError("异步API需要 aiohttp，请运行: pip install aiohttp")
+    import asyncio
+    import aiohttp
+
+    loop = asyncio.get_running_loop()
+    with _async_sessions_lock:
+        session = _async_sessions.get(loop)
+        if session is None or session.closed:
+            limit = config.get('api.http.async_limit', 100) if config is not None else 100
+            keep_alive = config.get('api.http.keep_alive', True) if config is not None else True
+            connector = aiohttp.TCPConnector(
+                limit=limit,
+                limit_per_host=limit,
+                force_close=not keep_alive
+            )
+            session = aiohttp.ClientSession(connector=connector)
+            _async_sessions[loop] = session
+            logger.info(f"异步HTTP连接池已创建 - 并发连接上限: {limit}")
+    return session
+
+
+async def close_async_session():
+    """关闭当前事件循环的共享会话"""
+    import asyncio
+    loop = asyncio.get_running_loop()
+    with _async_sessions_lock:
+        session = _async_sessions.pop(loop, None)
+    if session is not None and not session.closed:
+        await session.close()
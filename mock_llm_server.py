@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+本地模拟LLM服务 - 兼容 DeepSeek/OpenAI 的 /chat/completions 协议
+支持流式与非流式响应，可配置首token延迟、输出速度与错误注入，
+用于在无API密钥、零成本的情况下进行可复现的性能测试
+
+用法:
+    python mock_llm_server.py --port 8900 --latency 0.3 --tokens-per-second 50 --error-rate 0.05
+    然后将 api.deepseek.base_url 设置为 http://127.0.0.1:8900
+"""
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, List, Any, Optional
+
+from token_counter import get_token_counter
+
+
+DEFAULT_RESPONSE = json.dumps({
+    "thought": "这是本地模拟服务的回答，不需要调用工具。",
+    "final_answer": "你好！我是本地模拟的AI助手。"
+}, ensure_ascii=False, indent=2)
+
+
+class MockLLMConfig:
+    """模拟服务的行为配置"""
+
+    def __init__(self, latency: float = 0.0, tokens_per_second: float = 0.0, error_rate: float = 0.0,
+                 error_status: int = 500, retry_after: Optional[float] = None,
+                 responses: Optional[List[str]] = None, echo: bool = False, seed: Optional[int] = None,
+                 model_latency: Optional[Dict[str, float]] = None, keep_alive: bool = False):
+        """
+        Args:
+            latency: 首token前的延迟（秒）
+            tokens_per_second: 输出速度，0 表示不限速
+            error_rate: 按该概率返回错误
+            error_status: 注入错误使用的HTTP状态码
+            retry_after: 注入错误时返回的 Retry-After（秒）
+            responses: 依次循环返回的回答内容，为空时使用默认的 ReAct final_answer；
+                       元素为字典时作为助手消息返回（可包含 tool_calls，用于原生工具调用）
+            echo: 回显最后一条用户消息
+            seed: 随机种子，保证错误注入可复现
+            model_latency: 按请求的模型名覆盖 latency，用于模拟主备模型延迟不同（如对冲测试）
+            keep_alive: 先返回响应头，等待期间定期发送空行/SSE注释保活（同 DeepSeek），
+                        客户端可在首token前关闭连接
+        """
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.responses = responses or [DEFAULT_RESPONSE]
+        self.echo = echo
+        self.random = random.Random(seed)
+        self.model_latency = model_latency or {}
+        self.keep_alive = keep_alive
+        self._lock = threading.Lock()
+        self._next_response = 0
+        self.request_count = 0
+        self.error_count = 0
+        self.aborted_count = 0
+        self.last_request: Optional[Dict[str, Any]] = None
+
+    def next_content(self, messages: List[Dict[str, Any]]) -> Any:
+        """决定本次回答的内容"""
+        if self.echo:
+            user_messages = [msg for msg in messages if msg.get("role") == "user"]
+            return str(user_messages[-1].get("content", "")) if user_messages else ""
+        with self._lock:
+            content = self.responses[self._next_response % len(self.responses)]
+            self._next_response += 1
+        return content
+
+    def latency_for(self, model: str) -> float:
+        """本次请求的首token延迟"""
+        return self.model_latency.get(model, self.latency)
+
+    def should_fail(self) -> bool:
+        """按错误率决定本次请求是否注入错误"""
+        with self._lock:
+            self.request_count += 1
+            failed = self.error_rate > 0 and self.random.random() < self.error_rate
+            if failed:
+                self.error_count += 1
+        return failed
+
+    def record_abort(self):
+        """记录一次被客户端提前关闭的请求"""
+        with self._lock:
+            self.aborted_count += 1
+
+
+def _split_tokens(text: str) -> List[str]:
+    """将文本切分为近似token的片段，用于模拟逐token输出"""
+    pieces = []
+    buffer = ""
+    for char in text:
+        # 中日韩字符单独成片，其余按约4个字符一片
+        if ord(char) > 0x2E80:
+            if buffer:
+                pieces.append(buffer)
+                buffer = ""
+            pieces.append(char)
+            continue
+        buffer += char
+        if len(buffer) >= 4 or char in " \n":
+            pieces.append(buffer)
+            buffer = ""
+    if buffer:
+        pieces.append(buffer)
+    return pieces
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """处理 /chat/completions 请求"""
+
+    protocol_version = "HTTP/1.1"
+    mock_config: MockLLMConfig = None
+
+    def log_message(self, format, *args):
+        # 性能测试时不输出访问日志
+        pass
+
+    def _send_json(self, status: int, payload: Dict[str, Any], headers: Dict[str, str] = None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_chunk(self, data: bytes):
+        """按 HTTP chunked 编码写出一段数据"""
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"未知路径: {self.path}"}})
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            self._send_json(400, {"error": {"message": "请求体不是合法的JSON"}})
+            return
+
+        config = self.mock_config
+        config.last_request = body
+        if config.should_fail():
+            headers = {"Retry-After": str(config.retry_after)} if config.retry_after is not None else None
+            self._send_json(config.error_status, {"error": {"message": "模拟服务注入的错误"}}, headers)
+            return
+
+        messages = body.get("messages", [])
+        model = body.get("model", "mock-model")
+        content = config.next_content(messages)
+        message = {"role": "assistant", "content": content}
+        if isinstance(content, dict):
+            message = {"role": "assistant", **content}
+            content = content.get("content") or ""
+        counter = get_token_counter()
+        usage = {
+            "prompt_tokens": counter.count_messages(messages),
+            "completion_tokens": counter.count_message(message)
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+        stream = bool(body.get("stream"))
+        latency = config.latency_for(model)
+        try:
+            if config.keep_alive:
+                self._send_headers(stream)
+                self._keep_alive(latency, stream)
+            elif latency > 0:
+                time.sleep(latency)
+
+            if stream:
+                self._stream(model, content, usage, body)
+            else:
+                if config.tokens_per_second > 0:
+                    time.sleep(usage["completion_tokens"] / config.tokens_per_second)
+                payload = {
+                    "id": f"mock-{int(time.time() * 1000)}",
+                    "object": "chat.completion",
+                    "model": model,
+                    "choices": [{"index": 0, "message": message,
+                                 "finish_reason": "tool_calls" if message.get("tool_calls") else "stop"}],
+                    "usage": usage
+                }
+                if config.keep_alive:
+                    self._write_chunk(json.dumps(payload, ensure_ascii=False).encode("utf-8"))
+                    self._write_chunk(b"")
+                else:
+                    self._send_json(200, payload)
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端提前中止（例如已拿到完整答案，或对冲请求的另一路已胜出）
+            config.record_abort()
+            self.close_connection = True
+
+    def _send_headers(self, stream: bool):
+        """以 chunked 编码发送 200 响应头"""
+        self.send_response(200)
+        if stream:
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+        else:
+            self.send_header("Content-Type", "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        self.wfile.flush()
+
+    def _keep_alive(self, latency: float, stream: bool, interval: float = 0.05):
+        """等待首token期间定期发送保活数据，客户端断开时抛出 BrokenPipeError"""
+        deadline = time.monotonic() + latency
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            time.sleep(min(interval, remaining))
+            self._write_chunk(b": keep-alive\n\n" if stream else b"\n")
+
+    def _stream(self, model: str, content: str, usage: Dict[str, int], body: Dict[str, Any]):
+        """以 SSE 逐片输出"""
+        if not self.mock_config.keep_alive:
+            self._send_headers(True)
+
+        pieces = _split_tokens(content)
+        interval = 1.0 / self.mock_config.tokens_per_second if self.mock_config.tokens_per_second > 0 else 0
+        for piece in pieces:
+            chunk = {"model": model, "choices": [{"index": 0, "delta": {"content": piece}}]}
+            self._write_chunk(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            if interval:
+                time.sleep(interval)
+        if (body.get("stream_options") or {}).get("include_usage"):
+            chunk = {"model": model, "choices": [], "usage": usage}
+            self._write_chunk(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._write_chunk(b"")
+
+
+class MockLLMServer:
+    """可在测试中启动/停止的模拟服务"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, config: MockLLMConfig = None):
+        self.config = config or MockLLMConfig()
+        handler = type("MockHandler", (_Handler,), {"mock_config": self.config})
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockLLMServer":
+        """在后台线程中启动"""
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """停止服务"""
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟LLM服务（/chat/completions）")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", type=float, default=0.0, help="首token前的延迟（秒）")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="输出速度，0 表示不限速")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="注入错误的概率 0-1")
+    parser.add_argument("--error-status", type=int, default=500, help="注入错误的HTTP状态码")
+    parser.add_argument("--retry-after", type=float, default=None, help="注入错误时返回的 Retry-After")
+    parser.add_argument("--responses", help="回答内容文件，每行一个JSON字符串，循环返回")
+    parser.add_argument("--echo", action="store_true", help="回显最后一条用户消息")
+    parser.add_argument("--seed", type=int, default=None, help="随机种子")
+    parser.add_argument("--keep-alive", action="store_true", help="先返回响应头并在等待期间发送保活数据")
+    args = parser.parse_args()
+
+    responses = None
+    if args.responses:
+        with open(args.responses, "r", encoding="utf-8") as f:
+            responses = [json.loads(line) for line in f if line.strip()]
+
+    config = MockLLMConfig(
+        latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        retry_after=args.retry_after,
+        responses=responses,
+        echo=args.echo,
+        seed=args.seed,
+        keep_alive=args.keep_alive
+    )
+    server = MockLLMServer(args.host, args.port, config)
+    print(f"🧪 模拟LLM服务已启动: {server.url}/chat/completions")
+    print("⏹️  按 Ctrl+C 停止")
+    try:
+        server.server.serve_forever()
+    except KeyboardInterrupt:
+        server.server.server_close()
+        sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
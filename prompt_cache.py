@@ -0,0 +1,85 @@
+"""
+提供商前缀缓存 - 保持 prompt 前缀字节稳定并解析缓存命中用量
+DeepSeek 与 OpenAI 会自动缓存重复的请求前缀，Anthropic 需要显式的 cache_control 标记；
+三者都只在前缀逐字节相同时命中，因此系统提示词在发送前统一规范化
+"""
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Tuple
+
+
+# 规范化结果按原文缓存，同一份系统提示词每次得到同一个字符串对象
+_canonical: "OrderedDict[str, str]" = OrderedDict()
+_canonical_lock = threading.Lock()
+_CANONICAL_CACHE_SIZE = 64
+
+
+def canonical_prefix(text: str) -> str:
+    """
+    将系统提示词规范化为字节稳定的形式
+
+    统一换行符、去掉行尾空白和首尾空行，避免编辑器或模板渲染带来的细微差异破坏前缀缓存
+    """
+    if not isinstance(text, str):
+        return text
+    with _canonical_lock:
+        cached = _canonical.get(text)
+        if cached is not None:
+            _canonical.move_to_end(text)
+            return cached
+
+    lines = text.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    normalized = "\n".join(line.rstrip() for line in lines).strip("\n")
+
+    with _canonical_lock:
+        _canonical[text] = normalized
+        while len(_canonical) > _CANONICAL_CACHE_SIZE:
+            _canonical.popitem(last=False)
+    return normalized
+
+
+def _field(obj: Any, name: str, default: Any = 0) -> Any:
+    """从 dict 或 SDK 对象读取字段"""
+    if obj is None:
+        return default
+    if isinstance(obj, dict):
+        value = obj.get(name, default)
+    else:
+        value = getattr(obj, name, default)
+    return default if value is None else value
+
+
+def cached_prompt_tokens(usage: Any) -> int:
+    """
+    读取命中前缀缓存的 prompt tokens
+
+    DeepSeek 返回 prompt_cache_hit_tokens，OpenAI 返回 prompt_tokens_details.cached_tokens
+    """
+    hit = _field(usage, "prompt_cache_hit_tokens")
+    if hit:
+        return hit
+    return _field(_field(usage, "prompt_tokens_details", None), "cached_tokens")
+
+
+def anthropic_prompt_usage(usage: Any) -> Tuple[int, int, int]:
+    """
+    将 Anthropic 用量换算为 (prompt_tokens, 命中缓存tokens, 写入缓存tokens)
+
+    Anthropic 的 input_tokens 不含缓存部分，这里合计为与其他提供商一致的 prompt_tokens
+    """
+    read_tokens = _field(usage, "cache_read_input_tokens")
+    write_tokens = _field(usage, "cache_creation_input_tokens")
+    return _field(usage, "input_tokens") + read_tokens + write_tokens, read_tokens, write_tokens
+
+
+def with_cache_control(message: Dict[str, Any]) -> Dict[str, Any]:
+    """为 Anthropic 消息的最后一个内容块加上 ephemeral 缓存断点（返回新消息）"""
+    content = message.get("content")
+    if isinstance(content, str):
+        blocks = [{"type": "text", "text": content}]
+    elif isinstance(content, list) and content:
+        blocks = [dict(block) for block in content]
+    else:
+        return message
+    blocks[-1]["cache_control"] = {"type": "ephemeral"}
+    return {**message, "content": blocks}
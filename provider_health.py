@@ -0,0 +1,133 @@
+"""
+提供商健康度与延迟跟踪 - 用于对冲请求与故障切换
+记录每个 提供商/模型 最近的调用耗时与成功率，计算对冲触发延迟，
+并在健康分持续过低时自动降级该提供商。
+非流式调用的完整耗时与流式调用的首token耗时分别保存，互不影响对方的百分位数
+"""
+import time
+import math
+import threading
+from collections import deque
+from typing import Dict, Any, Optional
+
+from logger import logger
+
+
+class _ProviderState:
+    """单个 提供商/模型 的运行状态"""
+
+    def __init__(self, window: int):
+        self.durations = deque(maxlen=window)          # 非流式调用的完整耗时
+        self.first_token_times = deque(maxlen=window)  # 流式调用的首token耗时
+        self.score = 1.0            # 成功率的指数移动平均
+        self.samples = 0
+        self.consecutive_failures = 0
+        self.demoted_until = 0.0
+
+
+class ProviderHealth:
+    """线程安全的提供商健康度评分"""
+
+    def __init__(self, window: int = 100, alpha: float = 0.2, demote_threshold: float = 0.5,
+                 demote_cooldown: float = 60.0, min_samples: int = 5):
+        self.window = window
+        self.alpha = alpha
+        self.demote_threshold = demote_threshold
+        self.demote_cooldown = demote_cooldown
+        self.min_samples = min_samples
+        self._states: Dict[str, _ProviderState] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(provider: str, model: str) -> str:
+        return f"{provider}:{model}"
+
+    def _state(self, provider: str, model: str) -> _ProviderState:
+        """获取状态对象（调用方持有锁）"""
+        key = self._key(provider, model)
+        if key not in self._states:
+            self._states[key] = _ProviderState(self.window)
+        return self._states[key]
+
+    def record(self, provider: str, model: str, success: bool, duration: Optional[float] = None,
+               first_token: Optional[float] = None):
+        """
+        记录一次调用结果
+
+        Args:
+            duration: 非流式调用的完整耗时，为None时不计入延迟样本（如流式调用）
+            first_token: 流式调用的首token耗时
+        """
+        with self._lock:
+            state = self._state(provider, model)
+            state.samples += 1
+            state.score = (1 - self.alpha) * state.score + self.alpha * (1.0 if success else 0.0)
+            if success:
+                if duration is not None:
+                    state.durations.append(duration)
+                if first_token is not None:
+                    state.first_token_times.append(first_token)
+                state.consecutive_failures = 0
+                return
+
+            state.consecutive_failures += 1
+            if (state.samples >= self.min_samples and state.score < self.demote_threshold
+                    and state.demoted_until <= time.time()):
+                state.demoted_until = time.time() + self.demote_cooldown
+                logger.warning(f"提供商已降级 - {provider}:{model}, 健康分: {state.score:.2f}, "
+                               f"冷却: {self.demote_cooldown}s")
+
+    def is_demoted(self, provider: str, model: str) -> bool:
+        """是否处于降级冷却期；冷却结束后恢复尝试"""
+        with self._lock:
+            return self._state(provider, model).demoted_until > time.time()
+
+    def latency_percentile(self, provider: str, model: str, percentile: float,
+                           first_token: bool = False) -> Optional[float]:
+        """最近成功调用耗时（first_token=True 时为流式首token耗时）的百分位数，样本不足时返回None"""
+        with self._lock:
+            state = self._state(provider, model)
+            durations = sorted(state.first_token_times if first_token else state.durations)
+        if len(durations) < self.min_samples:
+            return None
+        index = min(len(durations) - 1, max(0, math.ceil(percentile / 100 * len(durations)) - 1))
+        return durations[index]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取各提供商的健康度统计"""
+        now = time.time()
+        with self._lock:
+            return {
+                key: {
+                    "score": round(state.score, 3),
+                    "samples": state.samples,
+                    "consecutive_failures": state.consecutive_failures,
+                    "demoted": state.demoted_until > now,
+                    "recent_latency_samples": len(state.durations),
+                    "recent_first_token_samples": len(state.first_token_times)
+                }
+                for key, state in self._states.items()
+            }
+
+
+# 进程级共享实例，所有 APIManager 共同学习延迟分布
+_health: Optional[ProviderHealth] = None
+_health_lock = threading.Lock()
+
+
+def get_provider_health(config=None) -> ProviderHealth:
+    """获取进程级共享的健康度跟踪器"""
+    global _health
+    if _health is None:
+        with _health_lock:
+            if _health is None:
+                settings = {}
+                if config is not None:
+                    settings = {
+                        "window": config.get('api.hedging.latency_window', 100),
+                        "demote_threshold": config.get('api.hedging.demote_threshold', 0.5),
+                        "demote_cooldown": config.get('api.hedging.demote_cooldown', 60),
+                        "min_samples": config.get('api.hedging.min_samples', 5)
+                    }
+                _health = ProviderHealth(**settings)
+    return _health
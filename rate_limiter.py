@@ -0,0 +1,350 @@
+"""
+提供商限流 - 进程级令牌桶与自适应并发
+按 提供商+API密钥 维护 请求/分钟 与 tokens/分钟 两个令牌桶，发送前等待配额；
+并发上限按 AIMD 调整：成功时缓慢增加，遇到 429/5xx 时减半。
+服务端返回 Retry-After 时，同一密钥的所有调用方一起暂停
+"""
+import time
+import hashlib
+import threading
+from contextlib import contextmanager, asynccontextmanager
+from typing import Dict, Any, Optional, Tuple
+
+from logger import logger
+
+
+# 触发并发收缩的HTTP状态码
+THROTTLE_STATUS_CODES = {429, 500, 502, 503, 504, 529}
+
+
+def error_status(error: BaseException) -> Optional[int]:
+    """从 requests/aiohttp/SDK 异常中提取HTTP状态码"""
+    status = getattr(error, "status_code", None) or getattr(error, "status", None)
+    if isinstance(status, int):
+        return status
+    response = getattr(error, "response", None)
+    status = getattr(response, "status_code", None) or getattr(response, "status", None)
+    return status if isinstance(status, int) else None
+
+
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    """读取异常对应响应中的 Retry-After（秒数或HTTP日期），没有时返回None"""
+    headers = getattr(error, "headers", None)
+    if headers is None:
+        headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+
+    value = headers.get("Retry-After") or headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except (TypeError, ValueError):
+        pass
+    try:
+        from email.utils import parsedate_to_datetime
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """按分钟补充的令牌桶，容量等于每分钟配额；rate 为0表示不限制"""
+
+    def __init__(self, per_minute: float):
+        self.per_minute = per_minute
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.level = min(self.per_minute, self.level + (now - self.updated) * self.per_minute / 60.0)
+        self.updated = now
+
+    def reserve(self, amount: float, now: float) -> float:
+        """
+        预留配额，返回需要等待的秒数（0 表示立即可用）
+
+        超出容量的单次请求按容量计算，避免永远等待；
+        预留后余额可以为负，后续调用方会相应等待更久
+        """
+        if self.per_minute <= 0:
+            return 0.0
+        self._refill(now)
+        amount = min(amount, self.per_minute)
+        self.level -= amount
+        if self.level >= 0:
+            return 0.0
+        return -self.level * 60.0 / self.per_minute
+
+    def adjust(self, delta: float):
+        """按实际用量修正预留（delta > 0 表示多用了，< 0 表示退还）"""
+        if self.per_minute > 0:
+            self.level = min(self.per_minute, self.level - delta)
+
+
+class AIMDLimiter:
+    """加性增、乘性减的并发上限"""
+
+    def __init__(self, initial: int = 16, min_limit: int = 1, max_limit: int = 64,
+                 decrease_factor: float = 0.5, decrease_cooldown: float = 1.0):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease_factor = decrease_factor
+        self.decrease_cooldown = decrease_cooldown
+        self.in_flight = 0
+        self.last_decrease = 0.0
+
+    def has_capacity(self) -> bool:
+        return self.in_flight < int(self.limit)
+
+    def on_success(self):
+        # 每个“窗口”（约 limit 次成功）增加 1
+        self.limit = min(self.max_limit, self.limit + 1.0 / max(self.limit, 1.0))
+
+    def on_throttle(self, now: float) -> bool:
+        """收缩并发上限；同一批并发失败只收缩一次"""
+        if now - self.last_decrease < self.decrease_cooldown:
+            return False
+        self.last_decrease = now
+        self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+        return True
+
+
+class _Lane:
+    """单个 提供商+API密钥 的限流状态"""
+
+    def __init__(self, rpm: float, tpm: float, concurrency: AIMDLimiter):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.concurrency = concurrency
+        self.paused_until = 0.0
+        self.waited = 0.0
+        self.throttled = 0
+        self.acquired = 0
+
+
+class Permit:
+    """一次已获准的调用，结束后需提交实际token用量"""
+
+    def __init__(self, limiter: "RateLimiter", lane: _Lane, reserved_tokens: int):
+        self._limiter = limiter
+        self._lane = lane
+        self._reserved_tokens = reserved_tokens
+        self._settled = False
+
+    def settle(self, actual_tokens: int):
+        """用实际消耗的token修正预留量"""
+        if self._settled or actual_tokens <= 0:
+            return
+        self._settled = True
+        with self._limiter._lock:
+            self._lane.tokens.adjust(actual_tokens - self._reserved_tokens)
+
+
+class RateLimiter:
+    """线程与协程共用的进程级限流器"""
+
+    def __init__(self, limits: Dict[str, Dict[str, float]] = None, concurrency: Dict[str, Any] = None,
+                 max_retry_after: float = 60.0):
+        self.limits = limits or {}
+        self.concurrency_settings = concurrency or {}
+        self.max_retry_after = max_retry_after
+        self._lanes: Dict[str, _Lane] = {}
+        self._lock = threading.Lock()
+        self._released = threading.Condition(self._lock)
+
+    @staticmethod
+    def _lane_key(provider: str, api_key: str) -> str:
+        # 统计中只保留密钥指纹
+        fingerprint = hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:8]
+        return f"{provider}:{fingerprint}"
+
+    def _lane(self, provider: str, api_key: str) -> _Lane:
+        """获取限流状态（调用方持有锁）"""
+        key = self._lane_key(provider, api_key)
+        if key not in self._lanes:
+            limits = self.limits.get(provider, {})
+            self._lanes[key] = _Lane(
+                rpm=limits.get("rpm", 0),
+                tpm=limits.get("tpm", 0),
+                concurrency=AIMDLimiter(
+                    initial=self.concurrency_settings.get("initial", 16),
+                    min_limit=self.concurrency_settings.get("min", 1),
+                    max_limit=self.concurrency_settings.get("max", 64)
+                )
+            )
+        return self._lanes[key]
+
+    def _try_enter(self, lane: _Lane, tokens: int) -> Tuple[bool, float]:
+        """
+        尝试占用并发槽并预留配额（调用方持有锁）
+
+        Returns:
+            (是否已占用并发槽, 需要等待的秒数)；已占用时等待的是令牌桶补充，
+            未占用时等待的是 Retry-After 暂停或其他调用释放槽位
+        """
+        now = time.monotonic()
+        if lane.paused_until > now:
+            return False, lane.paused_until - now
+        if not lane.concurrency.has_capacity():
+            return False, 0.05
+
+        lane.concurrency.in_flight += 1
+        lane.acquired += 1
+        return True, max(lane.requests.reserve(1, now), lane.tokens.reserve(tokens, now))
+
+    def _leave(self, lane: _Lane, error: Optional[BaseException]):
+        """释放并发槽，并根据调用结果调整并发上限"""
+        with self._lock:
+            lane.concurrency.in_flight -= 1
+            status = error_status(error) if error is not None else None
+            if error is None:
+                lane.concurrency.on_success()
+            elif status in THROTTLE_STATUS_CODES:
+                lane.throttled += 1
+                now = time.monotonic()
+                if lane.concurrency.on_throttle(now):
+                    logger.warning(f"提供商限流/过载 (HTTP {status})，并发上限降至 {int(lane.concurrency.limit)}")
+                retry_after = retry_after_seconds(error)
+                if retry_after:
+                    lane.paused_until = max(lane.paused_until, now + min(retry_after, self.max_retry_after))
+            self._released.notify_all()
+
+    def _cancel(self, lane: _Lane, tokens: int):
+        """请求未发出就被取消：释放并发槽并退还预留的配额"""
+        with self._lock:
+            lane.concurrency.in_flight -= 1
+            lane.requests.adjust(-1)
+            lane.tokens.adjust(-tokens)
+            self._released.notify_all()
+
+    @contextmanager
+    def limit(self, provider: str, api_key: str, tokens: int = 0):
+        """
+        同步获取调用许可
+
+        用法:
+            with limiter.limit("deepseek", api_key, estimated_tokens) as permit:
+                ...发送请求...
+                permit.settle(stats.total_tokens)
+        """
+        with self._lock:
+            lane = self._lane(provider, api_key)
+            while True:
+                entered, wait = self._try_enter(lane, tokens)
+                if entered:
+                    break
+                self._released.wait(timeout=wait)
+        if wait > 0:
+            # 已占用并发槽，等待配额补充；等待被中断时必须归还槽位与配额
+            self._record_wait(lane, wait)
+            try:
+                time.sleep(wait)
+            except BaseException:
+                self._cancel(lane, tokens)
+                raise
+
+        error = None
+        try:
+            yield Permit(self, lane, tokens)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self._leave(lane, error)
+
+    @asynccontextmanager
+    async def limit_async(self, provider: str, api_key: str, tokens: int = 0):
+        """异步获取调用许可，等待期间不阻塞事件循环"""
+        import asyncio
+        while True:
+            with self._lock:
+                lane = self._lane(provider, api_key)
+                entered, wait = self._try_enter(lane, tokens)
+            if entered:
+                break
+            await asyncio.sleep(wait)
+        if wait > 0:
+            # 对冲失败方被取消或调用方超时都可能发生在这里
+            self._record_wait(lane, wait)
+            try:
+                await asyncio.sleep(wait)
+            except BaseException:
+                self._cancel(lane, tokens)
+                raise
+
+        error = None
+        try:
+            yield Permit(self, lane, tokens)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self._leave(lane, error)
+
+    def _record_wait(self, lane: _Lane, wait: float):
+        with self._lock:
+            lane.waited += wait
+
+    def get_stats(self) -> Dict[str, Any]:
+        """各 提供商+密钥指纹 的限流统计"""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                key: {
+                    "concurrency_limit": int(lane.concurrency.limit),
+                    "in_flight": lane.concurrency.in_flight,
+                    "acquired": lane.acquired,
+                    "throttled": lane.throttled,
+                    "total_wait_seconds": round(lane.waited, 3),
+                    "paused_for": round(max(lane.paused_until - now, 0.0), 3),
+                    "rpm": lane.requests.per_minute,
+                    "tpm": lane.tokens.per_minute
+                }
+                for key, lane in self._lanes.items()
+            }
+
+
+# 进程级共享实例，所有 APIManager 和 Web 会话共用配额
+_limiter: Optional[RateLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter(config) -> Optional[RateLimiter]:
+    """
+    获取进程级共享的限流器
+
+    Args:
+        config: ConfigManager 实例，读取 api.rate_limit.* 配置
+
+    Returns:
+        未启用限流时返回None
+    """
+    global _limiter
+    if not config.get('api.rate_limit.enabled', True):
+        return None
+    if _limiter is not None:
+        return _limiter
+
+    with _limiter_lock:
+        if _limiter is None:
+            limits = {
+                provider: {
+                    "rpm": config.get(f'api.rate_limit.{provider}.rpm', 0),
+                    "tpm": config.get(f'api.rate_limit.{provider}.tpm', 0)
+                }
+                for provider in ("deepseek", "openai", "anthropic")
+            }
+            _limiter = RateLimiter(
+                limits=limits,
+                concurrency={
+                    "initial": config.get('api.rate_limit.concurrency.initial', 16),
+                    "min": config.get('api.rate_limit.concurrency.min', 1),
+                    "max": config.get('api.rate_limit.concurrency.max', 64)
+                },
+                max_retry_after=config.get('api.rate_limit.max_retry_after', 60)
+            )
+            logger.info(f"提供商限流已启用 - 初始并发上限: {_limiter.concurrency_settings['initial']}")
+    return _limiter
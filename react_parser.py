@@ -0,0 +1,524 @@
+"""
+ReAct 回复解析器 - 单遍、容错地从模型回复中提取 thought / action / final_answer
+
+模型回复经常不是严格的JSON：字符串里有未转义的换行或引号、末尾多余的逗号、
+外面包着 ```json 标记，或者因为达到长度上限被截断。这里用一个线性扫描的解析器
+一次性读出整个对象，能修复的直接修复，修复不了的记录精确的位置（字符区间与行列），
+用于生成给模型的格式错误提示。
+
+同时支持文本形式的 ReAct（Thought: / Action: / Final Answer:），
+既不是JSON也没有ReAct标签的回复视为直接回答。
+"""
+import re
+import json
+from dataclasses import dataclass, field
+from typing import Dict, List, Any, Optional, Tuple
+
+
+_NUMBER = re.compile(r'-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+-]?\d+)?')
+_LITERALS = {"true": True, "false": False, "null": None, "True": True, "False": False, "None": None}
+_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+_WHITESPACE = " \t\r\n"
+# 未转义的引号后面（跳过空白）出现这些字符时，才认为字符串在此结束
+_STRING_END_FOLLOWERS = ":}]"
+_VALUE_STARTS = '"{[]}-0123456789tfnTFN'
+
+# 回复开头的 ```json 标记后紧跟的对象，或正文中以已知字段开头的对象
+_FENCE = re.compile(r'\s*(?:```[a-zA-Z]*\s*)?')
+_EMBEDDED_OBJECT = re.compile(r'\{\s*"(?:question|thought|action|final_answer)"', re.IGNORECASE)
+# 文本 ReAct 标签，须位于行首
+_REACT_LABEL = re.compile(
+    r'^[ \t]*(thought|action|final[ _]answer|思考|动作|最终答案)[ \t]*[:：]',
+    re.IGNORECASE | re.MULTILINE
+)
+_PARTIAL_UNICODE_ESCAPE = re.compile(r'\\u[0-9a-fA-F]{0,3}$')
+_LABEL_FIELDS = {"thought": "thought", "思考": "thought", "action": "action", "动作": "action",
+                 "final answer": "final_answer", "final_answer": "final_answer", "最终答案": "final_answer"}
+
+
+@dataclass
+class ParseError:
+    """一处无法修复的格式错误，start/end 为原始回复中的字符区间"""
+    message: str
+    start: int
+    end: int
+    line: int
+    column: int
+
+    def __str__(self) -> str:
+        return f"第{self.line}行第{self.column}列: {self.message}"
+
+
+@dataclass
+class ReactStep:
+    """一次模型回复的解析结果"""
+    thought: Optional[str] = None
+    actions: List[Dict[str, Any]] = field(default_factory=list)
+    final_answer: Optional[str] = None
+    data: Dict[str, Any] = field(default_factory=dict)
+    errors: List[ParseError] = field(default_factory=list)
+    format: str = "text"  # json / react / text / native（原生工具调用）
+
+    @property
+    def has_action(self) -> bool:
+        return bool(self.actions)
+
+    @property
+    def is_final(self) -> bool:
+        return not self.actions and self.final_answer is not None
+
+    def error_summary(self, limit: int = 3) -> str:
+        """格式错误的简短描述，用于反馈给模型"""
+        return "；".join(str(error) for error in self.errors[:limit])
+
+
+class _TolerantJSONParser:
+    """容错的JSON解析器，每个字符只扫描常数次"""
+
+    def __init__(self, text: str, errors: List[ParseError]):
+        self.text = text
+        self.length = len(text)
+        self.errors = errors
+
+    def error(self, message: str, start: int, end: Optional[int] = None):
+        end = start + 1 if end is None else end
+        start = min(start, self.length)
+        line = self.text.count("\n", 0, start) + 1
+        column = start - (self.text.rfind("\n", 0, start) + 1) + 1
+        self.errors.append(ParseError(message, start, min(max(end, start), self.length), line, column))
+
+    def skip_whitespace(self, pos: int) -> int:
+        while pos < self.length and self.text[pos] in _WHITESPACE:
+            pos += 1
+        return pos
+
+    def parse_value(self, pos: int) -> Tuple[Any, int]:
+        pos = self.skip_whitespace(pos)
+        if pos >= self.length:
+            self.error("缺少值，回复在此处截断", pos)
+            return None, pos
+        char = self.text[pos]
+        if char == "{":
+            return self.parse_object(pos)
+        if char == "[":
+            return self.parse_array(pos)
+        if char == '"':
+            return self.parse_string(pos)
+        match = _NUMBER.match(self.text, pos)
+        if match:
+            number = match.group()
+            return (float(number) if any(c in number for c in ".eE") else int(number)), match.end()
+        for literal, value in _LITERALS.items():
+            if self.text.startswith(literal, pos):
+                return value, pos + len(literal)
+        # 未加引号的文本：读到结构字符为止，按字符串处理
+        end = pos
+        while end < self.length and self.text[end] not in ",}]\n":
+            end += 1
+        self.error("值缺少双引号", pos, end)
+        return self.text[pos:end].strip(), end
+
+    def parse_string(self, pos: int) -> Tuple[str, int]:
+        """读取字符串；允许未转义的换行、制表符和引号"""
+        start = pos
+        pos += 1
+        parts = []
+        chunk_start = pos
+        text = self.text
+        while pos < self.length:
+            char = text[pos]
+            if char == "\\":
+                parts.append(text[chunk_start:pos])
+                if pos + 1 >= self.length:
+                    pos += 1
+                    chunk_start = pos
+                    break
+                escaped = text[pos + 1]
+                if escaped in _ESCAPES:
+                    parts.append(_ESCAPES[escaped])
+                    pos += 2
+                elif escaped == "u" and re.fullmatch(r"[0-9a-fA-F]{4}", text[pos + 2:pos + 6]):
+                    parts.append(chr(int(text[pos + 2:pos + 6], 16)))
+                    pos += 6
+                else:
+                    # 非法转义（例如 Windows 路径 D:\data），保留反斜杠原样
+                    parts.append("\\")
+                    pos += 1
+                chunk_start = pos
+                continue
+            if char == '"' and self._closes_string(pos):
+                parts.append(text[chunk_start:pos])
+                return "".join(parts), pos + 1
+            pos += 1
+        parts.append(text[chunk_start:pos])
+        self.error("字符串未闭合，回复可能被截断", start, self.length)
+        return "".join(parts), self.length
+
+    def _closes_string(self, pos: int) -> bool:
+        """判断位于 pos 的引号是字符串结尾还是内容中未转义的引号"""
+        follow = self.skip_whitespace(pos + 1)
+        if follow >= self.length or self.text[follow] in _STRING_END_FOLLOWERS:
+            return True
+        if self.text[follow] == ",":
+            after = self.skip_whitespace(follow + 1)
+            return after >= self.length or self.text[after] in _VALUE_STARTS
+        return False
+
+    def parse_object(self, pos: int) -> Tuple[Dict[str, Any], int]:
+        start = pos
+        pos += 1
+        result: Dict[str, Any] = {}
+        while True:
+            pos = self.skip_whitespace(pos)
+            if pos >= self.length:
+                self.error("对象缺少右花括号 }，回复可能被截断", start, self.length)
+                return result, pos
+            char = self.text[pos]
+            if char == "}":
+                return result, pos + 1
+            if char == ",":
+                # 多余的逗号（包括末尾逗号）直接跳过
+                pos += 1
+                continue
+            if char == '"':
+                key, pos = self.parse_string(pos)
+            else:
+                end = pos
+                while end < self.length and self.text[end] not in ":,}\n":
+                    end += 1
+                key = self.text[pos:end].strip().strip("'")
+                if not key:
+                    self.error(f"意外的字符 {char!r}", pos)
+                    return result, pos
+                self.error("字段名缺少双引号", pos, end)
+                pos = end
+            pos = self.skip_whitespace(pos)
+            if pos < self.length and self.text[pos] == ":":
+                pos += 1
+            else:
+                self.error(f"字段 {key!r} 后缺少冒号", pos)
+            value, pos = self.parse_value(pos)
+            result[key] = value
+
+    def parse_array(self, pos: int) -> Tuple[List[Any], int]:
+        start = pos
+        pos += 1
+        result: List[Any] = []
+        while True:
+            pos = self.skip_whitespace(pos)
+            if pos >= self.length:
+                self.error("数组缺少右方括号 ]，回复可能被截断", start, self.length)
+                return result, pos
+            char = self.text[pos]
+            if char == "]":
+                return result, pos + 1
+            if char == ",":
+                pos += 1
+                continue
+            if char == "}":
+                self.error("数组缺少右方括号 ]", pos)
+                return result, pos
+            value, pos = self.parse_value(pos)
+            result.append(value)
+
+
+def loads_tolerant(text: str, pos: int = 0) -> Tuple[Any, List[ParseError], int]:
+    """
+    容错地解析一个JSON值
+
+    Returns:
+        (值, 格式错误列表, 结束位置)
+    """
+    errors: List[ParseError] = []
+    value, end = _TolerantJSONParser(text, errors).parse_value(pos)
+    return value, errors, end
+
+
+def _normalize_actions(value: Any, parser: _TolerantJSONParser, position: int) -> List[Dict[str, Any]]:
+    """将 action 字段统一为 [{"tool": ..., 参数...}, ...]"""
+    if value is None or value == "" or value == []:
+        return []
+    if isinstance(value, str):
+        # 有的模型把 action 数组写成字符串
+        value, errors, _ = loads_tolerant(value)
+        if errors or not isinstance(value, (list, dict)):
+            parser.error("action 必须是工具调用数组", position)
+            return []
+    if isinstance(value, dict):
+        value = [value]
+    if not isinstance(value, list):
+        parser.error("action 必须是工具调用数组", position)
+        return []
+    actions = []
+    for index, action in enumerate(value):
+        if isinstance(action, dict) and isinstance(action.get("tool"), str) and action["tool"]:
+            actions.append(action)
+        else:
+            parser.error(f"第{index + 1}个action缺少字符串类型的'tool'字段", position)
+    return actions
+
+
+def _text_or_none(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return value
+    return json.dumps(value, ensure_ascii=False)
+
+
+def _from_object(step: ReactStep, data: Dict[str, Any], parser: _TolerantJSONParser, position: int) -> ReactStep:
+    fields = {str(key).strip().lower().replace(" ", "_"): value for key, value in data.items()}
+    step.data = data
+    step.thought = _text_or_none(fields.get("thought"))
+    step.actions = _normalize_actions(fields.get("action"), parser, position)
+    step.final_answer = _text_or_none(fields.get("final_answer"))
+    return step
+
+
+def _parse_react_labels(text: str, matches: List["re.Match"], step: ReactStep) -> ReactStep:
+    """解析 Thought: / Action: / Final Answer: 形式的回复"""
+    parser = _TolerantJSONParser(text, step.errors)
+    sections = {}
+    for index, match in enumerate(matches):
+        end = matches[index + 1].start() if index + 1 < len(matches) else len(text)
+        name = _LABEL_FIELDS[match.group(1).lower().replace("_", " ")]
+        sections.setdefault(name, (match.end(), end))
+
+    step.format = "react"
+    if "thought" in sections:
+        start, end = sections["thought"]
+        step.thought = text[start:end].strip()
+    if "final_answer" in sections:
+        start, end = sections["final_answer"]
+        step.final_answer = text[start:end].strip()
+    if "action" in sections:
+        start, end = sections["action"]
+        value_start = parser.skip_whitespace(start)
+        if value_start < end and text[value_start] in "[{":
+            value, _ = parser.parse_value(value_start)
+            step.actions = _normalize_actions(value, parser, value_start)
+        else:
+            parser.error("Action 后应为JSON格式的工具调用数组", value_start, end)
+    step.data = {key: value for key, value in (("thought", step.thought), ("action", step.actions),
+                                               ("final_answer", step.final_answer)) if value}
+    return step
+
+
+def parse_react_response(text: str) -> ReactStep:
+    """
+    解析一次模型回复
+
+    回复以JSON对象开头（允许 ```json 标记）或正文中包含以已知字段开头的对象时按JSON解析；
+    否则按文本 ReAct 标签解析；都不是时整段回复作为 final_answer。
+
+    Returns:
+        ReactStep，errors 非空且没有 action / final_answer 时表示回复无法使用
+    """
+    step = ReactStep()
+    if not text or not text.strip():
+        return step
+
+    start = _FENCE.match(text).end()
+    if start >= len(text) or text[start] != "{":
+        embedded = _EMBEDDED_OBJECT.search(text)
+        start = embedded.start() if embedded else -1
+
+    if start >= 0:
+        parser = _TolerantJSONParser(text, step.errors)
+        data, _ = parser.parse_object(start)
+        step.format = "json"
+        return _from_object(step, data, parser, start)
+
+    labels = list(_REACT_LABEL.finditer(text))
+    if labels:
+        return _parse_react_labels(text, labels, step)
+
+    step.final_answer = text.strip()
+    return step
+
+
+class StreamingActionParser:
+    """
+    增量解析流式输出的 JSON 回复，action 数组中的每个对象一闭合就交给调用方，
+    并在确认没有 action 时给出完整的 final_answer：final_answer 字符串闭合后，
+    须等到下一个顶层字段不是 action 或顶层对象闭合
+
+    只跟踪结构（嵌套层级、字符串边界与顶层字段名），每个字符处理一次；
+    完整的对象再交给容错解析器解析。字符串中未转义引号的判断与 parse_react_response 一致，
+    需要看到后续字符时推迟到下一个分片再决定
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.stack: List[str] = []
+        self.started = False
+        self.start: Optional[int] = None    # 顶层对象的起始位置
+        self.complete = False        # 顶层对象已闭合
+        self.action_closed = False   # action 数组（或单个 action 对象）已闭合
+        self.action_end: Optional[int] = None
+        self.final_answer: Optional[str] = None     # 没有 action 时，已闭合的 final_answer
+        self.final_answer_end: Optional[int] = None
+        self._final_candidate: Optional[Tuple[Any, int]] = None
+        self._pos = 0
+        self._state = "value"        # value / string / escape / quote / quote_comma
+        self._string_start = 0
+        self._quote_pos = 0
+        self._last_string = ""
+        self._key = ""
+        self._expect_value = False
+        self._final_start: Optional[int] = None
+        self._action_kind: Optional[str] = None
+        self._action_depth = 0
+        self._element_start: Optional[int] = None
+
+    def partial_final_answer(self) -> Optional[str]:
+        """
+        目前收到的顶层 final_answer 文本（字符串未闭合时为已收到的部分，已解码转义），
+        用于逐段显示答案；还没有 final_answer 或已出现 action 时返回None
+        """
+        if self._action_kind is not None:
+            return None
+        if self.final_answer is not None:
+            return self.final_answer
+        if self._final_candidate is not None:
+            return self._final_candidate[0]
+        if self._final_start is None:
+            return None
+        end = self._quote_pos if self._state in ("quote", "quote_comma") else self._pos
+        raw = self.buffer[self._final_start + 1:end]
+        # 去掉末尾不完整的转义序列（\ 或 \u 后不足4位），等下一个分片补全
+        if self._state == "escape":
+            raw = raw[:-1]
+        else:
+            incomplete = _PARTIAL_UNICODE_ESCAPE.search(raw)
+            if incomplete:
+                before = raw[:incomplete.start()]
+                # 前面有偶数个反斜杠时 \u 才是转义的开头
+                if (len(before) - len(before.rstrip("\\"))) % 2 == 0:
+                    raw = before
+        value, _, _ = loads_tolerant('"' + raw + '"')
+        return value if isinstance(value, str) else None
+
+    @property
+    def stop_position(self) -> Optional[int]:
+        """回复中此后的内容都不再需要时，返回该位置（action 数组或 final_answer 的结尾）"""
+        return self.action_end if self.action_closed else self.final_answer_end
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        """
+        追加一个分片
+
+        Returns:
+            本次分片中闭合的 action 对象列表（已容错解析）
+        """
+        self.buffer += chunk
+        completed = []
+        while self._pos < len(self.buffer) and not self.complete:
+            action = self._step(self.buffer[self._pos])
+            if action is not None:
+                completed.append(action)
+        return completed
+
+    def _step(self, char: str) -> Optional[Dict[str, Any]]:
+        """处理当前位置的字符并前进；需要按结构重新处理时回退位置"""
+        pos = self._pos
+        self._pos += 1
+        state = self._state
+
+        if state == "escape":
+            self._state = "string"
+        elif state == "string":
+            if char == "\\":
+                self._state = "escape"
+            elif char == '"':
+                self._state = "quote"
+                self._quote_pos = pos
+        elif state in ("quote", "quote_comma"):
+            if char in _WHITESPACE:
+                return None
+            if state == "quote" and char == ",":
+                self._state = "quote_comma"
+            elif (state == "quote" and char in _STRING_END_FOLLOWERS) or \
+                    (state == "quote_comma" and char in _VALUE_STARTS):
+                # 引号确实是字符串结尾，从引号之后按结构重新处理
+                self._state = "value"
+                self._last_string = self.buffer[self._string_start + 1:self._quote_pos]
+                self._pos = self._quote_pos + 1
+                if self._final_start == self._string_start:
+                    self._on_final_answer()
+            else:
+                # 引号是内容的一部分，回到字符串中重新处理当前字符
+                self._state = "string"
+                self._pos = pos
+        elif not self.started:
+            if char == "{":
+                self.started = True
+                self.start = pos
+                self.stack.append(char)
+        elif char == '"':
+            self._state = "string"
+            self._string_start = pos
+            if self._expect_value and self._key == "final_answer" and len(self.stack) == 1:
+                self._final_start = pos
+            self._expect_value = False
+        elif char == ":" and len(self.stack) == 1:
+            self._key = self._last_string.strip().lower()
+            self._expect_value = True
+            if self._final_candidate is not None:
+                self._confirm_final_answer(self._key != "action")
+        elif char in "{[":
+            self._expect_value = False
+            self._on_open(char, pos)
+        elif char in "}]":
+            if self.stack:
+                self.stack.pop()
+            return self._on_close(pos)
+        elif char not in _WHITESPACE:
+            self._expect_value = False
+        return None
+
+    def _on_final_answer(self):
+        self._final_start = None
+        if self._action_kind is not None:
+            # 有 action 时 final_answer 不可信，以工具结果为准
+            return
+        value, _, _ = loads_tolerant(self.buffer[self._string_start:self._quote_pos + 1])
+        # 后面可能还有 action 字段，先记为候选
+        self._final_candidate = (value, self._quote_pos + 1)
+
+    def _confirm_final_answer(self, confirmed: bool):
+        if confirmed:
+            self.final_answer, self.final_answer_end = self._final_candidate
+        self._final_candidate = None
+
+    def _on_open(self, char: str, pos: int):
+        depth = len(self.stack)
+        if depth == 1 and self._key == "action" and self._action_kind is None:
+            self._action_kind = char
+            self._action_depth = depth + 1
+            if char == "{":
+                self._element_start = pos
+        elif self._action_kind == "[" and not self.action_closed and char == "{" and depth == self._action_depth:
+            self._element_start = pos
+        self.stack.append(char)
+
+    def _on_close(self, pos: int) -> Optional[Dict[str, Any]]:
+        depth = len(self.stack)
+        if depth == 0:
+            self.complete = True
+            if self._final_candidate is not None:
+                self._confirm_final_answer(True)
+        if self._action_kind is None or self.action_closed:
+            return None
+
+        action = None
+        element_closed = depth == (self._action_depth if self._action_kind == "[" else self._action_depth - 1)
+        if self._element_start is not None and element_closed:
+            value, _, _ = loads_tolerant(self.buffer[self._element_start:pos + 1])
+            self._element_start = None
+            if isinstance(value, dict) and isinstance(value.get("tool"), str) and value["tool"]:
+                action = value
+        if depth == self._action_depth - 1:
+            self.action_closed = True
+            self.action_end = pos + 1
+        return action
@@ -0,0 +1,269 @@
+"""
+LLM响应缓存 - 基于内容哈希的两级缓存
+内存LRU（带TTL与容量上限）+ 可选磁盘缓存（进程重启后仍可命中，条目数有上限）
+"""
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional
+
+from logger import logger
+
+
+class ResponseCache:
+    """按消息内容、模型和采样参数缓存 LLM 响应"""
+
+    def __init__(self, max_entries: int = 1000, ttl: float = 3600, disk_path: str = "",
+                 allow_nonzero_temperature: bool = False, max_disk_entries: int = 10000):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk_path = disk_path
+        self.max_disk_entries = max_disk_entries
+        self.allow_nonzero_temperature = allow_nonzero_temperature
+
+        self._memory: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {
+            "hits": 0,
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "bypassed": 0,
+            "saved_tokens": 0,
+            "saved_cost": 0.0,
+            "disk_evictions": 0
+        }
+
+        # 磁盘条目数的估计值（多个进程共用目录时可能偏小），超过上限时才扫描目录
+        self._disk_entries = 0
+        if self.disk_path:
+            os.makedirs(self.disk_path, exist_ok=True)
+            self._disk_entries = len(self._disk_files())
+
+    @staticmethod
+    def make_key(messages: List[Dict[str, Any]], model: str, params: Dict[str, Any]) -> str:
+        """根据规范化的消息、模型和采样参数计算缓存键"""
+        normalized = [
+            {"role": msg.get("role"), "content": str(msg.get("content", "")).strip()}
+            for msg in messages
+            if isinstance(msg, dict) and "role" in msg and "content" in msg
+        ]
+        payload = json.dumps(
+            {"messages": normalized, "model": model, "params": params},
+            sort_keys=True, ensure_ascii=False, separators=(",", ":")
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def should_bypass(self, params: Dict[str, Any]) -> bool:
+        """temperature > 0 时响应不确定，默认不缓存"""
+        temperature = params.get("temperature") or 0
+        if temperature > 0 and not self.allow_nonzero_temperature:
+            with self._lock:
+                self.stats["bypassed"] += 1
+            return True
+        return False
+
+    def _disk_file(self, key: str) -> str:
+        return os.path.join(self.disk_path, f"{key}.json")
+
+    def _disk_files(self) -> List[str]:
+        try:
+            return [os.path.join(self.disk_path, name) for name in os.listdir(self.disk_path)
+                    if name.endswith(".json")]
+        except OSError:
+            return []
+
+    def _prune_disk(self):
+        """
+        磁盘条目超出上限时清理：先删除过期条目，再按修改时间删除最旧的，
+        直到不超过上限的 90%（留出余量，避免每次写入都扫描目录）
+        """
+        entries = []
+        for path in self._disk_files():
+            try:
+                entries.append((os.path.getmtime(path), path))
+            except OSError:
+                continue
+        entries.sort()
+        target = int(self.max_disk_entries * 0.9)
+        now = time.time()
+        keep = len(entries)
+        removed = 0
+        for mtime, path in entries:
+            expired = self.ttl > 0 and now - mtime > self.ttl
+            if not expired and keep <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            keep -= 1
+            removed += 1
+        with self._lock:
+            self._disk_entries = keep
+            self.stats["disk_evictions"] += removed
+
+    def _is_expired(self, entry: Dict[str, Any]) -> bool:
+        return self.ttl > 0 and time.time() - entry["created_at"] > self.ttl
+
+    def _load_from_disk(self, key: str) -> Optional[Dict[str, Any]]:
+        """从磁盘读取缓存条目，过期则删除"""
+        path = self._disk_file(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"读取磁盘缓存失败 {path}: {e}")
+            return None
+        if self._is_expired(entry):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return entry
+
+    def _save_to_disk(self, key: str, entry: Dict[str, Any]):
+        """原子地写入磁盘缓存，超出条目上限时清理"""
+        path = self._disk_file(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        is_new = not os.path.exists(path)
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"写入磁盘缓存失败 {path}: {e}")
+            return
+        if not is_new or self.max_disk_entries <= 0:
+            return
+        with self._lock:
+            self._disk_entries += 1
+            over_limit = self._disk_entries > self.max_disk_entries
+        if over_limit:
+            self._prune_disk()
+
+    def _put_memory(self, key: str, entry: Dict[str, Any]):
+        """写入内存LRU，超出容量时淘汰最久未使用的条目（调用方持有锁）"""
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        查询缓存
+
+        Returns:
+            命中时返回条目 {"content", "prompt_tokens", "completion_tokens", "cost", "created_at"}，否则返回None
+        """
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and self._is_expired(entry):
+                del self._memory[key]
+                entry = None
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self._record_hit(entry, "memory_hits")
+                return entry
+
+        if self.disk_path:
+            entry = self._load_from_disk(key)
+            if entry is not None:
+                with self._lock:
+                    self._put_memory(key, entry)
+                    self._record_hit(entry, "disk_hits")
+                return entry
+
+        with self._lock:
+            self.stats["misses"] += 1
+        return None
+
+    def _record_hit(self, entry: Dict[str, Any], tier: str):
+        """记录命中及节省的token与成本（调用方持有锁）"""
+        self.stats["hits"] += 1
+        self.stats[tier] += 1
+        self.stats["saved_tokens"] += entry.get("prompt_tokens", 0) + entry.get("completion_tokens", 0)
+        self.stats["saved_cost"] += entry.get("cost", 0.0)
+
+    def set(self, key: str, content: str, prompt_tokens: int = 0, completion_tokens: int = 0, cost: float = 0.0):
+        """写入缓存"""
+        entry = {
+            "content": content,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "cost": cost,
+            "created_at": time.time()
+        }
+        with self._lock:
+            self._put_memory(key, entry)
+        if self.disk_path:
+            self._save_to_disk(key, entry)
+
+    def clear(self):
+        """清空内存与磁盘缓存"""
+        with self._lock:
+            self._memory.clear()
+        if self.disk_path and os.path.isdir(self.disk_path):
+            for name in os.listdir(self.disk_path):
+                if name.endswith(".json"):
+                    try:
+                        os.remove(os.path.join(self.disk_path, name))
+                    except OSError:
+                        pass
+        with self._lock:
+            self._disk_entries = 0
+
+    def get_stats(self) -> dict:
+        """获取缓存统计"""
+        with self._lock:
+            stats = dict(self.stats)
+            entries = len(self._memory)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups * 100, 2) if lookups > 0 else 0
+        stats["saved_cost"] = round(stats["saved_cost"], 6)
+        stats["entries"] = entries
+        stats["disk_enabled"] = bool(self.disk_path)
+        if self.disk_path:
+            stats["disk_entries"] = self._disk_entries
+        return stats
+
+
+# 进程级共享实例
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache(config) -> Optional[ResponseCache]:
+    """
+    获取进程级共享的响应缓存
+
+    Args:
+        config: ConfigManager 实例，读取 api.cache.* 配置
+
+    Returns:
+        未启用缓存时返回None
+    """
+    global _cache
+    if not config.get('api.cache.enabled', False):
+        return None
+    if _cache is not None:
+        return _cache
+
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache(
+                max_entries=config.get('api.cache.max_entries', 1000),
+                ttl=config.get('api.cache.ttl', 3600),
+                disk_path=config.get('api.cache.disk_path', ''),
+                max_disk_entries=config.get('api.cache.max_disk_entries', 10000),
+                allow_nonzero_temperature=config.get('api.cache.allow_nonzero_temperature', False)
+            )
+            logger.info(f"响应缓存已启用 - 容量: {_cache.max_entries}, TTL: {_cache.ttl}s, "
+                        f"磁盘缓存: {_cache.disk_path or '关闭'}")
+    return _cache
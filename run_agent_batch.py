@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+批量运行 ReactAgent - 从 JSONL 文件或标准输入读取问题，以有限并发交给一组 Agent 执行
+每完成一个问题立即输出一行 JSONL 结果（答案、状态、步骤、tokens、成本、耗时），
+结束时在标准错误输出吞吐、延迟与成本汇总。配合 --mock 使用本地模拟LLM服务，
+可用于回归测试与容量规划
+
+输入每行一个问题：JSON 对象（"question" 字段，可带 "id"）或纯文本
+
+用法:
+    python run_agent_batch.py questions.jsonl -o results.jsonl --concurrency 8
+    cat questions.txt | python run_agent_batch.py - --mock --mock-latency 0.2
+    python run_agent_batch.py questions.jsonl --summary-json summary.json
+"""
+import sys
+import json
+import math
+import time
+import queue
+import argparse
+import statistics
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, as_completed, wait
+from typing import Dict, List, Any, Callable, Iterable, Iterator, Optional, TextIO
+
+from config_manager import ConfigManager
+
+
+def read_questions(stream: TextIO) -> Iterator[Dict[str, Any]]:
+    """逐行读取问题，空行跳过；没有 id 的问题按行号编号"""
+    for line_number, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        record = None
+        if line.startswith("{"):
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                record = None
+        if not isinstance(record, dict):
+            record = {"question": line}
+        question = record.get("question") or record.get("input") or record.get("prompt")
+        if not question:
+            print(f"⚠️  第{line_number}行缺少 question 字段，已跳过", file=sys.stderr)
+            continue
+        yield {"id": record.get("id", line_number), "question": str(question)}
+
+
+class AgentPool:
+    """固定数量的 Agent，每个同一时间只处理一个问题（各自的API统计互不干扰）"""
+
+    def __init__(self, config: ConfigManager, size: int):
+        from agent import ReactAgent
+
+        self._agents: "queue.Queue" = queue.Queue()
+        for _ in range(size):
+            self._agents.put(ReactAgent(config))
+
+    def run(self, item: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+        """执行一个问题并返回结果记录"""
+        agent = self._agents.get()
+        try:
+            api_manager = agent._get_api_manager()
+            before = api_manager.get_stats()
+            start = time.time()
+            result = agent.run(item["question"], timeout=timeout)
+            latency = time.time() - start
+            after = api_manager.get_stats()
+        finally:
+            self._agents.put(agent)
+
+        return {
+            "id": item["id"],
+            "question": item["question"],
+            "status": result.get("status"),
+            "answer": result.get("answer"),
+            "message": result.get("message"),
+            "steps": result.get("actions", 0),
+            "api_calls": after["request_count"] - before["request_count"],
+            "tokens": after["total_tokens"] - before["total_tokens"],
+            "cost": round(after["total_cost"] - before["total_cost"], 6),
+            "latency": round(latency, 3)
+        }
+
+    def close(self):
+        """释放所有 Agent 持有的共享资源"""
+        while not self._agents.empty():
+            self._agents.get_nowait().close()
+
+
+def run_batch(items: Iterable[Dict[str, Any]], config: ConfigManager, concurrency: int = 4,
+              timeout: float = 60, on_result: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    """
+    以有限并发执行全部问题
+
+    输入按需读取，同时在途的问题不超过 concurrency 的两倍，适合很大的输入文件
+
+    Args:
+        items: read_questions 的输出
+        config: Agent 使用的配置
+        concurrency: 同时运行的 Agent 数
+        timeout: 单个问题的超时（秒）
+        on_result: 每个问题完成时以结果记录调用（按完成顺序）
+
+    Returns:
+        汇总信息，见 summarize
+    """
+    concurrency = max(1, concurrency)
+    pool = AgentPool(config, concurrency)
+    records = []
+    start = time.time()
+
+    def finish(futures):
+        for future in futures:
+            record = future.result()
+            records.append(record)
+            if on_result is not None:
+                on_result(record)
+
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="agent-batch") as executor:
+            pending = set()
+            for item in items:
+                if len(pending) >= concurrency * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    finish(done)
+                pending.add(executor.submit(pool.run, item, timeout))
+            finish(as_completed(pending))
+    finally:
+        pool.close()
+
+    return summarize(records, time.time() - start)
+
+
+def _percentile(values: List[float], percent: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+
+def summarize(records: List[Dict[str, Any]], wall_time: float) -> Dict[str, Any]:
+    """吞吐、延迟、步骤、tokens 与成本汇总"""
+    latencies = [record["latency"] for record in records]
+    statuses: Dict[str, int] = {}
+    for record in records:
+        statuses[record["status"]] = statuses.get(record["status"], 0) + 1
+    total_cost = sum(record["cost"] for record in records)
+    return {
+        "questions": len(records),
+        "statuses": statuses,
+        "success_rate": round(statuses.get("success", 0) / len(records) * 100, 2) if records else 0,
+        "wall_time": round(wall_time, 3),
+        "throughput": round(len(records) / wall_time, 3) if wall_time > 0 else 0,
+        "latency": {
+            "mean": round(statistics.mean(latencies), 3) if latencies else 0,
+            "p50": round(_percentile(latencies, 50), 3),
+            "p95": round(_percentile(latencies, 95), 3),
+            "p99": round(_percentile(latencies, 99), 3),
+            "max": round(max(latencies), 3) if latencies else 0
+        },
+        "avg_steps": round(statistics.mean(record["steps"] for record in records), 2) if records else 0,
+        "api_calls": sum(record["api_calls"] for record in records),
+        "total_tokens": sum(record["tokens"] for record in records),
+        "total_cost": round(total_cost, 6),
+        "cost_per_question": round(total_cost / len(records), 6) if records else 0
+    }
+
+
+def print_summary(summary: Dict[str, Any], stream: TextIO = sys.stderr):
+    latency = summary["latency"]
+    statuses = ", ".join(f"{status}: {count}" for status, count in sorted(summary["statuses"].items()))
+    print("\n📊 批量运行汇总", file=stream)
+    print(f"  问题数: {summary['questions']} ({statuses or '无'})，成功率: {summary['success_rate']}%", file=stream)
+    print(f"  总耗时: {summary['wall_time']}s，吞吐: {summary['throughput']} 问题/秒", file=stream)
+    print(f"  延迟: 平均 {latency['mean']}s, P50 {latency['p50']}s, P95 {latency['p95']}s, "
+          f"P99 {latency['p99']}s, 最大 {latency['max']}s", file=stream)
+    print(f"  平均步骤: {summary['avg_steps']}，API调用: {summary['api_calls']}", file=stream)
+    print(f"  Tokens: {summary['total_tokens']}，成本: ${summary['total_cost']} "
+          f"(每个问题 ${summary['cost_per_question']})", file=stream)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量运行 ReactAgent（JSONL 输入/输出）")
+    parser.add_argument("input", nargs="?", default="-", help="问题文件（JSONL 或每行一个问题），- 表示标准输入")
+    parser.add_argument("-o", "--output", default="-", help="结果 JSONL 文件，- 表示标准输出")
+    parser.add_argument("-c", "--concurrency", type=int, default=4, help="同时运行的 Agent 数")
+    parser.add_argument("--timeout", type=float, default=60, help="单个问题的超时（秒）")
+    parser.add_argument("--config", default=None, help="配置文件（YAML/JSON）")
+    parser.add_argument("--model", default=None, help="覆盖默认模型")
+    parser.add_argument("--summary-json", default=None, help="将汇总写入该JSON文件")
+    parser.add_argument("--mock", action="store_true", help="使用本地模拟LLM服务，无需 API Key")
+    parser.add_argument("--mock-latency", type=float, default=0.0, help="模拟服务首token前的延迟（秒）")
+    parser.add_argument("--mock-responses", default=None, help="模拟服务的回答内容文件，每行一个JSON字符串")
+    args = parser.parse_args()
+
+    config = ConfigManager(args.config)
+    if args.model:
+        config.set('api.deepseek.default_model', args.model)
+
+    server = None
+    if args.mock:
+        from mock_llm_server import MockLLMServer, MockLLMConfig
+        responses = None
+        if args.mock_responses:
+            with open(args.mock_responses, "r", encoding="utf-8") as f:
+                responses = [json.loads(line) for line in f if line.strip()]
+        server = MockLLMServer(config=MockLLMConfig(latency=args.mock_latency, responses=responses)).start()
+        config.set('api.deepseek.api_key', 'mock-key')
+        config.set('api.deepseek.base_url', server.url)
+        config.set('database.enabled', False)
+        print(f"🧪 使用模拟LLM服务: {server.url}", file=sys.stderr)
+
+    source = sys.stdin if args.input == "-" else open(args.input, "r", encoding="utf-8")
+    output = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+
+    def write(record):
+        output.write(json.dumps(record, ensure_ascii=False) + "\n")
+        output.flush()
+
+    try:
+        summary = run_batch(read_questions(source), config, args.concurrency, args.timeout, on_result=write)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if output is not sys.stdout:
+            output.close()
+        if server is not None:
+            server.stop()
+
+    print_summary(summary)
+    if args.summary_json:
+        with open(args.summary_json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+    sys.exit(0 if summary["statuses"].get("success", 0) == summary["questions"] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+单次运行内的工具结果记忆与动作循环检测
+模型经常在相邻步骤中以完全相同的参数重复调用同一工具：重复调用直接返回已有结果，
+不再执行工具；同一组动作连续循环出现时提前结束运行，而不是一直消耗到最大步骤数
+"""
+import json
+from typing import Dict, List, Any, Iterable, Optional, Tuple
+
+from logger import logger
+
+
+def canonical_action(action: Dict[str, Any]) -> str:
+    """动作的规范化键：工具名 + 按键排序的参数，忽略参数顺序与空白差异"""
+    params = {key: value for key, value in action.items() if key != "tool"}
+    return json.dumps([action.get("tool"), params], ensure_ascii=False, sort_keys=True,
+                      separators=(",", ":"), default=str)
+
+
+class RunMemo:
+    """一次 Agent 运行内的工具结果记忆，不跨运行共享"""
+
+    def __init__(self, uncached: Iterable[str] = (), cycle_repeats: int = 3, max_cycle_period: int = 3):
+        """
+        Args:
+            uncached: 有副作用、每次都必须执行的工具名
+            cycle_repeats: 同一组动作连续出现多少次视为循环，小于2时不检测
+            max_cycle_period: 检测的最长循环周期（步数）
+        """
+        self.uncached = set(uncached)
+        self.cycle_repeats = cycle_repeats
+        self.max_cycle_period = max_cycle_period
+        self._values: Dict[str, Any] = {}
+        self._steps: List[Tuple[str, ...]] = []
+        self.hits = 0
+
+    def get(self, action: Dict[str, Any]) -> Tuple[bool, Any]:
+        """
+        查找相同动作的结果（或仍在执行中的调用）
+
+        Returns:
+            (是否命中, 结果或执行凭据)
+        """
+        if action.get("tool") in self.uncached:
+            return False, None
+        key = canonical_action(action)
+        if key not in self._values:
+            return False, None
+        self.hits += 1
+        logger.info(f"重复的工具调用，复用已有结果: {key[:200]}")
+        return True, self._values[key]
+
+    def put(self, action: Dict[str, Any], value: Any):
+        """记录动作的结果；失败或未完成的结果不记录，下次重新执行"""
+        if action.get("tool") in self.uncached:
+            return
+        key = canonical_action(action)
+        if isinstance(value, dict) and "error" in value:
+            self._values.pop(key, None)
+        else:
+            self._values[key] = value
+
+    def observe_step(self, actions: List[Dict[str, Any]]) -> Optional[str]:
+        """
+        记录一步的动作序列并检测循环
+
+        Returns:
+            检测到循环时返回说明，否则为None
+        """
+        self._steps.append(tuple(canonical_action(action) for action in actions))
+        if self.cycle_repeats < 2:
+            return None
+        for period in range(1, self.max_cycle_period + 1):
+            span = period * self.cycle_repeats
+            if len(self._steps) < span:
+                break
+            recent = self._steps[-span:]
+            if all(recent[index] == recent[index % period] for index in range(span)):
+                tools = [json.loads(key)[0] for step in recent[:period] for key in step]
+                return f"最近{span}步中相同的动作序列（{', '.join(tools)}）已连续重复{self.cycle_repeats}次"
+        return None
+
+
+def create_run_memo(config) -> Optional[RunMemo]:
+    """
+    按 tools.run_memo.* 配置创建本次运行的记忆；未启用时返回None
+
+    有副作用的工具（tool_cache.NEVER_CACHE）始终不记忆，tools.run_memo.uncached 只能追加
+    """
+    from tool_cache import NEVER_CACHE
+
+    if not config.get('tools.run_memo.enabled', True):
+        return None
+    return RunMemo(
+        uncached=NEVER_CACHE.union(config.get('tools.run_memo.uncached', None) or ()),
+        cycle_repeats=config.get('tools.run_memo.cycle_repeats', 3),
+        max_cycle_period=config.get('tools.run_memo.max_cycle_period', 3)
+    )
@@ -150,6 +150,12 @@ class LLMAgentApp {
         // 显示加载状态
         const loadingId = this.showLoading();
 
+        // 浏览器支持流式读取时，逐字显示回复
+        if (window.ReadableStream && window.TextDecoder) {
+            this.sendMessageStream(message, loadingId);
+            return;
+        }
+
         // 发送到后端
         fetch('/api/chat', {
             method: 'POST',
@@ -181,6 +187,133 @@ class LLMAgentApp {
         });
     }
 
+    sendMessageStream(message, loadingId) {
+        let contentDiv = null;
+        let answerText = '';
+        let progress = '';
+        let finished = false;
+
+        const render = () => {
+            if (!contentDiv) {
+                // 收到第一个事件时替换加载动画
+                this.hideLoading(loadingId);
+                contentDiv = this.createStreamingMessage();
+            }
+            contentDiv.textContent = answerText || progress;
+            this.scrollToBottom();
+        };
+
+        const handleEvent = (event) => {
+            if (event.type === 'answer') {
+                // 最终答案的增量文本
+                answerText += event.content;
+                render();
+            } else if (event.type === 'answer_reset') {
+                // 模型在答案之后又调用了工具，已显示的答案作废
+                answerText = '';
+                render();
+            } else if (event.type === 'tool_start') {
+                progress = `🔧 正在调用工具: ${event.tools.join(', ')}...`;
+                render();
+            } else if (event.type === 'tool_end') {
+                progress = `✅ 工具调用完成: ${event.tools.join(', ')}，继续思考...`;
+                render();
+            } else if (event.type === 'done') {
+                finished = true;
+                this.hideLoading(loadingId);
+                // 最终答案以 done 事件中的 final_answer 为准
+                const answer = event.final_answer || answerText;
+                if (answer || event.success === false) {
+                    if (!contentDiv) {
+                        contentDiv = this.createStreamingMessage();
+                    }
+                    let html = answer ? this.formatMessage(answer) : '';
+                    if (event.success === false && event.status) {
+                        html += `<div class="stream-status">⚠️ 未完成: ${event.message || event.status}</div>`;
+                    }
+                    contentDiv.innerHTML = html;
+                    if (answer) {
+                        this.saveMessageToHistory('assistant', answer);
+                    }
+                }
+                this.updateChatTitle(message);
+            } else if (event.type === 'error') {
+                finished = true;
+                this.hideLoading(loadingId);
+                this.showError(event.error || '处理消息时出错');
+            }
+        };
+
+        fetch('/api/chat/stream', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({
+                message: message,
+                session_id: this.currentSession
+            })
+        })
+        .then(response => {
+            const contentType = response.headers.get('Content-Type') || '';
+            if (!contentType.includes('text/event-stream')) {
+                // 参数错误等情况下后端直接返回 JSON
+                return response.json().then(data => handleEvent({ type: 'error', error: data.error }));
+            }
+
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder('utf-8');
+            let buffer = '';
+
+            const read = () => reader.read().then(({ done, value }) => {
+                if (done) {
+                    if (!finished) {
+                        handleEvent({ type: 'done' });
+                    }
+                    return;
+                }
+                buffer += decoder.decode(value, { stream: true });
+
+                // SSE 事件之间以空行分隔
+                const events = buffer.split('\n\n');
+                buffer = events.pop();
+                events.forEach(rawEvent => {
+                    const dataLine = rawEvent.split('\n').find(line => line.startsWith('data: '));
+                    if (dataLine) {
+                        handleEvent(JSON.parse(dataLine.substring(6)));
+                    }
+                });
+                return read();
+            });
+            return read();
+        })
+        .catch(error => {
+            this.hideLoading(loadingId);
+            this.showError('网络错误: ' + error.message);
+        });
+    }
+
+    createStreamingMessage() {
+        const chatContainer = document.getElementById('chatMessages');
+        const messageDiv = document.createElement('div');
+        messageDiv.className = 'message assistant-message';
+        messageDiv.innerHTML = `
+            <div class="message-avatar">🤖</div>
+            <div class="assistant-message-content"></div>
+        `;
+        if (chatContainer) {
+            chatContainer.appendChild(messageDiv);
+        }
+        return messageDiv.querySelector('.assistant-message-content');
+    }
+
+    scrollToBottom() {
+        const chatContainer = document.getElementById('chatMessages');
+        if (chatContainer) {
+            chatContainer.scrollTop = chatContainer.scrollHeight;
+        }
+    }
+
     addMessage(role, content) {
         const chatContainer = document.getElementById('chatMessages');
         if (!chatContainer) return;
@@ -3,6 +3,8 @@ System Prompts for LLM Agent
 Contains various system prompts for different agent configurations
 """
 
+from string import Template
+
 # Enhanced system prompt that explicitly guides the agent to use database tools
 DATABASE_ENHANCED_SYSTEM_PROMPT = """你是一个智能助手，可以访问多种工具来帮助用户。
 
@@ -58,11 +60,31 @@ WEB_SEARCH_SYSTEM_PROMPT = """你是一个智能助手，主要使用网络搜
 对于需要实时信息或数据库中没有的信息，请使用搜索工具。
 """
 
-def get_system_prompt(prompt_type="database_enhanced"):
-    """Get system prompt by type"""
+# Response protocol appended to every prompt; parsed by react_parser
+REACT_FORMAT_INSTRUCTIONS = """
+## 回复格式（必须遵守）
+每次回复只输出一个JSON对象，不要添加任何其他文本或Markdown标记：
+- thought: 你对当前任务的思考
+- action: 需要调用工具时给出，格式为数组，每项包含 "tool" 字段和该工具的参数，例如
+  [{"tool": "check_product_stock", "product_name": "安吉白茶"}]
+- final_answer: 得出最终答案时给出，有 action 时不要给出
+
+输出 action 后立即停止，等待 {"observation": ...} 形式的工具结果再继续。
+如果收到 Incorrect_answer_format，请按提示修正格式后重新回答。
+不需要工具的简单问题直接给出 thought 和 final_answer。
+
+## 本次可用工具
+${tool_list}
+"""
+
+def get_system_prompt(prompt_type="database_enhanced", tool_list=None):
+    """Get system prompt by type, with the response protocol when a tool list is given"""
     prompts = {
         "database_enhanced": DATABASE_ENHANCED_SYSTEM_PROMPT,
         "standard": STANDARD_SYSTEM_PROMPT,
         "web_search": WEB_SEARCH_SYSTEM_PROMPT
     }
-    return prompts.get(prompt_type, STANDARD_SYSTEM_PROMPT)
\ No newline at end of file
+    prompt = prompts.get(prompt_type, STANDARD_SYSTEM_PROMPT)
+    if tool_list is None:
+        return prompt
+    return prompt + Template(REACT_FORMAT_INSTRUCTIONS).safe_substitute(tool_list=tool_list)
\ No newline at end of file
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+测试批量调用：结果按输入顺序汇总、并发上限、中断后按结果文件续跑且不重复发送已完成的条目
+使用本地模拟LLM服务（回显用户消息），无需真实 API Key
+"""
+
+import os
+import sys
+import json
+import time
+import tempfile
+import threading
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from config_manager import ConfigManager
+from api_manager import APIManager
+from api_batch import iter_batch, run_batch
+from mock_llm_server import MockLLMServer, MockLLMConfig
+
+
+def _batch(size: int):
+    return [[{"role": "user", "content": f"问题{index}"}] for index in range(size)]
+
+
+def _api_manager(base_url):
+    """创建指向模拟服务的 APIManager，并记录实际发出的请求"""
+    config = ConfigManager()
+    config.set('api.deepseek.api_key', 'test-key')
+    config.set('api.deepseek.base_url', base_url)
+    config.set('api.cache.enabled', False)
+    api_manager = APIManager(config)
+
+    api_manager.sent = []
+    api_manager.peak = 0
+    in_flight = [0]
+    lock = threading.Lock()
+    call_api = api_manager.call_api
+
+    def tracking_call_api(messages, *args, **kwargs):
+        with lock:
+            api_manager.sent.append(messages[-1]["content"])
+            in_flight[0] += 1
+            api_manager.peak = max(api_manager.peak, in_flight[0])
+        try:
+            return call_api(messages, *args, **kwargs)
+        finally:
+            with lock:
+                in_flight[0] -= 1
+
+    api_manager.call_api = tracking_call_api
+    return api_manager
+
+
+def test_run_batch_order_and_concurrency():
+    """测试结果与输入顺序一致，同时进行的请求不超过并发上限"""
+    with MockLLMServer(config=MockLLMConfig(echo=True, latency=0.05)) as server:
+        api_manager = _api_manager(server.url)
+        results = run_batch(api_manager, _batch(8), temperature=0, max_concurrency=3)
+
+        assert [result.content for result in results] == [f"问题{index}" for index in range(8)]
+        assert all(result.success and not result.resumed for result in results)
+        assert 1 < api_manager.peak <= 3
+
+
+def test_resume_after_interrupt():
+    """测试中断后续跑：已写入结果文件的条目不再发送，内容变化或未完成的条目重新发送"""
+    batch = _batch(6)
+    with MockLLMServer(config=MockLLMConfig(echo=True, latency=0.05)) as server, \
+            tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "results.jsonl")
+        api_manager = _api_manager(server.url)
+
+        # 收到 3 条结果后停止迭代，模拟进程被中断；最后一行写到一半
+        stream = iter_batch(api_manager, batch, temperature=0, max_concurrency=1, results_path=path)
+        for _ in range(3):
+            next(stream)
+        stream.close()
+        with open(path, "a", encoding="utf-8") as f:
+            f.write('{"index": 5, "content": "问')
+        # 中断时正在执行的请求可能仍在后台结束
+        time.sleep(0.2)
+
+        with open(path, "r", encoding="utf-8") as f:
+            done = {json.loads(line)["index"] for line in f if line.endswith("}\n")}
+        assert len(done) == 3
+
+        # 已完成的第一条输入内容被修改，不能复用旧结果
+        changed = min(done)
+        batch[changed] = [{"role": "user", "content": f"修改后的问题{changed}"}]
+        api_manager.sent.clear()
+        results = run_batch(api_manager, batch, temperature=0, max_concurrency=2, results_path=path)
+
+        expected_sent = {batch[index][-1]["content"] for index in range(6) if index not in done - {changed}}
+        assert sorted(api_manager.sent) == sorted(expected_sent)
+        assert [result.content for result in results] == [messages[-1]["content"] for messages in batch]
+        assert {result.index for result in results if result.resumed} == done - {changed}
+
+        # 全部完成后再次运行不发送任何请求
+        api_manager.sent.clear()
+        results = run_batch(api_manager, batch, temperature=0, results_path=path)
+        assert api_manager.sent == [] and all(result.resumed for result in results)
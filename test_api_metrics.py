@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+测试API调用指标：对数直方图的百分位精度、空/单样本直方图、TTFT 与 tokens/s 记录，
+回放调用不计入直方图，以及 Web 界面的 /api/metrics 输出
+"""
+
+import os
+import sys
+import math
+import random
+
+import pytest
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from api_metrics import LogHistogram, APIMetrics, get_api_metrics
+from api_manager import APIManager, APICallStats
+from config_manager import ConfigManager
+
+
+def _exact_percentile(values, percentile):
+    ordered = sorted(values)
+    return ordered[max(1, math.ceil(percentile / 100 * len(ordered))) - 1]
+
+
+def test_percentile_within_bucket_error():
+    """测试百分位估算的相对误差不超过一个桶的宽度"""
+    histogram = LogHistogram()
+    bucket_error = 10 ** (1 / histogram.buckets_per_decade) - 1
+    rng = random.Random(7)
+    values = [rng.lognormvariate(0, 1.5) for _ in range(5000)]
+    for value in values:
+        histogram.record(value)
+
+    for percentile in (1, 10, 50, 90, 95, 99, 99.9):
+        exact = _exact_percentile(values, percentile)
+        assert abs(histogram.percentile(percentile) - exact) / exact <= bucket_error
+    assert histogram.percentile(100) == max(values)
+    assert histogram.count == 5000 and histogram.total == pytest.approx(sum(values))
+
+
+def test_empty_and_single_sample():
+    """测试空直方图没有百分位，单样本的各百分位都等于该样本"""
+    histogram = LogHistogram()
+    assert histogram.percentile(50) is None
+    assert histogram.summary() == {"count": 0}
+
+    histogram.record(None)
+    histogram.record(-1)
+    histogram.record(float("nan"))
+    assert histogram.count == 0
+
+    histogram.record(0.4321)
+    summary = histogram.summary()
+    assert summary["count"] == 1
+    assert summary["min"] == summary["max"] == summary["mean"] == 0.4321
+    assert summary["p50"] == summary["p95"] == summary["p99"] == 0.4321
+
+
+def test_values_outside_range():
+    """测试超出上下限的样本落入边界桶，百分位仍限制在观测值之间"""
+    histogram = LogHistogram(min_value=0.01, max_value=10)
+    histogram.record(0.0001)
+    histogram.record(0.0002)
+    histogram.record(500)
+    assert 0.0001 <= histogram.percentile(50) <= 0.01
+    assert histogram.percentile(100) == 500
+
+
+def test_ttft_and_tokens_per_second():
+    """测试流式调用记录 TTFT，tokens/s 按首token之后的生成时间计算，失败只计数"""
+    metrics = APIMetrics()
+    metrics.record("deepseek", "m", True, duration=2.5, completion_tokens=100, time_to_first_token=0.5)
+    metrics.record("deepseek", "m", True, duration=1.0, completion_tokens=50)
+    metrics.record("deepseek", "m", False, duration=9.0, completion_tokens=10)
+
+    stats = metrics.get_stats()["deepseek:m"]
+    assert stats["errors"] == 1
+    assert stats["latency"]["count"] == 2 and stats["latency"]["max"] == 2.5
+    assert stats["ttft"]["count"] == 1 and stats["ttft"]["p50"] == 0.5
+    assert stats["tokens_per_second"]["min"] == 50 and stats["tokens_per_second"]["max"] == 50
+
+    metrics.reset()
+    assert metrics.get_stats() == {}
+
+
+def test_replayed_calls_not_recorded():
+    """测试磁带回放的调用不计入耗时直方图，真实调用照常记录"""
+    config = ConfigManager()
+    config.set('api.deepseek.api_key', 'test-key')
+    api_manager = APIManager(config)
+    api_manager.update_stats(APICallStats("deepseek", "metrics-replayed", duration=0.0, replayed=True))
+    api_manager.update_stats(APICallStats("deepseek", "metrics-live", duration=1.2, completion_tokens=30))
+
+    stats = get_api_metrics().get_stats()
+    assert "deepseek:metrics-replayed" not in stats
+    assert stats["deepseek:metrics-live"]["latency"]["count"] == 1
+    assert api_manager.get_stats()["request_count"] == 2
+
+
+def test_metrics_endpoint():
+    """测试 /api/metrics 返回各模型的百分位统计、健康度与限流状态"""
+    pytest.importorskip("flask")
+    import web_app
+
+    get_api_metrics().record("deepseek", "metrics-endpoint", True, duration=0.8, completion_tokens=40,
+                             time_to_first_token=0.3)
+    payload = web_app.app.test_client().get('/api/metrics').get_json()
+
+    assert {"timestamp", "models", "provider_health", "rate_limit"} <= set(payload)
+    model = payload["models"]["deepseek:metrics-endpoint"]
+    assert model["latency"]["p50"] == 0.8 and model["ttft"]["p50"] == 0.3
+    assert model["tokens_per_second"]["p50"] == 80
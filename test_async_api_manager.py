@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+测试异步API管理器
+在本地启动一个模拟 /chat/completions 的 HTTP 服务，无需真实 API Key
+"""
+
+import os
+import sys
+import json
+import asyncio
+
+import pytest
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+# aiohttp 是可选依赖（异步调用才需要），未安装时跳过整个模块
+web = pytest.importorskip("aiohttp.web")
+
+from config_manager import ConfigManager
+from api_manager import APIManager
+from http_transport import close_async_session
+
+
+async def _mock_chat_completions(request):
+    """模拟 DeepSeek /chat/completions，支持流式与非流式"""
+    body = await request.json()
+    if not body.get("stream"):
+        return web.json_response({
+            "choices": [{"message": {"content": "测试成功"}}],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 4}
+        })
+
+    response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+    await response.prepare(request)
+    for piece in ["测试", "成功"]:
+        chunk = {"choices": [{"delta": {"content": piece}}]}
+        await response.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+    usage_chunk = {"choices": [], "usage": {"prompt_tokens": 10, "completion_tokens": 2}}
+    await response.write(f"data: {json.dumps(usage_chunk)}\n\n".encode("utf-8"))
+    await response.write(b"data: [DONE]\n\n")
+    return response
+
+
+async def _with_mock_server(test_body):
+    """启动模拟服务并执行测试协程"""
+    app = web.Application()
+    app.router.add_post("/chat/completions", _mock_chat_completions)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    config = ConfigManager()
+    config.set('api.deepseek.api_key', 'test-key')
+    config.set('api.deepseek.base_url', f"http://127.0.0.1:{port}")
+    try:
+        return await test_body(APIManager(config))
+    finally:
+        await close_async_session()
+        await runner.cleanup()
+
+
+def test_call_api_async():
+    """测试异步非流式调用与统计"""
+    async def body(api_manager):
+        content = await api_manager.call_api_async([{"role": "user", "content": "你好"}])
+        assert content == "测试成功"
+        stats = api_manager.get_stats()
+        assert stats["request_count"] == 1
+        assert stats["total_tokens"] == 14
+
+    asyncio.run(_with_mock_server(body))
+
+
+def test_call_api_async_concurrent():
+    """测试同一事件循环上的并发调用"""
+    async def body(api_manager):
+        messages = [{"role": "user", "content": "你好"}]
+        results = await asyncio.gather(*[api_manager.call_api_async(messages) for _ in range(20)])
+        assert results == ["测试成功"] * 20
+        assert api_manager.get_stats()["request_count"] == 20
+
+    asyncio.run(_with_mock_server(body))
+
+
+def test_call_api_stream_async():
+    """测试异步流式调用与统计"""
+    async def body(api_manager):
+        pieces = []
+        async for text in api_manager.call_api_stream_async([{"role": "user", "content": "你好"}]):
+            pieces.append(text)
+        assert "".join(pieces) == "测试成功"
+        stats = api_manager.get_stats()
+        assert stats["request_count"] == 1
+        assert stats["total_tokens"] == 12
+
+    asyncio.run(_with_mock_server(body))
+
+
+def test_call_api_stream_async_early_stop():
+    """测试提前停止的异步流式调用计入 aborted_streams"""
+    async def body(api_manager):
+        stream = api_manager.call_api_stream_async([{"role": "user", "content": "你好"}])
+        async for text in stream:
+            assert text == "测试"
+            break
+        await stream.aclose()
+        stats = api_manager.get_stats()
+        assert stats["aborted_streams"] == 1
+        assert stats["request_count"] == 1
+
+    asyncio.run(_with_mock_server(body))
+
+
+class _FakeAsyncStream:
+    """模拟 SDK 的异步流，记录是否被关闭"""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.closed = False
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for chunk in self.chunks:
+            yield chunk
+
+    async def close(self):
+        self.closed = True
+
+
+def test_sdk_stream_closed_on_early_stop():
+    """测试调用方提前停止时关闭 OpenAI SDK 的流（归还HTTP连接）"""
+    from types import SimpleNamespace
+
+    def chunk(text):
+        return SimpleNamespace(usage=None, choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+
+    fake_stream = _FakeAsyncStream([chunk("第一"), chunk("第二")])
+
+    async def create(**kwargs):
+        return fake_stream
+
+    async def body():
+        config = ConfigManager()
+        config.set('api.openai.api_key', 'test-key')
+        api_manager = APIManager(config)
+        client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+        api_manager._get_async_openai_client = lambda: client
+        stream = api_manager.call_api_stream_async([{"role": "user", "content": "你好"}], model="gpt-4o-mini")
+        async for text in stream:
+            break
+        await stream.aclose()
+        assert fake_stream.closed
+        assert api_manager.get_stats()["aborted_streams"] == 1
+
+    asyncio.run(body())
+
+
+def main():
+    """运行所有测试"""
+    tests = [
+        ("异步调用", test_call_api_async),
+        ("异步并发调用", test_call_api_async_concurrent),
+        ("异步流式调用", test_call_api_stream_async),
+        ("异步流式提前停止", test_call_api_stream_async_early_stop),
+        ("关闭SDK流", test_sdk_stream_closed_on_early_stop)
+    ]
+
+    passed = 0
+    for test_name, test_func in tests:
+        try:
+            test_func()
+            print(f"✅ {test_name}: 通过")
+            passed += 1
+        except Exception as e:
+            print(f"❌ {test_name}: 失败 - {e}")
+
+    print(f"\n🎯 总体结果: {passed}/{len(tests)} 测试通过")
+
+
+if __name__ == "__main__":
+    main()
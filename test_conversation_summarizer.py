@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+测试后台增量对话摘要：阈值触发、增量更新、缓存复用与工具消息边界
+"""
+
+import os
+import sys
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from conversation_summarizer import ConversationSummarizer, SUMMARY_PREFIX
+
+
+def _conversation(turns):
+    messages = [{"role": "system", "content": "系统提示"}, {"role": "user", "content": "原始问题"}]
+    for index in range(turns):
+        messages.append({"role": "assistant", "content": f"第{index}步的思考 " + "内容" * 20})
+        messages.append({"role": "user", "content": f"第{index}步的观察 " + "结果" * 20})
+    return messages
+
+
+def _recording_summarizer(**kwargs):
+    calls = []
+
+    def summarize(previous, new_messages):
+        calls.append((previous, len(new_messages)))
+        return f"摘要{len(calls)}"
+
+    return ConversationSummarizer(summarize, **kwargs), calls
+
+
+def test_threshold_and_apply():
+    """测试超过阈值后在后台生成摘要，组装时替换最早的消息"""
+    summarizer, calls = _recording_summarizer(trigger_tokens=200, keep_recent=2)
+    messages = _conversation(1)
+    assert not summarizer.schedule("s1", messages)
+    assert summarizer.apply("s1", messages) is messages
+
+    messages = _conversation(6)
+    assert summarizer.schedule("s1", messages)
+    summarizer.wait("s1")
+    applied = summarizer.apply("s1", messages)
+    assert applied[:2] == messages[:2]
+    assert applied[2]["content"] == f"{SUMMARY_PREFIX}\n摘要1"
+    assert applied[3:] == messages[-2:]
+    assert calls == [("", 10)]
+    # 原列表不变
+    assert len(messages) == 14
+
+
+def test_incremental_and_cached():
+    """测试新摘要只追加新覆盖的消息，已覆盖的不重新计算"""
+    summarizer, calls = _recording_summarizer(trigger_tokens=200, keep_recent=2)
+    messages = _conversation(6)
+    summarizer.schedule("s1", messages)
+    summarizer.wait("s1")
+
+    # 没有新消息可覆盖时不再提交
+    assert not summarizer.schedule("s1", messages)
+
+    messages = messages + _conversation(8)[-4:]
+    assert summarizer.schedule("s1", messages)
+    summarizer.wait("s1")
+    assert calls == [("", 10), ("摘要1", 4)]
+    assert summarizer.apply("s1", messages)[2]["content"].endswith("摘要2")
+
+    # 历史被改写后旧摘要不再适用
+    rewritten = [dict(message) for message in messages]
+    rewritten[3]["content"] = "改写"
+    assert summarizer.apply("s1", rewritten) == rewritten
+    assert summarizer.apply("s2", messages) == messages
+
+
+def test_entries_bounded_and_disabled_by_default():
+    """测试每个会话只保留最新的若干份摘要，且默认不启用摘要（额外的付费调用）"""
+    from config_manager import ConfigManager
+    from conversation_summarizer import get_conversation_summarizer
+
+    summarizer, calls = _recording_summarizer(trigger_tokens=200, keep_recent=2, max_entries=2)
+    messages = _conversation(6)
+    for turns in range(7, 11):
+        summarizer.schedule("s1", messages)
+        summarizer.wait("s1")
+        messages = messages + _conversation(turns)[-2:]
+
+    assert len(calls) == 4
+    assert [entry[2] for entry in summarizer._sessions["s1"]] == ["摘要3", "摘要4"]
+    assert summarizer.apply("s1", messages)[2]["content"].endswith("摘要4")
+
+    assert get_conversation_summarizer(ConfigManager()) is None
+
+
+def test_tool_boundary():
+    """测试保留部分不以工具结果开头"""
+    summarizer, _ = _recording_summarizer(trigger_tokens=100, keep_recent=1)
+    messages = _conversation(4) + [
+        {"role": "assistant", "content": "", "tool_calls": [
+            {"id": "c1", "type": "function", "function": {"name": "read_file", "arguments": "{}"}}]},
+        {"role": "tool", "tool_call_id": "c1", "content": "文件内容"}
+    ]
+    summarizer.schedule("s1", messages)
+    summarizer.wait("s1")
+    applied = summarizer.apply("s1", messages)
+    assert applied[-2]["tool_calls"] and applied[-1]["role"] == "tool"
+
+
+def main():
+    """运行所有测试"""
+    tests = [
+        ("阈值与替换", test_threshold_and_apply),
+        ("增量与缓存", test_incremental_and_cached),
+        ("摘要条数上限与默认关闭", test_entries_bounded_and_disabled_by_default),
+        ("工具消息边界", test_tool_boundary)
+    ]
+
+    passed = 0
+    for test_name, test_func in tests:
+        try:
+            test_func()
+            print(f"✅ {test_name}: 通过")
+            passed += 1
+        except Exception as e:
+            print(f"❌ {test_name}: 失败 - {e}")
+
+    print(f"\n🎯 总体结果: {passed}/{len(tests)} 测试通过")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+测试截止时间在LLM请求、工具执行与子进程之间的传递
+Agent 部分使用本地模拟LLM服务，无需真实 API Key
+"""
+
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from deadline import Deadline, DeadlineExceeded, deadline_scope, remaining_time, run_with_context, current_deadline
+
+
+def test_deadline_scope():
+    """测试剩余时间、嵌套作用域与线程池中的传递"""
+    assert remaining_time(10) == 10
+    with deadline_scope(Deadline(0.5)) as outer:
+        assert remaining_time(10) <= 0.5
+        assert remaining_time(0.1) == 0.1
+        with deadline_scope(Deadline(30)) as inner:
+            assert inner is outer
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            assert pool.submit(run_with_context(current_deadline)).result() is outer
+            assert pool.submit(current_deadline).result() is None
+    assert current_deadline() is None
+
+    expired = Deadline(0)
+    try:
+        expired.limit(5, "测试")
+        assert False, "应抛出 DeadlineExceeded"
+    except DeadlineExceeded as e:
+        assert "测试" in str(e)
+
+
+def test_tool_executor_deadline():
+    """测试收集工具结果时不超过当前截止时间"""
+    from tool_executor import ToolExecutor
+
+    executor = ToolExecutor(max_workers=2)
+    start = time.time()
+    with deadline_scope(Deadline(0.2)):
+        results = executor.run(lambda name, params: time.sleep(params["seconds"]) or name,
+                               [("fast", {"seconds": 0.01}), ("slow", {"seconds": 1})])
+    assert time.time() - start < 0.6
+    assert results[0] == "fast"
+    assert results[1]["pending"] is True
+
+
+def _agent(server):
+    from config_manager import ConfigManager
+    from agent import ReactAgent
+
+    config = ConfigManager()
+    config.set('api.deepseek.api_key', 'test-key')
+    config.set('api.deepseek.base_url', server.url)
+    config.set('database.enabled', False)
+    return ReactAgent(config)
+
+
+def test_agent_timeout_with_partial_result():
+    """测试慢工具在截止时间被放弃，运行返回部分结果"""
+    from mock_llm_server import MockLLMServer, MockLLMConfig
+
+    responses = ['{"thought": "执行命令", "action": [{"tool": "run_terminal_command", '
+                 '"command": "sleep 3", "level": "safe"}]}']
+    with MockLLMServer(config=MockLLMConfig(responses=responses)) as server:
+        start = time.time()
+        result = _agent(server).run("运行命令", timeout=1)
+        elapsed = time.time() - start
+
+    assert result["status"] == "timeout", result
+    assert elapsed < 2.5
+    assert result["partial"]["last_thought"] == "执行命令"
+    assert len(result["partial"]["observations"]) == 1
+
+
+def test_agent_slow_provider():
+    """测试慢速提供商的请求只使用剩余时间，不再按固定超时重试"""
+    from mock_llm_server import MockLLMServer, MockLLMConfig
+
+    with MockLLMServer(config=MockLLMConfig(latency=3)) as server:
+        start = time.time()
+        result = _agent(server).run("你好", timeout=1)
+        elapsed = time.time() - start
+
+    assert result["status"] == "timeout", result
+    assert elapsed < 2.5
+
+
+def main():
+    """运行所有测试"""
+    tests = [
+        ("截止时间作用域", test_deadline_scope),
+        ("工具执行截止时间", test_tool_executor_deadline),
+        ("部分结果", test_agent_timeout_with_partial_result),
+        ("慢速提供商", test_agent_slow_provider)
+    ]
+
+    passed = 0
+    for test_name, test_func in tests:
+        try:
+            test_func()
+            print(f"✅ {test_name}: 通过")
+            passed += 1
+        except Exception as e:
+            print(f"❌ {test_name}: 失败 - {e}")
+
+    print(f"\n🎯 总体结果: {passed}/{len(tests)} 测试通过")
+
+
+if __name__ == "__main__":
+    main()
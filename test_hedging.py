@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+测试延迟对冲与故障切换：触发延迟、备用先返回、落败请求的取消、降级后优先备用，
+以及只有真实的非流式上游调用计入对冲延迟样本。
+使用本地模拟LLM服务按模型设置延迟，无需真实 API Key
+"""
+
+import os
+import sys
+import time
+import asyncio
+
+import pytest
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from config_manager import ConfigManager
+from api_manager import APIManager, APICallStats
+from provider_health import ProviderHealth
+from mock_llm_server import MockLLMServer, MockLLMConfig
+
+MESSAGES = [{"role": "user", "content": "对冲测试"}]
+SLOW = 1.0
+
+
+def _api_manager(base_url, backup_model, **settings):
+    """创建启用对冲、指向模拟服务的 APIManager（主备模型都走 DeepSeek 协议）"""
+    config = ConfigManager()
+    config.set('api.deepseek.api_key', 'test-key')
+    config.set('api.deepseek.base_url', base_url)
+    config.set('api.hedging.enabled', True)
+    config.set('api.hedging.backup_model', backup_model)
+    config.set('api.hedging.default_delay', 0.1)
+    config.set('api.hedging.min_delay', 0.05)
+    for key, value in settings.items():
+        config.set(key, value)
+    return APIManager(config)
+
+
+def _wait_for(condition, timeout: float = 5.0) -> bool:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return condition()
+
+
+def test_latency_windows():
+    """测试流式调用只记录首token耗时，回放与失败不计入延迟样本"""
+    health = ProviderHealth(min_samples=2)
+    health.record("deepseek", "m", True, duration=2.0)
+    health.record("deepseek", "m", True, first_token=0.3)
+    health.record("deepseek", "m", False)
+    assert health.latency_percentile("deepseek", "m", 95) is None
+    health.record("deepseek", "m", True, duration=4.0)
+    health.record("deepseek", "m", True, first_token=0.5)
+    assert health.latency_percentile("deepseek", "m", 95) == 4.0
+    assert health.latency_percentile("deepseek", "m", 95, first_token=True) == 0.5
+
+    api_manager = _api_manager("http://127.0.0.1:9", "deepseek-window-backup")
+    model = "deepseek-window"
+    for _ in range(5):
+        api_manager.update_stats(APICallStats("deepseek", model, duration=0.0, replayed=True))
+        api_manager.update_stats(APICallStats("deepseek", model, duration=30.0, streamed=True,
+                                              time_to_first_token=0.2))
+        api_manager.update_stats(APICallStats("deepseek", model, duration=1.5))
+    assert api_manager.health.latency_percentile("deepseek", model, 50) == 1.5
+    assert api_manager.health.latency_percentile("deepseek", model, 50, first_token=True) == 0.2
+
+
+def test_fast_primary_is_not_hedged():
+    """测试主请求在触发延迟内返回时不发起对冲"""
+    with MockLLMServer(config=MockLLMConfig(echo=True)) as server:
+        api_manager = _api_manager(server.url, "deepseek-fast-backup", **{'api.hedging.default_delay': 2})
+        assert api_manager.call_api(MESSAGES, model="deepseek-fast") == "对冲测试"
+        assert api_manager.get_stats()["hedging"]["hedged"] == 0
+        assert server.config.request_count == 1
+
+
+def test_slow_primary_is_hedged():
+    """测试主请求超过触发延迟后发起对冲，备用先返回"""
+    config = MockLLMConfig(echo=True, model_latency={"deepseek-slow": SLOW})
+    with MockLLMServer(config=config) as server:
+        api_manager = _api_manager(server.url, "deepseek-slow-backup")
+        start = time.time()
+        assert api_manager.call_api(MESSAGES, model="deepseek-slow") == "对冲测试"
+        assert time.time() - start < SLOW * 0.8
+
+        hedging = api_manager.get_stats()["hedging"]
+        assert hedging["hedged"] == 1 and hedging["backup_wins"] == 1
+        assert _wait_for(lambda: server.config.request_count == 2)
+
+
+def test_tool_calls_are_hedged():
+    """测试原生工具调用同样经过对冲"""
+    config = MockLLMConfig(responses=[{"content": "备用回答"}], model_latency={"deepseek-tools": SLOW})
+    tools = [{"name": "noop", "description": "无操作", "parameters": {"type": "object", "properties": {}}}]
+    with MockLLMServer(config=config) as server:
+        api_manager = _api_manager(server.url, "deepseek-tools-backup")
+        reply = api_manager.call_api_with_tools(MESSAGES, tools, model="deepseek-tools")
+        assert reply["content"] == "备用回答"
+        assert api_manager.get_stats()["hedging"]["backup_wins"] == 1
+
+
+def test_stream_hedged_on_first_token():
+    """测试流式调用按首token延迟对冲，落败的流在输出首个片段后被关闭"""
+    config = MockLLMConfig(echo=True, model_latency={"deepseek-stream": SLOW})
+    with MockLLMServer(config=config) as server:
+        api_manager = _api_manager(server.url, "deepseek-stream-backup")
+        start = time.time()
+        assert "".join(api_manager.call_api_stream(MESSAGES, model="deepseek-stream")) == "对冲测试"
+        assert time.time() - start < SLOW * 0.8
+
+        stats = api_manager.get_stats()
+        assert stats["hedging"]["hedged"] == 1 and stats["hedging"]["backup_wins"] == 1
+        assert _wait_for(lambda: api_manager.get_stats()["aborted_streams"] == 1)
+        assert api_manager.health.latency_percentile("deepseek", "deepseek-stream-backup", 50) is None
+
+
+def test_sync_loser_is_closed():
+    """测试同步对冲胜出后立即关闭仍在等待的落败请求，归还限流槽位并统计浪费的tokens"""
+    config = MockLLMConfig(echo=True, keep_alive=True, model_latency={"deepseek-close": SLOW * 3})
+    with MockLLMServer(config=config) as server:
+        api_manager = _api_manager(server.url, "deepseek-close-backup")
+        start = time.time()
+        assert api_manager.call_api(MESSAGES, model="deepseek-close") == "对冲测试"
+
+        # 落败方在自身延迟结束前就被中止
+        assert _wait_for(lambda: server.config.aborted_count == 1, timeout=SLOW)
+        assert time.time() - start < SLOW * 2
+        stats = api_manager.get_stats()
+        assert stats["hedging"]["cancelled"] == 1 and stats["hedging"]["wasted_tokens"] > 0
+        assert stats["errors"] == 0
+        assert all(lane["in_flight"] == 0 for lane in stats["rate_limit"].values())
+
+
+def test_sync_stream_loser_is_closed():
+    """测试同步流式对冲胜出后关闭仍在等待首token的落败流，计入 aborted_streams 与浪费的tokens"""
+    config = MockLLMConfig(echo=True, keep_alive=True, model_latency={"deepseek-stream-close": SLOW * 3})
+    with MockLLMServer(config=config) as server:
+        api_manager = _api_manager(server.url, "deepseek-stream-close-backup")
+        start = time.time()
+        assert "".join(api_manager.call_api_stream(MESSAGES, model="deepseek-stream-close")) == "对冲测试"
+
+        assert _wait_for(lambda: api_manager.get_stats()["aborted_streams"] == 1, timeout=SLOW)
+        assert time.time() - start < SLOW * 2
+        stats = api_manager.get_stats()
+        assert stats["hedging"]["cancelled"] == 1 and stats["hedging"]["wasted_tokens"] > 0
+        assert stats["errors"] == 0
+        assert all(lane["in_flight"] == 0 for lane in stats["rate_limit"].values())
+        assert _wait_for(lambda: server.config.aborted_count == 1, timeout=SLOW)
+
+
+def test_async_stream_loser_is_cancelled():
+    """测试异步对冲直接取消仍在等待首token的落败流，并归还限流槽位"""
+    pytest.importorskip("aiohttp")
+    config = MockLLMConfig(echo=True, model_latency={"deepseek-async": SLOW})
+    with MockLLMServer(config=config) as server:
+        api_manager = _api_manager(server.url, "deepseek-async-backup")
+
+        async def scenario():
+            return "".join([text async for text in api_manager.call_api_stream_async(MESSAGES,
+                                                                                     model="deepseek-async")])
+
+        start = time.time()
+        assert asyncio.run(scenario()) == "对冲测试"
+        assert time.time() - start < SLOW * 0.8
+
+        stats = api_manager.get_stats()
+        assert stats["hedging"]["backup_wins"] == 1 and stats["aborted_streams"] == 1
+        assert all(lane["in_flight"] == 0 for lane in stats["rate_limit"].values())
+
+
+def test_demoted_primary_goes_to_backup():
+    """测试主提供商健康分过低被降级后，直接优先使用备用模型"""
+    with MockLLMServer(config=MockLLMConfig(echo=True)) as server:
+        api_manager = _api_manager(server.url, "deepseek-demote-backup", **{'api.hedging.default_delay': 2})
+        for _ in range(10):
+            api_manager.health.record("deepseek", "deepseek-demote", False)
+        assert api_manager.health.is_demoted("deepseek", "deepseek-demote")
+
+        assert api_manager.call_api(MESSAGES, model="deepseek-demote") == "对冲测试"
+        assert server.config.last_request["model"] == "deepseek-demote-backup"
+        assert api_manager.get_stats()["hedging"]["demoted_skips"] == 1
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+测试共享HTTP传输层：进程级连接池的复用与每个事件循环一个异步会话
+使用本地模拟LLM服务，无需真实 API Key
+"""
+
+import os
+import sys
+import asyncio
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from http_transport import PooledTransport, get_transport, reset_transport, get_async_session, close_async_session
+
+
+def test_shared_transport():
+    """测试共享实例只创建一次，重置后重新创建"""
+    reset_transport()
+    try:
+        first = get_transport()
+        assert get_transport() is first
+        reset_transport()
+        assert get_transport() is not first
+    finally:
+        reset_transport()
+
+
+def test_connection_reuse():
+    """测试连续请求复用同一个 Keep-Alive 连接"""
+    from mock_llm_server import MockLLMServer
+
+    transport = PooledTransport()
+    try:
+        with MockLLMServer() as server:
+            for _ in range(3):
+                response = transport.post(f"{server.url}/chat/completions", json={"messages": []}, timeout=5)
+                assert response.status_code == 200
+        stats = transport.get_stats()
+    finally:
+        transport.close()
+
+    assert stats["request_count"] == 3
+    assert stats["new_connections"] == 1
+    assert stats["reused_connections"] == 2
+
+
+def test_async_session_per_loop():
+    """测试同一事件循环复用会话，不同事件循环各有自己的会话"""
+
+    async def sessions():
+        first = get_async_session()
+        second = get_async_session()
+        await close_async_session()
+        return first, second
+
+    first, second = asyncio.run(sessions())
+    assert first is second and first.closed
+    other, _ = asyncio.run(sessions())
+    assert other is not first
+
+
+def main():
+    """运行所有测试"""
+    tests = [
+        ("共享传输实例", test_shared_transport),
+        ("连接复用", test_connection_reuse),
+        ("每个事件循环一个会话", test_async_session_per_loop)
+    ]
+
+    passed = 0
+    for test_name, test_func in tests:
+        try:
+            test_func()
+            print(f"✅ {test_name}: 通过")
+            passed += 1
+        except Exception as e:
+            print(f"❌ {test_name}: 失败 - {e}")
+
+    print(f"\n🎯 总体结果: {passed}/{len(tests)} 测试通过")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+测试本地模拟LLM服务与录制/回放磁带
+无需真实 API Key，回放阶段不访问网络
+"""
+
+import os
+import sys
+import time
+import tempfile
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from config_manager import ConfigManager
+from api_manager import APIManager
+from cassette import CassetteMissError
+from mock_llm_server import MockLLMServer, MockLLMConfig
+
+
+def _api_manager(base_url, **settings):
+    """创建指向模拟服务的 APIManager"""
+    config = ConfigManager()
+    config.set('api.deepseek.api_key', 'test-key')
+    config.set('api.deepseek.base_url', base_url)
+    for key, value in settings.items():
+        config.set(key, value)
+    return APIManager(config)
+
+
+def test_mock_non_streaming_and_streaming():
+    """测试模拟服务的非流式与流式响应"""
+    with MockLLMServer(config=MockLLMConfig(echo=True)) as server:
+        api_manager = _api_manager(server.url)
+        messages = [{"role": "user", "content": "模拟服务你好"}]
+
+        assert api_manager.call_api(messages) == "模拟服务你好"
+        pieces = list(api_manager.call_api_stream(messages))
+        assert len(pieces) > 1
+        assert "".join(pieces) == "模拟服务你好"
+
+        stats = api_manager.get_stats()
+        assert stats["request_count"] == 2
+        assert stats["total_tokens"] > 0
+
+
+def test_mock_latency_and_token_rate():
+    """测试首token延迟与输出速度"""
+    config = MockLLMConfig(latency=0.2, tokens_per_second=100, responses=["一二三四五六七八九十"])
+    with MockLLMServer(config=config) as server:
+        api_manager = _api_manager(server.url)
+        start = time.time()
+        api_manager.call_api([{"role": "user", "content": "计时"}])
+        # 0.2s 延迟 + 约 10 个token / 100 tokens/s
+        assert time.time() - start >= 0.25
+
+
+def test_mock_error_injection():
+    """测试错误注入：每次都返回 429 时重试后仍然失败"""
+    config = MockLLMConfig(error_rate=1.0, error_status=429, retry_after=0)
+    with MockLLMServer(config=config) as server:
+        api_manager = _api_manager(server.url)
+        try:
+            api_manager.call_api([{"role": "user", "content": "出错"}])
+            raise AssertionError("应当抛出异常")
+        except AssertionError:
+            raise
+        except Exception:
+            pass
+        assert config.error_count == 3
+
+
+def test_cassette_record_and_replay():
+    """测试录制后在服务关闭的情况下回放"""
+    messages = [{"role": "user", "content": "录制这一条"}]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "cassette.json")
+
+        with MockLLMServer(config=MockLLMConfig(echo=True)) as server:
+            recorder = _api_manager(server.url, **{'api.cassette.mode': 'record', 'api.cassette.path': path})
+            recorded = recorder.call_api(messages)
+            recorded_stream = list(recorder.call_api_stream(messages, temperature=0))
+
+        player = _api_manager("http://127.0.0.1:9", **{'api.cassette.mode': 'replay', 'api.cassette.path': path})
+        assert player.call_api(messages) == recorded
+        assert list(player.call_api_stream(messages, temperature=0)) == recorded_stream
+        assert player.get_stats()["cassette"]["replayed"] == 2
+
+        try:
+            player.call_api([{"role": "user", "content": "没有录制"}])
+            raise AssertionError("应当抛出 CassetteMissError")
+        except CassetteMissError:
+            pass
+
+
+def test_native_tool_calls():
+    """测试原生工具调用：tools 字段发送工具描述，Agent 直接执行结构化的 tool_calls"""
+    from agent import ReactAgent
+
+    tool_call = {"id": "call_1", "type": "function",
+                 "function": {"name": "read_file", "arguments": '{"file_path": "%s"}' % os.path.abspath(__file__)}}
+    config = MockLLMConfig(responses=[{"content": "", "tool_calls": [tool_call]}, {"content": "文件已读取"}])
+    with MockLLMServer(config=config) as server:
+        api_manager = _api_manager(server.url, **{'api.deepseek.native_tools': True, 'database.enabled': False})
+        agent = ReactAgent(api_manager.config)
+        agent.api_manager = api_manager
+        result = agent.run("读一下测试文件")
+
+        assert result["status"] == "success", result
+        assert result["answer"] == "文件已读取"
+        assert result["actions"] == 1
+
+        body = config.last_request
+        assert any(tool["function"]["name"] == "read_file" for tool in body["tools"])
+        assert "本次可用工具" not in body["messages"][0]["content"]
+        tool_message = body["messages"][-1]
+        assert tool_message["role"] == "tool" and tool_message["tool_call_id"] == "call_1"
+        assert body["messages"][-2]["tool_calls"][0]["id"] == "call_1"
+
+
+def main():
+    """运行所有测试"""
+    tests = [
+        ("模拟服务响应", test_mock_non_streaming_and_streaming),
+        ("延迟与输出速度", test_mock_latency_and_token_rate),
+        ("错误注入", test_mock_error_injection),
+        ("录制与回放", test_cassette_record_and_replay),
+        ("原生工具调用", test_native_tool_calls)
+    ]
+
+    passed = 0
+    for test_name, test_func in tests:
+        try:
+            test_func()
+            print(f"✅ {test_name}: 通过")
+            passed += 1
+        except Exception as e:
+            print(f"❌ {test_name}: 失败 - {e}")
+
+    print(f"\n🎯 总体结果: {passed}/{len(tests)} 测试通过")
+
+
+if __name__ == "__main__":
+    main()
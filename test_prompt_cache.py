@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+测试提供商前缀缓存：系统提示词前缀字节稳定（与工具注册顺序、换行符和行尾空白无关），
+以及命中缓存的 prompt tokens 按折扣价格计费
+"""
+
+import os
+import sys
+
+import pytest
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from config_manager import ConfigManager
+from api_manager import APIManager
+from prompt_cache import canonical_prefix, cached_prompt_tokens, anthropic_prompt_usage, with_cache_control
+from system_prompts import get_system_prompt
+from tool_registry import ToolRegistry
+
+
+def read_file(file_path: str) -> str:
+    """读取文件内容"""
+    return file_path
+
+
+def write_file(file_path: str, content: str) -> str:
+    """写入文件"""
+    return content
+
+
+def run_command(command: str, timeout: int = 30) -> str:
+    """执行命令"""
+    return command
+
+
+TOOLS = [("read_file", read_file), ("write_file", write_file), ("run_command", run_command)]
+
+
+def _api_manager():
+    config = ConfigManager()
+    config.set('api.deepseek.api_key', 'test-key')
+    return APIManager(config)
+
+
+def _system_prefix(api_manager, tools, line_ending: str = "\n") -> bytes:
+    """按给定顺序注册工具，返回实际发送的系统消息字节"""
+    registry = ToolRegistry()
+    for name, function in tools:
+        registry.register(name, function)
+    prompt = get_system_prompt("database_enhanced", registry.render_tool_list())
+    prompt = line_ending.join(line + " " for line in prompt.split("\n"))
+    messages = [{"role": "system", "content": prompt}, {"role": "user", "content": "你好"}]
+    return api_manager._prepare_messages(messages)[0]["content"].encode("utf-8")
+
+
+def test_canonical_prefix():
+    """测试统一换行符、去掉行尾空白与首尾空行，同一原文返回同一个字符串对象"""
+    text = "\r\n系统提示词  \r\n- 工具\t\r\n\r\n"
+    assert canonical_prefix(text) == "系统提示词\n- 工具"
+    assert canonical_prefix(text) is canonical_prefix(text)
+    assert canonical_prefix(None) is None
+
+
+def test_system_prefix_independent_of_registration_order():
+    """测试不同的工具注册顺序、换行符与行尾空白渲染出逐字节相同的系统提示词"""
+    api_manager = _api_manager()
+    expected = _system_prefix(api_manager, TOOLS)
+    assert _system_prefix(api_manager, list(reversed(TOOLS))) == expected
+    assert _system_prefix(api_manager, TOOLS[1:] + TOOLS[:1], line_ending="\r\n") == expected
+    assert b"- read_file(" in expected and expected.index(b"- read_file(") < expected.index(b"- write_file(")
+
+    # 只有开头连续的系统消息属于前缀，之后的消息保持原样
+    messages = [{"role": "user", "content": "a  "}, {"role": "system", "content": "b  "}]
+    assert [msg["content"] for msg in api_manager._prepare_messages(messages)] == ["a  ", "b  "]
+
+
+def test_cached_usage_parsing():
+    """测试解析 DeepSeek、OpenAI 与 Anthropic 的缓存命中用量"""
+    assert cached_prompt_tokens({"prompt_tokens": 1000, "prompt_cache_hit_tokens": 800}) == 800
+    assert cached_prompt_tokens({"prompt_tokens": 1000, "prompt_tokens_details": {"cached_tokens": 512}}) == 512
+    assert cached_prompt_tokens({"prompt_tokens": 1000, "prompt_tokens_details": None}) == 0
+    assert anthropic_prompt_usage({"input_tokens": 100, "cache_read_input_tokens": 900,
+                                   "cache_creation_input_tokens": 50}) == (1050, 900, 50)
+
+    message = with_cache_control({"role": "user", "content": "历史"})
+    assert message["content"] == [{"type": "text", "text": "历史", "cache_control": {"type": "ephemeral"}}]
+
+
+def test_cached_tokens_billed_at_discount():
+    """测试命中缓存的 prompt tokens 按 cached_input 价格计费，并计入节省的成本"""
+    api_manager = _api_manager()
+    pricing = APIManager.PRICING["deepseek"]["deepseek-chat"]
+    _, stats = api_manager._parse_deepseek_response({
+        "choices": [{"message": {"content": "好"}}],
+        "usage": {"prompt_tokens": 1000, "completion_tokens": 100, "prompt_cache_hit_tokens": 800}
+    }, "deepseek-chat")
+
+    assert stats.cached_prompt_tokens == 800
+    expected = (200 * pricing["input"] + 800 * pricing["cached_input"] + 100 * pricing["output"]) / 1000
+    assert stats.cost == pytest.approx(expected)
+    full = api_manager.estimate_cost("deepseek", "deepseek-chat", 1000, 100)
+    assert full == pytest.approx((1000 * pricing["input"] + 100 * pricing["output"]) / 1000)
+
+    before = api_manager.get_stats()["prompt_cache"]
+    api_manager.update_stats(stats)
+    after = api_manager.get_stats()["prompt_cache"]
+    assert after["cached_prompt_tokens"] - before["cached_prompt_tokens"] == 800
+    assert after["savings"] - before["savings"] == pytest.approx(full - expected, abs=1e-6)
+
+    # Anthropic 写入缓存按 cache_write 价格计费；未配置缓存价格的模型按普通输入价格计费
+    claude = APIManager.PRICING["anthropic"]["claude-3-5-haiku-20241022"]
+    cost = api_manager.estimate_cost("anthropic", "claude-3-5-haiku-20241022", 1050, 0,
+                                     cached_tokens=900, cache_write_tokens=50)
+    assert cost == pytest.approx((100 * claude["input"] + 900 * claude["cached_input"]
+                                  + 50 * claude["cache_write"]) / 1000)
+    assert api_manager.estimate_cost("openai", "gpt-3.5-turbo", 1000, 0, cached_tokens=800) == \
+        api_manager.estimate_cost("openai", "gpt-3.5-turbo", 1000, 0)
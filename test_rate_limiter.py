@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+测试提供商限流：令牌桶、AIMD 并发上限、Retry-After 暂停、按 提供商+密钥 分道，
+以及等待配额时被中断不会泄漏并发槽。时间由假时钟推进，不真正等待
+"""
+
+import os
+import sys
+import asyncio
+from types import SimpleNamespace
+from unittest import mock
+from email.utils import formatdate
+
+import pytest
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import rate_limiter
+from rate_limiter import TokenBucket, AIMDLimiter, RateLimiter, retry_after_seconds, error_status
+
+
+class FakeClock:
+    """替代 rate_limiter 中的 time 模块，sleep 只推进时间"""
+
+    def __init__(self, start: float = 1000.0):
+        self.now = start
+        self.sleeps = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def time(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class HTTPError(Exception):
+    """带状态码与响应头的提供商错误"""
+
+    def __init__(self, status_code: int, headers: dict = None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+@pytest.fixture
+def clock():
+    fake = FakeClock()
+    with mock.patch.object(rate_limiter, "time", fake):
+        yield fake
+
+
+def _fail(limiter: RateLimiter, error: BaseException, provider: str = "deepseek", api_key: str = "k"):
+    with pytest.raises(type(error)):
+        with limiter.limit(provider, api_key):
+            raise error
+
+
+def test_token_bucket(clock):
+    """测试配额用完后按补充速度等待，超出容量的单次请求按容量计算，修正不超过容量"""
+    bucket = TokenBucket(per_minute=2)
+    assert bucket.reserve(1, clock.now) == 0 and bucket.reserve(1, clock.now) == 0
+    assert bucket.reserve(1, clock.now) == pytest.approx(30.0)
+    assert bucket.reserve(1, clock.now + 90) == 0
+
+    tokens = TokenBucket(per_minute=600)
+    assert tokens.reserve(10_000, clock.now) == 0
+    tokens.adjust(-10_000)
+    assert tokens.level == 600
+    assert TokenBucket(per_minute=0).reserve(10 ** 9, clock.now) == 0
+
+
+def test_aimd_limits():
+    """测试成功时加性增加，限流时减半且冷却期内只收缩一次，不低于下限、不超过上限"""
+    limiter = AIMDLimiter(initial=4, min_limit=1, max_limit=5)
+    for _ in range(4):
+        limiter.on_success()
+    assert limiter.limit == pytest.approx(5.0, abs=0.1)
+    for _ in range(20):
+        limiter.on_success()
+    assert limiter.limit == 5
+
+    assert limiter.on_throttle(10.0) and limiter.limit == 2.5
+    assert not limiter.on_throttle(10.5) and limiter.limit == 2.5
+    for step in range(5):
+        limiter.on_throttle(20.0 + step * 2)
+    assert limiter.limit == 1
+
+
+def test_throttle_status_shrinks_concurrency(clock):
+    """测试 429/5xx 收缩并发上限，其他 4xx 只释放槽位，成功调用逐步恢复"""
+    limiter = RateLimiter(concurrency={"initial": 8})
+    _fail(limiter, HTTPError(429))
+    stats = limiter.get_stats()
+    lane = next(iter(stats.values()))
+    assert lane["concurrency_limit"] == 4 and lane["throttled"] == 1 and lane["in_flight"] == 0
+
+    clock.now += 5
+    _fail(limiter, HTTPError(503))
+    assert next(iter(limiter.get_stats().values()))["concurrency_limit"] == 2
+
+    clock.now += 5
+    _fail(limiter, HTTPError(400))
+    _fail(limiter, ValueError("解析失败"))
+    assert next(iter(limiter.get_stats().values()))["concurrency_limit"] == 2
+
+    for _ in range(3):
+        with limiter.limit("deepseek", "k"):
+            pass
+    assert next(iter(limiter.get_stats().values()))["concurrency_limit"] == 3
+
+
+def test_retry_after_parsing(clock):
+    """测试 Retry-After 支持秒数与HTTP日期，缺失或无法解析时返回None"""
+    assert retry_after_seconds(HTTPError(429, {"Retry-After": "7"})) == 7
+    assert retry_after_seconds(HTTPError(429, {"retry-after": "-3"})) == 0
+    date = formatdate(clock.now + 30, usegmt=True)
+    assert retry_after_seconds(HTTPError(429, {"Retry-After": date})) == pytest.approx(30, abs=1)
+    assert retry_after_seconds(HTTPError(429, {"Retry-After": "soon"})) is None
+    assert retry_after_seconds(HTTPError(429)) is None
+
+    response_error = Exception()
+    response_error.response = SimpleNamespace(status_code=502, headers={"Retry-After": "2"})
+    assert error_status(response_error) == 502 and retry_after_seconds(response_error) == 2
+
+
+def test_retry_after_pauses_lane(clock):
+    """测试 Retry-After 暂停同一密钥的后续调用，暂停时长不超过 max_retry_after"""
+    limiter = RateLimiter(max_retry_after=10)
+    _fail(limiter, HTTPError(429, {"Retry-After": "3600"}))
+    assert next(iter(limiter.get_stats().values()))["paused_for"] == 10
+
+    with mock.patch.object(limiter._released, "wait", side_effect=lambda timeout: clock.sleep(timeout)):
+        with limiter.limit("deepseek", "k"):
+            pass
+    assert clock.sleeps == [10]
+    assert next(iter(limiter.get_stats().values()))["paused_for"] == 0
+
+
+def test_lanes_per_provider_and_key(clock):
+    """测试不同提供商或不同密钥各自计算配额与暂停，统计中只保留密钥指纹"""
+    limiter = RateLimiter(limits={"deepseek": {"rpm": 1}})
+    _fail(limiter, HTTPError(429, {"Retry-After": "30"}), api_key="key-a")
+    with limiter.limit("deepseek", "key-b"):
+        pass
+    with limiter.limit("openai", "key-a"):
+        pass
+    assert clock.sleeps == []
+
+    stats = limiter.get_stats()
+    assert len(stats) == 3
+    assert all("key-a" not in key and "key-b" not in key for key in stats)
+    assert stats[RateLimiter._lane_key("deepseek", "key-a")]["paused_for"] == 30
+    assert stats[RateLimiter._lane_key("deepseek", "key-b")]["paused_for"] == 0
+
+
+def test_sync_wait_for_quota(clock):
+    """测试请求与token配额用完后等待补充，并按实际用量修正token预留"""
+    limiter = RateLimiter(limits={"deepseek": {"rpm": 2, "tpm": 1000}})
+    lane_key = RateLimiter._lane_key("deepseek", "k")
+    with limiter.limit("deepseek", "k", tokens=100) as permit:
+        permit.settle(300)
+    assert limiter._lanes[lane_key].tokens.level == pytest.approx(700.0)
+    with limiter.limit("deepseek", "k", tokens=100):
+        pass
+    assert clock.sleeps == []
+
+    # 2 个请求已用完 rpm，第 3 个请求等待补充 1 个请求的时间
+    with limiter.limit("deepseek", "k", tokens=100):
+        pass
+    assert clock.sleeps == [pytest.approx(30.0)]
+    assert limiter.get_stats()[lane_key]["total_wait_seconds"] == pytest.approx(30.0)
+
+    # token 余额不足时按 tpm 补充速度等待
+    with limiter.limit("deepseek", "k", tokens=1000):
+        pass
+    assert clock.sleeps[-1] == pytest.approx(30.0, abs=0.1)
+
+
+def test_interrupted_sync_wait_releases_slot(clock):
+    """测试等待配额时被中断（如 KeyboardInterrupt）会释放并发槽并退还预留"""
+    limiter = RateLimiter(limits={"deepseek": {"rpm": 1, "tpm": 1000}}, concurrency={"initial": 1})
+    with limiter.limit("deepseek", "k", tokens=500):
+        pass
+
+    with mock.patch.object(clock, "sleep", side_effect=KeyboardInterrupt):
+        with pytest.raises(KeyboardInterrupt):
+            with limiter.limit("deepseek", "k", tokens=500):
+                pass
+
+    lane = limiter._lanes[RateLimiter._lane_key("deepseek", "k")]
+    assert lane.concurrency.in_flight == 0
+    assert lane.requests.level == pytest.approx(0.0) and lane.tokens.level == pytest.approx(500.0)
+    # 并发上限为1：槽位若泄漏，这里会一直等待
+    clock.now += 60
+    with limiter.limit("deepseek", "k", tokens=500):
+        pass
+
+
+def test_cancelled_async_wait_releases_slot(clock):
+    """测试异步等待配额时任务被取消（对冲失败方、调用方超时）不会泄漏并发槽"""
+    limiter = RateLimiter(limits={"deepseek": {"rpm": 1}}, concurrency={"initial": 1})
+
+    async def scenario():
+        async with limiter.limit_async("deepseek", "k"):
+            pass
+
+        async def waiting():
+            # rpm 用完，需等待60秒配额补充
+            async with limiter.limit_async("deepseek", "k"):
+                pass
+
+        task = asyncio.ensure_future(waiting())
+        await asyncio.sleep(0.05)
+        lane = limiter._lanes[RateLimiter._lane_key("deepseek", "k")]
+        assert lane.concurrency.in_flight == 1
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert lane.concurrency.in_flight == 0
+
+        clock.now += 60
+        await asyncio.wait_for(waiting(), timeout=1)
+
+    asyncio.run(scenario())
+
+
+def test_retry_wait_uses_configured_cap():
+    """测试重试等待的 Retry-After 上限取自 APIManager 配置，而不是固定的60秒"""
+    from api_manager import _retry_wait
+
+    error = HTTPError(429, {"Retry-After": "3600"})
+    state = SimpleNamespace(args=(SimpleNamespace(max_retry_after=5),),
+                            outcome=SimpleNamespace(exception=lambda: error))
+    assert _retry_wait(state) == 5
+    assert _retry_wait(state, max_retry_after=20) == 20
+    assert _retry_wait(SimpleNamespace(args=(), outcome=state.outcome)) == 60
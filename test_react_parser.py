@@ -0,0 +1,562 @@
+#!/usr/bin/env python3
+"""
+测试 ReAct 回复解析器与 ReactAgent 的动作分派
+Agent 部分使用本地模拟LLM服务或按预设回复输出的 StubAPIManager，无需真实 API Key
+"""
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from react_parser import parse_react_response, loads_tolerant, StreamingActionParser
+from tools import fix_string_values
+
+
+class StubAPIManager:
+    """
+    按顺序返回预设回复的 APIManager 替身，流式回复按固定长度分片，并记录流是否被提前关闭
+    native 为真时走原生工具调用，回复为 {"content", "tool_calls"} 字典
+    """
+
+    def __init__(self, replies, chunk_size: int = 4, native: bool = False):
+        self.replies = list(replies)
+        self.chunk_size = chunk_size
+        self.native = native
+        self.requests = []
+        self.tool_schemas = []
+        self.streams = []
+
+    def native_tools_enabled(self, model=None) -> bool:
+        return self.native
+
+    def call_api_with_tools(self, messages, tools, model=None, temperature=None):
+        from function_calling import tool_reply
+
+        self.requests.append(list(messages))
+        self.tool_schemas.append(tools)
+        reply = self.replies.pop(0)
+        return tool_reply(reply.get("content"), reply.get("tool_calls"))
+
+    def call_api(self, messages, model=None, temperature=None):
+        self.requests.append(messages)
+        return self.replies.pop(0)
+
+    def call_api_stream(self, messages, model=None, temperature=None):
+        self.requests.append(messages)
+        reply = self.replies.pop(0)
+        record = {"sent": 0, "aborted": False, "finished": False}
+        self.streams.append(record)
+        try:
+            for index in range(0, len(reply), self.chunk_size):
+                record["sent"] = min(index + self.chunk_size, len(reply))
+                yield reply[index:index + self.chunk_size]
+        except GeneratorExit:
+            record["aborted"] = record["sent"] < len(reply)
+            raise
+        finally:
+            record["finished"] = True
+
+
+def _stub_agent(replies, **settings):
+    """创建使用 StubAPIManager 的 ReactAgent"""
+    from config_manager import ConfigManager
+    from agent import ReactAgent
+
+    config = ConfigManager()
+    config.set('database.enabled', False)
+    config.set('api.cache.enabled', False)
+    for key, value in settings.items():
+        config.set(key, value)
+    agent = ReactAgent(config)
+    agent.api_manager = StubAPIManager(replies)
+    return agent
+
+
+def _drain(stream):
+    """运行流式生成器，返回 (结果, 输出文本)"""
+    output = []
+    try:
+        while True:
+            output.append(next(stream))
+    except StopIteration as stop:
+        return stop.value, "".join(output)
+
+
+def test_strict_json():
+    """测试合法JSON回复"""
+    step = parse_react_response(json.dumps({
+        "thought": "需要查询库存",
+        "action": [{"tool": "check_product_stock", "product_name": "安吉白茶"}]
+    }, ensure_ascii=False))
+    assert step.format == "json"
+    assert step.has_action and not step.is_final
+    assert step.actions == [{"tool": "check_product_stock", "product_name": "安吉白茶"}]
+    assert not step.errors
+
+
+def test_tolerant_json():
+    """测试未转义的换行与引号、末尾逗号和markdown标记"""
+    step = parse_react_response('```json\n{"thought": "第一行\n第二行", '
+                                '"final_answer": "他说"你好"，比例 "3:1"",}\n```')
+    assert step.thought == "第一行\n第二行"
+    assert step.final_answer == '他说"你好"，比例 "3:1"'
+    assert step.is_final
+    assert not step.errors
+
+
+def test_error_spans():
+    """测试无法修复的错误返回精确位置"""
+    text = '{"thought": "t",\n"action": [{"tool": 3}]}'
+    step = parse_react_response(text)
+    assert not step.has_action and not step.is_final
+    assert step.errors
+
+    value, errors, _ = loads_tolerant('{"a": [1, 2')
+    assert value == {"a": [1, 2]}
+    assert errors[0].line == 1 and errors[0].start == 6
+
+
+def test_react_labels_and_plain_text():
+    """测试文本 ReAct 标签与纯文本回答"""
+    step = parse_react_response('Thought: 查订单\nAction: [{"tool": "check_order_status", "order_id": "3"}]')
+    assert step.format == "react"
+    assert step.actions[0]["order_id"] == "3"
+
+    step = parse_react_response("产品描述{特殊字符}")
+    assert step.format == "text"
+    assert step.final_answer == "产品描述{特殊字符}"
+
+
+def test_streaming_action_parser():
+    """测试增量解析：action 对象逐个闭合，数组闭合后标记结束"""
+    text = '{"thought": "他说"好", 再查", "action": [{"tool": "a", "q": "x}]"}, {"tool": "b"}], "final_answer": "多余"}'
+    parser = StreamingActionParser()
+    actions = []
+    for index in range(0, len(text), 3):
+        actions.extend(parser.feed(text[index:index + 3]))
+        if parser.action_closed:
+            break
+    assert actions == [{"tool": "a", "q": "x}]"}, {"tool": "b"}]
+    assert text[:parser.action_end].endswith('{"tool": "b"}]')
+    assert not parser.complete
+
+
+def test_streaming_final_answer_before_action():
+    """测试 final_answer 出现在 action 之前时不作为最终答案，确认没有 action 后才给出"""
+    parser = StreamingActionParser()
+    text = '{"thought": "先答再查", "final_answer": "猜的答案", "action": [{"tool": "a"}]}'
+    actions = []
+    for index in range(0, len(text), 2):
+        actions.extend(parser.feed(text[index:index + 2]))
+        assert parser.final_answer_end is None
+    assert actions == [{"tool": "a"}] and parser.action_closed
+
+    # 下一个字段不是 action，或对象直接闭合时确认
+    parser = StreamingActionParser()
+    parser.feed('{"final_answer": "答案", "observation')
+    assert parser.final_answer_end is None
+    parser.feed('": "多余"')
+    assert parser.final_answer == "答案"
+    text = '{"thought": "t", "final_answer": "答案"}'
+    parser = StreamingActionParser()
+    parser.feed(text[:-1])
+    assert parser.final_answer_end is None
+    parser.feed(text[-1:])
+    assert parser.final_answer == "答案" and text[:parser.final_answer_end].endswith('"答案"')
+
+
+def test_request_history_fits_token_budget_only():
+    """测试默认只按 token 预算裁剪历史，多步工具调用的观察结果在预算内全部保留"""
+    agent = _stub_agent([])
+    assert agent.config.get('conversation.max_history') is None
+    messages = [{"role": "system", "content": "系统提示"}, {"role": "user", "content": "原始问题"}]
+    for index in range(8):
+        messages.append({"role": "assistant", "content": f'{{"action": [{{"tool": "t", "n": {index}}}]}}'})
+        messages.append({"role": "user", "content": f'{{"observation": "结果{index}"}}'})
+    assert agent._build_request_messages(messages) == messages
+
+    agent.config.set('conversation.max_history', 4)
+    trimmed = agent._build_request_messages(messages)
+    assert trimmed[:2] == messages[:2] and trimmed[2:] == messages[-4:]
+
+
+def test_fix_string_values():
+    """测试兼容的 fix_string_values 接口"""
+    fixed = fix_string_values('```json\n{"content": "a\nb"c"}\n```')
+    assert json.loads(fixed) == {"content": 'a\nb"c'}
+
+
+def test_agent_dispatch():
+    """测试 Agent 按解析结果调用工具并返回 final_answer"""
+    from config_manager import ConfigManager
+    from agent import ReactAgent
+    from mock_llm_server import MockLLMServer, MockLLMConfig
+
+    responses = [
+        '{"thought": "读取文件", "action": [{"tool": "read_file", "file_path": "%s"}]}' % os.path.abspath(__file__),
+        '{"thought": "缺少字段"',
+        '{"thought": "完成", "final_answer": "文件已读取"}'
+    ]
+    with MockLLMServer(config=MockLLMConfig(responses=responses)) as server:
+        config = ConfigManager()
+        config.set('api.deepseek.api_key', 'test-key')
+        config.set('api.deepseek.base_url', server.url)
+        config.set('database.enabled', False)
+        result = ReactAgent(config).run("读一下测试文件")
+
+    assert result["status"] == "success", result
+    assert result["answer"] == "文件已读取"
+    assert result["actions"] == 1
+
+
+def test_speculative_dispatch():
+    """测试流式输出中提前执行工具并中止请求"""
+    from config_manager import ConfigManager
+    from agent import ReactAgent
+    from mock_llm_server import MockLLMServer, MockLLMConfig
+
+    action = '{"thought": "读取", "action": [{"tool": "read_file", "file_path": "%s"}],' % os.path.abspath(__file__)
+    responses = [action + ' "observation": "' + "模型擅自生成的内容" * 20 + '"}',
+                 '{"thought": "完成", "final_answer": "文件已读取"}']
+    with MockLLMServer(config=MockLLMConfig(responses=responses, tokens_per_second=200)) as server:
+        config = ConfigManager()
+        config.set('api.deepseek.api_key', 'test-key')
+        config.set('api.deepseek.base_url', server.url)
+        config.set('database.enabled', False)
+        config.set('conversation.early_stop_measure_every', 0)
+        agent = ReactAgent(config)
+        stream = agent.run_stream("读一下测试文件")
+        output = []
+        try:
+            while True:
+                output.append(next(stream))
+        except StopIteration as stop:
+            result = stop.value
+
+    assert result["status"] == "success", result
+    assert result["answer"] == "文件已读取"
+    assert result["stats"]["speculative_actions"] == 1
+    assert result["stats"]["aborted_streams"] == 1
+    assert "模型擅自生成的内容" * 2 not in "".join(output)
+    assert agent.api_manager.get_stats()["aborted_streams"] == 1
+
+
+def test_final_answer_early_stop():
+    """测试 final_answer 完整后立即返回，并按完整生成的回复估算节省量"""
+    from config_manager import ConfigManager
+    from agent import ReactAgent
+    from mock_llm_server import MockLLMServer, MockLLMConfig
+
+    responses = ['{"thought": "直接回答", "final_answer": "答案", "observation": "' + "多余的内容" * 20 + '"}']
+    with MockLLMServer(config=MockLLMConfig(responses=responses, tokens_per_second=200)) as server:
+        config = ConfigManager()
+        config.set('api.deepseek.api_key', 'test-key')
+        config.set('api.deepseek.base_url', server.url)
+        config.set('database.enabled', False)
+        agent = ReactAgent(config)
+
+        def run():
+            stream = agent.run_stream("你好")
+            output = []
+            try:
+                while True:
+                    output.append(next(stream))
+            except StopIteration as stop:
+                return stop.value, "".join(output)
+
+        # 每次都完整生成：不中止，但记录尾部长度
+        config.set('conversation.early_stop_measure_every', 1)
+        result, output = run()
+        assert result["answer"] == "答案"
+        assert result["stats"]["aborted_streams"] == 0
+        assert "多余的内容" not in output
+
+        config.set('conversation.early_stop_measure_every', 0)
+        result, output = run()
+
+    assert result["status"] == "success", result
+    assert result["answer"] == "答案"
+    assert result["stats"]["aborted_streams"] == 1
+    assert result["stats"]["tokens_saved"] > 0
+    assert result["stats"]["latency_saved"] > 0
+    assert "多余的内容" * 2 not in output
+
+
+def test_speculative_dispatch_aborts_stub_stream():
+    """测试 action 完整后立即提交工具并关闭仍在输出的流，解析后的回复复用已提交的结果"""
+    reply = ('{"thought": "查询", "action": [{"tool": "probe", "query": "茶"}], "observation": "'
+             + "模型擅自生成的内容" * 20 + '"}')
+    agent = _stub_agent([reply, '{"thought": "完成", "final_answer": "查到了"}'],
+                        **{'conversation.early_stop_measure_every': 0})
+    stub = agent.api_manager
+    calls, submitted = [], []
+
+    def probe(query: str) -> str:
+        """记录调用并返回结果"""
+        calls.append(query)
+        return f"结果: {query}"
+
+    agent.tool_manager.register_tool("probe", probe)
+    submit_action = agent.tool_manager.submit_action
+
+    def tracking_submit(action):
+        submitted.append((action["tool"], stub.streams[-1]["finished"]))
+        return submit_action(action)
+
+    agent.tool_manager.submit_action = tracking_submit
+    result, output = _drain(agent.run_stream("查一下茶"))
+
+    assert result["status"] == "success", result
+    assert result["answer"] == "查到了"
+    assert result["stats"]["speculative_actions"] == 1
+    assert result["stats"]["aborted_streams"] == 1
+    # 流在输出完之前被关闭，工具只提交并执行一次
+    assert stub.streams[0]["aborted"] and stub.streams[0]["sent"] < len(reply)
+    assert submitted == [("probe", False)] and calls == ["茶"]
+    assert json.loads(stub.requests[1][-1]["content"]) == {"observation": "结果: 茶"}
+    assert "模型擅自生成的内容" * 2 not in output
+
+
+def test_side_effect_tools_wait_for_parsed_reply():
+    """测试有副作用的工具不在流式输出中预执行，而是在回复解析后执行"""
+    directory = tempfile.mkdtemp()
+    target = os.path.join(directory, "out.txt")
+    action = json.dumps({"thought": "读后写", "action": [
+        {"tool": "read_file", "file_path": os.path.abspath(__file__)},
+        {"tool": "write_to_file", "file_path": target, "content": "写入"}
+    ]}, ensure_ascii=False)
+    agent = _stub_agent([action, '{"thought": "完成", "final_answer": "已写入"}'],
+                        **{'conversation.early_stop_measure_every': 0})
+    submitted = []
+    submit_action = agent.tool_manager.submit_action
+
+    def tracking_submit(action):
+        submitted.append((action["tool"], agent.api_manager.streams[-1]["finished"]))
+        return submit_action(action)
+
+    agent.tool_manager.submit_action = tracking_submit
+    result, _ = _drain(agent.run_stream("读写文件"))
+
+    assert result["status"] == "success", result
+    assert result["stats"]["speculative_actions"] == 1
+    # read_file 在流式输出中提交，write_to_file 在回复结束后才提交
+    assert submitted == [("read_file", False), ("write_to_file", True)]
+    with open(target, "r", encoding="utf-8") as f:
+        assert f.read() == "写入"
+    shutil.rmtree(directory)
+
+
+def test_unmatched_dispatch_is_collected():
+    """测试解析后的回复中不存在的预执行动作被取消或收集，不会无主运行"""
+    import threading
+    from react_parser import ReactStep
+    from run_memo import RunMemo
+
+    agent = _stub_agent([])
+    started, release = threading.Event(), threading.Event()
+
+    def slow_lookup(key: str) -> str:
+        """等待放行后返回"""
+        started.set()
+        release.wait(5)
+        return key
+
+    agent.tool_manager.register_tool("slow_lookup", slow_lookup)
+    memo = RunMemo()
+    orphan = agent._dispatch_action({"tool": "slow_lookup", "key": "多余"}, memo)
+    assert started.wait(5)
+    threading.Timer(0.1, release.set).start()
+
+    step = ReactStep(actions=[{"tool": "read_file", "file_path": os.path.abspath(__file__)}])
+    messages = agent._execute_actions(step, dispatched=[orphan], memo=memo)
+
+    assert orphan[1][1].done()
+    assert memo.get({"tool": "slow_lookup", "key": "多余"}) == (True, "多余")
+    observation = json.loads(messages[0]["content"])["observation"]
+    assert not isinstance(observation, list)
+
+
+def test_native_tool_calls_round_trip():
+    """测试原生工具调用：tool_calls 分派到工具，结果按调用 id 以 tool 消息回传给模型"""
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "note.txt")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("原生工具调用的内容")
+    agent = _stub_agent([
+        {"content": "", "tool_calls": [{"id": "call_read", "name": "read_file",
+                                        "arguments": json.dumps({"file_path": path})}]},
+        {"content": "文件已读取"}
+    ])
+    stub = agent.api_manager
+    stub.native = True
+    result = agent.run("读一下文件")
+    shutil.rmtree(directory)
+
+    assert result["status"] == "success", result
+    assert result["answer"] == "文件已读取" and result["actions"] == 1
+    assert "read_file" in {schema["name"] for schema in stub.tool_schemas[0]}
+    first, second = stub.requests
+    assert first[0]["content"] == agent.native_system_prompt
+    assistant, tool_message = second[-2:]
+    assert assistant["tool_calls"][0]["id"] == "call_read"
+    assert json.loads(assistant["tool_calls"][0]["function"]["arguments"]) == {"file_path": path}
+    assert tool_message == {"role": "tool", "tool_call_id": "call_read", "content": "原生工具调用的内容"}
+
+
+def test_trimmed_reply_history():
+    """测试提前结束的回复写入历史时：被截断的对象补全括号并补回 ``` 标记，已闭合的对象不重复补括号"""
+    path = os.path.abspath(__file__)
+    action = '{"thought": "读取", "action": [{"tool": "read_file", "file_path": "%s"}]' % path
+    replies = ['```json\n' + action + ', "observation": "' + "模型擅自生成的内容" * 20 + '"}\n```',
+               action + '}',
+               '{"thought": "完成", "final_answer": "文件已读取"}']
+    agent = _stub_agent(replies, **{'conversation.early_stop_measure_every': 0,
+                                    'conversation.context_window': 100000})
+    result, _ = _drain(agent.run_stream("读两次文件"))
+    assert result["status"] == "success", result
+
+    history = [msg["content"] for msg in agent.api_manager.requests[-1] if msg["role"] == "assistant"]
+    assert history[0] == '```json\n' + action + '\n}\n```'
+    assert history[1] == action + '}'
+    assert all(not parse_react_response(content).errors for content in history)
+
+
+def test_early_stop_keeps_action_after_final_answer():
+    """测试回复先给 final_answer 再给 action 时不提前结束，action 照常执行"""
+    reply = json.dumps({"thought": "先答再查", "final_answer": "猜的答案",
+                        "action": [{"tool": "read_file", "file_path": os.path.abspath(__file__)}]},
+                       ensure_ascii=False)
+    agent = _stub_agent([reply, '{"thought": "完成", "final_answer": "文件已读取"}'],
+                        **{'conversation.early_stop_measure_every': 0})
+    result, _ = _drain(agent.run_stream("读一下测试文件"))
+
+    assert result["status"] == "success", result
+    assert result["answer"] == "文件已读取"
+    assert result["stats"]["steps"] == 1 and result["stats"]["speculative_actions"] == 1
+    assert len(agent.api_manager.requests) == 2
+
+
+def test_first_reply_seeds_savings_estimate():
+    """测试进程内第一次可提前结束的回复完整生成以建立估算，之后的中止才计入节省量"""
+    from unittest import mock
+    import agent as agent_module
+
+    reply = '{"thought": "直接回答", "final_answer": "答案", "observation": "' + "多余的内容" * 20 + '"}'
+    agent = _stub_agent([reply, reply])
+    with mock.patch.object(agent_module, "_reply_tails", agent_module._ReplyTailEstimator()) as tails:
+        first, _ = _drain(agent.run_stream("你好"))
+        assert first["stats"]["aborted_streams"] == 0 and tails.samples == 1
+        assert not agent.api_manager.streams[0]["aborted"]
+
+        second, _ = _drain(agent.run_stream("你好"))
+    assert second["answer"] == "答案"
+    assert second["stats"]["aborted_streams"] == 1 and second["stats"]["tokens_saved"] > 0
+    assert agent.api_manager.streams[1]["aborted"]
+
+    # 不测量时中止仍计数，但在有样本之前不报告节省量
+    agent = _stub_agent([reply], **{'conversation.early_stop_measure_every': 0})
+    with mock.patch.object(agent_module, "_reply_tails", agent_module._ReplyTailEstimator()):
+        result, _ = _drain(agent.run_stream("你好"))
+    assert result["stats"]["aborted_streams"] == 1 and result["stats"]["tokens_saved"] == 0
+
+
+def _collect_events(stream):
+    events = []
+    try:
+        while True:
+            events.append(next(stream))
+    except StopIteration as stop:
+        return stop.value, events
+
+
+ANSWER_FIRST = json.dumps({"thought": "先答再查", "final_answer": "猜的答案",
+                           "action": [{"tool": "read_file", "file_path": os.path.abspath(__file__)}]},
+                          ensure_ascii=False)
+FINAL = '{"thought": "内部推理", "final_answer": "文件第一行是\\"#!/usr/bin/env python3\\""}'
+
+
+def test_run_events():
+    """测试面向用户的事件流：只有最终答案的增量文本与工具进度，答案后出现 action 时撤回"""
+    agent = _stub_agent([ANSWER_FIRST, FINAL], **{'conversation.early_stop_measure_every': 0})
+    result, events = _collect_events(agent.run_events("读一下测试文件"))
+
+    assert result["status"] == "success", result
+    types = [event["type"] for event in events]
+    assert types.index("answer_reset") < types.index("tool_start") < types.index("tool_end")
+    assert events[types.index("tool_start")] == {"type": "tool_start", "step": 1, "tools": ["read_file"]}
+
+    # 撤回之后的答案片段拼接为最终答案
+    last_reset = len(types) - 1 - types[::-1].index("answer_reset")
+    answer = "".join(event["content"] for event in events[last_reset:] if event["type"] == "answer")
+    assert answer == result["answer"] == '文件第一行是"#!/usr/bin/env python3"'
+    serialized = json.dumps(events, ensure_ascii=False)
+    assert "内部推理" not in serialized and "observation" not in serialized and '"thought' not in serialized
+
+
+def test_stream_route_sends_events():
+    """测试 /api/chat/stream 只推送答案片段、工具进度与 done 事件，不推送原始输出"""
+    import pytest
+    pytest.importorskip("flask")
+    from datetime import datetime
+    import web_app
+
+    agent = _stub_agent([ANSWER_FIRST, FINAL], **{'conversation.early_stop_measure_every': 0})
+    web_app.agent_manager.sessions["stream-events"] = {'agent': agent, 'created_at': datetime.now(),
+                                                       'message_count': 0}
+    try:
+        body = web_app.app.test_client().post('/api/chat/stream', json={
+            "message": "读一下测试文件", "session_id": "stream-events"
+        }).get_data(as_text=True)
+    finally:
+        web_app.agent_manager.sessions.pop("stream-events", None)
+
+    events = [json.loads(line[len("data: "):]) for line in body.split("\n") if line.startswith("data: ")]
+    assert {event["type"] for event in events} == {"answer", "answer_reset", "tool_start", "tool_end", "done"}
+    assert events[-1]["final_answer"] == '文件第一行是"#!/usr/bin/env python3"' and events[-1]["success"]
+    assert "内部推理" not in body and "observation" not in body
+
+
+def main():
+    """运行所有测试"""
+    tests = [
+        ("合法JSON", test_strict_json),
+        ("容错JSON", test_tolerant_json),
+        ("错误位置", test_error_spans),
+        ("ReAct标签与纯文本", test_react_labels_and_plain_text),
+        ("增量解析", test_streaming_action_parser),
+        ("final_answer在action之前", test_streaming_final_answer_before_action),
+        ("只按token预算裁剪历史", test_request_history_fits_token_budget_only),
+        ("fix_string_values", test_fix_string_values),
+        ("Agent动作分派", test_agent_dispatch),
+        ("流式提前执行", test_speculative_dispatch),
+        ("final_answer提前结束", test_final_answer_early_stop),
+        ("预执行并中止流", test_speculative_dispatch_aborts_stub_stream),
+        ("副作用工具不预执行", test_side_effect_tools_wait_for_parsed_reply),
+        ("多余的预执行动作", test_unmatched_dispatch_is_collected),
+        ("原生工具调用往返", test_native_tool_calls_round_trip),
+        ("截断回复的历史", test_trimmed_reply_history),
+        ("final_answer在action之前不提前结束", test_early_stop_keeps_action_after_final_answer),
+        ("首次回复建立节省量估算", test_first_reply_seeds_savings_estimate),
+        ("面向用户的事件流", test_run_events),
+        ("流式接口只推送事件", test_stream_route_sends_events)
+    ]
+
+    passed = 0
+    for test_name, test_func in tests:
+        try:
+            test_func()
+            print(f"✅ {test_name}: 通过")
+            passed += 1
+        except Exception as e:
+            print(f"❌ {test_name}: 失败 - {e}")
+
+    print(f"\n🎯 总体结果: {passed}/{len(tests)} 测试通过")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+测试LLM响应缓存：内存LRU、TTL、磁盘缓存及其条目上限、temperature > 0 时不缓存，
+以及启用缓存时 Agent 的重复问题命中缓存
+APIManager 部分使用本地模拟LLM服务，无需真实 API Key
+"""
+
+import os
+import sys
+import time
+import tempfile
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from response_cache import ResponseCache
+
+MESSAGES = [{"role": "user", "content": "你好"}]
+
+
+def test_memory_lru_and_ttl():
+    """测试容量上限淘汰最久未使用的条目，过期条目不再命中"""
+    cache = ResponseCache(max_entries=2, ttl=3600)
+    cache.set("a", "A")
+    cache.set("b", "B")
+    assert cache.get("a")["content"] == "A"
+    cache.set("c", "C")
+    assert cache.get("b") is None
+    assert cache.get("a")["content"] == "A" and cache.get("c")["content"] == "C"
+
+    cache = ResponseCache(ttl=1)
+    cache.set("a", "A", prompt_tokens=10, completion_tokens=5, cost=0.01)
+    assert cache.get("a") is not None
+    cache._memory["a"]["created_at"] = time.time() - 2
+    assert cache.get("a") is None
+    stats = cache.get_stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1 and stats["saved_tokens"] == 15
+
+
+def test_key_normalization():
+    """测试缓存键忽略首尾空白，区分模型与采样参数"""
+    key = ResponseCache.make_key(MESSAGES, "m", {"temperature": 0})
+    assert key == ResponseCache.make_key([{"role": "user", "content": " 你好\n"}], "m", {"temperature": 0})
+    assert key != ResponseCache.make_key(MESSAGES, "other", {"temperature": 0})
+    assert key != ResponseCache.make_key(MESSAGES, "m", {"temperature": 0, "max_tokens": 10})
+
+
+def test_disk_tier():
+    """测试磁盘缓存跨实例命中、过期删除与条目上限"""
+    with tempfile.TemporaryDirectory() as directory:
+        ResponseCache(disk_path=directory).set("a", "A")
+        cache = ResponseCache(disk_path=directory)
+        assert cache.get("a")["content"] == "A"
+        assert cache.get_stats()["disk_hits"] == 1
+
+        expired = ResponseCache(ttl=1, disk_path=directory)
+        expired._save_to_disk("old", {"content": "旧", "created_at": time.time() - 10})
+        assert expired.get("old") is None
+        assert not os.path.exists(os.path.join(directory, "old.json"))
+        os.remove(os.path.join(directory, "a.json"))
+
+        bounded = ResponseCache(disk_path=directory, max_disk_entries=10)
+        for index in range(25):
+            bounded.set(f"k{index:02d}", str(index))
+            os.utime(os.path.join(directory, f"k{index:02d}.json"), (1000 + index, 1000 + index))
+        files = sorted(name for name in os.listdir(directory) if name.endswith(".json"))
+        assert len(files) <= 10
+        assert "k24.json" in files and "k00.json" not in files
+        assert bounded.get_stats()["disk_evictions"] >= 15
+
+
+def test_temperature_bypass():
+    """测试 temperature > 0 的调用不读写缓存，temperature = 0 的重复调用命中"""
+    from config_manager import ConfigManager
+    from api_manager import APIManager
+    from mock_llm_server import MockLLMServer
+
+    with MockLLMServer() as server:
+        config = ConfigManager()
+        config.set('api.deepseek.api_key', 'test-key')
+        config.set('api.deepseek.base_url', server.url)
+        api_manager = APIManager(config)
+        api_manager.cache = ResponseCache()
+
+        api_manager.call_api(MESSAGES, temperature=0)
+        api_manager.call_api(MESSAGES, temperature=0)
+        api_manager.call_api(MESSAGES, temperature=0.7)
+        api_manager.call_api(MESSAGES, temperature=0.7)
+
+    stats = api_manager.cache.get_stats()
+    assert stats["hits"] == 1
+    assert stats["bypassed"] == 2
+    assert stats["entries"] == 1
+
+    sampling = ResponseCache(allow_nonzero_temperature=True)
+    assert not sampling.should_bypass({"temperature": 0.7})
+
+
+def test_agent_requests_use_cache():
+    """测试启用响应缓存时 Agent 默认以 temperature 0 请求，重复的问题由缓存回答"""
+    from config_manager import ConfigManager
+    from agent import ReactAgent
+    from mock_llm_server import MockLLMServer
+
+    with MockLLMServer() as server:
+        config = ConfigManager()
+        config.set('api.deepseek.api_key', 'test-key')
+        config.set('api.deepseek.base_url', server.url)
+        config.set('database.enabled', False)
+        config.set('api.cache.enabled', True)
+
+        agents = [ReactAgent(config, session_id=f"faq-{index}") for index in range(2)]
+        assert agents[0]._request_temperature() == 0
+        agents[0]._get_api_manager().cache = agents[1]._get_api_manager().cache = ResponseCache()
+        first = agents[0].run("营业时间是几点？")
+        second = agents[1].run("营业时间是几点？")
+
+    assert first["status"] == second["status"] == "success"
+    assert server.config.request_count == 1
+    assert agents[1]._get_api_manager().cache.get_stats()["hits"] == 1
+
+    config.set('api.cache.allow_nonzero_temperature', True)
+    assert agents[0]._request_temperature() == 0.1
+    config.set('conversation.agent_temperature', 0.3)
+    assert agents[0]._request_temperature() == 0.3
+
+
+def main():
+    """运行所有测试"""
+    tests = [
+        ("内存LRU与TTL", test_memory_lru_and_ttl),
+        ("缓存键", test_key_normalization),
+        ("磁盘缓存", test_disk_tier),
+        ("temperature 绕过缓存", test_temperature_bypass),
+        ("Agent 请求命中缓存", test_agent_requests_use_cache)
+    ]
+
+    passed = 0
+    for test_name, test_func in tests:
+        try:
+            test_func()
+            print(f"✅ {test_name}: 通过")
+            passed += 1
+        except Exception as e:
+            print(f"❌ {test_name}: 失败 - {e}")
+
+    print(f"\n🎯 总体结果: {passed}/{len(tests)} 测试通过")
+
+
+if __name__ == "__main__":
+    main()
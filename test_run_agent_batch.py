@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+测试批量运行：输入解析、有限并发执行与汇总
+使用本地模拟LLM服务，无需真实 API Key
+"""
+
+import io
+import os
+import sys
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from run_agent_batch import read_questions, run_batch, summarize
+
+
+def test_read_questions():
+    """测试 JSONL、纯文本与缺少问题的行"""
+    stream = io.StringIO('{"id": "a", "question": "你好"}\n纯文本问题\n\n{"id": 5}\n{"prompt": "第三个"}\n')
+    assert list(read_questions(stream)) == [
+        {"id": "a", "question": "你好"},
+        {"id": 2, "question": "纯文本问题"},
+        {"id": 5, "question": "第三个"},
+    ]
+
+
+def test_run_batch():
+    """测试并发执行、逐条输出结果与汇总"""
+    from config_manager import ConfigManager
+    from mock_llm_server import MockLLMServer, MockLLMConfig
+
+    with MockLLMServer(config=MockLLMConfig(latency=0.2)) as server:
+        config = ConfigManager()
+        config.set('api.deepseek.api_key', 'test-key')
+        config.set('api.deepseek.base_url', server.url)
+        config.set('database.enabled', False)
+
+        records = []
+        items = ({"id": index, "question": f"问题{index}"} for index in range(6))
+        summary = run_batch(items, config, concurrency=3, timeout=10, on_result=records.append)
+
+    assert sorted(record["id"] for record in records) == list(range(6))
+    assert all(record["status"] == "success" and record["tokens"] > 0 for record in records)
+    assert summary["questions"] == 6
+    assert summary["statuses"] == {"success": 6}
+    assert summary["api_calls"] == 6
+    # 3 个并发：总耗时约为两轮请求，而不是六轮
+    assert summary["wall_time"] < 6 * 0.2
+    assert summary["latency"]["p50"] >= 0.2
+
+    assert summarize([], 0)["questions"] == 0
+
+
+def main():
+    """运行所有测试"""
+    tests = [
+        ("输入解析", test_read_questions),
+        ("批量执行", test_run_batch)
+    ]
+
+    passed = 0
+    for test_name, test_func in tests:
+        try:
+            test_func()
+            print(f"✅ {test_name}: 通过")
+            passed += 1
+        except Exception as e:
+            print(f"❌ {test_name}: 失败 - {e}")
+
+    print(f"\n🎯 总体结果: {passed}/{len(tests)} 测试通过")
+
+
+if __name__ == "__main__":
+    main()
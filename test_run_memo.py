@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+测试单次运行内的工具结果记忆与动作循环检测
+Agent 部分使用本地模拟LLM服务，无需真实 API Key
+"""
+
+import os
+import sys
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from run_memo import RunMemo, canonical_action
+
+
+def test_memo():
+    """测试规范化键、结果复用与不缓存的工具"""
+    assert canonical_action({"tool": "a", "x": 1, "y": [1, 2]}) == canonical_action({"y": [1, 2], "x": 1, "tool": "a"})
+
+    memo = RunMemo(uncached=["write_to_file"])
+    memo.put({"tool": "check_product_stock", "product_name": "白茶"}, {"stock": 3})
+    assert memo.get({"product_name": "白茶", "tool": "check_product_stock"}) == (True, {"stock": 3})
+    assert memo.get({"tool": "check_product_stock", "product_name": "绿茶"}) == (False, None)
+
+    memo.put({"tool": "search_database", "q": 1}, {"error": "连接失败"})
+    assert memo.get({"tool": "search_database", "q": 1})[0] is False
+
+    memo.put({"tool": "write_to_file", "file_path": "a"}, "ok")
+    assert memo.get({"tool": "write_to_file", "file_path": "a"})[0] is False
+    assert memo.hits == 1
+
+
+def test_side_effect_tools_never_memoized():
+    """测试 tool_cache.NEVER_CACHE 中的工具始终不记忆，配置只能追加"""
+    from config_manager import ConfigManager
+    from run_memo import create_run_memo
+    from tool_cache import NEVER_CACHE
+
+    config = ConfigManager()
+    config.set('tools.run_memo.uncached', ["fetch_webpage_content"])
+    memo = create_run_memo(config)
+    assert memo.uncached == set(NEVER_CACHE) | {"fetch_webpage_content"}
+
+    memo.put({"tool": "execute_sql_query", "sql_query": "SELECT stock FROM products"}, [{"stock": 3}])
+    assert memo.get({"tool": "execute_sql_query", "sql_query": "SELECT stock FROM products"})[0] is False
+
+    config.set('tools.run_memo.uncached', None)
+    assert create_run_memo(config).uncached == set(NEVER_CACHE)
+
+
+def test_cycle_detection():
+    """测试单步与多步周期的循环"""
+    memo = RunMemo(cycle_repeats=3)
+    a, b = [{"tool": "a"}], [{"tool": "b"}]
+    assert memo.observe_step(a) is None
+    assert memo.observe_step(a) is None
+    assert "a" in memo.observe_step(a)
+
+    memo = RunMemo(cycle_repeats=2, max_cycle_period=2)
+    assert memo.observe_step(a) is None
+    assert memo.observe_step(b) is None
+    assert memo.observe_step(a) is None
+    assert memo.observe_step(b) is not None
+
+
+def test_agent_loop_detected():
+    """测试 Agent 复用重复调用的结果并以 loop_detected 结束"""
+    from config_manager import ConfigManager
+    from agent import ReactAgent
+    from mock_llm_server import MockLLMServer, MockLLMConfig
+
+    responses = ['{"thought": "再读一次", "action": [{"tool": "read_file", "file_path": "%s"}]}'
+                 % os.path.abspath(__file__)]
+    with MockLLMServer(config=MockLLMConfig(responses=responses)) as server:
+        config = ConfigManager()
+        config.set('api.deepseek.api_key', 'test-key')
+        config.set('api.deepseek.base_url', server.url)
+        config.set('database.enabled', False)
+        agent = ReactAgent(config)
+        stream = agent.run_stream("读一下测试文件")
+        try:
+            while True:
+                next(stream)
+        except StopIteration as stop:
+            result = stop.value
+        assert agent.run("读一下测试文件")["status"] == "loop_detected"
+
+    assert result["status"] == "loop_detected", result
+    assert result["stats"]["steps"] == 2
+    # 第三步的动作在流式输出中已提前分派，同样命中记忆
+    assert result["stats"]["memo_hits"] == 2
+
+
+def main():
+    """运行所有测试"""
+    tests = [
+        ("结果复用", test_memo),
+        ("副作用工具不记忆", test_side_effect_tools_never_memoized),
+        ("循环检测", test_cycle_detection),
+        ("Agent循环结束", test_agent_loop_detected)
+    ]
+
+    passed = 0
+    for test_name, test_func in tests:
+        try:
+            test_func()
+            print(f"✅ {test_name}: 通过")
+            passed += 1
+        except Exception as e:
+            print(f"❌ {test_name}: 失败 - {e}")
+
+    print(f"\n🎯 总体结果: {passed}/{len(tests)} 测试通过")
+
+
+if __name__ == "__main__":
+    main()
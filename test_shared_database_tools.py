@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+测试进程内共享的数据库工具：多个 Agent 复用同一连接，最后一个释放时关闭
+使用模拟的 mysql.connector.connect，无需真实的MySQL服务
+"""
+
+import os
+import sys
+from unittest import mock
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import mysql.connector
+from database_tools import acquire_database_tools, release_database_tools, get_shared_database_stats
+
+
+def _config():
+    from config_manager import ConfigManager
+
+    config = ConfigManager()
+    config.set('database.enabled', True)
+    config.set('database.host', 'db.test')
+    return config
+
+
+def test_acquire_release():
+    """测试引用计数与按连接参数区分实例"""
+    config = {'enable_database': True, 'host': 'db.test', 'database': 'shop'}
+    with mock.patch.object(mysql.connector, 'connect', side_effect=lambda **kwargs: mock.MagicMock()) as connect:
+        first = acquire_database_tools(config)
+        second = acquire_database_tools(dict(config))
+        other = acquire_database_tools(dict(config, database='crm'))
+        assert first is second and first is not other
+        assert connect.call_count == 2
+
+        # 只有密码不同的配置不能复用已有连接（否则错误的密码也能"通过验证"）
+        wrong = acquire_database_tools(dict(config, password='wrong'))
+        assert wrong is not first and connect.call_args.kwargs["password"] == 'wrong'
+        release_database_tools(wrong)
+        assert get_shared_database_stats() == {"db.test:3306/shop": 2, "db.test:3306/crm": 1}
+
+        connection = first.db_manager.connection
+        release_database_tools(first)
+        assert not connection.close.called
+        release_database_tools(second)
+        release_database_tools(other)
+        assert connection.close.called
+        assert get_shared_database_stats() == {}
+
+    assert acquire_database_tools({'enable_database': False}) is None
+
+
+def test_connection_autocommit_and_ping():
+    """测试共享连接使用 autocommit（不保留旧快照），每次查询前 ping 并在断开后重连"""
+    config = {'enable_database': True, 'host': 'db.test', 'database': 'shop'}
+    with mock.patch.object(mysql.connector, 'connect') as connect:
+        tools = acquire_database_tools(config)
+        assert connect.call_args.kwargs["autocommit"] is True
+
+        connection = tools.db_manager.connection
+        tools.db_manager.execute_query("SELECT stock FROM products")
+        tools.db_manager.get_table_schema()
+        assert connection.ping.call_count == 2
+        assert connection.ping.call_args.kwargs["reconnect"] is True
+        release_database_tools(tools)
+
+
+def test_agents_share_connection():
+    """测试多个 Agent 只建立一次连接，全部关闭后释放"""
+    from agent import ReactAgent
+
+    with mock.patch.object(mysql.connector, 'connect') as connect:
+        agents = [ReactAgent(_config()) for _ in range(3)]
+        # 数据库工具在首次调用或预热时才连接
+        assert connect.call_count == 0 and agents[0].db_tools is None
+        for agent in agents:
+            agent.tool_manager.warm_up(["check_product_stock"])
+        assert connect.call_count == 1
+        assert all(agent.db_tools is agents[0].db_tools for agent in agents)
+        assert "check_product_stock" in agents[0].tool_manager.tools
+        assert get_shared_database_stats() == {"db.test:3306/llm_agent_db": 3}
+
+        for agent in agents:
+            agent.close()
+        assert connect.return_value.close.call_count == 1
+        assert get_shared_database_stats() == {}
+
+
+def test_lazy_database_tool():
+    """测试首次调用数据库工具时连接，之后复用"""
+    from Toolmanager import ToolManager
+
+    with mock.patch.object(mysql.connector, 'connect') as connect:
+        cursor = connect.return_value.cursor.return_value
+        cursor.fetchall.return_value = [{"id": 1}]
+        manager = ToolManager(_config())
+        assert "execute_sql_query" in manager.get_tool_list() and connect.call_count == 0
+
+        result = manager.execute_tool("execute_sql_query", {"sql_query": "SELECT id FROM orders"})
+        assert result["status"] == "success", result
+        manager.execute_tool("execute_sql_query", {"sql_query": "SELECT id FROM users"})
+        assert connect.call_count == 1
+        manager.close()
+        assert get_shared_database_stats() == {}
+
+
+def main():
+    """运行所有测试"""
+    tests = [
+        ("引用计数", test_acquire_release),
+        ("autocommit 与断线重连", test_connection_autocommit_and_ping),
+        ("Agent 共享连接", test_agents_share_connection),
+        ("首次调用时连接", test_lazy_database_tool)
+    ]
+
+    passed = 0
+    for test_name, test_func in tests:
+        try:
+            test_func()
+            print(f"✅ {test_name}: 通过")
+            passed += 1
+        except Exception as e:
+            print(f"❌ {test_name}: 失败 - {e}")
+
+    print(f"\n🎯 总体结果: {passed}/{len(tests)} 测试通过")
+
+
+if __name__ == "__main__":
+    main()
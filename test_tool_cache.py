@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+测试跨请求的工具结果缓存：按工具的 TTL 与容量、不可缓存的工具、失效键与共享后端
+"""
+
+import os
+import sys
+import time
+import tempfile
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import tool_cache
+from tool_cache import ToolResultCache, DiskToolCacheBackend, make_tag
+
+
+def test_policies():
+    """测试 TTL、条目上限、失败结果与不可缓存的工具"""
+    cache = ToolResultCache({
+        "search_web": {"ttl": 0.2, "max_entries": 2},
+        "write_to_file": {"ttl": 60}
+    })
+    assert not cache.cacheable("write_to_file")
+    assert not cache.cacheable("read_file")
+
+    cache.set("search_web", {"query": "a"}, {"results": [1]})
+    assert cache.get("search_web", {"query": "a"}) == (True, {"results": [1]})
+    cache.set("search_web", {"query": "b"}, "b")
+    cache.set("search_web", {"query": "c"}, "c")
+    assert cache.get("search_web", {"query": "a"})[0] is False
+
+    cache.set("search_web", {"query": "d"}, {"error": "超时"})
+    assert cache.get("search_web", {"query": "d"})[0] is False
+
+    time.sleep(0.25)
+    assert cache.get("search_web", {"query": "c"})[0] is False
+
+
+def test_invalidation_keys():
+    """测试按失效键清除相关结果"""
+    cache = ToolResultCache({"check_product_stock": {"ttl": 60, "invalidate_on": ["product_name"]}})
+    cache.set("check_product_stock", {"product_name": "白茶"}, {"stock": 3})
+    cache.set("check_product_stock", {"product_name": "绿茶"}, {"stock": 5})
+
+    cache.invalidate(make_tag("product_name", "白茶"))
+    assert cache.get("check_product_stock", {"product_name": "白茶"})[0] is False
+    assert cache.get("check_product_stock", {"product_name": "绿茶"}) == (True, {"stock": 5})
+
+    cache.set("check_product_stock", {"product_name": "白茶"}, {"stock": 2})
+    assert cache.get("check_product_stock", {"product_name": "白茶"}) == (True, {"stock": 2})
+
+
+def test_shared_backend():
+    """测试两个进程（两个缓存实例）通过磁盘后端共享结果与失效"""
+    policies = {"check_product_stock": {"ttl": 60, "invalidate_on": ["product_name"]}}
+    with tempfile.TemporaryDirectory() as path:
+        worker_a = ToolResultCache(policies, backend=DiskToolCacheBackend(path))
+        worker_b = ToolResultCache(policies, backend=DiskToolCacheBackend(path))
+
+        worker_a.set("check_product_stock", {"product_name": "白茶"}, {"stock": 3})
+        assert worker_b.get("check_product_stock", {"product_name": "白茶"}) == (True, {"stock": 3})
+        assert worker_b.get_stats()["shared_hits"] == 1
+
+        worker_a.invalidate(make_tag("product_name", "白茶"))
+        assert worker_b.get("check_product_stock", {"product_name": "白茶"})[0] is False
+
+
+def test_tool_manager_cache():
+    """测试 ToolManager.execute_tool 命中缓存时不再执行工具"""
+    from Toolmanager import ToolManager
+    from config_manager import ConfigManager
+
+    calls = []
+
+    def search_web(query: str) -> dict:
+        calls.append(query)
+        return {"results": [query]}
+
+    previous = tool_cache._cache
+    tool_cache._cache = ToolResultCache({"search_web": {"ttl": 60}})
+    try:
+        manager = ToolManager(ConfigManager())
+        manager.register_tool("search_web", search_web)
+        assert manager.execute_tool("search_web", {"query": "茶"}) == {"results": ["茶"]}
+        assert manager.execute_tool("search_web", {"query": "茶"}) == {"results": ["茶"]}
+        assert calls == ["茶"]
+
+        manager.invalidate_tool_cache(tool="search_web")
+        manager.execute_tool("search_web", {"query": "茶"})
+        assert calls == ["茶", "茶"]
+    finally:
+        tool_cache._cache = previous
+
+
+def main():
+    """运行所有测试"""
+    tests = [
+        ("缓存策略", test_policies),
+        ("失效键", test_invalidation_keys),
+        ("共享后端", test_shared_backend),
+        ("ToolManager缓存", test_tool_manager_cache)
+    ]
+
+    passed = 0
+    for test_name, test_func in tests:
+        try:
+            test_func()
+            print(f"✅ {test_name}: 通过")
+            passed += 1
+        except Exception as e:
+            print(f"❌ {test_name}: 失败 - {e}")
+
+    print(f"\n🎯 总体结果: {passed}/{len(tests)} 测试通过")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+测试工具并发执行：结果顺序、单工具超时、并发上限与截止时间
+"""
+
+import os
+import sys
+import time
+import threading
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from tool_executor import ToolExecutor
+
+
+def _sleepy(tool_name, params):
+    time.sleep(params.get("seconds", 0))
+    if params.get("fail"):
+        raise RuntimeError("故意失败")
+    return f"{tool_name}:{params.get('seconds')}"
+
+
+def test_parallel_and_ordered():
+    """测试并发执行且按原始顺序返回"""
+    executor = ToolExecutor(max_workers=4)
+    actions = [("search_web", {"seconds": 0.3}), ("search_web", {"seconds": 0.1}),
+               ("check_product_stock", {"seconds": 0.2}), ("read_file", {"fail": True})]
+    start = time.time()
+    results = executor.run(_sleepy, actions)
+    assert time.time() - start < 0.5
+    assert results[:3] == ["search_web:0.3", "search_web:0.1", "check_product_stock:0.2"]
+    assert "故意失败" in results[3]["error"]
+
+
+def test_tool_timeout_and_deadline():
+    """测试单工具超时与截止时间模式"""
+    executor = ToolExecutor(max_workers=4, default_timeout=5, tool_timeouts={"search_web": 0.1})
+    results = executor.run(_sleepy, [("search_web", {"seconds": 0.5}), ("read_file", {"seconds": 0.05})])
+    assert "超时" in results[0]["error"]
+    assert results[1] == "read_file:0.05"
+
+    results = executor.run(_sleepy, [("read_file", {"seconds": 0.05}), ("read_file", {"seconds": 0.5})],
+                           deadline=0.2)
+    assert results[0] == "read_file:0.05"
+    assert results[1]["pending"] is True
+    assert executor.get_stats()["pending"] == 1
+
+
+def test_concurrency_cap():
+    """测试按工具限制并发"""
+    executor = ToolExecutor(max_workers=4, concurrency={"write_to_file": 1})
+    active = []
+    peak = []
+    lock = threading.Lock()
+
+    def call(tool_name, params):
+        with lock:
+            active.append(1)
+            peak.append(len(active))
+        time.sleep(0.05)
+        with lock:
+            active.pop()
+        return tool_name
+
+    executor.run(call, [("write_to_file", {})] * 3)
+    assert max(peak) == 1
+
+
+def main():
+    """运行所有测试"""
+    tests = [
+        ("并发与顺序", test_parallel_and_ordered),
+        ("超时与截止时间", test_tool_timeout_and_deadline),
+        ("并发上限", test_concurrency_cap)
+    ]
+
+    passed = 0
+    for test_name, test_func in tests:
+        try:
+            test_func()
+            print(f"✅ {test_name}: 通过")
+            passed += 1
+        except Exception as e:
+            print(f"❌ {test_name}: 失败 - {e}")
+
+    print(f"\n🎯 总体结果: {passed}/{len(tests)} 测试通过")
+
+
+if __name__ == "__main__":
+    main()
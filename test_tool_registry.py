@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+测试预编译的工具注册表：描述符、缓存的工具列表、参数校验与工具的延迟加载
+"""
+
+import os
+import sys
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from tool_registry import ToolRegistry, LazyFunction, build_descriptor
+
+
+def lookup(sku: str, count: int = 1, exact: bool = False) -> str:
+    """
+    查询商品
+
+    Args:
+        sku: 商品编号
+        count: 数量
+    """
+    return f"{sku}:{count}:{exact}"
+
+
+def test_signature_descriptor():
+    """测试由函数签名生成的 Schema、提示词行与校验"""
+    descriptor = build_descriptor("lookup", lookup)
+    assert descriptor.description == "查询商品"
+    assert descriptor.parameters["required"] == ["sku"]
+    assert descriptor.parameters["properties"]["count"] == {"type": "integer", "description": "数量", "default": 1}
+    assert descriptor.prompt_line.startswith("- lookup(sku: str, count: int = 1, exact: bool = False) -> str: 查询商品")
+
+    params = {"sku": "A1"}
+    assert descriptor.validate(params) is params
+    assert descriptor.validate({"sku": "A1", "count": "3", "exact": "true"}) == {"sku": "A1", "count": 3, "exact": True}
+    for bad, expected in (({}, "缺少参数 sku"), ({"sku": "A1", "size": 2}, "未知参数 size"),
+                          ({"sku": "A1", "count": "很多"}, "count 应为 integer")):
+        try:
+            descriptor.validate(bad)
+            assert False, f"应拒绝 {bad}"
+        except ValueError as e:
+            assert expected in str(e) and "期望参数" in str(e), str(e)
+
+
+def test_args_schema_descriptor():
+    """测试 pydantic 参数模型生成的 Schema 与校验"""
+    from database_agent_tools import DatabaseSearchArgs
+
+    def search(query, category=None, limit=5):
+        return query, category, limit
+
+    descriptor = build_descriptor("search_database", search, "搜索数据库", DatabaseSearchArgs)
+    assert descriptor.parameters["required"] == ["query"]
+    assert "title" not in descriptor.parameters
+    assert descriptor.parameters["properties"]["limit"]["default"] == 5
+    assert descriptor.prompt_line.startswith("- search_database(query: string, category: string = None")
+    assert descriptor.validate({"query": "茶", "limit": "3"}) == {"query": "茶", "limit": 3}
+    try:
+        descriptor.validate({"limit": 3})
+        assert False, "应拒绝缺少 query 的参数"
+    except ValueError as e:
+        assert "search_database" in str(e)
+
+
+def test_registry_cache():
+    """测试工具列表缓存到注册表变化为止"""
+    registry = ToolRegistry()
+    registry.register("lookup", lookup)
+    first = registry.render_tool_list()
+    assert registry.render_tool_list() is first
+    assert registry.schemas() is registry.schemas()
+
+    registry.register("another", lambda: None, description="另一个工具")
+    updated = registry.render_tool_list()
+    assert updated.splitlines()[0] == "- another(): 另一个工具"
+    assert [schema["name"] for schema in registry.schemas()] == ["another", "lookup"]
+    assert registry.unregister("another") and not registry.unregister("another")
+    assert registry.render_tool_list() == first
+
+
+def test_tool_manager_register():
+    """测试 ToolManager 接受 database_agent_tools 的注册方式并在调用前校验参数"""
+    from Toolmanager import ToolManager
+    from database_agent_tools import ProductStockArgs
+
+    manager = ToolManager()
+    manager.register_tool(name="check_product_stock", description="查询库存",
+                          function=lambda product_name: f"{product_name}: 10",
+                          args_schema=ProductStockArgs)
+    assert manager.execute_tool("check_product_stock", {"product_name": "白茶"}) == "白茶: 10"
+    assert "- check_product_stock(product_name: string): 查询库存" in manager.get_tool_list()
+    try:
+        manager.execute_tool("check_product_stock", {})
+        assert False, "应拒绝缺少参数的调用"
+    except ValueError as e:
+        assert "product_name" in str(e)
+    assert manager.unregister_tool("check_product_stock")
+    assert "check_product_stock" not in manager.get_tool_list()
+
+
+def test_lazy_tool_and_warm_up():
+    """测试首次调用时加载的工具与预热（共用资源只加载一次）"""
+    from Toolmanager import ToolManager
+    from database_agent_tools import ProductStockArgs
+
+    loads = []
+
+    def loader():
+        loads.append(1)
+        return lambda product_name: f"{product_name}: 3"
+
+    lazy = LazyFunction(loader)
+    manager = ToolManager()
+    manager.register_tool("stock_a", lazy, "查询库存", ProductStockArgs)
+    manager.register_tool("stock_b", lazy, "查询库存", ProductStockArgs, warm_up=lazy.load)
+    assert not lazy.loaded and not loads
+
+    assert manager.warm_up(["stock_a", "stock_b", "read_file"]) == {"stock_a": True, "stock_b": True}
+    assert lazy.loaded and len(loads) == 1
+    assert manager.execute_tool("stock_b", {"product_name": "白茶"}) == "白茶: 3"
+    assert len(loads) == 1
+
+    failing = LazyFunction(lambda: 1 / 0)
+    manager.register_tool("broken", failing, "不可用", ProductStockArgs)
+    assert manager.warm_up(["broken"])["broken"].startswith("ZeroDivisionError")
+
+
+def test_database_tools_connect_on_first_call():
+    """测试启用数据库时 ToolManager 只注册描述符，首次调用数据库工具时才连接，之后复用同一连接"""
+    from unittest import mock
+    from config_manager import ConfigManager
+    from Toolmanager import ToolManager
+
+    config = ConfigManager()
+    config.set('database.enabled', True)
+    db_tools = mock.MagicMock()
+    db_tools.check_product_stock.return_value = "延迟白茶: 5"
+    db_tools.check_order_status.return_value = "已发货"
+    with mock.patch("database_tools.acquire_database_tools", return_value=db_tools) as acquire, \
+            mock.patch("database_tools.release_database_tools") as release:
+        manager = ToolManager(config)
+        assert {"search_database", "check_product_stock", "check_order_status"} <= set(manager.list_tools())
+        assert "check_product_stock" in manager.get_tool_list()
+        assert manager.db_tools is None and not acquire.called
+
+        assert manager.execute_tool("check_product_stock", {"product_name": "延迟白茶"}) == "延迟白茶: 5"
+        assert acquire.call_count == 1 and manager.db_tools is db_tools
+        assert manager.execute_tool("check_order_status", {"order_id": "A-1"}) == "已发货"
+        assert acquire.call_count == 1
+
+        manager.close()
+        release.assert_called_once_with(db_tools)
+
+
+def main():
+    """运行所有测试"""
+    tests = [
+        ("函数签名描述符", test_signature_descriptor),
+        ("参数模型描述符", test_args_schema_descriptor),
+        ("注册表缓存", test_registry_cache),
+        ("ToolManager 注册", test_tool_manager_register),
+        ("延迟加载与预热", test_lazy_tool_and_warm_up),
+        ("数据库工具首次调用时连接", test_database_tools_connect_on_first_call)
+    ]
+
+    passed = 0
+    for test_name, test_func in tests:
+        try:
+            test_func()
+            print(f"✅ {test_name}: 通过")
+            passed += 1
+        except Exception as e:
+            print(f"❌ {test_name}: 失败 - {e}")
+
+    print(f"\n🎯 总体结果: {passed}/{len(tests)} 测试通过")
+
+
+if __name__ == "__main__":
+    main()
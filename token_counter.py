@@ -0,0 +1,172 @@
+"""
+Token计数与上下文预算 - 基于 tiktoken
+每条消息只计数一次并缓存结果；组装请求时按 conversation.context_window
+裁剪最早的非系统消息，保证请求不超出上下文窗口
+"""
+import re
+import threading
+import importlib.util
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional
+
+from logger import logger
+
+# tiktoken 在第一次计数时才导入
+TIKTOKEN_AVAILABLE = importlib.util.find_spec("tiktoken") is not None
+
+
+# 每条消息的格式开销（role、分隔符等），与 OpenAI 的计数方式一致
+TOKENS_PER_MESSAGE = 4
+# 回复起始标记的开销
+TOKENS_PER_REPLY = 3
+
+# 中日韩字符大约每个字 1 个token，其余文本大约每 4 个字符 1 个token
+_CJK_PATTERN = re.compile(r'[　-〿㐀-䶿一-鿿＀-￯]')
+
+
+class TokenCounter:
+    """带缓存的消息token计数器"""
+
+    def __init__(self, encoding_name: str = "cl100k_base", cache_size: int = 4096):
+        self.encoding_name = encoding_name
+        self.cache_size = cache_size
+        self._encoding = None
+        self._encoding_failed = not TIKTOKEN_AVAILABLE
+        self._cache: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get_encoding(self):
+        """首次使用时加载编码；加载失败（如离线环境）后改用估算"""
+        if self._encoding is None and not self._encoding_failed:
+            try:
+                import tiktoken
+                self._encoding = tiktoken.get_encoding(self.encoding_name)
+            except Exception as e:
+                self._encoding_failed = True
+                logger.warning(f"tiktoken 编码加载失败，改用字符估算: {e}")
+        return self._encoding
+
+    @staticmethod
+    def _estimate(text: str) -> int:
+        """无 tiktoken 时的字符估算"""
+        cjk_count = len(_CJK_PATTERN.findall(text))
+        return cjk_count + (len(text) - cjk_count + 3) // 4
+
+    def count_text(self, text: str) -> int:
+        """计算文本的token数，相同文本只计算一次"""
+        if not text:
+            return 0
+        with self._lock:
+            cached = self._cache.get(text)
+            if cached is not None:
+                self._cache.move_to_end(text)
+                return cached
+
+        encoding = self._get_encoding()
+        count = len(encoding.encode(text, disallowed_special=())) if encoding else self._estimate(text)
+
+        with self._lock:
+            self._cache[text] = count
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return count
+
+    def count_message(self, message: Dict[str, Any]) -> int:
+        """计算单条消息的token数（含格式开销）"""
+        tokens = TOKENS_PER_MESSAGE + self.count_text(str(message.get("content") or ""))
+        for call in message.get("tool_calls") or []:
+            function = call.get("function") or {}
+            tokens += self.count_text(f"{function.get('name', '')}{function.get('arguments', '')}")
+        return tokens
+
+    def count_messages(self, messages: List[Dict[str, Any]]) -> int:
+        """估算一次请求的prompt token数"""
+        return sum(self.count_message(msg) for msg in messages) + TOKENS_PER_REPLY
+
+    def truncate_text(self, text: str, max_tokens: int) -> str:
+        """将文本截断到指定token数以内"""
+        if self.count_text(text) <= max_tokens:
+            return text
+        encoding = self._get_encoding()
+        if encoding:
+            return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+        # 估算模式下按比例截断字符
+        ratio = max_tokens / max(self.count_text(text), 1)
+        return text[:int(len(text) * ratio)]
+
+    def fit_messages(self, messages: List[Dict[str, Any]], max_prompt_tokens: int,
+                     max_history: Optional[int] = None, pinned: int = 0,
+                     condense_tokens: int = 200) -> List[Dict[str, Any]]:
+        """
+        按token预算组装请求消息
+
+        系统消息、前 pinned 条非系统消息（如用户的原始问题）和最后一条消息始终保留；
+        超出预算时先将最早的其余消息压缩为开头片段，仍超出则从最早的开始丢弃
+
+        Args:
+            messages: 完整的消息列表
+            max_prompt_tokens: prompt 的token上限
+            max_history: 除固定消息外最多保留的非系统消息条数，None表示不限制
+            pinned: 始终保留的前几条非系统消息数
+            condense_tokens: 压缩后每条消息保留的token数
+
+        Returns:
+            新的消息列表（不修改原列表）
+        """
+        system_messages = [msg for msg in messages if msg.get("role") == "system"]
+        non_system = [msg for msg in messages if msg.get("role") != "system"]
+        head = system_messages + non_system[:pinned]
+        history = non_system[pinned:]
+
+        if max_history is not None and max_history > 0 and len(history) > max_history:
+            history = _drop_orphan_tool_results(history[-max_history:])
+
+        def total(hist):
+            return self.count_messages(head + hist)
+
+        if total(history) <= max_prompt_tokens:
+            return head + history
+
+        original_tokens = total(history)
+
+        # 第一步：从最早的消息开始压缩（最后一条消息保持完整）
+        history = list(history)
+        for i in range(len(history) - 1):
+            if total(history) <= max_prompt_tokens:
+                break
+            content = str(history[i].get("content", ""))
+            if self.count_text(content) > condense_tokens:
+                condensed = self.truncate_text(content, condense_tokens) + "...[已截断]"
+                history[i] = {**history[i], "content": condensed}
+
+        # 第二步：仍超出预算则丢弃最早的消息
+        while len(history) > 1 and total(history) > max_prompt_tokens:
+            history.pop(0)
+        history = _drop_orphan_tool_results(history)
+
+        logger.info(f"上下文已按预算裁剪 - Tokens: {original_tokens} -> {total(history)}, "
+                    f"预算: {max_prompt_tokens}, 保留消息: {len(history)}")
+        return head + history
+
+
+def _drop_orphan_tool_results(history: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """丢弃开头失去对应助手消息的工具结果（提供商要求 tool 消息紧跟发起调用的助手消息）"""
+    start = 0
+    while start < len(history) - 1 and history[start].get("role") == "tool":
+        start += 1
+    return history[start:]
+
+
+# 进程级共享实例，缓存跨请求复用
+_counter: Optional[TokenCounter] = None
+_counter_lock = threading.Lock()
+
+
+def get_token_counter() -> TokenCounter:
+    """获取进程级共享的token计数器"""
+    global _counter
+    if _counter is None:
+        with _counter_lock:
+            if _counter is None:
+                _counter = TokenCounter()
+    return _counter
@@ -0,0 +1,303 @@
+"""
+跨请求的工具结果缓存 - 按工具配置缓存策略
+大量用户在短时间内询问同一商品时，搜索、网页抓取、库存与数据库查询的结果可以直接复用。
+每个工具单独配置 TTL 与条目上限，未配置的工具不缓存，有副作用的工具始终不缓存。
+结果可以带失效键（如 product_name=安吉白茶），数据变化时按失效键清除相关结果。
+
+两级存储：进程内LRU + 可选的共享后端（磁盘目录或 Redis），多个工作进程共享结果与失效信息。
+失效通过失效键的版本号实现：条目记录写入时各失效键的版本，版本变化后条目即失效
+"""
+import os
+import json
+import time
+import hashlib
+import threading
+import importlib.util
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional, Tuple
+
+from logger import logger
+from run_memo import canonical_action
+
+REDIS_AVAILABLE = importlib.util.find_spec("redis") is not None
+
+# 有副作用的工具，即使配置了策略也不缓存
+NEVER_CACHE = frozenset({"write_to_file", "run_terminal_command", "create_and_run_python_file", "execute_sql_query"})
+
+
+class DiskToolCacheBackend:
+    """磁盘目录后端，同一台机器上的多个工作进程共享"""
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.join(path, "tags"), exist_ok=True)
+
+    def _file(self, *parts: str) -> str:
+        return os.path.join(self.path, *parts)
+
+    def _read(self, path: str) -> Optional[Any]:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"读取工具缓存失败 {path}: {e}")
+            return None
+
+    def _write(self, path: str, value: Any):
+        """原子写入"""
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(value, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"写入工具缓存失败 {path}: {e}")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._read(self._file(f"{key}.json"))
+        if entry is not None and entry["expires_at"] <= time.time():
+            try:
+                os.remove(self._file(f"{key}.json"))
+            except OSError:
+                pass
+            return None
+        return entry
+
+    def set(self, key: str, entry: Dict[str, Any]):
+        self._write(self._file(f"{key}.json"), entry)
+
+    def generation(self, tag: str) -> int:
+        return self._read(self._file("tags", _digest(tag))) or 0
+
+    def bump(self, tag: str) -> int:
+        # 并发失效同一个键时版本号可能只增加一次，对失效而言已经足够
+        generation = self.generation(tag) + 1
+        self._write(self._file("tags", _digest(tag)), generation)
+        return generation
+
+
+class RedisToolCacheBackend:
+    """Redis 后端，多台机器共享（需要安装 redis）"""
+
+    def __init__(self, url: str, prefix: str = "tool_cache:"):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        raw = self.client.get(self.prefix + key)
+        return json.loads(raw) if raw else None
+
+    def set(self, key: str, entry: Dict[str, Any]):
+        ttl = max(1, int(entry["expires_at"] - time.time()))
+        self.client.set(self.prefix + key, json.dumps(entry, ensure_ascii=False), ex=ttl)
+
+    def generation(self, tag: str) -> int:
+        return int(self.client.get(f"{self.prefix}tag:{tag}") or 0)
+
+    def bump(self, tag: str) -> int:
+        return int(self.client.incr(f"{self.prefix}tag:{tag}"))
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def make_tag(param: str, value: Any) -> str:
+    """失效键，如 product_name=安吉白茶；不同工具的相同参数共用同一个失效键"""
+    return f"{param}={value}"
+
+
+class ToolResultCache:
+    """按工具策略缓存工具结果"""
+
+    def __init__(self, policies: Dict[str, Dict[str, Any]], default_max_entries: int = 500, backend=None):
+        """
+        Args:
+            policies: 工具名 -> {"ttl": 秒, "max_entries": 条目上限, "invalidate_on": [参数名, ...]}；
+                      ttl 为0或未列出的工具不缓存
+            default_max_entries: 策略未给出 max_entries 时的条目上限
+            backend: 共享后端（DiskToolCacheBackend / RedisToolCacheBackend），None 表示只用进程内缓存
+        """
+        self.policies = {name: dict(policy) for name, policy in (policies or {}).items() if name not in NEVER_CACHE}
+        self.default_max_entries = default_max_entries
+        self.backend = backend
+        self._memory: Dict[str, "OrderedDict[str, Dict[str, Any]]"] = {}
+        self._generations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "shared_hits": 0, "misses": 0, "stores": 0, "invalidations": 0, "backend_errors": 0}
+
+    def cacheable(self, tool_name: str) -> bool:
+        return tool_name not in NEVER_CACHE and (self.policies.get(tool_name) or {}).get("ttl", 0) > 0
+
+    def _key(self, tool_name: str, params: Dict[str, Any]) -> str:
+        return _digest(canonical_action({"tool": tool_name, **params}))
+
+    def _tags(self, tool_name: str, params: Dict[str, Any]) -> List[str]:
+        return [make_tag(name, params[name]) for name in self.policies[tool_name].get("invalidate_on", [])
+                if name in params]
+
+    def _backend_call(self, method: str, *args, default=None):
+        """共享后端不可用时退化为进程内缓存"""
+        try:
+            return getattr(self.backend, method)(*args)
+        except Exception as e:
+            with self._lock:
+                self.stats["backend_errors"] += 1
+            logger.warning(f"工具缓存共享后端调用失败（{method}）: {e}")
+            return default
+
+    def _generation(self, tag: str) -> int:
+        if self.backend is not None:
+            generation = self._backend_call("generation", tag)
+            if generation is not None:
+                return generation
+        with self._lock:
+            return self._generations.get(tag, 0)
+
+    def _valid(self, entry: Dict[str, Any]) -> bool:
+        if entry["expires_at"] <= time.time():
+            return False
+        return all(self._generation(tag) == generation for tag, generation in entry["tags"].items())
+
+    def get(self, tool_name: str, params: Dict[str, Any]) -> Tuple[bool, Any]:
+        """
+        查询缓存
+
+        Returns:
+            (是否命中, 结果)
+        """
+        if not self.cacheable(tool_name):
+            return False, None
+        key = self._key(tool_name, params)
+        with self._lock:
+            entries = self._memory.get(tool_name)
+            entry = entries.get(key) if entries else None
+        if entry is not None and self._valid(entry):
+            with self._lock:
+                if key in entries:
+                    entries.move_to_end(key)
+                self.stats["hits"] += 1
+            return True, entry["result"]
+
+        if self.backend is not None:
+            entry = self._backend_call("get", key)
+            if entry is not None and self._valid(entry):
+                with self._lock:
+                    self._put_memory(tool_name, key, entry)
+                    self.stats["hits"] += 1
+                    self.stats["shared_hits"] += 1
+                return True, entry["result"]
+
+        with self._lock:
+            self.stats["misses"] += 1
+        return False, None
+
+    def _put_memory(self, tool_name: str, key: str, entry: Dict[str, Any]):
+        """写入该工具的LRU，超出容量时淘汰最久未使用的条目（调用方持有锁）"""
+        entries = self._memory.setdefault(tool_name, OrderedDict())
+        entries[key] = entry
+        entries.move_to_end(key)
+        limit = self.policies[tool_name].get("max_entries", self.default_max_entries)
+        while len(entries) > limit:
+            entries.popitem(last=False)
+
+    def set(self, tool_name: str, params: Dict[str, Any], result: Any):
+        """写入缓存；失败的结果（含 error 或 success 为 False）不缓存"""
+        if not self.cacheable(tool_name):
+            return
+        if isinstance(result, dict) and ("error" in result or result.get("success") is False):
+            return
+        key = self._key(tool_name, params)
+        entry = {
+            "result": result,
+            "expires_at": time.time() + self.policies[tool_name]["ttl"],
+            "tags": {tag: self._generation(tag) for tag in self._tags(tool_name, params)}
+        }
+        with self._lock:
+            self._put_memory(tool_name, key, entry)
+            self.stats["stores"] += 1
+        if self.backend is not None:
+            try:
+                json.dumps(result)
+            except (TypeError, ValueError):
+                return  # 无法序列化的结果只保存在进程内
+            self._backend_call("set", key, entry)
+
+    def invalidate(self, *tags: str):
+        """
+        按失效键清除结果，如 invalidate(make_tag("product_name", "安吉白茶"))
+
+        共享后端中的版本号同时增加，其他进程中的相关条目随之失效
+        """
+        for tag in tags:
+            if self.backend is not None:
+                self._backend_call("bump", tag)
+            with self._lock:
+                self._generations[tag] = self._generations.get(tag, 0) + 1
+                self.stats["invalidations"] += 1
+
+    def invalidate_tool(self, tool_name: str):
+        """清除当前进程中某个工具的全部结果"""
+        with self._lock:
+            self._memory.pop(tool_name, None)
+            self.stats["invalidations"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+            stats["entries"] = sum(len(entries) for entries in self._memory.values())
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups * 100, 2) if lookups > 0 else 0
+        stats["backend"] = type(self.backend).__name__ if self.backend is not None else None
+        return stats
+
+
+def create_backend(config) -> Optional[Any]:
+    """按 tools.cache.backend 创建共享后端：disk / redis，留空只使用进程内缓存"""
+    backend = config.get('tools.cache.backend', '')
+    if backend == "disk":
+        return DiskToolCacheBackend(config.get('tools.cache.disk_path', '.tool_cache'))
+    if backend == "redis":
+        if not REDIS_AVAILABLE:
+            logger.warning("未安装 redis，工具缓存只使用进程内缓存")
+            return None
+        return RedisToolCacheBackend(config.get('tools.cache.redis_url', 'redis://localhost:6379/0'))
+    if backend:
+        logger.warning(f"未知的工具缓存后端: {backend}，只使用进程内缓存")
+    return None
+
+
+# 进程级共享实例
+_cache: Optional[ToolResultCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_tool_cache(config) -> Optional[ToolResultCache]:
+    """
+    获取进程级共享的工具结果缓存
+
+    Args:
+        config: ConfigManager 实例，读取 tools.cache.* 配置
+
+    Returns:
+        未启用缓存时返回None
+    """
+    global _cache
+    if config is None or not config.get('tools.cache.enabled', True):
+        return None
+    if _cache is not None:
+        return _cache
+
+    with _cache_lock:
+        if _cache is None:
+            _cache = ToolResultCache(
+                policies=config.get('tools.cache.policies', {}),
+                default_max_entries=config.get('tools.cache.max_entries', 500),
+                backend=create_backend(config)
+            )
+            logger.info(f"工具结果缓存已启用 - 工具: {', '.join(sorted(_cache.policies)) or '无'}, "
+                        f"共享后端: {config.get('tools.cache.backend', '') or '关闭'}")
+    return _cache
@@ -0,0 +1,167 @@
+"""
+工具并发执行器 - 同一个 action 数组中的多个工具调用并发执行
+提示词要求同一步中的工具调用互不依赖，因此可以同时发出：一步的耗时由各工具耗时之和
+变为其中最慢的一个。支持每个工具单独的超时与并发上限，结果按原始顺序返回，
+并可选择在截止时间到达时只返回已完成的结果。工具在提交时的上下文中执行，
+可以读取当前运行的截止时间（见 deadline.py），收集结果时也不会等待超过该截止时间
+"""
+import time
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Dict, List, Any, Callable, Optional, Tuple
+
+from logger import logger
+from deadline import current_deadline, run_with_context
+
+
+class ToolExecutor:
+    """进程级共享的工具线程池"""
+
+    def __init__(self, max_workers: int = 8, default_timeout: float = 60.0,
+                 tool_timeouts: Optional[Dict[str, float]] = None,
+                 concurrency: Optional[Dict[str, int]] = None):
+        """
+        Args:
+            max_workers: 线程池大小，为1时退化为顺序执行
+            default_timeout: 工具默认超时（秒），0 表示不限
+            tool_timeouts: 按工具名覆盖超时
+            concurrency: 按工具名限制同时执行的调用数
+        """
+        self.max_workers = max(1, int(max_workers))
+        self.default_timeout = default_timeout
+        self.tool_timeouts = dict(tool_timeouts or {})
+        self.concurrency = dict(concurrency or {})
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="tool-exec")
+        self._semaphores: Dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+        self.stats = {"batches": 0, "calls": 0, "timeouts": 0, "pending": 0}
+
+    def timeout_for(self, tool_name: str) -> float:
+        return float(self.tool_timeouts.get(tool_name, self.default_timeout) or 0)
+
+    def _semaphore(self, tool_name: str) -> Optional[threading.BoundedSemaphore]:
+        limit = self.concurrency.get(tool_name)
+        if not limit:
+            return None
+        with self._lock:
+            semaphore = self._semaphores.get(tool_name)
+            if semaphore is None:
+                semaphore = self._semaphores[tool_name] = threading.BoundedSemaphore(int(limit))
+        return semaphore
+
+    def _invoke(self, call: Callable[[str, Dict[str, Any]], Any], tool_name: str, params: Dict[str, Any]) -> Any:
+        semaphore = self._semaphore(tool_name)
+        if semaphore is None:
+            return call(tool_name, params)
+        with semaphore:
+            return call(tool_name, params)
+
+    def submit(self, call: Callable[[str, Dict[str, Any]], Any], tool_name: str,
+               params: Dict[str, Any]) -> Tuple[str, Future, float]:
+        """
+        提交单个工具调用，立即返回
+
+        Returns:
+            (工具名, Future, 提交时间)，交给 collect 按顺序收集；超时从提交时开始计算
+        """
+        with self._lock:
+            self.stats["calls"] += 1
+        future = self._pool.submit(run_with_context(self._invoke, call, tool_name, params))
+        return tool_name, future, time.monotonic()
+
+    def run(self, call: Callable[[str, Dict[str, Any]], Any], actions: List[Tuple[str, Dict[str, Any]]],
+            deadline: Optional[float] = None) -> List[Any]:
+        """
+        并发执行一组工具调用
+
+        Args:
+            call: 执行单个工具的函数 call(工具名, 参数)
+            actions: [(工具名, 参数字典), ...]
+            deadline: 整批的截止时间（秒，相对当前）；给出时未完成的调用以 pending 错误返回，
+                      不再等待
+
+        Returns:
+            与 actions 顺序一致的结果列表，失败或超时的调用为 {"error": ...}
+        """
+        return self.collect([self.submit(call, tool_name, params) for tool_name, params in actions], deadline)
+
+    def collect(self, submitted: List[Tuple[str, Future, float]], deadline: Optional[float] = None) -> List[Any]:
+        """
+        按提交顺序收集结果
+
+        Args:
+            submitted: submit 的返回值列表
+            deadline: 整批的截止时间（秒，从第一个调用提交时算起），同 run；
+                      当前运行的截止时间更早时以其为准
+        """
+        if not submitted:
+            return []
+        start = min(submitted_at for _, _, submitted_at in submitted)
+        run_deadline = current_deadline()
+        if run_deadline is not None and run_deadline.expires_at is not None:
+            remaining = run_deadline.expires_at - start
+            deadline = remaining if deadline is None else min(deadline, remaining)
+        with self._lock:
+            self.stats["batches"] += 1
+
+        results = []
+        for tool_name, future, submitted_at in submitted:
+            limits = []
+            timeout = self.timeout_for(tool_name)
+            if timeout > 0:
+                limits.append((submitted_at + timeout, False))
+            if deadline is not None:
+                limits.append((start + deadline, True))
+            until, by_deadline = min(limits) if limits else (None, False)
+
+            try:
+                remaining = None if until is None else max(0.0, until - time.monotonic())
+                results.append(future.result(timeout=remaining))
+            except FutureTimeoutError:
+                # 线程无法被强制终止，超时的调用在后台继续运行直至结束，结果被丢弃
+                future.cancel()
+                with self._lock:
+                    self.stats["pending" if by_deadline else "timeouts"] += 1
+                if by_deadline:
+                    results.append({"error": f"工具'{tool_name}'未在截止时间（{deadline:.3g}秒）前完成", "pending": True})
+                else:
+                    results.append({"error": f"工具'{tool_name}'执行超时（{timeout}秒）"})
+            except Exception as e:
+                # 记录错误但继续收集其他工具的结果
+                results.append({"error": f"工具'{tool_name}'执行失败: {e}"})
+
+        logger.debug(f"工具批次完成 - 调用数: {len(submitted)}, 耗时: {time.monotonic() - start:.3f}s")
+        return results
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self.stats, "max_workers": self.max_workers}
+
+
+_executor: Optional[ToolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_tool_executor(config=None) -> ToolExecutor:
+    """
+    获取进程级共享的工具执行器
+
+    Args:
+        config: ConfigManager 实例，读取 tools.executor.* 配置；为None时使用默认值
+    """
+    global _executor
+    if _executor is not None:
+        return _executor
+
+    def setting(key, default):
+        return config.get(f'tools.executor.{key}', default) if config is not None else default
+
+    with _executor_lock:
+        if _executor is None:
+            _executor = ToolExecutor(
+                max_workers=setting('max_workers', 8),
+                default_timeout=setting('timeout', 60),
+                tool_timeouts=setting('tool_timeouts', {}),
+                concurrency=setting('concurrency', {})
+            )
+    return _executor
@@ -0,0 +1,293 @@
+"""
+预编译的工具注册表 - 每个工具在注册时只分析一次
+描述符包含名称、说明、参数的 JSON Schema（来自 pydantic 的 *Args 模型或函数签名）、
+预先渲染好的提示词行和编译好的参数校验器。调用时只做字典查找与轻量的类型检查，
+工具列表与 Schema 列表缓存到注册表发生变化为止。
+
+描述符不持有工具背后的资源：实现模块、数据库连接、HTTP会话等可以在首次调用时再加载
+（见 LazyFunction），warm_up 用于在需要低延迟的部署中提前加载
+"""
+import re
+import inspect
+import threading
+import functools
+from dataclasses import dataclass, field
+from typing import Dict, List, Any, Callable, Optional, Tuple
+
+# 参数注解到 JSON Schema 类型的映射，未注解或无法识别的参数按字符串处理
+_JSON_TYPES = {str: "string", int: "integer", float: "number", bool: "boolean",
+               list: "array", dict: "object", List: "array", Dict: "object"}
+_ARG_DOC = re.compile(r'^\s*(\w+)\s*(?:\([^)]*\))?\s*:\s*(.+)$')
+
+# JSON Schema 类型 -> (可接受的Python类型, 从字符串转换的函数)
+_TYPE_CHECKS: Dict[str, Tuple[tuple, Optional[Callable[[str], Any]]]] = {
+    "string": ((str,), None),
+    "integer": ((int,), int),
+    "number": ((int, float), float),
+    "boolean": ((bool,), lambda text: {"true": True, "false": False}[text.strip().lower()]),
+    "array": ((list, tuple), None),
+    "object": ((dict,), None),
+}
+
+
+@dataclass
+class ToolDescriptor:
+    """一个工具注册时生成的全部信息"""
+    name: str
+    function: Callable
+    description: str
+    parameters: Dict[str, Any]
+    prompt_line: str
+    signature: str
+    validate: Callable[[Dict[str, Any]], Dict[str, Any]] = field(repr=False)
+    args_schema: Optional[type] = None
+    warm_up: Optional[Callable[[], Any]] = field(default=None, repr=False)
+
+    def schema(self) -> Dict[str, Any]:
+        """原生工具调用使用的描述 {"name", "description", "parameters"}"""
+        return {"name": self.name, "description": self.description, "parameters": self.parameters}
+
+
+def _strip_titles(schema: Any) -> Any:
+    """去掉 pydantic 生成的 title 字段，缩短发送给提供商的 Schema"""
+    if isinstance(schema, dict):
+        return {key: _strip_titles(value) for key, value in schema.items() if key != "title"}
+    if isinstance(schema, list):
+        return [_strip_titles(item) for item in schema]
+    return schema
+
+
+class LazyFunction:
+    """
+    首次调用时才加载的工具函数
+
+    loader 返回真正的工具函数（可在其中导入实现模块、建立连接），只执行一次；
+    加载失败时下次调用重试
+    """
+
+    def __init__(self, loader: Callable[[], Callable]):
+        self._loader = loader
+        self._function: Optional[Callable] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._function is not None
+
+    def load(self) -> Callable:
+        function = self._function
+        if function is None:
+            with self._lock:
+                if self._function is None:
+                    self._function = self._loader()
+                function = self._function
+        return function
+
+    def __call__(self, **kwargs) -> Any:
+        return self.load()(**kwargs)
+
+
+@functools.lru_cache(maxsize=None)
+def _model_schema(args_schema: type) -> Dict[str, Any]:
+    """pydantic 模型的 JSON Schema（兼容 v1 与 v2），每个模型只生成一次"""
+    if hasattr(args_schema, "model_json_schema"):
+        schema = args_schema.model_json_schema()
+    else:
+        schema = args_schema.schema()
+    schema = _strip_titles(schema)
+    schema.setdefault("required", [])
+    return schema
+
+
+def _signature_schema(function: Callable) -> Tuple[Dict[str, Any], bool]:
+    """
+    由函数签名生成参数 Schema，参数说明取自文档字符串的 Args 段
+
+    Returns:
+        (Schema, 是否接受任意关键字参数)
+    """
+    doc = inspect.getdoc(function) or ""
+    arg_docs = {}
+    for line in doc.split("Args:", 1)[1].splitlines() if "Args:" in doc else []:
+        match = _ARG_DOC.match(line)
+        if match:
+            arg_docs.setdefault(match.group(1), match.group(2).strip())
+
+    properties, required, var_keyword = {}, [], False
+    for param in inspect.signature(function).parameters.values():
+        if param.kind == param.VAR_KEYWORD:
+            var_keyword = True
+            continue
+        if param.kind == param.VAR_POSITIONAL:
+            continue
+        annotation = getattr(param.annotation, "__origin__", param.annotation)
+        prop = {"type": _JSON_TYPES.get(annotation, "string")}
+        if param.name in arg_docs:
+            prop["description"] = arg_docs[param.name]
+        if param.default is param.empty:
+            required.append(param.name)
+        elif isinstance(param.default, (str, int, float, bool)):
+            prop["default"] = param.default
+        properties[param.name] = prop
+    return {"type": "object", "properties": properties, "required": required}, var_keyword
+
+
+def _schema_signature(parameters: Dict[str, Any]) -> str:
+    """由 Schema 渲染类似函数签名的参数说明，如 (query: string, limit: integer = 5)"""
+    required = set(parameters.get("required", []))
+    parts = []
+    for name, prop in parameters.get("properties", {}).items():
+        types = [prop["type"]] if "type" in prop else [option.get("type") for option in prop.get("anyOf", [])]
+        text = f"{name}: {'|'.join(t for t in types if t and t != 'null') or 'any'}"
+        if name not in required:
+            text += f" = {prop.get('default')!r}"
+        parts.append(text)
+    return f"({', '.join(parts)})"
+
+
+def _compile_validator(name: str, parameters: Dict[str, Any], signature: str,
+                       var_keyword: bool = False) -> Callable[[Dict[str, Any]], Dict[str, Any]]:
+    """
+    生成参数校验函数：检查缺少与未知的参数，并按 Schema 类型检查取值
+
+    模型常把数字和布尔值写成字符串，这类值在可以无损转换时自动转换
+    """
+    properties = parameters.get("properties", {})
+    required = tuple(parameters.get("required", []))
+    checks = {}
+    for param, prop in properties.items():
+        if prop.get("type") in _TYPE_CHECKS and prop["type"] != "string":
+            checks[param] = (prop["type"],) + _TYPE_CHECKS[prop["type"]]
+
+    def validate(params: Dict[str, Any]) -> Dict[str, Any]:
+        missing = [param for param in required if param not in params]
+        unknown = [] if var_keyword else [param for param in params if param not in properties]
+        if missing or unknown:
+            problems = ([f"缺少参数 {', '.join(missing)}"] if missing else []) + \
+                       ([f"未知参数 {', '.join(unknown)}"] if unknown else [])
+            raise ValueError(f"工具'{name}'参数错误: {'；'.join(problems)}。期望参数: {signature}")
+        converted = None
+        for param, (json_type, accepted, convert) in checks.items():
+            value = params.get(param)
+            if value is None or (isinstance(value, accepted) and not (json_type != "boolean" and isinstance(value, bool))):
+                continue
+            try:
+                if not isinstance(value, str) or convert is None:
+                    raise ValueError
+                value = convert(value)
+            except (ValueError, KeyError):
+                raise ValueError(f"工具'{name}'参数错误: {param} 应为 {json_type}，实际为 {params[param]!r}。"
+                                 f"期望参数: {signature}")
+            if converted is None:
+                converted = dict(params)
+            converted[param] = value
+        return params if converted is None else converted
+
+    return validate
+
+
+def _model_validator(name: str, args_schema: type, signature: str) -> Callable[[Dict[str, Any]], Dict[str, Any]]:
+    """使用 pydantic 模型校验参数，只传递调用方给出的字段"""
+    validate_model = getattr(args_schema, "model_validate", None) or args_schema.parse_obj
+
+    def validate(params: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            model = validate_model(params)
+        except Exception as e:
+            raise ValueError(f"工具'{name}'参数错误: {e}。期望参数: {signature}")
+        dump = getattr(model, "model_dump", None) or model.dict
+        return dump(exclude_unset=True)
+
+    return validate
+
+
+def build_descriptor(name: str, function: Callable, description: Optional[str] = None,
+                     args_schema: Optional[type] = None,
+                     warm_up: Optional[Callable[[], Any]] = None) -> ToolDescriptor:
+    """
+    分析工具并生成描述符
+
+    Args:
+        name: 工具名
+        function: 工具函数；LazyFunction 需同时给出 description 与 args_schema（其签名不可用）
+        description: 工具说明；未给出时使用函数文档字符串
+        args_schema: pydantic 参数模型；给出时参数 Schema 与校验都以其为准
+        warm_up: 提前加载工具资源的函数；LazyFunction 默认使用其 load
+    """
+    if warm_up is None and isinstance(function, LazyFunction):
+        warm_up = function.load
+    doc = inspect.getdoc(function) or ""
+    if args_schema is not None:
+        parameters = _model_schema(args_schema)
+        signature = _schema_signature(parameters)
+        validate = _model_validator(name, args_schema, signature)
+    else:
+        parameters, var_keyword = _signature_schema(function)
+        signature = str(inspect.signature(function))
+        validate = _compile_validator(name, parameters, signature, var_keyword)
+    return ToolDescriptor(
+        name=name,
+        function=function,
+        description=(description or doc.split("\n\n", 1)[0]).strip(),
+        parameters=parameters,
+        prompt_line=f"- {name}{signature}: {description or doc}",
+        signature=signature,
+        validate=validate,
+        args_schema=args_schema,
+        warm_up=warm_up
+    )
+
+
+class ToolRegistry:
+    """工具描述符注册表，渲染结果缓存到注册表变化为止"""
+
+    def __init__(self):
+        self._descriptors: Dict[str, ToolDescriptor] = {}
+        self._tool_list: Optional[str] = None
+        self._schemas: Optional[List[Dict[str, Any]]] = None
+        self._lock = threading.Lock()
+
+    def register(self, name: str, function: Callable, description: Optional[str] = None,
+                 args_schema: Optional[type] = None,
+                 warm_up: Optional[Callable[[], Any]] = None) -> ToolDescriptor:
+        return self.add(build_descriptor(name, function, description, args_schema, warm_up))
+
+    def add(self, descriptor: ToolDescriptor) -> ToolDescriptor:
+        """加入已生成的描述符（描述符不可变，可在多个注册表之间共享）"""
+        with self._lock:
+            self._descriptors[descriptor.name] = descriptor
+            self._tool_list = self._schemas = None
+        return descriptor
+
+    def unregister(self, name: str) -> bool:
+        with self._lock:
+            if self._descriptors.pop(name, None) is None:
+                return False
+            self._tool_list = self._schemas = None
+            return True
+
+    def get(self, name: str) -> Optional[ToolDescriptor]:
+        return self._descriptors.get(name)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._descriptors
+
+    def names(self) -> List[str]:
+        return list(self._descriptors)
+
+    def render_tool_list(self) -> str:
+        """系统提示词中的工具列表，按名称排序保证字节稳定（提供商前缀缓存只在逐字节相同时命中）"""
+        tool_list = self._tool_list
+        if tool_list is None:
+            with self._lock:
+                tool_list = self._tool_list = "\n".join(
+                    descriptor.prompt_line for _, descriptor in sorted(self._descriptors.items()))
+        return tool_list
+
+    def schemas(self) -> List[Dict[str, Any]]:
+        """原生工具调用使用的描述列表，按名称排序"""
+        schemas = self._schemas
+        if schemas is None:
+            with self._lock:
+                schemas = self._schemas = [descriptor.schema() for _, descriptor in sorted(self._descriptors.items())]
+        return schemas
@@ -10,7 +10,7 @@ import json
 import logging
 import threading
 from datetime import datetime
-from flask import Flask, render_template, request, jsonify, session
+from flask import Flask, render_template, request, jsonify, session, Response, stream_with_context
 from dotenv import load_dotenv
 
 # 添加项目根目录到 Python 路径
@@ -20,6 +20,8 @@ sys.path.insert(0, project_root)
 # 加载环境变量
 load_dotenv()
 
+from config_manager import ConfigManager
+
 # 配置日志
 logging.basicConfig(
     level=logging.INFO,
@@ -64,7 +66,7 @@ class WebAgentManager:
                     config.conda_env = config_dict.get('conda_env', '')
                 
                 # 创建新的 Agent 实例
-                agent = ReactAgent(config)
+                agent = ReactAgent(config, session_id=session_id)
                 
                 self.sessions[session_id] = {
                     'agent': agent,
@@ -101,6 +103,21 @@ class WebAgentManager:
             logger.error(f"处理消息时出错: {e}")
             return f"处理消息时出错: {str(e)}"
     
+    def process_message_stream(self, session_id, user_input):
+        """
+        流式处理用户消息，逐个产出面向用户的事件（最终答案片段与工具进度，见 ReactAgent.run_events），
+        生成器返回值为运行结果
+        """
+        agent = self.get_agent_for_session(session_id)
+        if not agent:
+            raise RuntimeError("无法初始化 AI 助手")
+        
+        timeout = self._get_timeout_for_query(user_input)
+        result = yield from agent.run_events(user_input=user_input, timeout=timeout)
+        
+        self.sessions[session_id]['message_count'] += 1
+        return result
+    
     def _get_timeout_for_query(self, user_input):
         """根据查询类型动态设置超时时间"""
         user_input_lower = user_input.lower()
@@ -133,13 +150,21 @@ class WebAgentManager:
             if session_age.total_seconds() > 3600:  # 1小时过期
                 expired_sessions.append(session_id)
         
+        from conversation_summarizer import get_conversation_summarizer
         for session_id in expired_sessions:
-            del self.sessions[session_id]
+            agent = self.sessions.pop(session_id)['agent']
+            agent.close()
+            summarizer = get_conversation_summarizer(agent.config)
+            if summarizer is not None:
+                summarizer.drop(session_id)
             logger.info(f"清理过期会话: {session_id}")
 
 # 创建管理器实例
 agent_manager = WebAgentManager()
 
+# 应用级配置（默认值与环境变量），进程内只加载一次
+app_config = ConfigManager()
+
 @app.route('/')
 def index():
     """主页面"""
@@ -187,6 +212,60 @@ def process_message():
             'error': f'服务器错误: {str(e)}'
         })
 
+def _sse_event(event_type, payload):
+    """格式化一条 Server-Sent Events 消息"""
+    data = json.dumps({'type': event_type, **payload}, ensure_ascii=False)
+    return f"data: {data}\n\n"
+
+@app.route('/api/chat/stream', methods=['POST'])
+def process_message_stream():
+    """流式处理用户消息（Server-Sent Events）"""
+    data = request.get_json() or {}
+    user_input = data.get('message', '').strip()
+    session_id = data.get('session_id', 'default')
+    
+    if not user_input:
+        return jsonify({
+            'success': False,
+            'error': '消息内容不能为空'
+        })
+    
+    logger.info(f"流式处理用户消息 - 会话: {session_id}, 输入: {user_input[:50]}...")
+    
+    def generate():
+        stream = agent_manager.process_message_stream(session_id, user_input)
+        try:
+            # 只推送最终答案的增量文本与工具进度，模型的原始输出、思考与工具结果不发送给浏览器
+            while True:
+                event = dict(next(stream))
+                yield _sse_event(event.pop('type'), event)
+        except StopIteration as stop:
+            result = stop.value or {}
+            status = result.get('status', 'success')
+            # 以 final_answer 作为最终回答（答案不是逐段生成的 JSON 字段时只在这里给出）
+            yield _sse_event('done', {
+                'status': status,
+                'success': status == 'success',
+                'final_answer': result.get('answer'),
+                'message': result.get('message'),
+                'stats': result.get('stats', {}),
+                'session_id': session_id
+            })
+        except Exception as e:
+            logger.error(f"流式处理消息时出错: {e}")
+            yield _sse_event('error', {'error': f'服务器错误: {str(e)}'})
+        finally:
+            stream.close()
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # 关闭反向代理缓冲，保证逐段推送
+        }
+    )
+
 @app.route('/api/settings', methods=['POST'])
 def update_settings():
     """更新设置"""
@@ -281,6 +360,21 @@ def health_check():
         'active_sessions': len(agent_manager.sessions)
     })
 
+@app.route('/api/metrics', methods=['GET'])
+def api_metrics():
+    """API调用指标（JSON）：各 提供商/模型 的耗时、首token延迟与 tokens/s 百分位数"""
+    from api_metrics import get_api_metrics
+    from provider_health import get_provider_health
+    from rate_limiter import get_rate_limiter
+    
+    limiter = get_rate_limiter(app_config)
+    return jsonify({
+        'timestamp': datetime.now().isoformat(),
+        'models': get_api_metrics().get_stats(),
+        'provider_health': get_provider_health().get_stats(),
+        'rate_limit': limiter.get_stats() if limiter else {'enabled': False}
+    })
+
 if __name__ == '__main__':
     print("🚀 启动 LLM Auto Agent Web 界面...")
     print(f"📁 项目路径: {project_root}")